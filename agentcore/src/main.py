@@ -1,5 +1,6 @@
 """お店検索エージェント - AgentCore Gateway + Memory"""
 import os
+import time
 import boto3
 import base64
 import requests
@@ -71,6 +72,10 @@ async def invoke(payload, context):
     """エージェントのエントリーポイント"""
     user_message = payload.get("prompt", payload.get("message", ""))
     user_id = payload.get("user_id", "default_user")
+    # Lambda側のトレース（EMFのcorrelation_id）と突き合わせるためのID
+    correlation_id = payload.get("correlation_id", "-")
+    started = time.perf_counter()
+    print(f"[INFO] invoke started correlation_id={correlation_id}")
     
     if not user_message:
         yield "メッセージを入力してください。"
@@ -114,6 +119,8 @@ async def invoke(payload, context):
         
         result = agent(user_message)
         response_text = str(result)
+        print(f"[INFO] agent finished correlation_id={correlation_id} "
+              f"elapsed_ms={(time.perf_counter() - started) * 1000:.0f}")
         
         # 会話をMemoryに保存
         from bedrock_agentcore.memory.constants import ConversationalMessage, MessageRole
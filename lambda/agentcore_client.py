@@ -0,0 +1,105 @@
+"""
+AgentCore Runtimeクライアントを管理するモジュール。
+
+- コンテナ単位でクライアントを1つだけ生成し、ウォーム起動中は使い回す
+  （認証情報・エンドポイント解決・TLSハンドシェイクを毎回行わない）
+- タイムアウト・リトライ・コネクションプールは環境変数で設定可能
+- REINIT_EVERY_SEC 経過後はクライアントを作り直す
+- 残り時間に合わせた読み取りタイムアウトのクライアントも同様に使い回す
+"""
+
+import os
+import threading
+import time
+
+from env import get_float, get_int
+
+REGION = "ap-northeast-1"
+
+# 読み取りタイムアウトの丸め単位（秒）
+TIMEOUT_BUCKET_SEC = 5
+
+# 読み取りタイムアウトごとのクライアント {timeout: (client, created_at)}
+_clients = {}
+_client_lock = threading.Lock()
+
+
+def _default_read_timeout() -> float:
+    return get_float("AGENTCORE_READ_TIMEOUT", 55)
+
+
+def _build_config(read_timeout: float | None = None):
+    """環境変数からbotocoreのConfigを組み立てる"""
+    from botocore.config import Config
+
+    retries = {
+        "mode": os.environ.get("AGENTCORE_RETRY_MODE", "adaptive"),
+        "max_attempts": get_int("AGENTCORE_MAX_ATTEMPTS", 2),
+    }
+    if read_timeout is not None:
+        # 時間予算つきの呼び出しでは、リトライで予算を超えないよう1回だけ試す
+        # （botocoreの max_attempts は初回を含まないリトライ回数なので、total_max_attempts で指定する）
+        retries = {"mode": retries["mode"], "total_max_attempts": 1}
+    return Config(
+        region_name=REGION,
+        connect_timeout=get_float("AGENTCORE_CONNECT_TIMEOUT", 5),
+        read_timeout=read_timeout if read_timeout is not None else _default_read_timeout(),
+        retries=retries,
+        max_pool_connections=get_int("AGENTCORE_MAX_POOL_CONNECTIONS", 10),
+        tcp_keepalive=True,
+    )
+
+
+def _reinit_interval() -> int:
+    """クライアント再生成間隔（秒）。0以下なら再生成しない"""
+    return get_int("REINIT_EVERY_SEC", 0)
+
+
+def _timeout_bucket(read_timeout: float | None) -> int | None:
+    """
+    読み取りタイムアウトを丸める（クライアントの種類が増えすぎないように）。
+    予算を超えないよう TIMEOUT_BUCKET_SEC 単位で切り捨てる。
+    予算がデフォルト以上でも、予算つきの呼び出しはリトライしないクライアントを使う。
+    """
+    if read_timeout is None:
+        return None
+    read_timeout = min(read_timeout, _default_read_timeout())
+    if read_timeout < TIMEOUT_BUCKET_SEC:
+        return max(1, int(read_timeout))
+    return int(read_timeout // TIMEOUT_BUCKET_SEC) * TIMEOUT_BUCKET_SEC
+
+
+def get_agentcore_client(read_timeout: float | None = None):
+    """
+    AgentCoreクライアントを取得（遅延初期化・定期再生成）。
+
+    Args:
+        read_timeout: 読み取りタイムアウト（秒）。省略時は AGENTCORE_READ_TIMEOUT
+    """
+    key = _timeout_bucket(read_timeout)
+    now = time.monotonic()
+    interval = _reinit_interval()
+    entry = _clients.get(key)
+    if entry is not None and not (interval > 0 and now - entry[1] >= interval):
+        return entry[0]
+
+    with _client_lock:
+        entry = _clients.get(key)
+        if entry is None or (interval > 0 and now - entry[1] >= interval):
+            if entry is not None:
+                print("[DEBUG] Reinitializing AgentCore client")
+            import boto3
+            client = boto3.client(
+                "bedrock-agentcore",
+                config=_build_config(key),
+                endpoint_url=os.environ.get("AGENTCORE_ENDPOINT_URL") or None,
+            )
+            entry = (client, now)
+            _clients[key] = entry
+    return entry[0]
+
+
+def reset_client():
+    """クライアントを破棄する（テスト用）"""
+    with _client_lock:
+        _clients.clear()
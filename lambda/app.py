@@ -1,100 +1,172 @@
+import io
 import os
 import json
+import time
 import traceback
-import requests
-import boto3
-
-from ssm_secrets import get_secret
+import uuid
+import circuit_breaker
+import coalesce
+import delivery_outbox
+import event_dispatch
+import event_queue
+import idempotency
+import intent_router
+import line_api
+import location_context
+import message_packer
+import metrics
+import places
+import query_cache
+import rate_limiter
+import result_pages
+import singleflight
+import sse
+import usage_meter
+from agentcore_client import get_agentcore_client
+from circuit_breaker import CircuitOpenError, agentcore_breaker
+from deadline import Deadline, min_agent_budget_sec, reply_token_expired
+from env import get_bool, get_int
+from loading_indicator import LoadingIndicator
+from progressive import PARAGRAPH_SEP, FlushPolicy, ProgressiveBuffer
+from ssm_secrets import get_secret, prefetch_secrets
 
 # AgentCore Runtime設定
 AGENT_RUNTIME_ARN = "arn:aws:bedrock-agentcore:ap-northeast-1:179323781340:runtime/lineshopbot_Agent-bO1T7aE4xR"
-REGION = "ap-northeast-1"
 
-def _call_agentcore(user_id: str, query: str) -> str:
-    """AgentCore Runtimeを呼び出す"""
-    client = boto3.client("bedrock-agentcore", region_name=REGION)
-    
-    response = client.invoke_agent_runtime(
-        agentRuntimeArn=AGENT_RUNTIME_ARN,
-        payload=json.dumps({
+EMPTY_RESPONSE_MESSAGE = "申し訳ございません。応答を取得できませんでした。"
+AGENT_ERROR_MESSAGE = "申し訳ございません。現在検索サービスに接続できません。"
+AGENT_TIMEOUT_MESSAGE = "申し訳ございません。検索に時間がかかっています。少し時間をおいてもう一度お試しください。"
+FOLLOWUP_MESSAGE = "検索に時間がかかっています。結果はあとでお送りします。"
+AGENT_DEGRADED_MESSAGE = "申し訳ございません。現在検索サービスが混み合っています。しばらくしてからお試しください。"
+LOCATION_FALLBACK_QUERY = "近くのおすすめのお店"
+
+# コンテナ初期化時にシークレットをまとめて取得（リクエスト処理中にSSMを待たない）
+prefetch_secrets()
+
+def _stream_agentcore(user_id: str, query: str, read_timeout: float | None = None):
+    """AgentCore Runtimeを呼び出し、応答テキストを届いた順に返す"""
+    # クライアントの作成（コールドスタート時のboto3の読み込みなど）はAgentCoreの所要時間・失敗に含めない
+    client = get_agentcore_client(read_timeout)
+    with agentcore_breaker.guard() as guard:
+        payload = {
             "prompt": query,
             "user_id": user_id
-        }),
-        contentType="application/json"
-    )
-    
+        }
+        # Runtime側のログと突き合わせるためのID
+        correlation_id = metrics.current_correlation_id()
+        if correlation_id:
+            payload["correlation_id"] = correlation_id
+
+        started = time.perf_counter()
+        chars = 0
+        size = 0
+        # 利用量はここで計上する（段階的な送信など、_call_agentcore を通らない呼び出しも含める）
+        try:
+            with metrics.stage("AgentCoreInvoke"):
+                response = client.invoke_agent_runtime(
+                    agentRuntimeArn=AGENT_RUNTIME_ARN,
+                    payload=json.dumps(payload),
+                    contentType="application/json"
+                )
+
+            try:
+                for text in _iter_response_text(response):
+                    if not chars:
+                        metrics.record("AgentCoreFirstChunkMs", round((time.perf_counter() - started) * 1000, 1), "Milliseconds")
+                    chars += len(text)
+                    size += len(text.encode("utf-8"))
+                    # 受け手（LINEへの送信など）に渡している間はAgentCoreの所要時間に含めない
+                    with guard.paused():
+                        yield text
+            finally:
+                metrics.record("AgentCoreMs", round(guard.elapsed() * 1000, 1), "Milliseconds")
+                metrics.record("AgentCoreResponseChars", chars)
+        except Exception:
+            usage_meter.add(agent_errors=1)
+            raise
+        finally:
+            usage_meter.add(agent_calls=1, agent_ms=guard.elapsed() * 1000, agent_bytes=size)
+
+def _iter_response_text(response):
     # StreamingBodyから読み取る（キーは'response'）
     body = response.get("response")
-    if body and hasattr(body, 'read'):
-        result = body.read().decode("utf-8")
-    else:
-        result = ""
-    
-    # SSE形式 "data: \"...\"\n" からテキストを抽出
-    if result.startswith('data: "'):
-        result = result[7:]
-        if result.endswith('"\n'):
-            result = result[:-2]
-        result = result.replace("\\n", "\n")
-    
-    return result if result else "申し訳ございません。応答を取得できませんでした。"
+    if not body or not hasattr(body, 'read'):
+        return
+
+    # ストリーミングでない場合はJSON本文をそのままデコード
+    if not response.get("contentType", "").startswith("text/event-stream"):
+        raw = body.read()
+        if raw.startswith(b"data:"):
+            # contentTypeが付いていないSSE
+            yield from sse.iter_text(io.BytesIO(raw))
+        elif raw:
+            yield sse.decode_data(raw.decode("utf-8"))
+        return
+
+    yield from sse.iter_text(body)
+
+def _call_agentcore(user_id: str, query: str, read_timeout: float | None = None) -> str:
+    """AgentCore Runtimeを呼び出す"""
+    result = "".join(_stream_agentcore(user_id, query, read_timeout))
+    return result if result else EMPTY_RESPONSE_MESSAGE
+
+def _ask_agent(user_id: str, query: str, read_timeout: float | None = None) -> str:
+    """AgentCoreに問い合わせ、得られた応答をキャッシュする"""
+    started = time.monotonic()
+    answer = _call_agentcore(user_id, query, read_timeout)
+    if answer != EMPTY_RESPONSE_MESSAGE:
+        query_cache.put(query, answer, (time.monotonic() - started) * 1000)
+    return answer
 
 # =========================
 # LINE senders
 # =========================
-def send_line_reply(reply_token, message, access_token):
-    url = "https://api.line.me/v2/bot/message/reply"
-    header = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-
-    MAX_LEN = int(os.environ.get("LINE_MAX_TEXT_LEN", "4500"))
-    if len(message) > MAX_LEN:
-        message = message[:MAX_LEN - 20] + "\n...(長いので省略)"
-
-    body = json.dumps({
-        "replyToken": reply_token,
-        "messages": [{"type": "text", "text": message}]
-    })
-
-    res = requests.post(url=url, headers=header, data=body, timeout=10)
+def _record_packing(batches):
+    """1吹き出し1回で送った場合と比べて減らせたAPI呼び出し回数を記録する"""
+    messages = sum(len(b) for b in batches)
+    metrics.record("LineTextMessages", messages)
+    if messages > len(batches):
+        metrics.record("LineCallsSaved", messages - len(batches))
+
+def send_line_reply(reply_token, message, access_token, push_to=None, quick_reply=None):
+    """
+    長い応答は複数の吹き出しに分けて1回のreplyで送る。
+    5個に収まらない分は push_to が指定されていれば1回のpushでまとめて送る（なければ省略）
+    """
+    batches = message_packer.pack(message, max_calls=2 if push_to else 1, quick_reply=quick_reply)
+    res = line_api.reply(reply_token, batches[0], access_token)
     print(f"[DEBUG] LINE REPLY status: {res.status_code}")
+    if res.status_code < 400 and len(batches) > 1:
+        _push_messages(push_to, batches[1], access_token)
+    _record_packing(batches)
     return res
 
-def send_line_push(to_id, message, access_token):
-    url = "https://api.line.me/v2/bot/message/push"
-    header = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-
-    MAX_LEN = int(os.environ.get("LINE_MAX_TEXT_LEN", "4500"))
-    if len(message) > MAX_LEN:
-        message = message[:MAX_LEN - 20] + "\n...(長いので省略)"
-
-    body = json.dumps({
-        "to": to_id,
-        "messages": [{"type": "text", "text": message}]
-    })
+def send_line_push(to_id, message, access_token, quick_reply=None, retry_key=None):
+    """
+    retry_key（UUID）を指定すると、吹き出しのまとまりごとに毎回同じX-Line-Retry-Keyで送る
+    （前回受け付け済みのまとまりは409になるので、送信済みとして次に進む）
+    """
+    batches = message_packer.pack(message, max_calls=2, quick_reply=quick_reply)
+    for i, messages in enumerate(batches):
+        key = str(uuid.uuid5(uuid.UUID(retry_key), str(i))) if retry_key else None
+        res = _push_messages(to_id, messages, access_token, key)
+        if res.status_code >= 400 and not (key and res.status_code == delivery_outbox.ALREADY_ACCEPTED):
+            break
+    _record_packing(batches)
+    return res
 
-    res = requests.post(url=url, headers=header, data=body, timeout=10)
+def _push_messages(to_id, messages, access_token, retry_key=None):
+    res = line_api.push(to_id, messages, access_token, retry_key)
     print(f"[DEBUG] LINE PUSH status: {res.status_code}, body: {res.text}")
+    # pushは課金対象なので送信数を記録する
+    metrics.put_metric("LinePushMessages", 1)
+    usage_meter.add(push_calls=1, push_messages=len(messages))
     return res
 
 def start_line_loading(chat_id, loading_seconds, access_token):
     """1対1チャットでローディング表示を開始する"""
-    url = "https://api.line.me/v2/bot/chat/loading/start"
-    header = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}"
-    }
-    body = json.dumps({
-        "chatId": chat_id,
-        "loadingSeconds": loading_seconds
-    })
     try:
-        res = requests.post(url=url, headers=header, data=body, timeout=10)
+        res = line_api.start_loading(chat_id, loading_seconds, access_token)
         print(f"[DEBUG] LINE LOADING status: {res.status_code}, body: {res.text}")
         return res
     except Exception as e:
@@ -113,38 +185,554 @@ def _get_push_destination(ev) -> str | None:
     return None
 
 def _allow_push_fallback() -> bool:
-    return os.environ.get("LINE_ALLOW_PUSH_FALLBACK", "false").lower() in ("1", "true", "yes", "on")
+    return get_bool("LINE_ALLOW_PUSH_FALLBACK", False)
 
 def _get_loading_seconds() -> int:
-    raw = os.environ.get("LINE_LOADING_SECONDS", "20")
-    try:
-        n = int(raw)
-    except ValueError:
-        n = 20
-    n = max(5, min(60, n))
+    n = max(5, min(60, get_int("LINE_LOADING_SECONDS", 20)))
     return (n // 5) * 5
 
+def _is_location_message(ev) -> bool:
+    return ev.get("type") == "message" and (ev.get("message") or {}).get("type") == "location"
+
+def _places_enabled() -> bool:
+    return get_bool("PLACES_ENABLED", True)
+
+def _answer_location(ev, user_id) -> tuple[str, dict | None] | None:
+    """位置情報メッセージにPlaces APIの周辺検索で答える（使えない場合はNone）"""
+    msg = ev.get("message") or {}
+    try:
+        lat, lng = float(msg["latitude"]), float(msg["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    label = msg.get("title") or msg.get("address") or "送信された場所"
+    location_context.remember(user_id, lat, lng, label)
+    if not _places_enabled():
+        return None
+    try:
+        with metrics.stage("PlacesNearby"):
+            results = places.search_nearby(lat, lng)
+    except places.PlacesError as e:
+        print(f"[WARN] Places nearby search failed; falling back to AgentCore: {e}")
+        return None
+    metrics.set_property("answer_source", "places")
+    metrics.record("PlacesResults", len(results))
+    return result_pages.first_page(user_id, result_pages.NEARBY, {"origin": label}, results)
+
+def _answer_route(route, user_id) -> tuple[str, dict | None] | None:
+    """「エリア＋ジャンル」だけの質問にPlaces APIのテキスト検索で答える（使えない・見つからない場合はNone）"""
+    try:
+        with metrics.stage("PlacesTextSearch"):
+            results = places.search_text(route.search_query)
+    except places.PlacesError as e:
+        print(f"[WARN] Places text search failed; falling back to AgentCore: {e}")
+        return None
+    if not results:
+        # 見つからない場合は条件を広げて探せるAgentCoreに任せる
+        return None
+    metrics.set_property("answer_source", "router")
+    metrics.record("PlacesResults", len(results))
+    return result_pages.first_page(user_id, result_pages.SEARCH, {"area": route.area, "genre": route.genre}, results)
+
+def _next_page(user_id, cursor, offset) -> tuple[str, dict | None]:
+    """保存済みの検索結果の次のページを返す（AgentCore・Places APIは呼ばない）"""
+    with metrics.stage("ResultPage"):
+        text, quick_reply = result_pages.next_page(user_id, cursor, offset)
+    metrics.set_property("answer_source", "result_page")
+    return text, quick_reply
+
+def _extract_query(ev) -> str | None:
+    """
+    テキストメッセージから検索条件を取り出す。
+    グループ・ルームでは「@お店」で始まるメッセージのみ対象（対象外はNone）
+    """
+    if ev.get("type") != "message":
+        return None
+    msg = ev.get("message", {}) or {}
+    if msg.get("type") != "text":
+        return None
+    received_text = (msg.get("text", "") or "").strip()
+    source_type = (ev.get("source", {}) or {}).get("type")
+
+    # トリガー判定
+    TRIGGERS = ["@お店", "＠お店"]
+
+    if source_type == "user":
+        return received_text
+    for trigger in TRIGGERS:
+        if received_text.startswith(trigger):
+            return received_text[len(trigger):].strip()
+    return None
+
+def register_events(events):
+    """受信したメッセージを連続メッセージの結合用に記録する"""
+    for ev in events:
+        query = _extract_query(ev)
+        if query:
+            coalesce.register(_get_user_id(ev), ev, query)
+
 def _get_user_id(ev) -> str:
     """ユーザーIDを取得（Memory用）"""
     source = ev.get("source", {}) or {}
     return source.get("userId") or source.get("groupId") or source.get("roomId") or "unknown"
 
+def _get_group_id(ev) -> str | None:
+    source = ev.get("source", {}) or {}
+    return source.get("groupId") or source.get("roomId")
+
+def usage_subject(ev):
+    """イベントの利用量を送信元のユーザー・グループに加算する範囲"""
+    return usage_meter.attribute(_get_user_id(ev), _get_group_id(ev))
+
+def _webhook_mode() -> str:
+    """sync: webhook内でAgentCoreまで処理 / queue: SQSに積んでworkerで処理"""
+    mode = os.environ.get("WEBHOOK_MODE", "sync").lower()
+    return mode if mode in ("sync", "queue") else "sync"
+
+def _should_enqueue(ev) -> bool:
+    """
+    workerで処理する必要のあるイベントか
+    （位置情報はPlaces APIで即答でき、postbackは保存済みの結果を返すだけなのでwebhookで処理）
+    """
+    return ev.get("type") == "message" and not _is_location_message(ev)
+
+def _parse_body(event) -> dict:
+    body_str = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        import base64
+        body_str = base64.b64decode(body_str).decode("utf-8")
+    return json.loads(body_str) if body_str else {}
+
+# =========================
+# Progressive delivery
+# =========================
+def _deliver_progressively(user_id, query, reply_token, dest, policy, access_token, read_timeout=None):
+    """
+    AgentCoreの応答を段落単位で送る（最初の塊はreply、以降はpush）。
+    送れる塊ができても、ストリームの続きが届くまでは送らない。応答を1回で返すRuntimeでは
+    途中で送るものがないので、replyとpushに分けずに1回のreplyで送る（pushを無駄に使わない）
+
+    Returns:
+        (応答全文（AgentCoreの呼び出しに失敗した場合は空文字）, いずれかの塊を送信できたか)
+    """
+    buffer = ProgressiveBuffer(policy)
+    replied = False
+    delivered = False
+    sends = 0
+
+    def send(chunk):
+        # LINEへの送信の失敗はAgentCoreの失敗として扱わない（ストリームは読み続ける）
+        nonlocal replied, delivered, sends
+        sends += 1
+        try:
+            if not replied:
+                replied = True
+                res = send_line_reply(reply_token, chunk, access_token)
+                if res.status_code < 400:
+                    delivered = True
+                    return
+                print("[WARN] reply failed; trying push fallback")
+            if send_line_push(dest, chunk, access_token).status_code < 400:
+                delivered = True
+        except Exception as e:
+            print(f"[ERROR] LINE send failed: {e}")
+            traceback.print_exc()
+
+    pieces = []
+    # 送れる状態の塊（ストリームの続きが届いたら送る）
+    ready = []
+    failed = False
+    stream = _stream_agentcore(user_id, query, read_timeout)
+    try:
+        for piece in stream:
+            for chunk in ready:
+                send(chunk)
+            pieces.append(piece)
+            ready = buffer.feed(piece)
+        rest = buffer.finish()
+    except Exception as e:
+        _log_agent_error(e)
+        failed = True
+        rest = buffer.finish()
+        rest = (rest + PARAGRAPH_SEP if rest else "") + AGENT_ERROR_MESSAGE
+    finally:
+        stream.close()
+
+    rest = PARAGRAPH_SEP.join([*ready, rest] if rest else ready)
+    if rest:
+        send(rest)
+    elif not replied:
+        send(EMPTY_RESPONSE_MESSAGE)
+
+    metrics.put_metric("ProgressiveFlushes", sends, properties={"mode": policy.mode})
+    return ("" if failed else "".join(pieces)), delivered
+
+# =========================
+# Event handling
+# =========================
+def handle_event(ev, access_token, deadline=None):
+    """LINEイベント1件を処理する（webhook同期モード・workerで共通）"""
+    with metrics.trace("Event", ev.get("webhookEventId")), usage_subject(ev):
+        metrics.set_property("event_type", ev.get("type"))
+        metrics.set_property("source_type", (ev.get("source") or {}).get("type"))
+        usage_meter.add(events=1)
+        _handle_event(ev, access_token, deadline)
+
+def _handle_event(ev, access_token, deadline=None):
+    event_id = ev.get("webhookEventId")
+    if not event_id:
+        record_result(ev, None, _process_message(ev, access_token, deadline))
+        return
+
+    # LINEの再送で同じイベントを二重に処理しない
+    existing = idempotency.begin(event_id)
+    if existing is not None:
+        if needs_replay(ev, existing):
+            delivered = (_send_answer(ev, ev.get("replyToken"), existing.answer, access_token)
+                         or _defer_delivery(ev, existing.answer))
+            idempotency.complete(event_id, existing.answer, delivered)
+        return
+
+    try:
+        result = _process_message(ev, access_token, deadline)
+    except Exception:
+        idempotency.release(event_id)
+        raise
+    record_result(ev, event_id, result)
+
+def needs_replay(ev, existing) -> bool:
+    """処理済みのイベントが再送された場合に、保存済みの（届かなかった）応答を送り直すか"""
+    event_id = ev.get("webhookEventId")
+    redelivery = (ev.get("deliveryContext") or {}).get("isRedelivery")
+    if existing.status == idempotency.COMPLETED and existing.answer and not existing.delivered:
+        print(f"[INFO] Replaying stored answer for {event_id} (redelivery={redelivery})")
+        return True
+    print(f"[INFO] Skipping duplicate event {event_id} ({existing.status}, redelivery={redelivery})")
+    return False
+
+def record_result(ev, event_id, result):
+    """
+    処理結果を冪等性ストアに記録する（webhook・worker・ASGIサーバーで共通）。
+    届かなかった応答はアウトボックスに渡す
+    """
+    answer, delivered = result if result else (None, True)
+    if event_id is None:
+        if answer and not delivered:
+            _defer_delivery(ev, answer)
+        return
+    if answer in (AGENT_ERROR_MESSAGE, AGENT_DEGRADED_MESSAGE) and not delivered:
+        # AgentCoreにもLINEにも届かなかった場合は再送で最初からやり直す
+        idempotency.release(event_id)
+        return
+    if answer and not delivered:
+        # 作った応答は捨てずにアウトボックスに渡す（以降の送信はアウトボックスが受け持つ）
+        delivered = _defer_delivery(ev, answer)
+    idempotency.complete(event_id, answer, delivered)
+
+def _defer_delivery(ev, answer) -> bool:
+    """
+    届かなかった応答をアウトボックスに保存する（push許可時はpushで再送、それ以外はDLQへ）。
+    作り直しても安い定型のお詫びは保存しない
+    """
+    if answer in (AGENT_ERROR_MESSAGE, AGENT_DEGRADED_MESSAGE, AGENT_TIMEOUT_MESSAGE, EMPTY_RESPONSE_MESSAGE):
+        return False
+    return delivery_outbox.defer(ev, answer, _get_push_destination(ev), _allow_push_fallback())
+
+class Plan:
+    """
+    plan_message の結果（LINE・AgentCoreへのI/Oを除いた判断）。
+
+    kind:
+        ANSWER      : text（と quick_reply）を応答として送る
+        NOTICE      : text をreplyで知らせるだけ（応答としては記録しない）
+        OUT_OF_TIME : 残り時間内に応答できない
+        ASK_AGENT   : query をAgentCoreに問い合わせる（read_timeout は時間予算）
+    """
+    ANSWER = "answer"
+    NOTICE = "notice"
+    OUT_OF_TIME = "out_of_time"
+    ASK_AGENT = "ask_agent"
+
+    __slots__ = ("kind", "text", "quick_reply", "query", "read_timeout")
+
+    def __init__(self, kind, text=None, quick_reply=None, query=None, read_timeout=None):
+        self.kind = kind
+        self.text = text
+        self.quick_reply = quick_reply
+        self.query = query
+        self.read_timeout = read_timeout
+
+def plan_message(ev, deadline=None, coalescing=True) -> Plan | None:
+    """
+    メッセージイベント（と「もっと見る」のpostback）にどう答えるかを決める
+    （webhook・worker・ASGIサーバーで共通。Places API・DynamoDBなど同期の呼び出しを含む）。
+
+    Args:
+        coalescing: 立て続けに送られたメッセージを最後の1件にまとめるか
+
+    Returns:
+        Plan。応答しない場合はNone
+    """
+    source = ev.get("source", {}) or {}
+    source_type = source.get("type")
+    user_id = _get_user_id(ev)
+
+    if ev.get("type") == "postback":
+        # クイックリプライの「もっと見る」
+        page = result_pages.parse_postback((ev.get("postback") or {}).get("data"))
+        if page is None:
+            return None
+        return Plan(Plan.ANSWER, *_next_page(user_id, *page))
+
+    if _is_location_message(ev):
+        # 位置情報は1対1チャットのみ対象（グループでの共有には反応しない）
+        if source_type != "user":
+            return None
+        answer = _answer_location(ev, user_id)
+        if answer is not None:
+            return Plan(Plan.ANSWER, *answer)
+        # Places APIが使えない場合はAgentCoreに現在地付きで問い合わせる
+        query = location_context.attach(user_id, LOCATION_FALLBACK_QUERY)
+    else:
+        query = _extract_query(ev)
+        if query is None:
+            return None
+
+    if not query:
+        msg = "条件を教えてください。\n例）上野で静かなカフェ" if source_type == "user" else "使い方：@お店 の後に条件を書いてね。"
+        return Plan(Plan.NOTICE, msg)
+
+    # 立て続けに送られたメッセージは最後の1件でまとめて検索する
+    if coalescing:
+        max_wait = deadline.agent_budget_sec() - min_agent_budget_sec() if deadline else None
+        query = coalesce.settle(user_id, ev, query, max_wait)
+        if query is None:
+            print("[INFO] Coalesced into a later message")
+            metrics.set_property("answer_source", "coalesced")
+            return None
+
+    # 直前の検索結果の続きを求められたら、保存済みの候補から次のページを返す
+    if result_pages.is_more_request(query):
+        position = result_pages.latest(user_id)
+        if position is not None:
+            return Plan(Plan.ANSWER, *_next_page(user_id, *position))
+
+    # 「エリア＋ジャンル」だけの単純な質問はAgentCoreを通さずに答える
+    route = intent_router.classify(query)
+    metrics.set_property("intent_route", route.reason)
+    if route.direct and _places_enabled():
+        answer = _answer_route(route, user_id)
+        if answer is not None:
+            return Plan(Plan.ANSWER, *answer)
+
+    # AgentCoreで答える質問なので、以降の「他には？」はAgentCore（Memory）に任せる
+    result_pages.forget(user_id)
+
+    # 直前に位置情報が送られていれば、周辺を指す質問に現在地を添える
+    query = location_context.attach(user_id, query)
+
+    # 同じ検索条件の応答がキャッシュにあればAgentCoreを呼ばない
+    ai_response = query_cache.get(query)
+    if ai_response is not None:
+        metrics.set_property("answer_source", "cache")
+        return Plan(Plan.ANSWER, ai_response)
+
+    # 1人（1グループ）がAgentCoreの処理能力を使い切らないよう制限する
+    if not rate_limiter.allow(user_id):
+        print(f"[WARN] Rate limited: {user_id}")
+        return Plan(Plan.NOTICE, rate_limiter.LIMITED_MESSAGE)
+
+    # 残り時間が足りなければAgentCoreを呼ばない
+    read_timeout = None
+    if deadline is not None:
+        if not deadline.can_call_agent():
+            print(f"[WARN] Not enough time left for AgentCore ({deadline.remaining_sec():.1f}s)")
+            return Plan(Plan.OUT_OF_TIME)
+        read_timeout = deadline.agent_budget_sec()
+
+    # AgentCoreが劣化中ならタイムアウトを待たずに即座に返す
+    if agentcore_breaker.state == circuit_breaker.OPEN:
+        print("[WARN] AgentCore circuit is open; sending degraded reply")
+        return Plan(Plan.ANSWER, AGENT_DEGRADED_MESSAGE)
+
+    return Plan(Plan.ASK_AGENT, query=query, read_timeout=read_timeout)
+
+def loading_chat_id(ev) -> str | None:
+    """ローディング表示を出すチャット（1対1チャットのみ）"""
+    source = ev.get("source", {}) or {}
+    return source.get("userId") if source.get("type") == "user" else None
+
+def agent_error_answer(e: Exception) -> str:
+    """AgentCoreの呼び出しに失敗した場合に返すお詫び"""
+    _log_agent_error(e)
+    return AGENT_DEGRADED_MESSAGE if isinstance(e, CircuitOpenError) else AGENT_ERROR_MESSAGE
+
+def _process_message(ev, access_token, deadline=None):
+    """
+    メッセージイベント（と「もっと見る」のpostback）を処理する。
+
+    Returns:
+        (応答, 送信できたか)。応答を作らなかった場合はNone
+    """
+    plan = plan_message(ev, deadline)
+    if plan is None:
+        return None
+    reply_token = ev.get("replyToken")
+    if plan.kind == Plan.NOTICE:
+        if reply_token:
+            send_line_reply(reply_token, plan.text, access_token)
+        return None
+    if plan.kind == Plan.ANSWER:
+        return plan.text, _send_answer(ev, reply_token, plan.text, access_token, plan.quick_reply)
+    if plan.kind == Plan.OUT_OF_TIME:
+        return _answer_out_of_time(ev, reply_token, access_token)
+
+    user_id = _get_user_id(ev)
+    query, read_timeout = plan.query, plan.read_timeout
+
+    # 1対1チャットのみ、処理待ちをローディングで可視化（AgentCore呼び出しと並行）
+    loading = None
+    chat_id = loading_chat_id(ev)
+    if chat_id:
+        loading = LoadingIndicator(start_line_loading, chat_id, _get_loading_seconds(), access_token).start()
+
+    # 段階送信モード（reply token + pushが使える場合のみ）
+    policy = FlushPolicy.from_env()
+    dest = _get_push_destination(ev)
+    if policy.enabled and reply_token and dest and _allow_push_fallback():
+        started = time.monotonic()
+        try:
+            full_text, delivered = _deliver_progressively(
+                user_id, query, reply_token, dest, policy, access_token, read_timeout)
+        finally:
+            if loading:
+                loading.stop()
+        if full_text:
+            query_cache.put(query, full_text, (time.monotonic() - started) * 1000)
+        return full_text, delivered
+
+    # AgentCore Runtime呼び出し（同じ検索条件が処理中ならその結果を共有する）
+    try:
+        ai_response = singleflight.do(query, lambda: _ask_agent(user_id, query, read_timeout), read_timeout)
+    except Exception as e:
+        if read_timeout is not None and _is_timeout(e):
+            print(f"[WARN] AgentCore timed out within budget ({read_timeout:.1f}s)")
+            return _answer_out_of_time(ev, reply_token, access_token)
+        ai_response = agent_error_answer(e)
+    finally:
+        if loading:
+            loading.stop()
+
+    return ai_response, _send_answer(ev, reply_token, ai_response, access_token)
+
+def _log_agent_error(e: Exception):
+    # ブレーカーOPEN中は同じエラーが続くのでスタックトレースは出さない
+    if isinstance(e, CircuitOpenError):
+        print(f"[WARN] AgentCore skipped: {e}")
+        return
+    print(f"[ERROR] AgentCore error: {e}")
+    traceback.print_exc()
+
+def _is_timeout(e: Exception) -> bool:
+    return isinstance(e, TimeoutError) or type(e).__name__ in ("ReadTimeoutError", "ConnectTimeoutError")
+
+def _followup_enabled() -> bool:
+    """時間切れのイベントをキュー経由で後から処理するか（結果はpushで送る）"""
+    return (
+        os.environ.get("DEADLINE_FOLLOWUP", "off").lower() == "queue"
+        and bool(os.environ.get("EVENT_QUEUE_URL"))
+        and _allow_push_fallback()
+    )
+
+def _answer_out_of_time(ev, reply_token, access_token):
+    """Lambdaの残り時間内に応答できない場合の処理"""
+    if _followup_enabled() and not ev.get("followup"):
+        followup = dict(ev)
+        # replyTokenはこの場で使うので、後続処理ではpushで送る
+        followup.pop("replyToken", None)
+        followup["followup"] = True
+        if ev.get("webhookEventId"):
+            followup["webhookEventId"] = f"{ev['webhookEventId']}-followup"
+        if not event_queue.enqueue_events([followup]):
+            if reply_token:
+                send_line_reply(reply_token, FOLLOWUP_MESSAGE, access_token)
+            return None
+        print("[ERROR] Failed to enqueue follow-up")
+    return AGENT_TIMEOUT_MESSAGE, _send_answer(ev, reply_token, AGENT_TIMEOUT_MESSAGE, access_token)
+
+def _send_answer(ev, reply_token, ai_response, access_token, quick_reply=None) -> bool:
+    """返信はreplyを優先（push課金を抑えるため）。送信できたらTrue"""
+    metrics.record("AnswerChars", len(ai_response))
+    try:
+        with metrics.stage("Send"):
+            return _deliver_answer(ev, reply_token, ai_response, access_token, quick_reply)
+    except Exception as e:
+        # 送信の失敗で応答ごと失われないよう、呼び出し側には未送信として返す
+        print(f"[ERROR] LINE send failed: {e}")
+        traceback.print_exc()
+        return False
+
+def _deliver_answer(ev, reply_token, ai_response, access_token, quick_reply=None) -> bool:
+    if reply_token and _allow_push_fallback() and reply_token_expired(ev):
+        # 失敗が分かっているreplyは投げずにpushへ切り替える
+        print("[WARN] replyToken is likely expired; using push")
+        reply_token = None
+    if reply_token:
+        # 吹き出し5個に収まらない長い応答は、push許可時のみ残りをpushで送る
+        push_to = _get_push_destination(ev) if _allow_push_fallback() else None
+        reply_res = send_line_reply(reply_token, ai_response, access_token, push_to, quick_reply)
+        if reply_res.status_code < 400:
+            return True
+        if _allow_push_fallback():
+            print("[WARN] reply failed; trying push fallback")
+            dest = _get_push_destination(ev)
+            if dest:
+                return send_line_push(dest, ai_response, access_token, quick_reply).status_code < 400
+    elif _allow_push_fallback():
+        print("[WARN] replyToken not found; trying push fallback")
+        dest = _get_push_destination(ev)
+        if dest:
+            return send_line_push(dest, ai_response, access_token, quick_reply).status_code < 400
+    return False
+
+def get_dispatch_key(ev) -> str:
+    """並列処理のグループキー（同じ会話のイベントは順番に処理する）"""
+    return _get_push_destination(ev) or _get_user_id(ev)
+
+def process_events(events, access_token, deadline=None):
+    """送信元ごとに順序を保ちつつ、異なる送信元のイベントを並列処理する"""
+    def process_group(group_events):
+        for ev in group_events:
+            try:
+                handle_event(ev, access_token, deadline)
+            except Exception as e:
+                print(f"[ERROR] Event handling error: {e}")
+                traceback.print_exc()
+
+    event_dispatch.run_by_group(events, get_dispatch_key, process_group)
+
 # =========================
 # LINE webhook handler
 # =========================
 def lambda_handler(event, context):
     print("=== Lambda handler started ===")
+    try:
+        with metrics.trace("Webhook", getattr(context, "aws_request_id", None)):
+            response = _handle_webhook(event, context)
+            metrics.set_property("status_code", response["statusCode"])
+            return response
+    finally:
+        # 呼び出し中に集計した利用量をまとめて出力する（凍結・回収に備えてDynamoDBにも書く）
+        usage_meter.flush(force=True)
 
-    CHANNEL_ACCESS_TOKEN = get_secret("CHANNEL_ACCESS_TOKEN")
+def _handle_webhook(event, context):
+    with metrics.stage("GetSecret"):
+        CHANNEL_ACCESS_TOKEN = get_secret("CHANNEL_ACCESS_TOKEN")
     if not CHANNEL_ACCESS_TOKEN:
         return {"statusCode": 500, "body": "CHANNEL_ACCESS_TOKEN is missing"}
 
     try:
-        body_str = event.get("body") or ""
-        if event.get("isBase64Encoded"):
-            import base64
-            body_str = base64.b64decode(body_str).decode("utf-8")
-        body = json.loads(body_str) if body_str else {}
+        with metrics.stage("ParseBody"):
+            body = _parse_body(event)
     except Exception as e:
         print(f"[ERROR] Error parsing body: {e}")
         return {"statusCode": 400, "body": "Invalid body"}
@@ -152,71 +740,23 @@ def lambda_handler(event, context):
     if not body.get("events"):
         return {"statusCode": 200, "body": "OK"}
 
-    for ev in body["events"]:
-        try:
-            if ev.get("type") != "message":
-                continue
-            msg = ev.get("message", {})
-            if msg.get("type") != "text":
-                continue
-
-            reply_token = ev.get("replyToken")
-            received_text = (msg.get("text", "") or "").strip()
-            source = ev.get("source", {}) or {}
-            source_type = source.get("type")
-            user_id = _get_user_id(ev)
-
-            # トリガー判定
-            TRIGGERS = ["@お店", "＠お店"]
-            
-            if source_type == "user":
-                query = received_text
-            else:
-                matched_trigger = None
-                for trigger in TRIGGERS:
-                    if received_text.startswith(trigger):
-                        matched_trigger = trigger
-                        break
-                if not matched_trigger:
-                    continue
-                query = received_text[len(matched_trigger):].strip()
-            
-            if not query:
-                if reply_token:
-                    msg = "条件を教えてください。\n例）上野で静かなカフェ" if source_type == "user" else "使い方：@お店 の後に条件を書いてね。"
-                    send_line_reply(reply_token, msg, CHANNEL_ACCESS_TOKEN)
-                continue
-
-            # 1対1チャットのみ、処理待ちをローディングで可視化
-            if source_type == "user":
-                chat_id = source.get("userId")
-                if chat_id:
-                    start_line_loading(chat_id, _get_loading_seconds(), CHANNEL_ACCESS_TOKEN)
-
-            # AgentCore Runtime呼び出し
-            try:
-                ai_response = _call_agentcore(user_id, query)
-            except Exception as e:
-                print(f"[ERROR] AgentCore error: {e}")
-                traceback.print_exc()
-                ai_response = "申し訳ございません。現在検索サービスに接続できません。"
-
-            # 返信はreplyを優先（push課金を抑えるため）
-            if reply_token:
-                reply_res = send_line_reply(reply_token, ai_response, CHANNEL_ACCESS_TOKEN)
-                if reply_res.status_code >= 400 and _allow_push_fallback():
-                    print("[WARN] reply failed; trying push fallback")
-                    dest = _get_push_destination(ev)
-                    if dest:
-                        send_line_push(dest, ai_response, CHANNEL_ACCESS_TOKEN)
-            elif _allow_push_fallback():
-                print("[WARN] replyToken not found; trying push fallback")
-                dest = _get_push_destination(ev)
-                if dest:
-                    send_line_push(dest, ai_response, CHANNEL_ACCESS_TOKEN)
+    events = body["events"]
+    metrics.record("WebhookEvents", len(events))
+    register_events(events)
 
+    # queueモード：イベントをSQSに積んで即座に200を返す
+    # （位置情報・postbackと、積めなかった分はここで同期処理する。同じ会話の順序は受信順のまま）
+    if _webhook_mode() == "queue":
+        try:
+            with metrics.stage("Enqueue"):
+                failed = event_queue.enqueue_events([ev for ev in events if _should_enqueue(ev)])
+            failed_ids = {id(ev) for ev in failed}
+            events = [ev for ev in events if not _should_enqueue(ev) or id(ev) in failed_ids]
         except Exception as e:
-            print(f"[ERROR] Event handling error: {e}")
+            print(f"[ERROR] Enqueue failed; falling back to sync processing: {e}")
             traceback.print_exc()
 
+    with metrics.stage("ProcessEvents"):
+        process_events(events, CHANNEL_ACCESS_TOKEN, Deadline.from_context(context))
+
     return {"statusCode": 200, "body": "OK"}
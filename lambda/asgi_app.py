@@ -0,0 +1,486 @@
+"""
+LINE webhookを常駐プロセスで受けるASGIサーバー（Starlette）。
+
+Lambda版（app.lambda_handler）と同じトリガー判定・応答の組み立てを使い、
+AgentCore / LINE APIの呼び出しだけをasyncioで行う。AgentCoreの応答待ち（数秒）の間に
+スレッドを占有しないので、1プロセスで多数のイベントを同時に処理できる。
+- X-Line-Signature（CHANNEL_SECRET）を検証し、webhookは受信したら即座に200を返し、イベントはタスクとして処理する
+- 同じ会話（送信元）のイベントは順番に処理する（app.get_dispatch_key）
+- 同時に処理するイベント数・AgentCore / LINE APIの同時呼び出し数をセマフォで制限する
+- 処理待ちが ASGI_MAX_PENDING_EVENTS を超えたら503を返す（LINEの再送に任せる）
+- Places API・DynamoDB・SSMなど同期クライアントの呼び出しは上限付きのスレッドプールで実行する
+- GET /healthz : 死活監視
+- GET /metrics : Prometheus形式のメトリクス（処理中・待ち・セマフォ使用数・ブレーカー・処理時間・RSS）
+
+起動:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import json
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import app as webhook
+import circuit_breaker
+import idempotency
+import line_api
+import message_packer
+import metrics
+import query_cache
+import singleflight
+import usage_meter
+from async_clients import AsyncAgentCore, AsyncLineApi
+from circuit_breaker import agentcore_breaker, line_breaker, loading_breaker
+from deadline import reply_token_expired
+from env import get_float, get_int
+
+# /metrics で分位点を出すために保持する直近のイベント処理時間の数
+LATENCY_WINDOW = 1000
+
+
+class _State:
+    """プロセス内で共有するクライアント・セマフォ・カウンター"""
+
+    def __init__(self):
+        self.access_token = None
+        self.channel_secret = None
+        self.http = None
+        self.line = None
+        self.agent = None
+        self.events = asyncio.Semaphore(get_int("ASGI_MAX_CONCURRENT_EVENTS", 500))
+        self.max_pending = get_int("ASGI_MAX_PENDING_EVENTS", 2000)
+        self.pending = 0
+        self.in_flight = 0
+        self.tasks = set()
+        # 会話ごとの [ロック, 待っているイベント数]
+        self.conversations = {}
+        # 同じ検索条件のAgentCore呼び出しを1回にまとめる（singleflight.flight_key -> Future）
+        self.flights = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = {
+            "webhook_requests": 0,
+            "webhook_rejected": 0,
+            "events_completed": 0,
+            "events_failed": 0,
+            "singleflight_shared": 0,
+        }
+
+
+_state = None
+
+
+async def _blocking(fn, *args):
+    """同期関数をスレッドプールで実行する（トレースはasyncio.to_threadが引き継ぐ）"""
+    return await asyncio.to_thread(fn, *args)
+
+
+# =========================
+# LINE senders
+# =========================
+async def send_line_reply(reply_token, message, push_to=None, quick_reply=None):
+    """app.send_line_reply と同じ（5個に収まらない分は push_to があれば1回のpushで送る）"""
+    batches = message_packer.pack(message, max_calls=2 if push_to else 1, quick_reply=quick_reply)
+    res = await _state.line.reply(reply_token, batches[0])
+    print(f"[DEBUG] LINE REPLY status: {res.status_code}")
+    if res.status_code < 400 and len(batches) > 1:
+        await _push_messages(push_to, batches[1])
+    webhook._record_packing(batches)
+    return res
+
+
+async def send_line_push(to_id, message, quick_reply=None):
+    batches = message_packer.pack(message, max_calls=2, quick_reply=quick_reply)
+    for messages in batches:
+        res = await _push_messages(to_id, messages)
+        if res.status_code >= 400:
+            break
+    webhook._record_packing(batches)
+    return res
+
+
+async def _push_messages(to_id, messages):
+    res = await _state.line.push(to_id, messages)
+    print(f"[DEBUG] LINE PUSH status: {res.status_code}")
+    metrics.put_metric("LinePushMessages", 1)
+    usage_meter.add(push_calls=1, push_messages=len(messages))
+    return res
+
+
+async def _keep_loading(chat_id: str, loading_seconds: int):
+    """AgentCoreの応答を待つ間、ローディング表示を出し続ける（キャンセルで終了）"""
+    interval = max(1.0, loading_seconds - 1.0)
+    while True:
+        try:
+            await _state.line.start_loading(chat_id, loading_seconds)
+        except Exception as e:
+            print(f"[WARN] LINE LOADING failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def _send_answer(ev, reply_token, ai_response, quick_reply=None) -> bool:
+    """app._send_answer と同じ（replyを優先し、許可されていればpushにフォールバック）"""
+    metrics.record("AnswerChars", len(ai_response))
+    try:
+        with metrics.stage("Send"):
+            return await _deliver_answer(ev, reply_token, ai_response, quick_reply)
+    except Exception as e:
+        print(f"[ERROR] LINE send failed: {e}")
+        traceback.print_exc()
+        return False
+
+
+async def _deliver_answer(ev, reply_token, ai_response, quick_reply=None) -> bool:
+    allow_push = webhook._allow_push_fallback()
+    dest = webhook._get_push_destination(ev) if allow_push else None
+    if reply_token and allow_push and reply_token_expired(ev):
+        print("[WARN] replyToken is likely expired; using push")
+        reply_token = None
+    if reply_token:
+        reply_res = await send_line_reply(reply_token, ai_response, dest, quick_reply)
+        if reply_res.status_code < 400:
+            return True
+        if dest:
+            print("[WARN] reply failed; trying push fallback")
+            return (await send_line_push(dest, ai_response, quick_reply)).status_code < 400
+    elif dest:
+        print("[WARN] replyToken not found; trying push fallback")
+        return (await send_line_push(dest, ai_response, quick_reply)).status_code < 400
+    return False
+
+
+# =========================
+# AgentCore
+# =========================
+async def _call_agentcore(user_id: str, query: str) -> str:
+    payload = {"prompt": query, "user_id": user_id}
+    correlation_id = metrics.current_correlation_id()
+    if correlation_id:
+        payload["correlation_id"] = correlation_id
+
+    started = time.perf_counter()
+    pieces = []
+    try:
+        async for text in _state.agent.stream(payload):
+            if not pieces:
+                metrics.record("AgentCoreFirstChunkMs", round((time.perf_counter() - started) * 1000, 1), "Milliseconds")
+            pieces.append(text)
+    except Exception:
+        usage_meter.add(agent_errors=1)
+        raise
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.record("AgentCoreMs", round(elapsed_ms, 1), "Milliseconds")
+        metrics.record("AgentCoreResponseChars", sum(len(p) for p in pieces))
+        usage_meter.add(agent_calls=1, agent_ms=elapsed_ms, agent_bytes=sum(len(p.encode("utf-8")) for p in pieces))
+    return "".join(pieces) or webhook.EMPTY_RESPONSE_MESSAGE
+
+
+async def _ask_agent(user_id: str, query: str) -> str:
+    """
+    AgentCoreに問い合わせ、得られた応答をキャッシュする。
+    同じ検索条件が処理中なら、その結果を待って共有する（プロセス内のsingle-flight）。
+    キーと対象外の質問（会話の文脈に依存する質問）はLambda版の singleflight と同じ
+    """
+    key = singleflight.flight_key(query)
+    if key is None:
+        return await _ask_agent_once(user_id, query)
+
+    flight = _state.flights.get(key)
+    if flight is not None:
+        _state.counters["singleflight_shared"] += 1
+        metrics.record("SingleFlightShared", 1)
+        return await asyncio.shield(flight)
+
+    flight = asyncio.get_running_loop().create_future()
+    _state.flights[key] = flight
+    try:
+        answer = await _ask_agent_once(user_id, query)
+        flight.set_result(answer)
+        return answer
+    except asyncio.CancelledError:
+        flight.cancel()
+        raise
+    except Exception as e:
+        flight.set_exception(e)
+        # 待っている呼び出しがなければ例外の取り出し漏れの警告を出さない
+        flight.exception()
+        raise
+    finally:
+        _state.flights.pop(key, None)
+
+
+async def _ask_agent_once(user_id: str, query: str) -> str:
+    started = time.monotonic()
+    answer = await _call_agentcore(user_id, query)
+    if answer != webhook.EMPTY_RESPONSE_MESSAGE:
+        await _blocking(query_cache.put, query, answer, (time.monotonic() - started) * 1000)
+    return answer
+
+
+# =========================
+# Event handling
+# =========================
+async def _process_message(ev):
+    """
+    app._process_message の非同期版。判断は app.plan_message と共通で、LINE・AgentCoreの呼び出しだけを
+    asyncioで行う（連続メッセージの結合と段階送信は行わない）。
+
+    Returns:
+        (応答, 送信できたか)。応答を作らなかった場合はNone
+    """
+    plan = await _blocking(webhook.plan_message, ev, None, False)
+    if plan is None:
+        return None
+    reply_token = ev.get("replyToken")
+    if plan.kind == webhook.Plan.NOTICE:
+        if reply_token:
+            await send_line_reply(reply_token, plan.text)
+        return None
+    if plan.kind == webhook.Plan.ANSWER:
+        return plan.text, await _send_answer(ev, reply_token, plan.text, plan.quick_reply)
+
+    loading = None
+    chat_id = webhook.loading_chat_id(ev)
+    if chat_id:
+        loading = asyncio.create_task(_keep_loading(chat_id, webhook._get_loading_seconds()))
+
+    try:
+        ai_response = await _ask_agent(webhook._get_user_id(ev), plan.query)
+    except Exception as e:
+        ai_response = webhook.agent_error_answer(e)
+    finally:
+        if loading:
+            loading.cancel()
+
+    return ai_response, await _send_answer(ev, reply_token, ai_response)
+
+
+async def _handle_event(ev):
+    """app._handle_event と同じ（LINEの再送で同じイベントを二重に処理しない）"""
+    event_id = ev.get("webhookEventId")
+    if not event_id:
+        await _blocking(webhook.record_result, ev, None, await _process_message(ev))
+        return
+
+    existing = await _blocking(idempotency.begin, event_id)
+    if existing is not None:
+        if webhook.needs_replay(ev, existing):
+            delivered = (await _send_answer(ev, ev.get("replyToken"), existing.answer)
+                         or await _blocking(webhook._defer_delivery, ev, existing.answer))
+            await _blocking(idempotency.complete, event_id, existing.answer, delivered)
+        return
+
+    try:
+        result = await _process_message(ev)
+    except BaseException:
+        await _blocking(idempotency.release, event_id)
+        raise
+    await _blocking(webhook.record_result, ev, event_id, result)
+
+
+async def _run_event(ev):
+    """会話ごとに順番を保ち、同時処理数の上限内でイベント1件を処理する"""
+    key = webhook.get_dispatch_key(ev)
+    entry = _state.conversations.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0], _state.events:
+            _state.in_flight += 1
+            started = time.monotonic()
+            try:
+                with metrics.trace("Event", ev.get("webhookEventId")), webhook.usage_subject(ev):
+                    metrics.set_property("event_type", ev.get("type"))
+                    metrics.set_property("source_type", (ev.get("source") or {}).get("type"))
+                    usage_meter.add(events=1)
+                    await _handle_event(ev)
+                _state.counters["events_completed"] += 1
+            except Exception as e:
+                _state.counters["events_failed"] += 1
+                print(f"[ERROR] Event handling error: {e}")
+                traceback.print_exc()
+            finally:
+                _state.in_flight -= 1
+                _state.latencies.append(time.monotonic() - started)
+    finally:
+        _state.pending -= 1
+        entry[1] -= 1
+        if not entry[1]:
+            _state.conversations.pop(key, None)
+
+
+async def _flush_usage():
+    """利用量を USAGE_FLUSH_INTERVAL_SEC ごとにまとめて出力する"""
+    interval = max(1, get_int("USAGE_FLUSH_INTERVAL_SEC", 60))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _blocking(usage_meter.flush)
+        except Exception as e:
+            print(f"[WARN] Usage flush failed: {e}")
+
+
+def _spawn(ev):
+    _state.pending += 1
+    task = asyncio.create_task(_run_event(ev))
+    # 完了前にGCされないよう参照を持っておく
+    _state.tasks.add(task)
+    task.add_done_callback(_state.tasks.discard)
+
+
+# =========================
+# HTTP endpoints
+# =========================
+async def callback(request):
+    _state.counters["webhook_requests"] += 1
+    raw = await request.body()
+    # 公開エンドポイントなので、LINEから送られたことを確かめてから本文を読む
+    if not line_api.verify_signature(raw, request.headers.get("X-Line-Signature"), _state.channel_secret):
+        print("[WARN] Invalid X-Line-Signature; rejecting webhook")
+        return _response(401, "Invalid signature")
+    try:
+        body = json.loads(raw or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("body is not a JSON object")
+    except ValueError as e:
+        print(f"[ERROR] Error parsing body: {e}")
+        return _response(400, "Invalid body")
+
+    events = body.get("events") or []
+    if not events:
+        return _response(200, "OK")
+    if _state.pending + len(events) > _state.max_pending:
+        # 処理しきれないので受け取らない（LINEの再送に任せる）
+        _state.counters["webhook_rejected"] += 1
+        print(f"[WARN] Too many pending events ({_state.pending}); rejecting webhook")
+        return _response(503, "Busy")
+
+    metrics.put_metric("WebhookEvents", len(events))
+    for ev in events:
+        _spawn(ev)
+    return _response(200, "OK")
+
+
+async def healthz(request):
+    return _response(200, "OK")
+
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def _quantile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def render_metrics() -> str:
+    """Prometheusのテキスト形式"""
+    lines = []
+
+    def add(name, kind, value, help_text, labels=""):
+        lines.append(f"# HELP linebot_{name} {help_text}")
+        lines.append(f"# TYPE linebot_{name} {kind}")
+        lines.append(f"linebot_{name}{labels} {value}")
+
+    for name, value in _state.counters.items():
+        add(f"{name}_total", "counter", value, name.replace("_", " "))
+    add("events_in_flight", "gauge", _state.in_flight, "events being processed")
+    add("events_pending", "gauge", _state.pending, "events accepted but not finished")
+    add("agentcore_in_flight", "gauge", _state.agent.limiter.in_flight if _state.agent else 0,
+        "AgentCore calls in flight")
+    add("line_in_flight", "gauge", _state.line.limiter.in_flight if _state.line else 0, "LINE API calls in flight")
+    add("singleflight_keys", "gauge", len(_state.flights), "distinct queries waiting for AgentCore")
+
+    lines.append("# HELP linebot_circuit_state circuit breaker state (0=CLOSED, 1=HALF_OPEN, 2=OPEN)")
+    lines.append("# TYPE linebot_circuit_state gauge")
+    for breaker in (agentcore_breaker, line_breaker, loading_breaker):
+        snap = breaker.snapshot()
+        lines.append(f'linebot_circuit_state{{name="{snap["name"]}"}} {circuit_breaker._STATE_VALUES[snap["state"]]}')
+
+    ordered = sorted(_state.latencies)
+    lines.append("# HELP linebot_event_seconds event processing time (recent events)")
+    lines.append("# TYPE linebot_event_seconds summary")
+    for q in (0.5, 0.95, 0.99):
+        lines.append(f'linebot_event_seconds{{quantile="{q}"}} {_quantile(ordered, q):.4f}')
+    lines.append(f"linebot_event_seconds_count {len(ordered)}")
+
+    rss = _rss_bytes()
+    if rss is not None:
+        add("process_resident_memory_bytes", "gauge", rss, "resident memory")
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(request):
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _response(status: int, text: str):
+    from starlette.responses import PlainTextResponse
+    return PlainTextResponse(text, status_code=status)
+
+
+@asynccontextmanager
+async def lifespan(starlette_app):
+    global _state
+    import httpx
+
+    _state = _State()
+    # 同期クライアント（boto3・requests）の呼び出し用。上限を超えた分は待たせる
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=get_int("ASGI_BLOCKING_THREADS", 32))
+    loop.set_default_executor(executor)
+
+    _state.access_token = await _blocking(webhook.get_secret, "CHANNEL_ACCESS_TOKEN")
+    if not _state.access_token:
+        raise RuntimeError("CHANNEL_ACCESS_TOKEN is missing")
+    _state.channel_secret = await _blocking(webhook.get_secret, "CHANNEL_SECRET")
+    if not _state.channel_secret:
+        raise RuntimeError("CHANNEL_SECRET is missing")
+    limits = httpx.Limits(
+        max_connections=get_int("ASGI_MAX_CONNECTIONS", 400),
+        max_keepalive_connections=get_int("ASGI_MAX_KEEPALIVE", 100),
+    )
+    _state.http = httpx.AsyncClient(limits=limits)
+    _state.line = AsyncLineApi(_state.http, _state.access_token)
+    _state.agent = AsyncAgentCore(_state.http, webhook.AGENT_RUNTIME_ARN)
+    await _blocking(_state.agent.load_credentials)
+    usage_flusher = asyncio.create_task(_flush_usage())
+    print("[INFO] ASGI webhook server started")
+    try:
+        yield
+    finally:
+        # 受け付け済みのイベントを処理し終えてから止める
+        if _state.tasks:
+            await asyncio.wait(set(_state.tasks), timeout=get_float("ASGI_SHUTDOWN_TIMEOUT", 30))
+        usage_flusher.cancel()
+        await _blocking(usage_meter.flush, True)
+        await _state.http.aclose()
+        executor.shutdown(wait=False)
+
+
+def create_app():
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+
+    return Starlette(
+        routes=[
+            Route("/callback", callback, methods=["POST"]),
+            Route("/healthz", healthz, methods=["GET"]),
+            Route("/metrics", metrics_endpoint, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
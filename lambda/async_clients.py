@@ -0,0 +1,208 @@
+"""
+ASGIサーバー（asgi_app）用の非同期HTTPクライアント。
+
+Lambda版の line_api / agentcore_client と同じ設定・サーキットブレーカー・トレース記録で、
+LINE Messaging API と AgentCore Runtime を httpx.AsyncClient から呼び出す。
+- 1プロセスで1つのAsyncClient（コネクションプール）を共有する
+- 同時呼び出し数はセマフォで制限する（待たされた時間も {stage}WaitMs として記録）
+- LINE: 429/5xxはバックオフ付きでリトライ（Retry-Afterに従う。pushはX-Line-Retry-Keyで重複送信を防止）
+- AgentCore: botocoreの認証情報でSigV4署名したリクエストを送り、SSEを逐次デコードする
+  （認証情報は起動時に解決し、更新が必要なときだけスレッドで取得してイベントループを止めない）
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from urllib.parse import quote
+
+import line_api
+import metrics
+import sse
+from agentcore_client import REGION
+from circuit_breaker import CircuitBreaker, agentcore_breaker, line_breaker, loading_breaker
+from env import get_float, get_int
+
+DEFAULT_AGENTCORE_ENDPOINT = f"https://bedrock-agentcore.{REGION}.amazonaws.com"
+
+
+class _Limiter:
+    """セマフォと実行中の数（/metrics 用）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        await self._semaphore.acquire()
+        self.in_flight += 1
+        return time.monotonic() - started
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+
+class AsyncLineApi:
+    def __init__(self, client, access_token: str, concurrency: int | None = None):
+        self._client = client
+        self._headers = {"Content-Type": "application/json", "Authorization": f"Bearer {access_token}"}
+        self.limiter = _Limiter(concurrency or get_int("ASGI_LINE_CONCURRENCY", 100))
+
+    async def post(self, endpoint: str, path: str, payload: dict, headers: dict | None = None,
+                   breaker: CircuitBreaker = line_breaker):
+        """LINE APIへJSONをPOSTする（LINE APIが劣化中は送信せずに503相当を返す）"""
+        stage = f"Line{endpoint.capitalize()}"
+        if not breaker.allow():
+            print(f"[WARN] LINE circuit is open; skipped {endpoint}")
+            metrics.set_property(f"line_{endpoint}_status", "circuit_open")
+            return line_api.UnsentResponse()
+
+        data = json.dumps(payload).encode("utf-8")
+        metrics.record(f"{stage}Bytes", len(data), "Bytes")
+        connect, read = line_api._timeout(endpoint)
+        retries = get_int("LINE_MAX_RETRIES", 2)
+        backoff = get_float("LINE_RETRY_BACKOFF", 0.3)
+        started = time.monotonic()
+        try:
+            async with self.limiter as waited:
+                metrics.record(f"{stage}WaitMs", round(waited * 1000, 1), "Milliseconds")
+                for attempt in range(retries + 1):
+                    res = await self._client.post(
+                        f"{line_api._base_url()}{path}",
+                        content=data,
+                        headers={**self._headers, **(headers or {})},
+                        timeout=_httpx_timeout(connect, read),
+                    )
+                    if not line_api._is_failure_status(res.status_code) or attempt == retries:
+                        break
+                    retry_after = res.headers.get("Retry-After")
+                    await asyncio.sleep(float(retry_after) if retry_after and retry_after.isdigit()
+                                        else backoff * (2 ** attempt))
+        except Exception as e:
+            breaker.record(True, time.monotonic() - started)
+            metrics.set_property(f"line_{endpoint}_status", type(e).__name__)
+            raise
+        finally:
+            metrics.record(f"{stage}Ms", round((time.monotonic() - started) * 1000, 1), "Milliseconds")
+        breaker.record(line_api._is_failure_status(res.status_code), time.monotonic() - started)
+        metrics.set_property(f"line_{endpoint}_status", res.status_code)
+        if res.status_code >= 400:
+            metrics.record(f"{stage}Errors", 1)
+        return res
+
+    async def reply(self, reply_token: str, messages: list[dict]):
+        return await self.post("reply", "/v2/bot/message/reply", {
+            "replyToken": reply_token,
+            "messages": messages,
+        })
+
+    async def push(self, to_id: str, messages: list[dict]):
+        # リトライ時に同じメッセージが二重送信されないようにする
+        return await self.post("push", "/v2/bot/message/push", {
+            "to": to_id,
+            "messages": messages,
+        }, headers={"X-Line-Retry-Key": str(uuid.uuid4())})
+
+    async def start_loading(self, chat_id: str, loading_seconds: int):
+        return await self.post("loading", "/v2/bot/chat/loading/start", {
+            "chatId": chat_id,
+            "loadingSeconds": loading_seconds,
+        }, breaker=loading_breaker)
+
+
+def _httpx_timeout(connect: float, read: float):
+    import httpx
+    return httpx.Timeout(read, connect=connect)
+
+
+class AsyncAgentCore:
+    """
+    AgentCore Runtimeの invoke_agent_runtime を非同期に呼び出す。
+    boto3と同じ認証情報の解決（環境変数・ロール）を使い、リクエストごとにSigV4署名する。
+    """
+
+    def __init__(self, client, runtime_arn: str, concurrency: int | None = None):
+        self._client = client
+        self._runtime_arn = runtime_arn
+        self._endpoint = (os.environ.get("AGENTCORE_ENDPOINT_URL") or DEFAULT_AGENTCORE_ENDPOINT).rstrip("/")
+        self._credentials = None
+        self.limiter = _Limiter(concurrency or get_int("ASGI_AGENTCORE_CONCURRENCY", 200))
+
+    def load_credentials(self):
+        """
+        AWS認証情報を解決する。
+
+        認証情報の探索（IMDS・STSへの問い合わせを含む）は同期通信なので、起動時にスレッドで1回だけ呼ぶ。
+        """
+        import botocore.session
+
+        credentials = botocore.session.get_session().get_credentials()
+        if credentials is None:
+            raise RuntimeError("AWS credentials are not available")
+        self._credentials = credentials
+
+    def _sign(self, url: str, body: bytes) -> dict:
+        from botocore.auth import SigV4Auth
+        from botocore.awsrequest import AWSRequest
+
+        if self._credentials is None:
+            self.load_credentials()
+        request = AWSRequest(method="POST", url=url, data=body, headers={
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream, application/json",
+        })
+        SigV4Auth(self._credentials.get_frozen_credentials(), "bedrock-agentcore", REGION).add_auth(request)
+        return dict(request.headers.items())
+
+    async def _signed_headers(self, url: str, body: bytes) -> dict:
+        """SigV4署名したヘッダーを返す（認証情報の取得・更新が必要なときだけスレッドで署名する）"""
+        credentials = self._credentials
+        refresh_needed = getattr(credentials, "refresh_needed", None)
+        if credentials is None or (refresh_needed is not None and refresh_needed()):
+            return await asyncio.to_thread(self._sign, url, body)
+        return self._sign(url, body)
+
+    async def stream(self, payload: dict, read_timeout: float | None = None):
+        """応答テキストを届いた順に返す（非同期ジェネレーター）"""
+        url = f"{self._endpoint}/runtimes/{quote(self._runtime_arn, safe='')}/invocations"
+        body = json.dumps(payload).encode("utf-8")
+        timeout = _httpx_timeout(
+            get_float("AGENTCORE_CONNECT_TIMEOUT", 5),
+            read_timeout or get_float("AGENTCORE_READ_TIMEOUT", 55),
+        )
+        with agentcore_breaker.guard():
+            async with self.limiter as waited:
+                metrics.record("AgentCoreWaitMs", round(waited * 1000, 1), "Milliseconds")
+                headers = await self._signed_headers(url, body)
+                with metrics.stage("AgentCoreInvoke"):
+                    request = self._client.build_request("POST", url, content=body, headers=headers, timeout=timeout)
+                    response = await self._client.send(request, stream=True)
+                try:
+                    if response.status_code >= 400:
+                        detail = (await response.aread())[:200]
+                        raise RuntimeError(f"AgentCore returned {response.status_code}: {detail!r}")
+                    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                        raw = await response.aread()
+                        if raw.startswith(b"data:"):
+                            decoder = sse.SSEDecoder()
+                            for ev in decoder.feed(raw) + decoder.close():
+                                if ev.event == "message" and ev.data:
+                                    yield sse.decode_data(ev.data)
+                        elif raw:
+                            yield sse.decode_data(raw.decode("utf-8"))
+                        return
+                    decoder = sse.SSEDecoder()
+                    async for chunk in response.aiter_raw():
+                        for ev in decoder.feed(chunk):
+                            if ev.event == "message" and ev.data:
+                                yield sse.decode_data(ev.data)
+                    for ev in decoder.close():
+                        if ev.event == "message" and ev.data:
+                            yield sse.decode_data(ev.data)
+                finally:
+                    await response.aclose()
@@ -0,0 +1,193 @@
+"""
+外部サービス（AgentCore / LINE API）呼び出しのサーキットブレーカー。
+
+コンテナ内で共有し、相手が劣化しているときにタイムアウトまで待たずに即座に失敗させる。
+- CLOSED    : 通常。直近 window_size 件の失敗率・遅延率がしきい値を超えたらOPEN
+- OPEN      : open_sec の間は呼び出さずに CircuitOpenError
+- HALF_OPEN : 試しに half_open_max_calls 件だけ通し、成功すればCLOSED、失敗すればOPEN
+状態遷移はメトリクス（CircuitState: 0=CLOSED, 1=HALF_OPEN, 2=OPEN）として出力する。
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+from env import get_float
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """ブレーカーがOPENのため呼び出しを行わなかった"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5,
+                 slow_call_sec: float = 30.0, slow_rate_threshold: float = 0.8,
+                 window_size: int = 20, min_calls: int = 5, open_sec: float = 30.0,
+                 half_open_max_calls: int = 1, clock=time.monotonic):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_sec = slow_call_sec
+        self.slow_rate_threshold = slow_rate_threshold
+        self.min_calls = min_calls
+        self.open_sec = open_sec
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        # (失敗したか, 遅かったか)
+        self._window = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, slow_call_sec: float) -> "CircuitBreaker":
+        return cls(
+            name,
+            failure_rate_threshold=get_float(f"{prefix}_CB_FAILURE_RATE", 0.5),
+            slow_call_sec=get_float(f"{prefix}_CB_SLOW_CALL_SEC", slow_call_sec),
+            slow_rate_threshold=get_float(f"{prefix}_CB_SLOW_RATE", 0.8),
+            window_size=int(get_float(f"{prefix}_CB_WINDOW", 20)),
+            min_calls=int(get_float(f"{prefix}_CB_MIN_CALLS", 5)),
+            open_sec=get_float(f"{prefix}_CB_OPEN_SEC", 30),
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _transition(self, state: str):
+        if self._state == state:
+            return
+        print(f"[WARN] Circuit {self.name}: {self._state} -> {state}")
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state in (OPEN, CLOSED):
+            self._window.clear()
+        self._half_open_calls = 0
+        metrics.put_metric("CircuitState", _STATE_VALUES[state], "None", {"Breaker": self.name})
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_sec:
+            self._transition(HALF_OPEN)
+
+    def allow(self) -> bool:
+        """呼び出してよいか（HALF_OPENでは試行枠を1つ消費する）"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+        metrics.put_metric("CircuitRejected", 1, dimensions={"Breaker": self.name})
+        return False
+
+    def record(self, failed: bool, duration_sec: float):
+        slow = duration_sec >= self.slow_call_sec
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN if failed or slow else CLOSED)
+                return
+            if self._state == OPEN:
+                return
+            self._window.append((failed, slow))
+            n = len(self._window)
+            if n < self.min_calls:
+                return
+            failure_rate = sum(1 for f, _ in self._window if f) / n
+            slow_rate = sum(1 for _, s in self._window if s) / n
+            if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_rate_threshold:
+                self._transition(OPEN)
+
+    def release(self):
+        """結果を記録せずに試行枠を返す（呼び出しが途中で打ち切られた場合）"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def guard(self, is_failure=None):
+        """
+        with breaker.guard(): ... の形で呼び出しを囲む。
+        OPEN中は CircuitOpenError を送出する。
+        """
+        return _Guard(self, is_failure)
+
+    def reset(self):
+        """状態を破棄してCLOSEDに戻す（テスト用）"""
+        with self._lock:
+            self._window.clear()
+            self._state = CLOSED
+            self._opened_at = 0.0
+            self._half_open_calls = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            n = len(self._window)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": n,
+                "failure_rate": (sum(1 for f, _ in self._window if f) / n) if n else 0.0,
+                "slow_rate": (sum(1 for _, s in self._window if s) / n) if n else 0.0,
+            }
+
+
+class _Guard:
+    def __init__(self, breaker: CircuitBreaker, is_failure):
+        self._breaker = breaker
+        self._is_failure = is_failure
+        self._started = 0.0
+        self._paused_sec = 0.0
+
+    def __enter__(self):
+        if not self._breaker.allow():
+            raise CircuitOpenError(f"circuit {self._breaker.name} is open")
+        self._started = self._breaker._clock()
+        return self
+
+    @contextmanager
+    def paused(self):
+        """
+        with guard.paused(): yield ... の形で、呼び出し側に制御を渡している間を所要時間から除く
+        （ストリームの受け手がLINEへの送信などで待たせた時間を相手の遅延として数えない）
+        """
+        started = self._breaker._clock()
+        try:
+            yield
+        finally:
+            self._paused_sec += self._breaker._clock() - started
+
+    def elapsed(self) -> float:
+        """相手の処理にかかった時間（秒）"""
+        return self._breaker._clock() - self._started - self._paused_sec
+
+    def __exit__(self, exc_type, exc, tb):
+        # ジェネレーターの途中終了などは結果に含めないが、HALF_OPENの試行枠は返す
+        if exc_type is not None and not issubclass(exc_type, Exception):
+            self._breaker.release()
+            return False
+        failed = exc is not None
+        if self._is_failure is not None and exc is not None:
+            failed = self._is_failure(exc)
+        self._breaker.record(failed, self.elapsed())
+        return False
+
+
+# コンテナ内で共有するブレーカー
+agentcore_breaker = CircuitBreaker.from_env("agentcore", "AGENTCORE", slow_call_sec=30.0)
+line_breaker = CircuitBreaker.from_env("line", "LINE", slow_call_sec=5.0)
+# ローディング表示は表示できなくても困らないので、reply/pushとは別に数える
+# （ローディング表示の失敗で line_breaker が開き、応答が送れなくならないように）
+loading_breaker = CircuitBreaker.from_env("line_loading", "LINE_LOADING", slow_call_sec=2.0)
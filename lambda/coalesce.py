@@ -0,0 +1,289 @@
+"""
+同じユーザーから立て続けに届いたメッセージを1回の検索にまとめるモジュール。
+
+「渋谷で」「静かな」「カフェ」のように分けて送られた依頼を、
+COALESCE_WINDOW_SEC 以内の連続したメッセージとして1つのクエリに結合する。
+- 受信時（Webhook）に register でメッセージを記録する
+- 処理時（Webhook同期モード・worker）に settle で、後続メッセージが届かないまま
+  ウィンドウが過ぎるのを待つ。後続メッセージがあればNoneを返し、最後のメッセージの
+  処理で全体をまとめて応答する（返信に使うのは最後のreplyTokenだけ）
+- 時刻はLINEイベントの timestamp（ミリ秒）で比較する
+
+メッセージはDynamoDB（COALESCE_TABLE）でコンテナ間（Webhookとworkerの間も含む）で共有する。
+別々のWebhook呼び出しで届いたメッセージはプロセス内のストアではまとめられないので、
+COALESCE_TABLE がなければ COALESCE_WINDOW_SEC を設定しても結合は行わない。
+"""
+
+import os
+import threading
+import time
+
+import metrics
+from dynamodb import get_dynamodb_client
+from env import get_float
+
+# 1件分のメッセージ (timestamp_ms, webhookEventId, query)
+Entry = tuple[int, str, str]
+
+
+def window_sec() -> float:
+    """0以下なら無効"""
+    return get_float("COALESCE_WINDOW_SEC", 0)
+
+
+def _entry_ttl_sec(window: float) -> int:
+    # 処理されずに残ったメッセージ（後続の処理が失敗した場合など）を捨てるまでの時間
+    return int(max(60.0, window * 10))
+
+
+class LocalStore:
+    """プロセス内のストア（同じプロセスで受信・処理されるメッセージのみまとめられる。テスト・ローカル実行用）"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._entries = {}
+        # 後続メッセージにまとめられたメッセージ {(key, webhookEventId): expires_at}
+        self._absorbed = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, entry: Entry, ttl_sec: int):
+        with self._lock:
+            self._entries.setdefault(key, {})[entry[1]] = (entry, self._clock() + ttl_sec)
+            self._evict_expired()
+
+    def mark_absorbed(self, key: str, event_ids: list[str], ttl_sec: int):
+        with self._lock:
+            for event_id in event_ids:
+                self._absorbed[(key, event_id)] = self._clock() + ttl_sec
+
+    def is_absorbed(self, key: str, event_id: str) -> bool:
+        with self._lock:
+            return self._absorbed.get((key, event_id), 0) > self._clock()
+
+    def load(self, key: str) -> list[Entry]:
+        now = self._clock()
+        with self._lock:
+            return [e for e, expires_at in self._entries.get(key, {}).values() if expires_at > now]
+
+    def remove(self, key: str, entries: list[Entry]):
+        with self._lock:
+            bucket = self._entries.get(key)
+            if bucket is None:
+                return
+            for entry in entries:
+                bucket.pop(entry[1], None)
+            if not bucket:
+                del self._entries[key]
+
+    def _evict_expired(self):
+        now = self._clock()
+        for key in list(self._entries):
+            bucket = self._entries[key]
+            for event_id in [i for i, (_, expires_at) in bucket.items() if expires_at <= now]:
+                del bucket[event_id]
+            if not bucket:
+                del self._entries[key]
+        for absorbed in [a for a, expires_at in self._absorbed.items() if expires_at <= now]:
+            del self._absorbed[absorbed]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._absorbed.clear()
+
+
+def _encode(entry: Entry) -> str:
+    ts, event_id, query = entry
+    return f"{ts}\t{event_id}\t{query}"
+
+
+def _decode(raw: str) -> Entry:
+    ts, event_id, query = raw.split("\t", 2)
+    return int(ts), event_id, query
+
+
+class DynamoStore:
+    """
+    キーごとに1アイテム、メッセージを文字列セットで持つ（同じメッセージの再登録は冪等）。
+    後続メッセージにまとめられたメッセージは「{key}#absorbed#{webhookEventId}」のアイテムで記録する
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def add(self, key: str, entry: Entry, ttl_sec: int):
+        get_dynamodb_client().update_item(
+            TableName=self.table_name,
+            Key={"pk": {"S": key}},
+            UpdateExpression="ADD entries :e SET expires_at = :exp",
+            ExpressionAttributeValues={
+                ":e": {"SS": [_encode(entry)]},
+                ":exp": {"N": str(int(time.time()) + ttl_sec)},
+            },
+        )
+
+    def load(self, key: str) -> list[Entry]:
+        res = get_dynamodb_client().get_item(
+            TableName=self.table_name, Key={"pk": {"S": key}}, ConsistentRead=True,
+        )
+        item = res.get("Item") or {}
+        return [_decode(raw) for raw in item.get("entries", {}).get("SS", [])]
+
+    def remove(self, key: str, entries: list[Entry]):
+        get_dynamodb_client().update_item(
+            TableName=self.table_name,
+            Key={"pk": {"S": key}},
+            UpdateExpression="DELETE entries :e",
+            ExpressionAttributeValues={":e": {"SS": [_encode(e) for e in entries]}},
+        )
+
+    def mark_absorbed(self, key: str, event_ids: list[str], ttl_sec: int):
+        expires_at = str(int(time.time()) + ttl_sec)
+        for event_id in event_ids:
+            get_dynamodb_client().put_item(
+                TableName=self.table_name,
+                Item={"pk": {"S": f"{key}#absorbed#{event_id}"}, "expires_at": {"N": expires_at}},
+            )
+
+    def is_absorbed(self, key: str, event_id: str) -> bool:
+        res = get_dynamodb_client().get_item(
+            TableName=self.table_name, Key={"pk": {"S": f"{key}#absorbed#{event_id}"}}, ConsistentRead=True,
+        )
+        item = res.get("Item")
+        # TTLによる削除は遅れるので期限を見る
+        return item is not None and int(item["expires_at"]["N"]) > time.time()
+
+
+class Coalescer:
+    """
+    Args:
+        window_sec: 前のメッセージからこの秒数以内に届いたメッセージをまとめる
+        store: LocalStore / DynamoStore
+        clock: 現在時刻（エポック秒。イベントのtimestampと比較する）
+        sleep: 待機関数（テストでは時計を進める関数を渡す）
+    """
+
+    def __init__(self, window_sec: float, store, clock=time.time, sleep=time.sleep):
+        self.window_sec = window_sec
+        self.store = store
+        self._clock = clock
+        self._sleep = sleep
+
+    def register(self, key: str, event_id: str, timestamp_ms: int, query: str):
+        query = query.replace("\t", " ")
+        self.store.add(key, (int(timestamp_ms), event_id, query), _entry_ttl_sec(self.window_sec))
+
+    def _chain(self, entries: list[Entry]) -> list[Entry]:
+        """最後のメッセージから遡り、間隔がウィンドウ以内で続いているものを返す（古い順）"""
+        window_ms = self.window_sec * 1000
+        chain = [entries[-1]]
+        for entry in reversed(entries[:-1]):
+            if chain[-1][0] - entry[0] > window_ms:
+                break
+            chain.append(entry)
+        return list(reversed(chain))
+
+    def settle(self, key: str, event_id: str, query: str, max_wait_sec: float | None = None) -> str | None:
+        """
+        後続メッセージが届かないままウィンドウが過ぎるまで待つ。
+
+        Returns:
+            まとめたクエリ。ウィンドウ内に後続メッセージがある場合はNone（そちらの処理で応答する）
+        """
+        waited = 0.0
+        while True:
+            entries = sorted(self.store.load(key))
+            index = next((i for i, e in enumerate(entries) if e[1] == event_id), None)
+            if index is None:
+                if self.store.is_absorbed(key, event_id):
+                    # 後続メッセージの処理で既にまとめて応答した
+                    return None
+                # 登録されていない
+                return query
+            mine = entries[index]
+            if index + 1 < len(entries):
+                if entries[index + 1][0] - mine[0] <= self.window_sec * 1000:
+                    return None
+                # 次のメッセージはウィンドウ外なので、ここまでで応答する
+                break
+            wait = mine[0] / 1000 + self.window_sec - self._clock()
+            if max_wait_sec is not None:
+                wait = min(wait, max_wait_sec - waited)
+            if wait <= 0:
+                break
+            self._sleep(wait)
+            waited += wait
+
+        chain = self._chain(entries[:index + 1])
+        # 取り除く前に記録する（まとめた前のメッセージの処理が、記録もメッセージも見えない瞬間を作らない）
+        absorbed = [e[1] for e in chain if e[1] != event_id]
+        if absorbed:
+            self.store.mark_absorbed(key, absorbed, _entry_ttl_sec(self.window_sec))
+        self.store.remove(key, chain)
+        if len(chain) > 1:
+            metrics.put_metric("CoalescedMessages", len(chain) - 1)
+        return " ".join(q for _, _, q in chain)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+_warned_no_table = False
+
+
+def _table_name() -> str | None:
+    return os.environ.get("COALESCE_TABLE") or None
+
+
+def enabled() -> bool:
+    """COALESCE_WINDOW_SEC と COALESCE_TABLE がどちらも設定されているか"""
+    global _warned_no_table
+    if window_sec() <= 0:
+        return False
+    if not _table_name():
+        if not _warned_no_table:
+            _warned_no_table = True
+            print("[WARN] COALESCE_WINDOW_SEC is set but COALESCE_TABLE is not; message coalescing is disabled")
+        return False
+    return True
+
+
+def _get_coalescer() -> Coalescer:
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = Coalescer(window_sec(), DynamoStore(_table_name()))
+    return _coalescer
+
+
+def register(key: str, ev, query: str):
+    """受信したメッセージを記録する（無効時・webhookEventIdがない場合は何もしない）"""
+    event_id = ev.get("webhookEventId")
+    if not enabled() or not event_id or not query:
+        return
+    try:
+        _get_coalescer().register(key, event_id, ev.get("timestamp") or int(time.time() * 1000), query)
+    except Exception as e:
+        print(f"[WARN] Coalesce register failed: {e}")
+
+
+def settle(key: str, ev, query: str, max_wait_sec: float | None = None) -> str | None:
+    """まとめたクエリを返す。後続メッセージに引き継ぐ場合はNone"""
+    event_id = ev.get("webhookEventId")
+    if not enabled() or not event_id:
+        return query
+    try:
+        return _get_coalescer().settle(key, event_id, query, max_wait_sec)
+    except Exception as e:
+        # ストアが使えない場合はまとめずにそのまま処理する
+        print(f"[WARN] Coalesce settle failed: {e}")
+        return query
+
+
+def reset():
+    """状態を破棄する（テスト用）"""
+    global _coalescer, _warned_no_table
+    _coalescer = None
+    _warned_no_table = False
@@ -0,0 +1,60 @@
+"""
+Lambdaの残り実行時間からリクエストごとの時間予算を計算するモジュール。
+
+- context.get_remaining_time_in_millis() を起点に残り時間を追跡する
+- 返信（reply/push）に必要な時間を LINE_REPLY_RESERVE_SEC だけ確保し、
+  残りをAgentCore呼び出しの読み取りタイムアウトに使う
+- replyTokenはイベント発生から時間が経つと使えなくなるため、
+  REPLY_TOKEN_TTL_SEC を過ぎたらpushに切り替える判断に使う
+"""
+
+import time
+
+from env import get_float
+
+
+def reply_reserve_sec() -> float:
+    return get_float("LINE_REPLY_RESERVE_SEC", 3)
+
+
+def min_agent_budget_sec() -> float:
+    """これより短い予算しか残っていなければAgentCoreを呼ばない"""
+    return get_float("AGENT_MIN_BUDGET_SEC", 5)
+
+
+def reply_token_ttl_sec() -> float:
+    return get_float("REPLY_TOKEN_TTL_SEC", 50)
+
+
+class Deadline:
+    def __init__(self, remaining_sec: float, clock=time.monotonic):
+        self._clock = clock
+        self._expires_at = clock() + remaining_sec
+
+    @classmethod
+    def from_context(cls, context, clock=time.monotonic) -> "Deadline | None":
+        """Lambdaのcontextから作る（ローカル実行などでcontextがなければNone）"""
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining is None:
+            return None
+        return cls(get_remaining() / 1000, clock)
+
+    def remaining_sec(self) -> float:
+        return max(0.0, self._expires_at - self._clock())
+
+    def agent_budget_sec(self) -> float:
+        """返信用の時間を差し引いた、AgentCoreに使える時間"""
+        return max(0.0, self.remaining_sec() - reply_reserve_sec())
+
+    def can_call_agent(self) -> bool:
+        return self.agent_budget_sec() >= min_agent_budget_sec()
+
+
+def reply_token_expired(ev, now_ms: float | None = None) -> bool:
+    """イベント発生からの経過時間でreplyTokenが使えなくなっていそうか判定する"""
+    timestamp = ev.get("timestamp")
+    if not timestamp:
+        return False
+    if now_ms is None:
+        now_ms = time.time() * 1000
+    return (now_ms - timestamp) / 1000 > reply_token_ttl_sec()
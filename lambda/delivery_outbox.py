@@ -0,0 +1,199 @@
+"""
+LINEに送れなかった応答を保存し、pushで再送するモジュール（配信のアウトボックス）。
+
+AgentCoreで作った応答（高コストな部分）がreplyの失敗などで届かなかった場合に、
+応答を捨てずにSQSへ積み、バックオフ付きでpushで再送する。
+- DELIVERY_QUEUE_URL : 再送待ちのキュー。DelaySecondsで次の再送時刻まで見えなくする
+- DELIVERY_DLQ_URL   : DELIVERY_MAX_ATTEMPTS 回送れなかった、pushできない、または恒久的な4xxで失敗した応答の退避先。
+                       元のイベントと応答を保持し、scripts/replay_deliveries.py でAgentCoreを呼ばずに再送する
+- 再送のpushには項目のID（UUID）から作った固定のX-Line-Retry-Keyを使い、LINE側で受け付け済みなら重複送信しない
+- キューの未設定時は何もしない（従来どおり応答は冪等性ストアにだけ残る）
+"""
+
+import json
+import os
+import time
+import uuid
+
+import metrics
+from env import get_int
+
+# SQSのDelaySecondsの上限
+MAX_DELAY_SEC = 900
+
+# X-Line-Retry-Keyが受け付け済み（前回のpushが届いている）
+ALREADY_ACCEPTED = 409
+
+_sqs_client = None
+
+
+def _get_sqs_client():
+    """SQSクライアントを取得（遅延初期化）"""
+    global _sqs_client
+    if _sqs_client is None:
+        import boto3
+        _sqs_client = boto3.client(
+            "sqs",
+            endpoint_url=os.environ.get("SQS_ENDPOINT_URL") or None,
+        )
+    return _sqs_client
+
+
+def _queue_url() -> str | None:
+    return os.environ.get("DELIVERY_QUEUE_URL") or None
+
+
+def _dlq_url() -> str | None:
+    return os.environ.get("DELIVERY_DLQ_URL") or None
+
+
+def enabled() -> bool:
+    return bool(_queue_url() or _dlq_url())
+
+
+def max_attempts() -> int:
+    return max(1, get_int("DELIVERY_MAX_ATTEMPTS", 5))
+
+
+def backoff_sec(attempt: int) -> int:
+    """attempt 回目の失敗後、次の再送までの秒数（DELIVERY_RETRY_BASE_SEC から倍々）"""
+    base = max(0, get_int("DELIVERY_RETRY_BASE_SEC", 30))
+    return min(MAX_DELAY_SEC, base * (2 ** max(0, attempt - 1)))
+
+
+def new_entry(ev: dict, answer: str, destination: str | None, error: str | None = None) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "event": ev,
+        "answer": answer,
+        "destination": destination,
+        "attempts": 1,
+        "first_failed_at": int(time.time()),
+        "last_error": error,
+    }
+
+
+def _send(queue_url: str, entry: dict, delay_sec: int = 0):
+    _get_sqs_client().send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps(entry, ensure_ascii=False),
+        DelaySeconds=max(0, min(MAX_DELAY_SEC, delay_sec)),
+    )
+
+
+def dead_letter(entry: dict, reason: str):
+    """再送をあきらめてDLQに退避する（DLQがなければログにだけ残す）"""
+    entry = {**entry, "dead_lettered_at": int(time.time()), "reason": reason}
+    dlq = _dlq_url()
+    if not dlq:
+        print(f"[ERROR] Undeliverable answer dropped ({reason}): {entry['id']}")
+        return
+    _send(dlq, entry)
+    print(f"[WARN] Delivery dead-lettered ({reason}): {entry['id']} after {entry['attempts']} attempts")
+    metrics.put_metric("DeliveryDeadLettered", 1, properties={"reason": reason})
+
+
+def defer(ev: dict, answer: str, destination: str | None, can_push: bool, error: str | None = None) -> bool:
+    """
+    届かなかった応答をアウトボックスに保存する。
+
+    Args:
+        destination: pushの送信先（ユーザー／グループ／ルームID）
+        can_push: pushでの再送が許可されているか。不可ならDLQに直接退避する
+
+    Returns:
+        保存できたらTrue（以降の送信はアウトボックスが受け持つ）
+    """
+    if not enabled():
+        return False
+    entry = new_entry(ev, answer, destination, error)
+    try:
+        if can_push and destination and _queue_url():
+            _send(_queue_url(), entry, backoff_sec(1))
+            print(f"[INFO] Delivery deferred for retry: {entry['id']}")
+            metrics.record("DeliveryDeferred", 1)
+        else:
+            reason = "no_destination" if not destination else "push_not_allowed" if not can_push else "no_retry_queue"
+            dead_letter(entry, reason)
+            if not _dlq_url():
+                return False
+    except Exception as e:
+        print(f"[ERROR] Failed to store undelivered answer: {e}")
+        return False
+    return True
+
+
+def process_records(records: list[dict], push) -> list[dict]:
+    """
+    再送キューのSQSレコードを処理する。
+
+    Args:
+        push: push(entry) -> ステータスコード。アウトボックスの項目をpushで送る関数
+
+    Returns:
+        SQSに返すbatchItemFailures（再送・退避のキュー操作自体に失敗したもの）
+    """
+    failures = []
+    for record in records:
+        try:
+            entry = _parse(record["body"])
+        except ValueError as e:
+            # 読めない項目は再送しても読めないので、バッチ全体を巻き込まずにDLQへ退避する
+            entry = {"id": record.get("messageId"), "attempts": 0, "body": record["body"], "last_error": str(e)}
+            try:
+                dead_letter(entry, "malformed")
+            except Exception as e:
+                print(f"[ERROR] Delivery retry bookkeeping failed: {e}")
+                failures.append({"itemIdentifier": record["messageId"]})
+            continue
+        try:
+            _retry(entry, push)
+        except Exception as e:
+            print(f"[ERROR] Delivery retry bookkeeping failed: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+    return failures
+
+
+def _parse(body: str) -> dict:
+    """再送キューのメッセージ本文を項目に戻す。形が違う場合は ValueError"""
+    entry = json.loads(body)
+    if not isinstance(entry, dict) or not all(k in entry for k in ("id", "event", "answer", "destination", "attempts", "first_failed_at")):
+        raise ValueError("not a delivery entry")
+    return entry
+
+
+def _is_retryable(status: int) -> bool:
+    """時間をおけば届く見込みがあるか（429・5xx）。ブロックされたなどの4xxは再送しても届かない"""
+    return status == 429 or status >= 500
+
+
+def _retry(entry: dict, push):
+    permanent = False
+    try:
+        status = push(entry)
+        error = None if status < 400 or status == ALREADY_ACCEPTED else f"status {status}"
+        permanent = error is not None and not _is_retryable(status)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    metrics.record("DeliveryRetries", 1)
+    if error is None:
+        print(f"[INFO] Delivered deferred answer: {entry['id']} (attempt {entry['attempts'] + 1})")
+        metrics.record("DeliveryRecovered", 1)
+        metrics.record("DeliveryDelaySec", int(time.time()) - entry["first_failed_at"], "Seconds")
+        return
+
+    entry = {**entry, "attempts": entry["attempts"] + 1, "last_error": error}
+    if permanent:
+        dead_letter(entry, error)
+        return
+    if entry["attempts"] >= max_attempts():
+        dead_letter(entry, "max_attempts")
+        return
+    print(f"[WARN] Deferred delivery failed ({error}); retrying {entry['id']} in {backoff_sec(entry['attempts'])}s")
+    _send(_queue_url(), entry, backoff_sec(entry["attempts"]))
+
+
+def reset_client():
+    """クライアントを破棄する（テスト用）"""
+    global _sqs_client
+    _sqs_client = None
@@ -0,0 +1,32 @@
+"""
+DynamoDBクライアントを共有するモジュール。
+
+キャッシュ・冪等性ストアなどの共有ティアから使う。
+DYNAMODB_ENDPOINT_URL でローカルのエンドポイント（moto等）を指定できる。
+"""
+
+import os
+import threading
+
+_dynamodb_client = None
+_client_lock = threading.Lock()
+
+
+def get_dynamodb_client():
+    """DynamoDBクライアントを取得（遅延初期化）"""
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        with _client_lock:
+            if _dynamodb_client is None:
+                import boto3
+                _dynamodb_client = boto3.client(
+                    "dynamodb",
+                    endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL") or None,
+                )
+    return _dynamodb_client
+
+
+def reset_client():
+    """クライアントを破棄する（テスト用）"""
+    global _dynamodb_client
+    _dynamodb_client = None
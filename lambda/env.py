@@ -0,0 +1,31 @@
+"""
+環境変数から設定値を読むモジュール。
+
+値が未設定・不正な場合はデフォルト値を使う（設定ミスでLambdaを落とさない）。
+"""
+
+import os
+
+_TRUTHY = ("1", "true", "yes", "on")
+
+
+def get_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_bool(name: str, default: bool) -> bool:
+    """1 / true / yes / on（大文字小文字を区別しない）ならTrue"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in _TRUTHY
@@ -0,0 +1,53 @@
+"""
+複数イベントを送信元ごとに並列処理するモジュール。
+
+- 同じ送信元（ユーザー／グループ／ルーム）のイベントは到着順に逐次処理
+- 異なる送信元のイベントはスレッドプールで並列処理
+- 同時実行数は LINE_EVENT_CONCURRENCY で上限を設定
+"""
+
+import os
+
+
+def get_concurrency() -> int:
+    raw = os.environ.get("LINE_EVENT_CONCURRENCY", "4")
+    try:
+        n = int(raw)
+    except ValueError:
+        n = 4
+    return max(1, n)
+
+
+def group_by_key(items, key_fn) -> dict:
+    """到着順を保ったままキーごとにまとめる"""
+    groups = {}
+    for item in items:
+        groups.setdefault(key_fn(item), []).append(item)
+    return groups
+
+
+def run_by_group(items, key_fn, process_group, max_workers: int | None = None):
+    """
+    キーごとにまとめたアイテムを並列に処理する。
+
+    Args:
+        items: 処理対象（到着順）
+        key_fn: アイテムからグループキーを返す関数
+        process_group: グループ内のアイテムのリストを受け取り逐次処理する関数
+        max_workers: 同時実行数（省略時は LINE_EVENT_CONCURRENCY）
+
+    Returns:
+        process_group の戻り値のリスト（グループの出現順）
+    """
+    groups = list(group_by_key(items, key_fn).values())
+    if not groups:
+        return []
+
+    workers = min(max_workers or get_concurrency(), len(groups))
+    if workers == 1:
+        return [process_group(g) for g in groups]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(process_group, groups))
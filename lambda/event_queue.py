@@ -0,0 +1,95 @@
+"""
+LINEイベントをSQS FIFOキューに積むモジュール（WEBHOOK_MODE=queue 用）。
+
+- 会話（ユーザー／グループ／ルーム）単位のMessageGroupIdで順序を保証
+- webhookEventIdをMessageDeduplicationIdに使い、再送イベントの二重投入を防止
+- EVENT_QUEUE_URL でキューを指定（ローカルではElasticMQ/motoのURLを指定）
+"""
+
+import json
+import os
+
+# SQS SendMessageBatchの上限
+MAX_BATCH_SIZE = 10
+
+_sqs_client = None
+
+
+def _get_sqs_client():
+    """SQSクライアントを取得（遅延初期化）"""
+    global _sqs_client
+    if _sqs_client is None:
+        import boto3
+        _sqs_client = boto3.client(
+            "sqs",
+            endpoint_url=os.environ.get("SQS_ENDPOINT_URL") or None,
+        )
+    return _sqs_client
+
+
+def _queue_url() -> str:
+    url = os.environ.get("EVENT_QUEUE_URL")
+    if not url:
+        raise RuntimeError("EVENT_QUEUE_URL is not set")
+    return url
+
+
+def message_group_id(ev) -> str:
+    """会話単位のグループID（グループ・ルームは会話全体で順序を揃える）"""
+    source = ev.get("source", {}) or {}
+    return source.get("groupId") or source.get("roomId") or source.get("userId") or "unknown"
+
+
+def _dedup_id(ev) -> str | None:
+    return ev.get("webhookEventId")
+
+
+def enqueue_events(events: list[dict]) -> list[dict]:
+    """
+    イベントをキューに積む。
+
+    Returns:
+        キューに積めなかったイベントのリスト（呼び出し側で同期処理する）
+    """
+    client = _get_sqs_client()
+    queue_url = _queue_url()
+    failed = []
+
+    for start in range(0, len(events), MAX_BATCH_SIZE):
+        chunk = events[start:start + MAX_BATCH_SIZE]
+        entries = []
+        for i, ev in enumerate(chunk):
+            entry = {
+                "Id": str(i),
+                "MessageBody": json.dumps(ev, ensure_ascii=False),
+                "MessageGroupId": message_group_id(ev),
+            }
+            dedup_id = _dedup_id(ev)
+            if dedup_id:
+                entry["MessageDeduplicationId"] = dedup_id
+            entries.append(entry)
+
+        try:
+            res = client.send_message_batch(QueueUrl=queue_url, Entries=entries)
+        except Exception as e:
+            print(f"[ERROR] SQS send_message_batch failed: {e}")
+            failed.extend(chunk)
+            continue
+
+        for f in res.get("Failed", []) or []:
+            print(f"[WARN] SQS enqueue failed: {f.get('Code')} {f.get('Message')}")
+            failed.append(chunk[int(f["Id"])])
+
+    print(f"[DEBUG] Enqueued {len(events) - len(failed)}/{len(events)} events")
+    return failed
+
+
+def decode_records(records: list[dict]) -> list[tuple[str, dict]]:
+    """SQSレコードを (messageId, LINEイベント) のリストに変換する"""
+    return [(r["messageId"], json.loads(r["body"])) for r in records]
+
+
+def reset_client():
+    """クライアントを破棄する（テスト用）"""
+    global _sqs_client
+    _sqs_client = None
@@ -0,0 +1,147 @@
+"""
+LINE Webhookの再送（deliveryContext.isRedelivery）を冪等に処理するモジュール。
+
+webhookEventIdをキーに処理状況を記録し、同じイベントの二重処理を防ぐ。
+- IN_PROGRESS : 処理中（再送はスキップ）
+- COMPLETED   : 処理済み。応答と送信できたかどうかを保持し、未送信なら再送時に応答を再利用する
+
+プロセス内のTTL付きストアに加え、IDEMPOTENCY_TABLE を設定すると
+DynamoDBの条件付き書き込みでコンテナ間でも重複を排除する。
+"""
+
+import os
+import time
+
+from dynamodb import get_dynamodb_client
+from env import get_int
+from ttl_cache import TTLCache
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+_local = None
+
+
+class Record:
+    __slots__ = ("status", "answer", "delivered")
+
+    def __init__(self, status: str, answer: str | None = None, delivered: bool = False):
+        self.status = status
+        self.answer = answer
+        self.delivered = delivered
+
+
+def _ttl_sec() -> int:
+    """処理済みレコードの保持期間（LINEの再送期間をカバーする）"""
+    return get_int("IDEMPOTENCY_TTL_SEC", 3600)
+
+
+def _inflight_ttl_sec() -> int:
+    """処理中レコードの保持期間（処理が異常終了した場合に再処理できるようにする）"""
+    return get_int("IDEMPOTENCY_INFLIGHT_TTL_SEC", 180)
+
+
+def _get_local_store() -> TTLCache:
+    global _local
+    if _local is None:
+        _local = TTLCache(max_entries=get_int("IDEMPOTENCY_MAX_ENTRIES", 10000), ttl_sec=_ttl_sec())
+    return _local
+
+
+def _table_name() -> str | None:
+    return os.environ.get("IDEMPOTENCY_TABLE") or None
+
+
+def _from_item(item: dict) -> Record:
+    answer = item.get("answer", {}).get("S")
+    delivered = item.get("delivered", {}).get("BOOL", False)
+    return Record(item["status"]["S"], answer, delivered)
+
+
+def _begin_shared(event_id: str) -> Record | None:
+    """DynamoDBで処理権を取得する。取得できればNone、既存レコードがあればそれを返す"""
+    client = get_dynamodb_client()
+    now = int(time.time())
+    try:
+        client.put_item(
+            TableName=_table_name(),
+            Item={
+                "pk": {"S": event_id},
+                "status": {"S": IN_PROGRESS},
+                "expires_at": {"N": str(now + _inflight_ttl_sec())},
+            },
+            ConditionExpression="attribute_not_exists(pk) OR expires_at < :now",
+            ExpressionAttributeValues={":now": {"N": str(now)}},
+        )
+        return None
+    except client.exceptions.ConditionalCheckFailedException:
+        res = client.get_item(TableName=_table_name(), Key={"pk": {"S": event_id}}, ConsistentRead=True)
+        item = res.get("Item")
+        return _from_item(item) if item else Record(IN_PROGRESS)
+
+
+def begin(event_id: str) -> Record | None:
+    """
+    イベントの処理を開始する。
+
+    Returns:
+        None: 処理を開始してよい
+        Record: 既に処理中／処理済み（statusを見て呼び出し側で判断する）
+    """
+    local = _get_local_store()
+    if not local.add(event_id, Record(IN_PROGRESS), _inflight_ttl_sec()):
+        return local.get(event_id) or Record(IN_PROGRESS)
+
+    if not _table_name():
+        return None
+    try:
+        existing = _begin_shared(event_id)
+    except Exception as e:
+        # 共有ストアが使えない場合はプロセス内の判定だけで処理を続ける
+        print(f"[WARN] Idempotency store unavailable: {e}")
+        return None
+    if existing is not None:
+        local.pop(event_id)
+    return existing
+
+
+def complete(event_id: str, answer: str | None, delivered: bool):
+    """処理結果を記録する"""
+    _get_local_store().set(event_id, Record(COMPLETED, answer, delivered), _ttl_sec())
+    if not _table_name():
+        return
+    item = {
+        "pk": {"S": event_id},
+        "status": {"S": COMPLETED},
+        "delivered": {"BOOL": delivered},
+        "expires_at": {"N": str(int(time.time()) + _ttl_sec())},
+    }
+    if answer:
+        item["answer"] = {"S": answer}
+    try:
+        get_dynamodb_client().put_item(TableName=_table_name(), Item=item)
+    except Exception as e:
+        print(f"[WARN] Idempotency complete failed: {e}")
+
+
+def release(event_id: str):
+    """処理に失敗した場合にレコードを消し、再送で再処理できるようにする"""
+    _get_local_store().pop(event_id)
+    if not _table_name():
+        return
+    try:
+        get_dynamodb_client().delete_item(
+            TableName=_table_name(),
+            Key={"pk": {"S": event_id}},
+            ConditionExpression="#s = :s",
+            ExpressionAttributeNames={"#s": "status"},
+            ExpressionAttributeValues={":s": {"S": IN_PROGRESS}},
+        )
+    except Exception as e:
+        print(f"[WARN] Idempotency release failed: {e}")
+
+
+def clear():
+    """プロセス内ストアをクリアする（テスト用）"""
+    if _local is not None:
+        _local.clear()
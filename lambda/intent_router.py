@@ -0,0 +1,276 @@
+"""
+「エリア＋ジャンル」だけの単純な質問を判定し、LLMを通さずに答えるかを決めるモジュール。
+
+「渋谷 ラーメン」「新宿駅の焼肉」のような質問はPlaces APIのテキスト検索で十分なので、
+AgentCoreを呼ばずに決まった書式で返信する。それ以外はすべてAgentCoreに回す。
+- 駅名・エリア名とジャンルの辞書を Aho-Corasick オートマトンにまとめてimport時に構築する
+- 質問を最左最長一致で分割し、エリア1つ・ジャンル1つ・つなぎの語（「で」「駅前」「おすすめ」など）
+  だけで全体が埋まる場合のみ直接検索にする（雰囲気・予算などの条件が残ればAgentCore）
+- 表記ゆれは query_cache.normalize_query と同じ正規化で吸収する
+- 誤って直接検索に回すと回答の質が落ちるので、再現率より適合率を優先する
+  （評価セットとベンチマークは scripts/intent_router/evaluate.py）
+"""
+
+
+import query_cache
+from env import get_bool
+
+PLACES = "places"
+AGENT = "agent"
+
+_AREA = "area"
+_GENRE = "genre"
+_FILLER = "filler"
+
+# 正規化後に読み飛ばす文字（空白・区切り記号）
+_SEPARATORS = frozenset(" 、,・/!?()「」")
+
+# エリア名 -> 別表記（正規化で吸収できないもの）
+AREAS = {
+    # 東京
+    "東京": ["東京駅"], "丸の内": ["丸ノ内"], "有楽町": [], "日比谷": [], "新橋": [], "銀座": [],
+    "築地": [], "日本橋": [], "人形町": [], "八重洲": [], "神田": [], "秋葉原": ["アキバ"],
+    "御茶ノ水": ["お茶の水"], "神保町": ["神田神保町"], "水道橋": [], "飯田橋": [], "神楽坂": [],
+    "四ツ谷": ["四谷"], "市ヶ谷": ["市ケ谷"], "赤坂": [], "六本木": [], "麻布十番": [], "虎ノ門": ["虎ノ門ヒルズ"],
+    "浜松町": [], "田町": [], "品川": [], "五反田": [], "大崎": [], "目黒": [], "恵比寿": ["恵比須"],
+    "代官山": [], "中目黒": [], "渋谷": [], "表参道": [], "原宿": [], "青山": [], "外苑前": [],
+    "千駄ヶ谷": [], "代々木": [], "新宿": [], "新宿三丁目": [], "西新宿": [], "新大久保": [],
+    "高田馬場": ["高田の馬場"], "早稲田": [], "目白": [], "池袋": [], "大塚": [], "巣鴨": [], "駒込": [],
+    "田端": [], "日暮里": [], "西日暮里": [], "鶯谷": [], "上野": [], "御徒町": [], "浅草": [],
+    "押上": ["スカイツリー"], "錦糸町": [], "両国": [], "門前仲町": ["門仲"], "月島": [], "豊洲": [],
+    "お台場": ["台場"], "北千住": [], "赤羽": [], "王子": [], "板橋": [], "練馬": [], "中野": [],
+    "高円寺": [], "阿佐ヶ谷": ["阿佐谷"], "荻窪": [], "吉祥寺": [], "三鷹": [], "下北沢": ["シモキタ"],
+    "三軒茶屋": ["三茶"], "二子玉川": ["二子玉"], "自由が丘": [], "蒲田": [], "大井町": [], "立川": [],
+    "町田": [], "八王子": [], "国分寺": [], "調布": [],
+    # 神奈川・埼玉・千葉
+    "横浜": [], "みなとみらい": [], "桜木町": [], "関内": [], "元町": [],
+    "横浜中華街": ["中華街", "元町中華街", "元町・中華街"],
+    "川崎": [], "武蔵小杉": ["ムサコ"], "新横浜": [], "鎌倉": [], "藤沢": [], "大宮": [], "浦和": [],
+    "川越": [], "千葉": [], "船橋": [], "柏": [], "舞浜": [],
+    # 関西
+    "梅田": ["大阪駅"], "北新地": [], "難波": ["なんば"], "心斎橋": [], "道頓堀": [], "天王寺": [],
+    "阿倍野": ["あべの"], "新世界": [], "天満": [], "京橋": [], "本町": [], "新大阪": [], "鶴橋": [],
+    "京都": ["京都駅"], "四条": [], "河原町": [], "祇園": [], "烏丸": [], "三宮": ["三ノ宮"], "南京町": [],
+    "神戸": [], "奈良": [],
+    # 中部
+    "名古屋": ["名古屋駅", "名駅"], "栄": [], "大須": [], "金山": [], "静岡": [], "浜松": [], "金沢": [],
+    # 九州・その他
+    "博多": [], "天神": [], "中洲": [], "小倉": [], "熊本": [], "鹿児島": [], "那覇": [], "国際通り": [],
+    "札幌": [], "すすきの": ["薄野"], "大通": ["大通公園"], "仙台": [], "国分町": [], "広島": [],
+    "岡山": [], "高松": [], "松山": [],
+}
+
+# ジャンル名 -> 別表記
+GENRES = {
+    "ラーメン": ["拉麺", "中華そば", "ら〜めん"],
+    "つけ麺": ["つけめん"],
+    "寿司": ["すし", "鮨", "お寿司", "おすし"],
+    "回転寿司": ["回転ずし"],
+    "焼肉": ["焼き肉", "やきにく"],
+    "焼き鳥": ["焼鳥", "やきとり"],
+    "居酒屋": [],
+    "カフェ": ["喫茶"],
+    "喫茶店": ["純喫茶"],
+    "イタリアン": ["イタリア料理"],
+    "パスタ": [],
+    "ピザ": ["ピッツァ"],
+    "フレンチ": ["フランス料理"],
+    "ビストロ": [],
+    "スペイン料理": ["スペインバル"],
+    "バル": [],
+    "中華": ["中華料理", "中国料理"],
+    "餃子": ["ぎょうざ", "ギョーザ"],
+    "韓国料理": ["韓国"],
+    "タイ料理": [],
+    "ベトナム料理": [],
+    "インド料理": [],
+    "カレー": ["カレーライス"],
+    "うどん": ["讃岐うどん"],
+    "蕎麦": ["お蕎麦", "そば屋", "蕎麦屋", "日本蕎麦"],
+    "天ぷら": ["天麩羅", "てんぷら"],
+    "とんかつ": ["豚カツ", "トンカツ"],
+    "串カツ": ["串かつ", "串揚げ"],
+    "お好み焼き": ["お好み焼", "おこのみやき"],
+    "たこ焼き": ["たこ焼", "たこやき"],
+    "もんじゃ焼き": ["もんじゃ"],
+    "もつ鍋": [],
+    "しゃぶしゃぶ": [],
+    "すき焼き": ["すきやき"],
+    "ジンギスカン": [],
+    "牛タン": [],
+    "ステーキ": [],
+    "ハンバーグ": [],
+    "ハンバーガー": ["バーガー"],
+    "牛丼": [],
+    "海鮮丼": [],
+    "海鮮": ["海鮮料理"],
+    "定食": ["定食屋"],
+    "和食": ["日本料理"],
+    "洋食": [],
+    "懐石": ["懐石料理", "会席料理"],
+    "鉄板焼き": ["鉄板焼"],
+    "ビュッフェ": ["バイキング", "食べ放題"],
+    "バー": [],
+    "ワインバー": [],
+    "ベーカリー": ["パン屋"],
+    "スイーツ": ["デザート"],
+    "ケーキ": ["ケーキ屋"],
+    "パンケーキ": [],
+    "クレープ": [],
+    "かき氷": [],
+}
+
+# エリアとジャンルをつなぐだけで条件を変えない語
+FILLERS = [
+    "駅", "駅前", "駅周辺", "駅近", "駅近く", "駅チカ", "周辺", "付近", "近く", "近辺", "周り", "まわり",
+    "あたり", "辺り", "らへん", "界隈", "エリア", "方面",
+    "で", "の", "に", "な", "は", "を", "が", "か", "で探して",
+    "お店", "店", "屋", "さん", "料理",
+    "おすすめ", "お勧め", "お薦め", "オススメ", "人気", "有名", "美味しい", "おいしい", "うまい", "評判",
+    "教えて", "探して", "調べて", "ください", "下さい", "ほしい", "欲しい", "ある", "あります",
+    "いい", "良い", "食べたい", "行きたい",
+]
+
+
+class Automaton:
+    """
+    Aho-Corasick オートマトン（複数パターンの一括検索）。
+
+    Args:
+        patterns: {パターン文字列: 値}
+    """
+
+    def __init__(self, patterns: dict):
+        self._goto = [{}]
+        self._fail = [0]
+        # 状態ごとに、そこで終わるパターンの (長さ, 値)
+        self._out = [[]]
+        for word, value in patterns.items():
+            self._add(word, value)
+        self._build_fail()
+
+    def _add(self, word: str, value):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(word), value))
+
+    def _build_fail(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0) if state else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def longest_at(self, text: str) -> dict:
+        """{開始位置: (終了位置, 値)}。同じ位置から始まる一致は最長のもの"""
+        found = {}
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                start = i + 1 - length
+                prev = found.get(start)
+                if prev is None or prev[0] < i + 1:
+                    found[start] = (i + 1, value)
+        return found
+
+
+def _build_automaton() -> Automaton:
+    patterns = {}
+    # 後から登録したものが優先されるので、つなぎの語 < ジャンル < エリアの順で登録する
+    for word in FILLERS:
+        patterns[query_cache.normalize_query(word)] = (_FILLER, word)
+    for name, aliases in GENRES.items():
+        for word in [name, *aliases]:
+            patterns[query_cache.normalize_query(word)] = (_GENRE, name)
+    for name, aliases in AREAS.items():
+        for word in [name, *aliases]:
+            patterns[query_cache.normalize_query(word)] = (_AREA, name)
+    return Automaton(patterns)
+
+
+_automaton = _build_automaton()
+
+
+class Route:
+    """
+    kind  : PLACES（直接検索）/ AGENT
+    area  : 直接検索するエリア
+    genre : 直接検索するジャンル
+    reason: 判定理由（メトリクス・評価用）
+    """
+
+    __slots__ = ("kind", "area", "genre", "reason")
+
+    def __init__(self, kind: str, reason: str, area: str | None = None, genre: str | None = None):
+        self.kind = kind
+        self.reason = reason
+        self.area = area
+        self.genre = genre
+
+    @property
+    def direct(self) -> bool:
+        return self.kind == PLACES
+
+    @property
+    def search_query(self) -> str:
+        """Places APIのテキスト検索に渡す文字列"""
+        return f"{self.area} {self.genre}"
+
+    def __repr__(self):
+        return f"Route({self.kind!r}, {self.reason!r}, area={self.area!r}, genre={self.genre!r})"
+
+
+def _enabled() -> bool:
+    return get_bool("INTENT_ROUTER_ENABLED", True)
+
+
+def classify(query: str) -> Route:
+    """質問をPlaces APIで直接答えるか（PLACES）、AgentCoreに回すか（AGENT）判定する"""
+    if not _enabled():
+        return Route(AGENT, "disabled")
+    if query_cache.is_context_dependent(query):
+        return Route(AGENT, "context")
+
+    text = query_cache.normalize_query(query)
+    matches = _automaton.longest_at(text)
+    areas, genres = set(), set()
+    i = 0
+    while i < len(text):
+        if text[i] in _SEPARATORS:
+            i += 1
+            continue
+        match = matches.get(i)
+        if match is None:
+            # 辞書にない語（雰囲気・予算・人数などの条件）が含まれる
+            return Route(AGENT, "unmatched")
+        end, (kind, name) = match
+        if kind == _AREA:
+            areas.add(name)
+        elif kind == _GENRE:
+            genres.add(name)
+        i = end
+
+    if len(areas) != 1:
+        return Route(AGENT, "no_area" if not areas else "multiple_areas")
+    if len(genres) != 1:
+        return Route(AGENT, "no_genre" if not genres else "multiple_genres")
+    return Route(PLACES, "area_genre", area=areas.pop(), genre=genres.pop())
@@ -0,0 +1,181 @@
+"""
+LINE Messaging APIクライアントを管理するモジュール。
+
+- コンテナ単位でrequests.Sessionを共有し、api.line.meへの接続をkeep-aliveで使い回す
+- Authorizationヘッダーはセッション生成時に1回だけ設定
+- 429/5xxはバックオフ付きでリトライ（pushはX-Line-Retry-Keyで重複送信を防止）
+- エンドポイントごとのタイムアウトは環境変数で設定可能
+- LINE APIが劣化している間はサーキットブレーカーで呼び出しを止める（ローディング表示は別のブレーカー）
+- 呼び出しごとの処理時間・ステータスコード・送信サイズを実行中のトレースに記録する
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+
+import metrics
+from circuit_breaker import CircuitBreaker, line_breaker, loading_breaker
+from env import get_float, get_int
+
+DEFAULT_BASE_URL = "https://api.line.me"
+
+# エンドポイントごとの読み取りタイムアウト秒のデフォルト値
+_DEFAULT_TIMEOUTS = {
+    "reply": 10.0,
+    "push": 10.0,
+    "loading": 3.0,
+}
+
+_session = None
+_session_token = None
+_session_lock = threading.Lock()
+
+
+def _base_url() -> str:
+    return os.environ.get("LINE_API_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def _timeout(endpoint: str) -> tuple[float, float]:
+    """(connect, read) タイムアウトを返す"""
+    read = get_float(f"LINE_{endpoint.upper()}_TIMEOUT", _DEFAULT_TIMEOUTS[endpoint])
+    connect = min(get_float("LINE_CONNECT_TIMEOUT", 3.0), read)
+    return connect, read
+
+
+def _build_session(access_token: str) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=get_int("LINE_MAX_RETRIES", 2),
+        connect=get_int("LINE_MAX_RETRIES", 2),
+        read=0,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        backoff_factor=get_float("LINE_RETRY_BACKOFF", 0.3),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=get_int("LINE_MAX_POOL_CONNECTIONS", 10),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {access_token}",
+    })
+    return session
+
+
+def get_session(access_token: str) -> "requests.Session":
+    """アクセストークンに紐づく共有セッションを取得（トークン変更時は作り直す）"""
+    global _session, _session_token
+    if _session is not None and _session_token == access_token:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_token != access_token:
+            if _session is not None:
+                _session.close()
+            _session = _build_session(access_token)
+            _session_token = access_token
+    return _session
+
+
+class UnsentResponse:
+    """サーキットブレーカーがOPENで送信しなかった場合のレスポンス"""
+    status_code = 503
+    text = "circuit open"
+    ok = False
+
+    def json(self):
+        return {"message": self.text}
+
+
+def _is_failure_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def post(endpoint: str, path: str, payload: dict, access_token: str,
+         headers: dict | None = None, breaker: CircuitBreaker = line_breaker) -> "requests.Response":
+    """LINE APIへJSONをPOSTする（LINE APIが劣化中は送信せずに503相当を返す）"""
+    stage = f"Line{endpoint.capitalize()}"
+    if not breaker.allow():
+        print(f"[WARN] LINE circuit is open; skipped {endpoint}")
+        metrics.set_property(f"line_{endpoint}_status", "circuit_open")
+        return UnsentResponse()
+
+    session = get_session(access_token)
+    data = json.dumps(payload)
+    metrics.record(f"{stage}Bytes", len(data.encode("utf-8")), "Bytes")
+    started = time.monotonic()
+    try:
+        res = session.post(
+            f"{_base_url()}{path}",
+            data=data,
+            headers=headers,
+            timeout=_timeout(endpoint),
+        )
+    except Exception as e:
+        breaker.record(True, time.monotonic() - started)
+        metrics.set_property(f"line_{endpoint}_status", type(e).__name__)
+        raise
+    finally:
+        metrics.record(f"{stage}Ms", round((time.monotonic() - started) * 1000, 1), "Milliseconds")
+    breaker.record(_is_failure_status(res.status_code), time.monotonic() - started)
+    metrics.set_property(f"line_{endpoint}_status", res.status_code)
+    if res.status_code >= 400:
+        metrics.record(f"{stage}Errors", 1)
+    return res
+
+
+def reply(reply_token: str, messages: list[dict], access_token: str) -> "requests.Response":
+    return post("reply", "/v2/bot/message/reply", {
+        "replyToken": reply_token,
+        "messages": messages,
+    }, access_token)
+
+
+def push(to_id: str, messages: list[dict], access_token: str,
+         retry_key: str | None = None) -> "requests.Response":
+    # リトライ時に同じメッセージが二重送信されないようにする
+    # （呼び出しをまたいで再送する場合は retry_key に同じUUIDを渡す）
+    return post("push", "/v2/bot/message/push", {
+        "to": to_id,
+        "messages": messages,
+    }, access_token, headers={"X-Line-Retry-Key": retry_key or str(uuid.uuid4())})
+
+
+def start_loading(chat_id: str, loading_seconds: int, access_token: str) -> "requests.Response":
+    return post("loading", "/v2/bot/chat/loading/start", {
+        "chatId": chat_id,
+        "loadingSeconds": loading_seconds,
+    }, access_token, breaker=loading_breaker)
+
+
+def verify_signature(body: bytes, signature: str | None, channel_secret: str) -> bool:
+    """webhookのX-Line-Signature（本文のHMAC-SHA256をBase64にしたもの）を検証する"""
+    if not signature or not channel_secret:
+        return False
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode("ascii"), signature)
+
+
+def reset_session():
+    """セッションを破棄する（テスト用）"""
+    global _session, _session_token
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_token = None
@@ -0,0 +1,77 @@
+"""
+LINEのローディング表示をAgentCore呼び出しと並行して行うモジュール。
+
+- ローディング開始APIはバックグラウンドスレッドで投げっぱなしにし、
+  AgentCore呼び出しを待たせない
+- AgentCore呼び出しが loadingSeconds より長引いた場合は自動で再表示する
+- 並行化で短縮できた時間（ローディングAPIの所要時間）をメトリクスとして出力
+- ローディングAPIの呼び出しは呼び出し元のトレースに記録する
+"""
+
+import threading
+import time
+
+import metrics
+
+# 表示が切れる少し前に再表示する（秒）
+REARM_MARGIN_SEC = 1.0
+
+
+class LoadingIndicator:
+    """
+    使い方:
+        with LoadingIndicator(start_fn, chat_id, 20, token):
+            ai_response = _call_agentcore(...)
+    """
+
+    def __init__(self, start_fn, chat_id: str, loading_seconds: int, access_token: str):
+        self._start_fn = metrics.bind(start_fn)
+        self._chat_id = chat_id
+        self._loading_seconds = loading_seconds
+        self._access_token = access_token
+        self._stopped = threading.Event()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._first_call_ms = None
+
+    def _fire(self):
+        if self._stopped.is_set():
+            return
+        started = time.monotonic()
+        self._start_fn(self._chat_id, self._loading_seconds, self._access_token)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            if self._first_call_ms is None:
+                self._first_call_ms = elapsed_ms
+        self._schedule_rearm()
+
+    def _schedule_rearm(self):
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            interval = max(1.0, self._loading_seconds - REARM_MARGIN_SEC)
+            self._timer = threading.Timer(interval, self._fire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def start(self):
+        thread = threading.Thread(target=self._fire, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            saved_ms = self._first_call_ms
+        # 従来はローディングAPIの完了を待ってからAgentCoreを呼んでいたため、その分が短縮時間
+        if saved_ms is not None:
+            metrics.put_metric("LoadingOverlapSavedMs", round(saved_ms, 1), "Milliseconds")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
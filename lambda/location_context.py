@@ -0,0 +1,112 @@
+"""
+ユーザーが直前に送った位置情報を覚えておき、続く質問に付け加えるモジュール。
+
+位置情報メッセージのあとに「近くで静かなカフェ」のように送られた場合、
+AgentCoreへのクエリに現在地（住所・緯度経度）を添えて周辺で探せるようにする。
+- プロセス内のTTL付きストア（LOCATION_CONTEXT_TTL_SEC）
+- LOCATION_CONTEXT_TABLE を設定するとDynamoDBを共有ティアとして使う。
+  queueモードでは位置情報はWebhookのLambda、続く質問はworkerのLambdaで処理されるため、
+  テーブルがないと付け加えられない（syncモードでも別コンテナに振られると付け加えられない）
+- 「近く」「この辺」など周辺を指す表現を含む質問にだけ付け加える
+"""
+
+import json
+import os
+import re
+import time
+
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_int
+from ttl_cache import TTLCache
+
+_NEARBY = re.compile("近く|近所|この辺|このへん|周辺|付近|ここ|現在地|徒歩|歩いて")
+
+_store = None
+
+
+def _enabled() -> bool:
+    return get_bool("LOCATION_CONTEXT_ENABLED", True)
+
+
+def _ttl_sec() -> int:
+    return get_int("LOCATION_CONTEXT_TTL_SEC", 1800)
+
+
+def _get_store() -> TTLCache:
+    global _store
+    if _store is None:
+        _store = TTLCache(
+            max_entries=get_int("LOCATION_CONTEXT_MAX_ENTRIES", 10000),
+            ttl_sec=_ttl_sec(),
+        )
+    return _store
+
+
+def _table_name() -> str | None:
+    return os.environ.get("LOCATION_CONTEXT_TABLE") or None
+
+
+def _get_shared(user_id: str):
+    table = _table_name()
+    if not table:
+        return None
+    try:
+        res = get_dynamodb_client().get_item(TableName=table, Key={"pk": {"S": f"location#{user_id}"}})
+    except Exception as e:
+        print(f"[WARN] Location context get failed: {e}")
+        return None
+    item = res.get("Item")
+    if not item or int(item["expires_at"]["N"]) <= int(time.time()):
+        return None
+    return tuple(json.loads(item["payload"]["S"]))
+
+
+def _put_shared(user_id: str, location: tuple):
+    table = _table_name()
+    if not table:
+        return
+    try:
+        get_dynamodb_client().put_item(
+            TableName=table,
+            Item={
+                "pk": {"S": f"location#{user_id}"},
+                "payload": {"S": json.dumps(location, ensure_ascii=False)},
+                "expires_at": {"N": str(int(time.time()) + _ttl_sec())},
+            },
+        )
+    except Exception as e:
+        print(f"[WARN] Location context put failed: {e}")
+
+
+def remember(user_id: str, lat: float, lng: float, label: str):
+    if _enabled():
+        location = (lat, lng, label)
+        _get_store().set(user_id, location)
+        _put_shared(user_id, location)
+
+
+def _load(user_id: str):
+    location = _get_store().get(user_id)
+    if location is None:
+        location = _get_shared(user_id)
+        if location is not None:
+            _get_store().set(user_id, location)
+    return location
+
+
+def attach(user_id: str, query: str) -> str:
+    """周辺を指す質問なら、覚えている現在地を付け加えたクエリを返す"""
+    if not _enabled() or not _NEARBY.search(query) or "（現在地：" in query:
+        return query
+    location = _load(user_id)
+    if location is None:
+        return query
+    lat, lng, label = location
+    # 座標は約10m単位に丸める（応答キャッシュのキーがばらけすぎないように）
+    return f"{query}（現在地：{label} 緯度{lat:.4f} 経度{lng:.4f}）"
+
+
+def clear():
+    """ストアをクリアする（テスト用）"""
+    if _store is not None:
+        _store.clear()
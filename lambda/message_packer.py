@@ -0,0 +1,116 @@
+"""
+長い応答をLINEのテキストメッセージ（吹き出し）複数個に分割するモジュール。
+
+1回のreply・pushで送れるメッセージオブジェクトは最大5個、1個あたりの文字数には上限がある。
+長い応答を途中で切り捨てる代わりに、段落（お店1件）> 行 > 句点 の順に区切りの良い位置で
+分割し、5個ずつ1回のAPI呼び出しにまとめる。
+- 文字数はLINEと同じUTF-16のコード単位で数える（絵文字などのサロゲートペアは2）
+- 分割位置で絵文字の結合（ZWJ・異体字セレクタ・肌色）や結合文字を切り離さない
+- 呼び出し回数の上限を超える分だけ、最後の吹き出しの末尾を省略する
+"""
+
+import unicodedata
+
+import metrics
+from env import get_int
+
+# 1回のreply・pushで送れるメッセージオブジェクトの最大数
+MAX_MESSAGES_PER_CALL = 5
+# テキストメッセージ1個あたりのLINEの上限（UTF-16のコード単位）
+LINE_TEXT_LIMIT = 5000
+OMITTED_SUFFIX = "\n...(長いので省略)"
+
+# 分割位置の候補（優先順）
+_BOUNDARIES = ("\n\n", "\n", "。")
+_JOINERS = frozenset("\u200d\ufe0e\ufe0f")
+
+
+def max_text_units() -> int:
+    """吹き出し1個あたりの上限（LINE_MAX_TEXT_LEN、LINEの上限以下）"""
+    return max(1, min(LINE_TEXT_LIMIT, get_int("LINE_MAX_TEXT_LEN", 4500)))
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _joined(text: str, i: int) -> bool:
+    """text[i-1] と text[i] の間で切ると見た目の1文字が分かれるか"""
+    ch = text[i]
+    return (
+        ch in _JOINERS
+        or text[i - 1] == "\u200d"
+        or 0x1F3FB <= ord(ch) <= 0x1F3FF
+        or unicodedata.combining(ch) != 0
+    )
+
+
+def _cut_index(text: str, max_units: int) -> int:
+    """UTF-16で max_units 以内に収まる最長の先頭部分の長さ（コードポイント数）"""
+    units = 0
+    for i, ch in enumerate(text):
+        units += 2 if ord(ch) > 0xFFFF else 1
+        if units > max_units:
+            cut = i
+            while cut > 0 and _joined(text, cut):
+                cut -= 1
+            # 1文字の結合列が上限を超える場合はそのまま切る
+            return cut or i
+    return len(text)
+
+
+def split_text(text: str, max_units: int) -> list[str]:
+    """各要素が max_units 以内になるよう、区切りの良い位置で分割する"""
+    pieces = []
+    rest = text
+    while utf16_len(rest) > max_units:
+        cut = max(1, _cut_index(rest, max_units))
+        head = rest[:cut]
+        for sep in _BOUNDARIES:
+            pos = head.rfind(sep)
+            # 区切りが先頭に近すぎる場合は吹き出しの数が増えるので次の候補にする
+            if pos >= cut // 2:
+                cut = pos + len(sep)
+                break
+        piece = rest[:cut].rstrip("\n")
+        if piece:
+            pieces.append(piece)
+        rest = rest[cut:].lstrip("\n")
+    if rest or not pieces:
+        pieces.append(rest)
+    return pieces
+
+
+def pack(text: str, max_calls: int = 1, max_units: int | None = None,
+         quick_reply: dict | None = None) -> list[list[dict]]:
+    """
+    応答をAPI呼び出し1回分ずつのメッセージオブジェクトのリストにする。
+
+    Args:
+        max_calls: 使ってよいAPI呼び出しの回数（reply 1回 + push 1回なら2）
+        max_units: 吹き出し1個あたりの上限（省略時は LINE_MAX_TEXT_LEN）
+        quick_reply: 最後の吹き出しに付けるクイックリプライ
+
+    Returns:
+        [[{"type": "text", "text": ...}, ...（最大5個）], ...（最大 max_calls 個）]
+    """
+    max_units = max_units or max_text_units()
+    pieces = split_text(text, max_units)
+    limit = MAX_MESSAGES_PER_CALL * max(1, max_calls)
+    if len(pieces) > limit:
+        omitted = sum(len(p) for p in pieces[limit:])
+        pieces = pieces[:limit]
+        last = pieces[-1]
+        keep = _cut_index(last, max(0, max_units - utf16_len(OMITTED_SUFFIX)))
+        omitted += len(last) - keep
+        pieces[-1] = last[:keep] + OMITTED_SUFFIX
+        metrics.record("TruncatedMessages", 1)
+        metrics.record("TruncatedChars", omitted)
+    batches = [
+        [{"type": "text", "text": p} for p in pieces[i:i + MAX_MESSAGES_PER_CALL]]
+        for i in range(0, len(pieces), MAX_MESSAGES_PER_CALL)
+    ]
+    if quick_reply:
+        # クイックリプライは最後に届いたメッセージのものだけが表示される
+        batches[-1][-1]["quickReply"] = quick_reply
+    return batches
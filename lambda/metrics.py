@@ -0,0 +1,198 @@
+"""
+CloudWatch Embedded Metric Format (EMF) でメトリクスを出力するモジュール。
+
+標準出力にEMF形式のJSONを1行で出力すると、CloudWatch Logsが自動的に
+メトリクスとして取り込む。
+
+- put_metric : メトリクスを1件出力する（put_metrics は複数をまとめて1レコード）
+- trace      : リクエスト（イベント）単位でステージごとの処理時間・ステータス・サイズを集め、
+               終了時に1レコードにまとめて出力する。correlation_id はAgentCoreにも渡し、
+               Lambda側とRuntime側のログを突き合わせられるようにする
+- set_sink   : 出力先を差し替える（テストや負荷試験でレコードを直接受け取る）
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+NAMESPACE = "LineShopBot"
+
+_sink = None
+# 実行中のトレース（スレッドごと・asyncioのタスクごとに独立）
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _namespace() -> str:
+    return os.environ.get("METRICS_NAMESPACE", NAMESPACE)
+
+
+def set_sink(sink):
+    """レコード（dict）を受け取る関数を設定する。Noneで標準出力に戻す"""
+    global _sink
+    _sink = sink
+
+
+def _emit(record: dict):
+    if _sink is not None:
+        _sink(record)
+        return
+    print(json.dumps(record, ensure_ascii=False))
+
+
+def _record(values: dict, dimensions: dict | None = None, properties: dict | None = None) -> dict:
+    """values: {メトリクス名: (値, 単位)}"""
+    dimensions = dimensions or {}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": _namespace(),
+                "Dimensions": [list(dimensions.keys())],
+                "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in values.items()],
+            }],
+        },
+        **{name: value for name, (value, _) in values.items()},
+        **dimensions,
+        **(properties or {}),
+    }
+    return record
+
+
+def put_metric(name: str, value: float, unit: str = "Count",
+               dimensions: dict | None = None, properties: dict | None = None):
+    """メトリクスを1件出力する"""
+    _emit(_record({name: (value, unit)}, dimensions, properties))
+
+
+def put_metrics(values: dict, dimensions: dict | None = None, properties: dict | None = None):
+    """複数のメトリクスを1レコードで出力する（values: {メトリクス名: (値, 単位)}）"""
+    _emit(_record(values, dimensions, properties))
+
+
+def parse_records(lines):
+    """ログの各行からEMFレコードを取り出す（オフラインでの集計・テスト用）"""
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{") or '"_aws"' not in line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "_aws" in record:
+            yield record
+
+
+# =========================
+# Tracing
+# =========================
+class Trace:
+    """1リクエスト分のステージ処理時間などを集めて1レコードで出力する"""
+
+    def __init__(self, name: str, correlation_id: str | None = None, clock=time.perf_counter):
+        self.name = name
+        self.correlation_id = correlation_id or uuid.uuid4().hex
+        self._clock = clock
+        self._started = clock()
+        self._values = {}
+        self._properties = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float, unit: str = "Count"):
+        """値を加算する（同じステージが複数回あれば合計になる）"""
+        with self._lock:
+            current, _ = self._values.get(name, (0, unit))
+            self._values[name] = (current + value, unit)
+
+    def set_property(self, key: str, value):
+        """メトリクスにはしない検索用の属性（ステータスコードなど）"""
+        with self._lock:
+            self._properties[key] = value
+
+    @contextmanager
+    def stage(self, name: str):
+        """with trace.stage("AgentCore"): ... の処理時間を {name}Ms として記録する"""
+        started = self._clock()
+        try:
+            yield self
+        except Exception as e:
+            self.set_property(f"{name}Error", type(e).__name__)
+            raise
+        finally:
+            self.add(f"{name}Ms", round((self._clock() - started) * 1000, 1), "Milliseconds")
+
+    def flush(self):
+        with self._lock:
+            values = dict(self._values)
+            values[f"{self.name}TotalMs"] = (round((self._clock() - self._started) * 1000, 1), "Milliseconds")
+            properties = {"correlation_id": self.correlation_id, "trace": self.name, **self._properties}
+            self._values.clear()
+            self._properties.clear()
+        _emit(_record(values, properties=properties))
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+def current_correlation_id() -> str | None:
+    t = current_trace()
+    return t.correlation_id if t else None
+
+
+@contextmanager
+def trace(name: str, correlation_id: str | None = None):
+    """
+    このスレッド（asyncioではこのタスク）で実行中のトレースを開始し、終了時に出力する。
+    入れ子にした場合は終了時に外側のトレースに戻る。
+    """
+    t = Trace(name, correlation_id)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        t.flush()
+
+
+def bind(fn):
+    """別スレッドで実行する関数を、呼び出し元のトレースに記録されるようにする"""
+    t = current_trace()
+    if t is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        token = _current.set(t)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+@contextmanager
+def stage(name: str):
+    """実行中のトレースにステージの処理時間を記録する（トレース外では何もしない）"""
+    t = current_trace()
+    if t is None:
+        yield None
+        return
+    with t.stage(name):
+        yield t
+
+
+def record(name: str, value: float, unit: str = "Count"):
+    """実行中のトレースに値を加算する（トレース外では何もしない）"""
+    t = current_trace()
+    if t is not None:
+        t.add(name, value, unit)
+
+
+def set_property(key: str, value):
+    t = current_trace()
+    if t is not None:
+        t.set_property(key, value)
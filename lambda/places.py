@@ -0,0 +1,156 @@
+"""
+Google Places API（Nearby Search / Text Search）をLambdaから直接呼び出すモジュール。
+
+位置情報メッセージや「エリア＋ジャンル」だけの質問（intent_router）は
+LLMを通さずに検索し、決まった書式で返信する。
+- APIキーはSSMの GOOGLE_MAPS_API_KEY（なければ環境変数）
+- PLACES_API_BASE_URL で接続先を差し替え可能（ローカルのスタブサーバー用）
+- コンテナ単位でrequests.Sessionを共有し、短いタイムアウトで呼び出す
+"""
+
+import os
+import threading
+from urllib.parse import quote
+
+import usage_meter
+from env import get_float, get_int
+from ssm_secrets import get_secret
+
+DEFAULT_BASE_URL = "https://maps.googleapis.com/maps/api"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PlacesError(Exception):
+    """Places APIの呼び出しに失敗した（フォールバックの判断に使う）"""
+
+
+def _base_url() -> str:
+    return os.environ.get("PLACES_API_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+
+
+def _get_session() -> "requests.Session":
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                _session = requests.Session()
+    return _session
+
+
+def _api_key() -> str:
+    try:
+        return get_secret("GOOGLE_MAPS_API_KEY")
+    except RuntimeError as e:
+        raise PlacesError(str(e)) from e
+
+
+def _search(path: str, params: dict) -> list[dict]:
+    params = {**params, "language": "ja", "key": _api_key()}
+    timeout = get_float("PLACES_TIMEOUT", 2.0)
+    usage_meter.add(places_calls=1)
+    try:
+        res = _get_session().get(f"{_base_url()}{path}", params=params, timeout=timeout)
+        body = res.json()
+    except Exception as e:
+        raise PlacesError(f"{path} failed: {e}") from e
+
+    status = body.get("status")
+    if status == "ZERO_RESULTS":
+        return []
+    if res.status_code >= 400 or status != "OK":
+        raise PlacesError(f"{path} returned {res.status_code} {status}: {body.get('error_message', '')}")
+
+    results = [r for r in body.get("results", []) if r.get("business_status", "OPERATIONAL") == "OPERATIONAL"]
+    # 評価（件数の少ない高評価に偏らないよう件数も加味）の高い順
+    results.sort(key=lambda r: (-(r.get("rating") or 0) * min(1.0, (r.get("user_ratings_total") or 0) / 20),
+                                r.get("name", "")))
+    return results
+
+
+def search_nearby(lat: float, lng: float, radius_m: int | None = None,
+                  place_type: str | None = None, keyword: str | None = None) -> list[dict]:
+    """
+    指定地点周辺のお店を検索する。
+
+    Returns:
+        Places APIの results（評価の高い順に並べ替え済み）
+    """
+    params = {
+        "location": f"{lat},{lng}",
+        "radius": radius_m or get_int("PLACES_RADIUS_M", 800),
+        "type": place_type or os.environ.get("PLACES_TYPE", "restaurant"),
+    }
+    if keyword:
+        params["keyword"] = keyword
+    return _search("/place/nearbysearch/json", params)
+
+
+def search_text(query: str) -> list[dict]:
+    """
+    「渋谷 ラーメン」のような文字列でお店を検索する（AgentCoreのGatewayと同じText Search）。
+
+    Returns:
+        Places APIの results（評価の高い順に並べ替え済み）
+    """
+    return _search("/place/textsearch/json", {"query": query})
+
+
+def maps_url(place: dict) -> str:
+    name = quote(place.get("name", ""))
+    place_id = place.get("place_id")
+    if place_id:
+        return f"https://www.google.com/maps/search/?api=1&query={name}&query_place_id={place_id}"
+    return f"https://www.google.com/maps/search/?api=1&query={name}"
+
+
+def _format(heading: str, places: list[dict], limit: int | None, footer: str, start: int = 1) -> str:
+    limit = limit or get_int("PLACES_MAX_RESULTS", 3)
+    lines = [heading]
+    for i, place in enumerate(places[:limit], start=start):
+        lines.append("")
+        lines.append(f"{i}. {place.get('name', '')}")
+        rating = place.get("rating")
+        if rating:
+            count = place.get("user_ratings_total")
+            lines.append(f"評価：{rating}" + (f"（{count}件）" if count else ""))
+        open_now = (place.get("opening_hours") or {}).get("open_now")
+        if open_now is not None:
+            lines.append("営業中" if open_now else "営業時間外")
+        address = place.get("vicinity") or place.get("formatted_address")
+        if address:
+            lines.append(f"住所：{address}")
+        lines.append(maps_url(place))
+    lines.append("")
+    lines.append(footer)
+    return "\n".join(lines)
+
+
+def format_places(places: list[dict], origin: str, limit: int | None = None, start: int = 1) -> str:
+    """
+    周辺検索の結果を決まった書式の返信テキストにする（同じ入力なら同じ出力）。
+    start は先頭の番号（2ページ目以降は続きの番号から振る）
+    """
+    if not places:
+        return f"{origin}の近くにお店が見つかりませんでした。\n場所やジャンルを文字で送ってもらえれば探します。"
+    heading = f"{origin}の近くのお店です。" if start == 1 else f"{origin}の近くのお店の続きです。"
+    return _format(heading, places, limit,
+                   "ジャンルや雰囲気を送ってもらえれば、この周辺でさらに探します（例：近くの静かなカフェ）", start)
+
+
+def format_search(places: list[dict], area: str, genre: str, limit: int | None = None, start: int = 1) -> str:
+    """テキスト検索の結果を決まった書式の返信テキストにする（同じ入力なら同じ出力）"""
+    heading = f"{area}の{genre}のお店です。" if start == 1 else f"{area}の{genre}のお店の続きです。"
+    return _format(heading, places, limit,
+                   f"雰囲気や予算などを添えてもらえれば、さらに絞り込んで探します（例：{area}で静かな{genre}）", start)
+
+
+def reset_session():
+    """セッションを破棄する（テスト用）"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
@@ -0,0 +1,113 @@
+"""
+長い応答を段階的に送るためのバッファとフラッシュポリシー。
+
+AgentCoreのストリーミング応答を受け取り、段落（空行区切り）単位で
+送信可能になった部分を返す。最初の塊はreply、以降はpushで送る想定。
+応答を1回で返すRuntimeでは途中で送れる塊がないので、送る側（app._deliver_progressively）は
+ストリームの続きが届くまで塊を送らず、1回のreplyにまとめる。
+
+LINE_PROGRESSIVE_MODE:
+- off      : 段階送信しない（デフォルト）
+- chars    : LINE_PROGRESSIVE_FIRST_CHARS 文字以上たまった時点で最初の段落群を送り、残りは最後にまとめて送る
+- place    : 段落（お店1件）が完成するたびに1段落ずつ送る（1つの断片で複数の段落が完成しても段落ごとに分ける）
+- deadline : LINE_PROGRESSIVE_DEADLINE_SEC 経過時点で完成済みの段落を送り、残りは最後にまとめて送る
+"""
+
+import os
+import time
+
+from env import get_float, get_int
+
+MODES = ("off", "chars", "place", "deadline")
+PARAGRAPH_SEP = "\n\n"
+
+
+class FlushPolicy:
+    def __init__(self, mode: str = "off", first_chars: int = 300, deadline_sec: float = 8.0):
+        self.mode = mode if mode in MODES else "off"
+        self.first_chars = first_chars
+        self.deadline_sec = deadline_sec
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @classmethod
+    def from_env(cls) -> "FlushPolicy":
+        return cls(
+            mode=os.environ.get("LINE_PROGRESSIVE_MODE", "off").lower(),
+            first_chars=get_int("LINE_PROGRESSIVE_FIRST_CHARS", 300),
+            deadline_sec=get_float("LINE_PROGRESSIVE_DEADLINE_SEC", 8.0),
+        )
+
+
+class ProgressiveBuffer:
+    """ストリームの断片を受け取り、送信してよい塊を返す"""
+
+    def __init__(self, policy: FlushPolicy, clock=time.monotonic):
+        self._policy = policy
+        self._clock = clock
+        self._started = clock()
+        # 未送信の断片。段落区切りが届いて送れるときだけ結合する（断片ごとに結合し直さない）
+        self._pending = []
+        self._pending_len = 0
+        self._has_sep = False
+        # 直前の断片の末尾（断片の境界をまたぐ段落区切りの検出用）
+        self._tail = ""
+        self.flush_count = 0
+
+    def _should_flush(self) -> bool:
+        mode = self._policy.mode
+        if mode == "place":
+            return True
+        if self.flush_count > 0:
+            # chars / deadline は最初の1回だけ途中送信し、残りは最後にまとめる
+            return False
+        if mode == "chars":
+            return self._pending_len >= self._policy.first_chars
+        if mode == "deadline":
+            return self._clock() - self._started >= self._policy.deadline_sec
+        return False
+
+    def feed(self, text: str) -> list[str]:
+        if not text:
+            return []
+        if not self._has_sep:
+            self._has_sep = PARAGRAPH_SEP in self._tail + text
+        self._tail = text[1 - len(PARAGRAPH_SEP):]
+        self._pending.append(text)
+        self._pending_len += len(text)
+
+        if not self._has_sep or not self._should_flush():
+            return []
+        pending = "".join(self._pending)
+        self._has_sep = False
+        cut = pending.rfind(PARAGRAPH_SEP)
+        if cut <= 0:
+            self._pending = [pending]
+            return []
+
+        head = pending[:cut].strip()
+        rest = pending[cut + len(PARAGRAPH_SEP):]
+        self._pending = [rest] if rest else []
+        self._pending_len = len(rest)
+        self._tail = rest[1 - len(PARAGRAPH_SEP):]
+        if not head:
+            return []
+        if self._policy.mode == "place":
+            chunks = [p.strip() for p in head.split(PARAGRAPH_SEP) if p.strip()]
+        else:
+            chunks = [head]
+        self.flush_count += len(chunks)
+        return chunks
+
+    def finish(self) -> str:
+        """ストリーム終了時に残りをすべて返す"""
+        rest = "".join(self._pending).strip()
+        self._pending = []
+        self._pending_len = 0
+        self._has_sep = False
+        self._tail = ""
+        if rest:
+            self.flush_count += 1
+        return rest
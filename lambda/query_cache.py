@@ -0,0 +1,171 @@
+"""
+AgentCoreの応答を検索条件ごとにキャッシュするモジュール。
+
+- キーは正規化した検索条件（全角/半角・空白・かなの表記ゆれを吸収）
+- プロセス内のLRU（QUERY_CACHE_TTL_SEC / QUERY_CACHE_MAX_ENTRIES）
+- QUERY_CACHE_TABLE を設定するとDynamoDBを共有ティアとして使う
+- 会話の文脈（Memory）に依存する質問はキャッシュしない
+- ヒット率と短縮できた時間をメトリクスとして出力
+"""
+
+import hashlib
+import os
+import re
+import time
+import unicodedata
+
+import metrics
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_int
+from ttl_cache import TTLCache
+
+# 直前の会話を参照していそうな表現（Memoryに依存するのでキャッシュしない）
+_CONTEXT_DEPENDENT = re.compile(
+    "|".join([
+        "ほかに", "他に", "ほかの", "他の", "もっと", "さっき", "先ほど", "前の", "前回",
+        "続き", "つづき", "次の", "別の", "違う", "同じ", "それ", "そこ", "あそこ",
+        "この店", "この辺", r"\d+件目", r"\d+番目", "私の", "僕の", "俺の",
+    ])
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[。．.!！?？、,]+$")
+
+_local = None
+# キャッシュミス時のAgentCore所要時間の移動平均（ヒット時の短縮時間の推定に使う）
+_avg_agent_ms = None
+
+
+def _enabled() -> bool:
+    return get_bool("QUERY_CACHE_ENABLED", True)
+
+
+def _ttl_sec() -> int:
+    return get_int("QUERY_CACHE_TTL_SEC", 600)
+
+
+def _max_value_chars() -> int:
+    return get_int("QUERY_CACHE_MAX_VALUE_CHARS", 10000)
+
+
+def _get_local_cache() -> TTLCache:
+    global _local
+    if _local is None:
+        _local = TTLCache(
+            max_entries=get_int("QUERY_CACHE_MAX_ENTRIES", 256),
+            ttl_sec=_ttl_sec(),
+        )
+    return _local
+
+
+def _katakana_to_hiragana(text: str) -> str:
+    return "".join(
+        chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch
+        for ch in text
+    )
+
+
+def normalize_query(text: str) -> str:
+    """検索条件を正規化する（＠→@、全角空白→空白、半角カナ→全角、カタカナ→ひらがな）"""
+    text = unicodedata.normalize("NFKC", text)
+    text = _katakana_to_hiragana(text)
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return _TRAILING_PUNCT.sub("", text)
+
+
+def is_context_dependent(query: str) -> bool:
+    """直前の会話に依存していそうな質問か（空の質問も含む）"""
+    normalized = normalize_query(query)
+    return not normalized or bool(_CONTEXT_DEPENDENT.search(normalized))
+
+
+def is_cacheable(query: str) -> bool:
+    if not _enabled():
+        return False
+    return not is_context_dependent(query)
+
+
+def cache_key(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def _table_name() -> str | None:
+    return os.environ.get("QUERY_CACHE_TABLE") or None
+
+
+def _get_shared(key: str) -> str | None:
+    table = _table_name()
+    if not table:
+        return None
+    try:
+        res = get_dynamodb_client().get_item(
+            TableName=table,
+            Key={"pk": {"S": key}},
+            ConsistentRead=False,
+        )
+    except Exception as e:
+        print(f"[WARN] Query cache get failed: {e}")
+        return None
+    item = res.get("Item")
+    if not item or int(item["expires_at"]["N"]) <= int(time.time()):
+        return None
+    return item["answer"]["S"]
+
+
+def _put_shared(key: str, answer: str):
+    table = _table_name()
+    if not table:
+        return
+    try:
+        get_dynamodb_client().put_item(
+            TableName=table,
+            Item={
+                "pk": {"S": key},
+                "answer": {"S": answer},
+                "expires_at": {"N": str(int(time.time()) + _ttl_sec())},
+            },
+        )
+    except Exception as e:
+        print(f"[WARN] Query cache put failed: {e}")
+
+
+def get(query: str) -> str | None:
+    """キャッシュ済みの応答を返す（なければNone）"""
+    if not is_cacheable(query):
+        return None
+
+    key = cache_key(query)
+    tier = "local"
+    answer = _get_local_cache().get(key)
+    if answer is None:
+        tier = "dynamodb"
+        answer = _get_shared(key)
+        if answer is not None:
+            _get_local_cache().set(key, answer)
+
+    metrics.put_metric("QueryCacheHit" if answer is not None else "QueryCacheMiss", 1,
+                       properties={"tier": tier} if answer is not None else None)
+    if answer is not None and _avg_agent_ms is not None:
+        metrics.put_metric("QueryCacheLatencySavedMs", round(_avg_agent_ms, 1), "Milliseconds")
+    return answer
+
+
+def put(query: str, answer: str, agent_ms: float | None = None):
+    """AgentCoreの応答をキャッシュする"""
+    global _avg_agent_ms
+    if agent_ms is not None:
+        _avg_agent_ms = agent_ms if _avg_agent_ms is None else _avg_agent_ms * 0.8 + agent_ms * 0.2
+
+    if not answer or len(answer) > _max_value_chars() or not is_cacheable(query):
+        return
+    key = cache_key(query)
+    _get_local_cache().set(key, answer)
+    _put_shared(key, answer)
+
+
+def clear():
+    """プロセス内キャッシュと応答時間の平均をクリアする（テスト用）"""
+    global _avg_agent_ms
+    _avg_agent_ms = None
+    if _local is not None:
+        _local.clear()
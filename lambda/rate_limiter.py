@@ -0,0 +1,129 @@
+"""
+ユーザー（グループ・ルーム）単位のレート制限モジュール。
+
+AgentCore Runtimeの同時実行数とBedrockのクォータを1人に使い切られないようにする。
+- プロセス内：トークンバケット（RATE_LIMIT_BURST 個まで連続可、毎分 RATE_LIMIT_REFILL_PER_MIN 個回復）
+- RATE_LIMIT_TABLE を設定するとDynamoDBのアトミックカウンタで
+  コンテナ間でも RATE_LIMIT_WINDOW_SEC ごとの上限を共有する
+"""
+
+import os
+import threading
+import time
+
+import metrics
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_float
+
+LIMITED_MESSAGE = "リクエストが集中しています。少し時間をおいてからお試しください。"
+
+
+def _enabled() -> bool:
+    return get_bool("RATE_LIMIT_ENABLED", True)
+
+
+class TokenBucket:
+    """キーごとのトークンバケット（スレッドセーフ）"""
+
+    def __init__(self, burst: float, refill_per_sec: float, clock=time.monotonic, max_keys: int = 10000):
+        self.burst = burst
+        self.refill_per_sec = refill_per_sec
+        self._clock = clock
+        self._max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: str, cost: float = 1.0) -> bool:
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.refill_per_sec)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self._max_keys:
+                self._evict_full(now)
+            return allowed
+
+    def _evict_full(self, now: float):
+        """満タンまで回復したバケットは初期状態と同じなので捨てる"""
+        full = [
+            k for k, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.refill_per_sec >= self.burst
+        ]
+        for k in full:
+            del self._buckets[k]
+
+
+_bucket = None
+
+
+def _get_bucket() -> TokenBucket:
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(
+            burst=get_float("RATE_LIMIT_BURST", 10),
+            refill_per_sec=get_float("RATE_LIMIT_REFILL_PER_MIN", 10) / 60,
+        )
+    return _bucket
+
+
+def _table_name() -> str | None:
+    return os.environ.get("RATE_LIMIT_TABLE") or None
+
+
+def _allow_shared(key: str) -> bool:
+    """固定ウィンドウのアトミックカウンタで上限を超えていないか判定する"""
+    window = max(1, int(get_float("RATE_LIMIT_WINDOW_SEC", 60)))
+    burst = get_float("RATE_LIMIT_BURST", 10)
+    refill_per_min = get_float("RATE_LIMIT_REFILL_PER_MIN", 10)
+    limit = int(get_float("RATE_LIMIT_SHARED_MAX_PER_WINDOW", burst + refill_per_min * window / 60))
+
+    now = int(time.time())
+    window_start = now - now % window
+    client = get_dynamodb_client()
+    try:
+        client.update_item(
+            TableName=_table_name(),
+            Key={"pk": {"S": f"{key}#{window_start}"}},
+            UpdateExpression="ADD #c :one SET expires_at = :exp",
+            ConditionExpression="attribute_not_exists(#c) OR #c < :limit",
+            ExpressionAttributeNames={"#c": "count"},
+            ExpressionAttributeValues={
+                ":one": {"N": "1"},
+                ":limit": {"N": str(limit)},
+                ":exp": {"N": str(window_start + window * 2)},
+            },
+        )
+        return True
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def allow(key: str) -> bool:
+    """AgentCoreを呼んでよいか判定する。制限した場合はメトリクスを出力する"""
+    if not _enabled():
+        return True
+
+    if not _get_bucket().allow(key):
+        metrics.put_metric("RateLimited", 1, properties={"tier": "local"})
+        return False
+
+    if not _table_name():
+        return True
+    try:
+        allowed = _allow_shared(key)
+    except Exception as e:
+        # 共有ティアが使えない場合はプロセス内の判定だけで通す
+        print(f"[WARN] Rate limit store unavailable: {e}")
+        return True
+    if not allowed:
+        metrics.put_metric("RateLimited", 1, properties={"tier": "dynamodb"})
+    return allowed
+
+
+def reset():
+    """状態を破棄する（テスト用）"""
+    global _bucket
+    _bucket = None
@@ -0,0 +1,240 @@
+"""
+Places APIの検索結果をページ送り（「もっと見る」）で返すためのカーソルを管理するモジュール。
+
+位置情報・「エリア＋ジャンル」の直接検索では、Places APIが返した候補（最大20件）のうち
+最初の数件だけを返信する。残りはカーソルに紐づけて保存し、返信のクイックリプライ
+（postbackボタン）や「他には？」「もっと見る」への応答で、AgentCoreやPlaces APIを
+呼ばずに次のページを返す。
+- カーソルはpostbackのdataに入れる（同じボタンを2回押しても同じページを返す）
+- ユーザーごとに最後に見たカーソルと次の位置も覚え、テキストでの「もっと見る」に使う
+- プロセス内のLRU（RESULT_PAGES_TTL_SEC / RESULT_PAGES_MAX_ENTRIES）
+- RESULT_PAGES_TABLE を設定するとDynamoDBを共有ティアとして使う（別コンテナでもページ送りできる）
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs, urlencode
+
+import places
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_int
+from ttl_cache import TTLCache
+
+NEARBY = "nearby"
+SEARCH = "search"
+
+MORE_ACTION = "more"
+MORE_LABEL = "もっと見る"
+EXPIRED_MESSAGE = "前回の検索結果の保存期間が過ぎました。もう一度条件を送ってください。"
+NO_MORE_MESSAGE = "これ以上の候補はありません。条件を変えて送ってもらえれば、さらに探します。"
+
+# 保存する項目（返信の書式に使うものだけ）
+_FIELDS = ("name", "place_id", "rating", "user_ratings_total", "vicinity", "formatted_address")
+
+# 次のページを求めるテキスト
+_MORE_REQUEST = re.compile(
+    r"^(他に(は|も)?|ほかに(は|も)?|もっと(見る|見せて)?|次|つぎ|続き|つづき)"
+    r"(は|を)?(ある|ない|あります|ありますか|見せて|見たい|教えて)?[?？!！。…\s]*$"
+)
+
+_pages = None
+_positions = None
+
+
+def _enabled() -> bool:
+    return get_bool("RESULT_PAGES_ENABLED", True)
+
+
+def _ttl_sec() -> int:
+    return get_int("RESULT_PAGES_TTL_SEC", 1800)
+
+
+def page_size() -> int:
+    return max(1, get_int("PLACES_MAX_RESULTS", 3))
+
+
+def _get_pages() -> TTLCache:
+    global _pages
+    if _pages is None:
+        _pages = TTLCache(max_entries=get_int("RESULT_PAGES_MAX_ENTRIES", 1000), ttl_sec=_ttl_sec())
+    return _pages
+
+
+def _get_positions() -> TTLCache:
+    global _positions
+    if _positions is None:
+        _positions = TTLCache(max_entries=get_int("RESULT_PAGES_MAX_ENTRIES", 1000), ttl_sec=_ttl_sec())
+    return _positions
+
+
+def _table_name() -> str | None:
+    return os.environ.get("RESULT_PAGES_TABLE") or None
+
+
+def _get_shared(key: str):
+    table = _table_name()
+    if not table:
+        return None
+    try:
+        res = get_dynamodb_client().get_item(TableName=table, Key={"pk": {"S": key}})
+    except Exception as e:
+        print(f"[WARN] Result pages get failed: {e}")
+        return None
+    item = res.get("Item")
+    if not item or int(item["expires_at"]["N"]) <= int(time.time()):
+        return None
+    return json.loads(item["payload"]["S"])
+
+
+def _put_shared(key: str, value):
+    table = _table_name()
+    if not table:
+        return
+    try:
+        get_dynamodb_client().put_item(
+            TableName=table,
+            Item={
+                "pk": {"S": key},
+                "payload": {"S": json.dumps(value, ensure_ascii=False)},
+                "expires_at": {"N": str(int(time.time()) + _ttl_sec())},
+            },
+        )
+    except Exception as e:
+        print(f"[WARN] Result pages put failed: {e}")
+
+
+def _compact(place: dict) -> dict:
+    entry = {k: place[k] for k in _FIELDS if k in place}
+    open_now = (place.get("opening_hours") or {}).get("open_now")
+    if open_now is not None:
+        entry["opening_hours"] = {"open_now": open_now}
+    return entry
+
+
+def _load(cursor: str) -> dict | None:
+    entry = _get_pages().get(cursor)
+    if entry is None:
+        entry = _get_shared(f"cursor#{cursor}")
+        if entry is not None:
+            _get_pages().set(cursor, entry)
+    return entry
+
+
+def _remember_position(user_id: str, cursor: str, offset: int | None):
+    position = [cursor, offset]
+    _get_positions().set(user_id, position)
+    _put_shared(f"user#{user_id}", position)
+
+
+def forget(user_id: str):
+    """別の質問に答えたので、以降の「他には？」はページ送りにしない"""
+    if not _enabled():
+        return
+    _get_positions().pop(user_id)
+    table = _table_name()
+    if not table:
+        return
+    try:
+        get_dynamodb_client().delete_item(TableName=table, Key={"pk": {"S": f"user#{user_id}"}})
+    except Exception as e:
+        print(f"[WARN] Result pages delete failed: {e}")
+
+
+def latest(user_id: str) -> tuple[str, int] | None:
+    """ユーザーが最後に見た検索結果の (カーソル, 次のページの位置)。次のページがなければNone"""
+    if not _enabled():
+        return None
+    position = _get_positions().get(user_id)
+    if position is None:
+        position = _get_shared(f"user#{user_id}")
+        if position is not None:
+            _get_positions().set(user_id, position)
+    if not position or position[1] is None:
+        return None
+    return position[0], position[1]
+
+
+def _render(entry: dict, offset: int) -> tuple[str, int | None]:
+    size = page_size()
+    results = entry["results"]
+    items = results[offset:offset + size]
+    params = entry["params"]
+    if entry["kind"] == NEARBY:
+        text = places.format_places(items, params["origin"], size, start=offset + 1)
+    else:
+        text = places.format_search(items, params["area"], params["genre"], size, start=offset + 1)
+    next_offset = offset + size if offset + size < len(results) else None
+    return text, next_offset
+
+
+def quick_reply(cursor: str, offset: int) -> dict:
+    """次のページを表示するpostbackボタン"""
+    data = urlencode({"action": MORE_ACTION, "cursor": cursor, "offset": offset})
+    return {
+        "items": [{
+            "type": "action",
+            "action": {"type": "postback", "label": MORE_LABEL, "data": data, "displayText": MORE_LABEL},
+        }],
+    }
+
+
+def parse_postback(data: str) -> tuple[str, int] | None:
+    """「もっと見る」のpostbackなら (カーソル, 位置)"""
+    params = parse_qs(data or "")
+    if params.get("action") != [MORE_ACTION]:
+        return None
+    try:
+        return params["cursor"][0], int(params["offset"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def is_more_request(text: str) -> bool:
+    return bool(_MORE_REQUEST.match((text or "").strip()))
+
+
+def first_page(user_id: str, kind: str, params: dict, results: list[dict]) -> tuple[str, dict | None]:
+    """
+    検索結果を保存し、最初のページを返す。
+
+    Returns:
+        (返信テキスト, 次のページがあればクイックリプライ)
+    """
+    entry = {"kind": kind, "params": params, "results": [_compact(r) for r in results]}
+    text, next_offset = _render(entry, 0)
+    if next_offset is None or not _enabled():
+        forget(user_id)
+        return text, None
+    cursor = uuid.uuid4().hex[:16]
+    _get_pages().set(cursor, entry)
+    _put_shared(f"cursor#{cursor}", entry)
+    _remember_position(user_id, cursor, next_offset)
+    return text, quick_reply(cursor, next_offset)
+
+
+def next_page(user_id: str, cursor: str, offset: int) -> tuple[str, dict | None]:
+    """
+    保存済みの検索結果から offset 以降のページを返す（AgentCore・Places APIは呼ばない）。
+
+    Returns:
+        (返信テキスト, さらに次のページがあればクイックリプライ)
+    """
+    entry = _load(cursor)
+    if entry is None:
+        return EXPIRED_MESSAGE, None
+    if offset < 0 or offset >= len(entry["results"]):
+        return NO_MORE_MESSAGE, None
+    text, next_offset = _render(entry, offset)
+    _remember_position(user_id, cursor, next_offset)
+    return text, quick_reply(cursor, next_offset) if next_offset is not None else None
+
+
+def clear():
+    """プロセス内のストアをクリアする（テスト用）"""
+    if _pages is not None:
+        _pages.clear()
+    if _positions is not None:
+        _positions.clear()
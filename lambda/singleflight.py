@@ -0,0 +1,259 @@
+"""
+同じ検索条件のAgentCore呼び出しを1回にまとめる（シングルフライト）モジュール。
+
+昼どきにグループの複数人が同じ「@お店 ...」を送った場合などに、
+最初の呼び出しの結果を待って共有する（返信はそれぞれのreplyTokenで行う）。
+- キーは query_cache と同じ正規化した検索条件
+- プロセス内：スレッド間で処理中の呼び出しを共有する
+- SINGLEFLIGHT_TABLE を設定するとDynamoDBのロックアイテムでコンテナ間でも共有する
+  （先に取得したコンテナが結果をアイテムに書き込み、他はそれをポーリングで待つ）
+- 会話の文脈に依存する質問はまとめない
+- まとめた件数は CollapsedRequests メトリクスとして出力
+"""
+
+import os
+import threading
+import time
+import uuid
+
+import metrics
+import query_cache
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_float
+
+IN_FLIGHT = "IN_FLIGHT"
+DONE = "DONE"
+
+
+def _enabled() -> bool:
+    return get_bool("SINGLEFLIGHT_ENABLED", True)
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """プロセス内のシングルフライト"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, timeout: float | None = None) -> tuple[object, bool]:
+        """
+        Returns:
+            (fnの結果, 他の呼び出しの結果を共有したか)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"timed out waiting for in-flight call ({timeout}s)")
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.value, False
+
+
+class DynamoFlight:
+    """
+    DynamoDBのロックアイテムによるシングルフライト。
+
+    pk           : 検索条件のキー
+    status       : IN_FLIGHT / DONE
+    owner        : ロックを取得した呼び出しのID
+    lease_until  : ロックの有効期限（エポック秒）。過ぎたら他の呼び出しが取得できる
+    answer       : DONEの場合の結果（result_ttl_sec の間、後から来た呼び出しにも返す）
+    """
+
+    def __init__(self, table_name: str, poll_sec: float = 0.3, result_ttl_sec: float = 10.0,
+                 clock=time.time, sleep=time.sleep):
+        self.table_name = table_name
+        self.poll_sec = poll_sec
+        self.result_ttl_sec = result_ttl_sec
+        self._clock = clock
+        self._sleep = sleep
+
+    def _acquire(self, key: str, owner: str, lease_sec: float) -> bool:
+        client = get_dynamodb_client()
+        now = self._clock()
+        try:
+            client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "pk": {"S": key},
+                    "status": {"S": IN_FLIGHT},
+                    "owner": {"S": owner},
+                    "lease_until": {"N": f"{now + lease_sec:.3f}"},
+                    "expires_at": {"N": str(int(now + lease_sec + 60))},
+                },
+                ConditionExpression="attribute_not_exists(pk) OR lease_until < :now",
+                ExpressionAttributeValues={":now": {"N": f"{now:.3f}"}},
+            )
+            return True
+        except client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def _load(self, key: str) -> dict | None:
+        res = get_dynamodb_client().get_item(
+            TableName=self.table_name, Key={"pk": {"S": key}}, ConsistentRead=True,
+        )
+        return res.get("Item")
+
+    def _publish(self, key: str, owner: str, value: str):
+        client = get_dynamodb_client()
+        now = self._clock()
+        try:
+            client.update_item(
+                TableName=self.table_name,
+                Key={"pk": {"S": key}},
+                UpdateExpression="SET #s = :done, answer = :a, lease_until = :l, expires_at = :e",
+                ConditionExpression="#o = :me",
+                ExpressionAttributeNames={"#s": "status", "#o": "owner"},
+                ExpressionAttributeValues={
+                    ":done": {"S": DONE},
+                    ":a": {"S": value},
+                    ":l": {"N": f"{now + self.result_ttl_sec:.3f}"},
+                    ":e": {"N": str(int(now + self.result_ttl_sec + 60))},
+                    ":me": {"S": owner},
+                },
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            # リースが切れて他の呼び出しに引き継がれていた
+            pass
+
+    def _release(self, key: str, owner: str):
+        client = get_dynamodb_client()
+        try:
+            client.delete_item(
+                TableName=self.table_name,
+                Key={"pk": {"S": key}},
+                ConditionExpression="#o = :me",
+                ExpressionAttributeNames={"#o": "owner"},
+                ExpressionAttributeValues={":me": {"S": owner}},
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def do(self, key: str, fn, timeout: float | None = None) -> tuple[object, bool]:
+        timeout = timeout if timeout is not None else get_float("SINGLEFLIGHT_WAIT_SEC", 60)
+        owner = uuid.uuid4().hex
+        give_up_at = self._clock() + timeout
+        try:
+            while not self._acquire(key, owner, timeout):
+                item = self._load(key)
+                if item and item["status"]["S"] == DONE and "answer" in item:
+                    return item["answer"]["S"], True
+                if self._clock() >= give_up_at:
+                    raise TimeoutError(f"timed out waiting for in-flight call ({timeout}s)")
+                # ロックが外れた・リースが切れた場合は次のループで取得を試みる
+                self._sleep(min(self.poll_sec, max(0.0, give_up_at - self._clock())))
+        except TimeoutError:
+            raise
+        except Exception as e:
+            # ロックストアが使えない場合はまとめずに呼び出す
+            print(f"[WARN] Single-flight store unavailable: {e}")
+            return fn(), False
+
+        try:
+            value = fn()
+        except Exception:
+            self._release_quietly(key, owner)
+            raise
+        try:
+            self._publish(key, owner, value)
+        except Exception as e:
+            print(f"[WARN] Single-flight publish failed: {e}")
+        return value, False
+
+    def _release_quietly(self, key: str, owner: str):
+        try:
+            self._release(key, owner)
+        except Exception as e:
+            print(f"[WARN] Single-flight release failed: {e}")
+
+
+_local = SingleFlight()
+_remote = None
+_remote_lock = threading.Lock()
+
+
+def _get_remote() -> DynamoFlight | None:
+    global _remote
+    table = os.environ.get("SINGLEFLIGHT_TABLE")
+    if not table:
+        return None
+    if _remote is None:
+        with _remote_lock:
+            if _remote is None:
+                _remote = DynamoFlight(
+                    table,
+                    poll_sec=get_float("SINGLEFLIGHT_POLL_SEC", 0.3),
+                    result_ttl_sec=get_float("SINGLEFLIGHT_RESULT_TTL_SEC", 10),
+                )
+    return _remote
+
+
+def flight_key(query: str) -> str | None:
+    """
+    まとめる単位のキー（正規化した検索条件）。
+    無効時・会話の文脈に依存する質問（ユーザーごとに答えが変わる）はNone
+    """
+    if not _enabled() or query_cache.is_context_dependent(query):
+        return None
+    return f"sf#{query_cache.cache_key(query)}"
+
+
+def do(query: str, fn, timeout: float | None = None) -> str:
+    """
+    同じ検索条件の呼び出しが処理中ならその結果を待って返し、なければ fn を呼ぶ。
+    fn（先行の呼び出し）が例外を送出した場合は、待っていた呼び出しにも同じ例外を送出する。
+    """
+    key = flight_key(query)
+    if key is None:
+        return fn()
+
+    remote = _get_remote()
+
+    def call():
+        if remote is None:
+            return fn()
+        value, shared = remote.do(key, fn, timeout)
+        if shared:
+            metrics.put_metric("CollapsedRequests", 1, properties={"tier": "dynamodb"})
+            metrics.set_property("answer_source", "collapsed")
+        return value
+
+    value, shared = _local.do(key, call, timeout)
+    if shared:
+        metrics.put_metric("CollapsedRequests", 1, properties={"tier": "local"})
+        metrics.set_property("answer_source", "collapsed")
+    return value
+
+
+def reset():
+    """状態を破棄する（テスト用）"""
+    global _local, _remote
+    _local = SingleFlight()
+    _remote = None
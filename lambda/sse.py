@@ -0,0 +1,164 @@
+"""
+AgentCore Runtimeのレスポンス（Server-Sent Events）を逐次デコードするモジュール。
+
+- StreamingBodyをチャンク単位で読み、届いたイベントから順に返す
+- マルチバイト文字やイベントがチャンク境界で分断されても正しく復元する
+- data: のペイロードはJSONとしてデコード（エスケープ・\\uXXXXを正しく復元）
+"""
+
+import codecs
+import json
+
+DEFAULT_CHUNK_SIZE = 8192
+
+
+def _find_line_end(text: str, start: int) -> int:
+    """start以降で最初の改行文字（CR / LF）の位置。なければ -1"""
+    lf = text.find("\n", start)
+    cr = text.find("\r", start)
+    if cr == -1:
+        return lf
+    if lf == -1:
+        return cr
+    return min(lf, cr)
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, event: str, data: str, id: str | None):
+        self.event = event
+        self.data = data
+        self.id = id
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data!r}, id={self.id!r})"
+
+
+class SSEDecoder:
+    """バイト列を受け取り、完成したSSEイベントを返すインクリメンタルデコーダー"""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._parts = []
+        self._pending_cr = False
+        self._reset_event()
+
+    def _reset_event(self):
+        self._event = ""
+        self._data = []
+        self._id = None
+
+    def _split_lines(self, text: str) -> list[str]:
+        """完成した行を取り出す（CRLF / LF / CR いずれの改行にも対応）"""
+        if self._pending_cr and text.startswith("\n"):
+            text = text[1:]
+        self._pending_cr = False
+
+        lines = []
+        start = 0
+        n = len(text)
+        # 行の途中までの断片はリストに溜め、行が完成したときだけ結合する
+        i = _find_line_end(text, 0)
+        while i != -1:
+            self._parts.append(text[start:i])
+            lines.append("".join(self._parts))
+            self._parts = []
+            if text[i] == "\r":
+                if i + 1 < n:
+                    if text[i + 1] == "\n":
+                        i += 1
+                else:
+                    # 次のチャンク先頭の \n はこのCRの一部
+                    self._pending_cr = True
+            start = i + 1
+            i = _find_line_end(text, start)
+        if start < n:
+            self._parts.append(text[start:])
+        return lines
+
+    def _process_line(self, line: str) -> SSEEvent | None:
+        if line == "":
+            if not self._data and not self._event:
+                self._reset_event()
+                return None
+            ev = SSEEvent(self._event or "message", "\n".join(self._data), self._id)
+            self._reset_event()
+            return ev
+        if line.startswith(":"):
+            return None
+
+        field, sep, value = line.partition(":")
+        if sep and value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self._data.append(value)
+        elif field == "event":
+            self._event = value
+        elif field == "id":
+            self._id = value
+        return None
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        events = []
+        for line in self._split_lines(self._decoder.decode(chunk)):
+            ev = self._process_line(line)
+            if ev is not None:
+                events.append(ev)
+        return events
+
+    def close(self) -> list[SSEEvent]:
+        """ストリーム終端。末尾に空行がなくても残りのイベントを確定する"""
+        lines = self._split_lines(self._decoder.decode(b"", final=True))
+        if self._parts:
+            lines.append("".join(self._parts))
+            self._parts = []
+        lines.append("")
+        events = []
+        for line in lines:
+            ev = self._process_line(line)
+            if ev is not None:
+                events.append(ev)
+        return events
+
+
+def _iter_chunks(body, chunk_size: int):
+    if hasattr(body, "iter_chunks"):
+        yield from body.iter_chunks(chunk_size)
+        return
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_events(body, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """StreamingBodyからSSEイベントを逐次取り出す"""
+    decoder = SSEDecoder()
+    for chunk in _iter_chunks(body, chunk_size):
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+def decode_data(data: str) -> str:
+    """data: のペイロードをテキストに変換する（JSON文字列ならデコード）"""
+    try:
+        value = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        for key in ("response", "text", "content"):
+            if isinstance(value.get(key), str):
+                return value[key]
+    return json.dumps(value, ensure_ascii=False)
+
+
+def iter_text(body, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """StreamingBodyからテキスト断片を逐次取り出す"""
+    for ev in iter_events(body, chunk_size):
+        if ev.event != "message" or not ev.data:
+            continue
+        yield decode_data(ev.data)
@@ -5,60 +5,152 @@ Parameter Storeからシークレットを取得するモジュール。
 - 4.1: コールドスタート時にboto3を使用してParameter_Storeクライアントを初期化
 - 4.2: ウォーム起動中、取得したシークレットをメモリにキャッシュ
 - 4.4: 環境変数フォールバック（ローカルテスト用）
+
+コンテナ初期化時に SSM_PREFIX 配下をget_parameters_by_pathでまとめて取得する。
+キャッシュは REINIT_EVERY_SEC で期限切れになり、期限切れ後は古い値を返しつつ
+バックグラウンドで再取得する（stale-while-revalidate）。
 """
 
 import os
-import boto3
+import threading
+import time
+
+from env import get_int
 
 _ssm_client = None
 _secrets_cache = {}
+_prefetch_attempted = False
+_refreshing = False
+_lock = threading.Lock()
+
+# SSM API呼び出し回数（コスト・レイテンシの確認用）
+_api_calls = {"get_parameters_by_path": 0, "get_parameter": 0}
 
 
 def _get_ssm_client():
     """SSMクライアントを取得（遅延初期化）"""
     global _ssm_client
     if _ssm_client is None:
-        _ssm_client = boto3.client('ssm')
+        import boto3
+        _ssm_client = boto3.client('ssm', endpoint_url=os.environ.get("SSM_ENDPOINT_URL") or None)
     return _ssm_client
 
 
+def _ttl_sec() -> int:
+    """キャッシュの有効期間（秒）。0以下なら期限切れにしない"""
+    return get_int("REINIT_EVERY_SEC", 900)
+
+
+def _expires_at() -> float:
+    ttl = _ttl_sec()
+    return time.monotonic() + ttl if ttl > 0 else float("inf")
+
+
+def _fetch_all(ssm_prefix: str) -> dict:
+    """SSM_PREFIX配下のパラメータをまとめて取得する"""
+    client = _get_ssm_client()
+    paginator = client.get_paginator("get_parameters_by_path")
+    values = {}
+    for page in paginator.paginate(Path=ssm_prefix, WithDecryption=True, Recursive=False):
+        _api_calls["get_parameters_by_path"] += 1
+        for param in page.get("Parameters", []):
+            name = param["Name"][len(ssm_prefix):].lstrip("/")
+            values[name] = param["Value"]
+    return values
+
+
+def _store_all(values: dict):
+    expires_at = _expires_at()
+    with _lock:
+        for name, value in values.items():
+            _secrets_cache[name] = (value, expires_at)
+
+
+def prefetch_secrets() -> bool:
+    """
+    SSM_PREFIX配下のシークレットをまとめてキャッシュする（コンテナ初期化時に呼ぶ）。
+
+    Returns:
+        取得できたかどうか（SSM_PREFIXがない場合はFalse）
+    """
+    global _prefetch_attempted
+    ssm_prefix = os.environ.get("SSM_PREFIX")
+    if not ssm_prefix:
+        return False
+    _prefetch_attempted = True
+    try:
+        _store_all(_fetch_all(ssm_prefix))
+        return True
+    except Exception as e:
+        print(f"[WARN] Failed to prefetch secrets: {e}")
+        return False
+
+
+def _refresh_in_background(ssm_prefix: str):
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+
+    def run():
+        global _refreshing
+        try:
+            _store_all(_fetch_all(ssm_prefix))
+        except Exception as e:
+            print(f"[WARN] Background secret refresh failed: {e}")
+        finally:
+            _refreshing = False
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def get_secret(name: str, use_cache: bool = True) -> str:
     """
     Parameter Storeからシークレットを取得する。
-    
+
     環境変数SSM_PREFIXが設定されている場合はParameter Storeから取得。
     設定されていない場合は環境変数から取得（ローカルテスト用）。
-    
+
     Args:
         name: シークレット名（例: GOOGLE_MAPS_API_KEY）
         use_cache: キャッシュを使用するかどうか（デフォルト: True）
-    
+
     Returns:
         シークレットの値
-    
+
     Raises:
         RuntimeError: シークレットが見つからない場合
     """
     ssm_prefix = os.environ.get("SSM_PREFIX")
-    
+
     # ローカルテスト用：SSM_PREFIXがない場合は環境変数から取得
     if not ssm_prefix:
         return os.environ.get(name, "")
-    
-    # キャッシュチェック
-    if use_cache and name in _secrets_cache:
-        return _secrets_cache[name]
-    
+
+    # キャッシュチェック（期限切れでも古い値を返し、裏で再取得する）
+    if use_cache:
+        if not _prefetch_attempted:
+            prefetch_secrets()
+        cached = _secrets_cache.get(name)
+        if cached is not None:
+            value, expires_at = cached
+            if expires_at <= time.monotonic():
+                _refresh_in_background(ssm_prefix)
+            return value
+
     # Parameter Storeから取得
     try:
         client = _get_ssm_client()
         param_name = f"{ssm_prefix}/{name}"
+        _api_calls["get_parameter"] += 1
         response = client.get_parameter(Name=param_name, WithDecryption=True)
         value = response['Parameter']['Value']
-        
+
         if use_cache:
-            _secrets_cache[name] = value
-        
+            with _lock:
+                _secrets_cache[name] = (value, _expires_at())
+
         return value
     except Exception as e:
         print(f"[ERROR] Failed to get secret {name}: {e}")
@@ -70,7 +162,17 @@ def get_secret(name: str, use_cache: bool = True) -> str:
         raise RuntimeError(f"Secret {name} not found in Parameter Store or environment")
 
 
+def get_api_call_counts() -> dict:
+    """SSM API呼び出し回数を返す"""
+    return dict(_api_calls)
+
+
 def clear_cache():
-    """キャッシュをクリアする（テスト用）"""
-    global _secrets_cache
+    """キャッシュとクライアントをクリアする（テスト用）"""
+    global _ssm_client, _secrets_cache, _prefetch_attempted, _refreshing
+    _ssm_client = None
     _secrets_cache = {}
+    _prefetch_attempted = False
+    _refreshing = False
+    for key in _api_calls:
+        _api_calls[key] = 0
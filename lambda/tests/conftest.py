@@ -0,0 +1,164 @@
+"""
+lambda/ のテスト共通の設定。
+
+- lambda/ をimportパスに追加し、SSM・実際のAWSには接続しない
+- モジュールが持つコンテナ内の状態（キャッシュ・ストア・クライアント）はテストごとに破棄する
+- metrics_records でEMFのレコードをリストで受け取れる
+- create_table でmotoのDynamoDBにテーブル（キーは pk）を、create_queue でSQS FIFOキューを作れる
+- fake_line / fake_agent / fake_places でLINE API・AgentCore・Places APIを置き換え、送信内容・呼び出しを記録する
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+os.environ.pop("SSM_PREFIX", None)
+os.environ.update({
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_SESSION_TOKEN": "testing",
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+})
+
+
+def _reset_state():
+    import agentcore_client
+    import circuit_breaker
+    import coalesce
+    import delivery_outbox
+    import dynamodb
+    import event_queue
+    import idempotency
+    import line_api
+    import location_context
+    import query_cache
+    import rate_limiter
+    import result_pages
+    import singleflight
+    import ssm_secrets
+    import usage_meter
+
+    agentcore_client.reset_client()
+    circuit_breaker.agentcore_breaker.reset()
+    circuit_breaker.line_breaker.reset()
+    circuit_breaker.loading_breaker.reset()
+    coalesce.reset()
+    delivery_outbox.reset_client()
+    dynamodb.reset_client()
+    event_queue.reset_client()
+    idempotency.clear()
+    line_api.reset_session()
+    location_context.clear()
+    query_cache.clear()
+    rate_limiter.reset()
+    result_pages.clear()
+    singleflight.reset()
+    ssm_secrets.clear_cache()
+    usage_meter.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    _reset_state()
+    yield
+    _reset_state()
+
+
+@pytest.fixture
+def metrics_records():
+    import metrics
+
+    records = []
+    metrics.set_sink(records.append)
+    yield records
+    metrics.set_sink(None)
+
+
+@pytest.fixture
+def aws():
+    """moto でAWSのAPIを置き換える"""
+    from moto import mock_aws
+
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def create_table(aws, monkeypatch):
+    """DynamoDBのテーブルを作り、環境変数 env_name に設定する"""
+    from dynamodb import get_dynamodb_client
+
+    def create(env_name: str, table_name: str | None = None) -> str:
+        table_name = table_name or env_name.lower().replace("_", "-")
+        get_dynamodb_client().create_table(
+            TableName=table_name,
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        monkeypatch.setenv(env_name, table_name)
+        return table_name
+
+    return create
+
+
+@pytest.fixture
+def create_queue(aws, monkeypatch):
+    """
+    SQS FIFOキューを作り、EVENT_QUEUE_URL に設定する。
+    受信したイベントを返す関数を返す（イベントソースマッピングと同じく受信したメッセージは削除する）
+    """
+    import json
+
+    import boto3
+
+    client = boto3.client("sqs")
+    queue_url = client.create_queue(QueueName="line-events.fifo", Attributes={"FifoQueue": "true"})["QueueUrl"]
+    monkeypatch.setenv("EVENT_QUEUE_URL", queue_url)
+
+    def received() -> list[dict]:
+        messages = client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", [])
+        for m in messages:
+            client.delete_message(QueueUrl=queue_url, ReceiptHandle=m["ReceiptHandle"])
+        return [json.loads(m["Body"]) for m in messages]
+
+    return received
+
+
+@pytest.fixture
+def fake_line(monkeypatch):
+    import line_api
+    from tests.fakes import FakeLine
+
+    fake = FakeLine()
+    monkeypatch.setattr(line_api, "reply", fake.reply)
+    monkeypatch.setattr(line_api, "push", fake.push)
+    monkeypatch.setattr(line_api, "start_loading", fake.start_loading)
+    return fake
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    import app
+    from tests.fakes import FakeAgentCore
+
+    fake = FakeAgentCore()
+    monkeypatch.setattr(app, "get_agentcore_client", lambda read_timeout=None: fake)
+    return fake
+
+
+@pytest.fixture
+def fake_places(monkeypatch):
+    import places
+    from tests.fakes import FakePlaces
+
+    fake = FakePlaces()
+    monkeypatch.setattr(places, "search_nearby", fake.search_nearby)
+    monkeypatch.setattr(places, "search_text", fake.search_text)
+    return fake
@@ -0,0 +1,154 @@
+"""テストで使うLINE API・AgentCore・Places APIの代わりとイベントの組み立て"""
+
+import io
+import json
+import threading
+import time
+
+
+class FakeResponse:
+    """requests.Response の代わり"""
+
+    def __init__(self, status_code: int = 200, text: str = "{}"):
+        self.status_code = status_code
+        self.text = text
+        self.ok = status_code < 400
+
+    def json(self):
+        return {}
+
+
+class FakeLine:
+    """line_api の reply / push / start_loading の代わり。送信内容を記録する"""
+
+    def __init__(self):
+        self.calls = []
+        self.status = {"reply": 200, "push": 200, "loading": 202}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint: str, record: dict):
+        with self._lock:
+            self.calls.append((endpoint, record))
+        if endpoint in self.errors:
+            raise self.errors[endpoint]
+        return FakeResponse(self.status[endpoint])
+
+    def reply(self, reply_token, messages, access_token):
+        return self._call("reply", {"replyToken": reply_token, "messages": messages})
+
+    def push(self, to_id, messages, access_token, retry_key=None):
+        return self._call("push", {"to": to_id, "messages": messages, "retry_key": retry_key})
+
+    def start_loading(self, chat_id, loading_seconds, access_token):
+        return self._call("loading", {"chatId": chat_id})
+
+    def sent(self, endpoint: str | None = None) -> list[tuple[str, dict]]:
+        return [(e, r) for e, r in self.calls if endpoint is None or e == endpoint]
+
+    def texts(self, endpoint: str | None = None) -> list[str]:
+        """送った吹き出しの本文（送信ごとに結合）"""
+        return ["\n\n".join(m["text"] for m in r["messages"]) for e, r in self.calls
+                if e != "loading" and (endpoint is None or e == endpoint)]
+
+
+class FakeAgentCore:
+    """
+    bedrock-agentcore クライアントの代わり。SSEで answer(prompt) を返す
+    （answer がリストを返す場合は要素ごとに1イベントで返す）
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.delay_sec = 0.0
+        self.error = None
+        self.answer = lambda prompt: f"「{prompt}」の候補です。"
+        self._lock = threading.Lock()
+
+    def invoke_agent_runtime(self, agentRuntimeArn, payload, contentType):
+        request = json.loads(payload)
+        with self._lock:
+            self.calls.append(request)
+        if self.delay_sec:
+            time.sleep(self.delay_sec)
+        if self.error is not None:
+            raise self.error
+        answer = self.answer(request["prompt"])
+        pieces = [answer] if isinstance(answer, str) else answer
+        data = "".join(f"data: {json.dumps(p, ensure_ascii=False)}\n\n" for p in pieces)
+        return {"contentType": "text/event-stream", "response": io.BytesIO(data.encode("utf-8"))}
+
+    def prompts(self) -> list[str]:
+        return [c["prompt"] for c in self.calls]
+
+
+class FakePlaces:
+    """places.search_nearby / search_text の代わり。count 件の候補を返す"""
+
+    def __init__(self, count: int = 8):
+        self.count = count
+        self.calls = []
+
+    def results(self) -> list[dict]:
+        return [
+            {
+                "name": f"スタブ食堂{i + 1}",
+                "place_id": f"stub-{i + 1}",
+                "rating": round(4.5 - i * 0.1, 1),
+                "user_ratings_total": 100,
+                "vicinity": f"渋谷区{i + 1}-1-1",
+                "formatted_address": f"東京都渋谷区{i + 1}-1-1",
+            }
+            for i in range(self.count)
+        ]
+
+    def search_nearby(self, lat, lng, *args, **kwargs):
+        self.calls.append(("nearby", (lat, lng)))
+        return self.results()
+
+    def search_text(self, query):
+        self.calls.append(("text", query))
+        return self.results()
+
+
+def _event(event_type: str, event_id: str | None, source: dict | None, **fields) -> dict:
+    ev = {
+        "type": event_type,
+        "replyToken": f"reply-{event_id}",
+        "timestamp": int(time.time() * 1000),
+        "source": source or {"type": "user", "userId": "U1"},
+        **fields,
+    }
+    if event_id:
+        ev["webhookEventId"] = event_id
+        ev["deliveryContext"] = {"isRedelivery": False}
+    return ev
+
+
+def location_event(event_id: str | None = None, source: dict | None = None, title: str = "渋谷駅") -> dict:
+    """LINEの位置情報メッセージイベントを作る"""
+    return _event("message", event_id, source, message={
+        "type": "location", "id": f"m-{event_id}", "title": title,
+        "latitude": 35.658, "longitude": 139.7016,
+    })
+
+
+def postback_event(data: str, event_id: str | None = None, source: dict | None = None) -> dict:
+    """LINEのpostbackイベントを作る"""
+    return _event("postback", event_id, source, postback={"data": data})
+
+
+def text_event(text: str, event_id: str | None = None, source: dict | None = None, **extra) -> dict:
+    """LINEのテキストメッセージイベントを作る"""
+    ev = {
+        "type": "message",
+        "replyToken": f"reply-{event_id or text}",
+        "timestamp": int(time.time() * 1000),
+        "source": source or {"type": "user", "userId": "U1"},
+        "message": {"type": "text", "id": f"m-{event_id or text}", "text": text},
+        **extra,
+    }
+    if event_id:
+        ev["webhookEventId"] = event_id
+        ev["deliveryContext"] = {"isRedelivery": False}
+    return ev
@@ -0,0 +1,231 @@
+"""常駐サーバー（asgi_app）のエンドポイントのテスト"""
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import pytest
+
+import asgi_app
+import result_pages
+from circuit_breaker import OPEN, agentcore_breaker
+from tests.fakes import location_event, postback_event, text_event
+
+SECRET = "channel-secret"
+
+U1 = {"type": "user", "userId": "U1"}
+U2 = {"type": "user", "userId": "U2"}
+GROUP = {"type": "group", "groupId": "G1", "userId": "U1"}
+
+
+def _sign(body: bytes, secret: str = SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+def _body(*events) -> bytes:
+    return json.dumps({"destination": "Ubot", "events": list(events)}, ensure_ascii=False).encode("utf-8")
+
+
+class _Apis:
+    """httpxのMockTransportで受けるLINE API・AgentCore。受けたリクエストを記録する"""
+
+    def __init__(self):
+        self.line = []
+        self.prompts = []
+        self.agent_status = 200
+        self.answer = lambda prompt: f"「{prompt}」の候補です。"
+        self._lock = threading.Lock()
+
+    def handle(self, request):
+        import httpx
+
+        body = json.loads(request.content)
+        if request.url.path.startswith("/runtimes/"):
+            with self._lock:
+                self.prompts.append(body["prompt"])
+            if self.agent_status >= 400:
+                return httpx.Response(self.agent_status, text="error")
+            data = f"data: {json.dumps(self.answer(body['prompt']), ensure_ascii=False)}\n\n".encode("utf-8")
+
+            async def chunks():
+                # ストリームとして返す（バイト列を渡すと読み込み済みのレスポンスになる）
+                for i in range(0, len(data), 7):
+                    yield data[i:i + 7]
+
+            return httpx.Response(200, content=chunks(), headers={"content-type": "text/event-stream"})
+        endpoint = request.url.path.rsplit("/", 2)[-2:]
+        with self._lock:
+            self.line.append(("loading" if endpoint[0] == "loading" else endpoint[1], body))
+        return httpx.Response(200, json={})
+
+    def replies(self, reply_token: str) -> list[str]:
+        return ["\n\n".join(m["text"] for m in body["messages"]) for endpoint, body in self.line
+                if endpoint == "reply" and body["replyToken"] == reply_token]
+
+
+@pytest.fixture
+def apis(monkeypatch):
+    import httpx
+
+    apis = _Apis()
+    client = httpx.AsyncClient
+
+    def mock_client(**kwargs):
+        return client(transport=httpx.MockTransport(apis.handle))
+
+    monkeypatch.setattr(httpx, "AsyncClient", mock_client)
+    return apis
+
+
+@pytest.fixture
+def client(monkeypatch, apis):
+    from starlette.testclient import TestClient
+
+    monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+    monkeypatch.setenv("CHANNEL_SECRET", SECRET)
+    with TestClient(asgi_app.create_app()) as client:
+        yield client
+
+
+def _post(client, body: bytes, signature: str | None = "sign"):
+    headers = {"Content-Type": "application/json"}
+    if signature == "sign":
+        signature = _sign(body)
+    if signature is not None:
+        headers["X-Line-Signature"] = signature
+    return client.post("/callback", content=body, headers=headers)
+
+
+def _deliver(client, *events):
+    """webhookを送り、受け付けたイベントの処理が終わるまで待つ"""
+    assert _post(client, _body(*events)).status_code == 200
+    deadline = time.monotonic() + 5
+    while asgi_app._state.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert asgi_app._state.pending == 0
+
+
+class TestCallback:
+    def test_signed_webhook_is_accepted(self, client):
+        assert _post(client, _body()).status_code == 200
+
+    @pytest.mark.parametrize("signature", [None, "", "invalid", _sign(_body(), "other-secret")])
+    def test_invalid_signature_is_rejected(self, client, signature):
+        res = _post(client, _body(), signature)
+        assert res.status_code == 401
+        assert asgi_app._state.pending == 0
+
+    def test_tampered_body_is_rejected(self, client):
+        signature = _sign(_body())
+        assert _post(client, _body({"type": "follow"}), signature).status_code == 401
+
+    @pytest.mark.parametrize("body", [b"{not json", b"[]", b'"events"', b"null"])
+    def test_malformed_body_is_400(self, client, body):
+        assert _post(client, body).status_code == 400
+
+    def test_missing_secret_fails_startup(self, monkeypatch):
+        from starlette.testclient import TestClient
+
+        monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+        monkeypatch.delenv("CHANNEL_SECRET", raising=False)
+        with pytest.raises(RuntimeError, match="CHANNEL_SECRET"):
+            with TestClient(asgi_app.create_app()):
+                pass
+
+
+class TestPipeline:
+    def test_text_is_answered_by_agent(self, client, apis):
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+        assert apis.prompts == ["上野で静かなカフェ"]
+        assert apis.replies("reply-evt-1") == ["「上野で静かなカフェ」の候補です。"]
+        assert [endpoint for endpoint, _ in apis.line][0] == "loading"
+
+    def test_redelivered_event_is_processed_once(self, client, apis):
+        ev = text_event("上野で静かなカフェ", event_id="evt-1", source=U1)
+        _deliver(client, ev)
+        _deliver(client, {**ev, "deliveryContext": {"isRedelivery": True}})
+        assert len(apis.prompts) == 1
+        assert len(apis.replies("reply-evt-1")) == 1
+
+    def test_cached_answer_skips_agent(self, client, apis):
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-2", source=U2))
+        assert len(apis.prompts) == 1
+        assert apis.replies("reply-evt-2") == apis.replies("reply-evt-1")
+
+    def test_location_is_answered_by_places(self, client, apis, fake_places):
+        _deliver(client, location_event("evt-1", source=U1))
+        assert apis.prompts == []
+        assert apis.replies("reply-evt-1")[0].count("スタブ食堂") == result_pages.page_size()
+
+    def test_more_postback_returns_next_page(self, client, apis, fake_places):
+        _, quick_reply = result_pages.first_page("U1", result_pages.NEARBY, {"origin": "渋谷駅"}, fake_places.results())
+        data = quick_reply["items"][0]["action"]["data"]
+        _deliver(client, postback_event(data, "evt-1", source=U1))
+        assert apis.prompts == []
+        assert "スタブ食堂4" in apis.replies("reply-evt-1")[0]
+
+    def test_group_message_without_trigger_is_ignored(self, client, apis):
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=GROUP))
+        assert apis.prompts == [] and apis.line == []
+
+    def test_empty_query_gets_usage(self, client, apis):
+        _deliver(client, text_event("@お店", event_id="evt-1", source=GROUP))
+        assert apis.replies("reply-evt-1") == ["使い方：@お店 の後に条件を書いてね。"]
+
+    def test_rate_limited(self, client, apis, monkeypatch):
+        import rate_limiter
+
+        monkeypatch.setattr(rate_limiter, "allow", lambda user_id: False)
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+        assert apis.prompts == []
+        assert apis.replies("reply-evt-1") == [rate_limiter.LIMITED_MESSAGE]
+
+    def test_open_breaker_sends_degraded_reply(self, client, apis):
+        import app
+
+        agentcore_breaker._transition(OPEN)
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+        assert apis.prompts == []
+        assert apis.replies("reply-evt-1") == [app.AGENT_DEGRADED_MESSAGE]
+
+    def test_agent_error_sends_apology(self, client, apis):
+        import app
+
+        apis.agent_status = 500
+        _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+        assert apis.replies("reply-evt-1") == [app.AGENT_ERROR_MESSAGE]
+
+
+class TestAgentCoreCredentials:
+    def test_resolved_at_startup(self, client):
+        assert asgi_app._state.agent._credentials is not None
+
+    def test_refresh_is_signed_off_the_event_loop(self, client, monkeypatch):
+        import asyncio
+
+        signed_in = []
+        agent = asgi_app._state.agent
+        sign = agent._sign
+        monkeypatch.setattr(agent, "_sign", lambda url, body: signed_in.append(threading.current_thread()) or sign(url, body))
+
+        asyncio.run(agent._signed_headers("https://example.com/", b"{}"))
+        monkeypatch.setattr(agent._credentials, "refresh_needed", lambda: True, raising=False)
+        asyncio.run(agent._signed_headers("https://example.com/", b"{}"))
+
+        assert signed_in[0] is threading.main_thread()
+        assert signed_in[1] is not threading.main_thread()
+
+
+def test_healthz(client):
+    assert client.get("/healthz").status_code == 200
+
+
+def test_metrics(client, apis):
+    _deliver(client, text_event("上野で静かなカフェ", event_id="evt-1", source=U1))
+    text = client.get("/metrics").text
+    assert "linebot_events_completed" in text
+    assert 'linebot_circuit_state{name="line_loading"}' in text
@@ -0,0 +1,200 @@
+"""サーキットブレーカー（状態遷移・HALF_OPENの試行枠・ストリームの所要時間）のテスト"""
+
+import pytest
+
+import app
+import line_api
+import query_cache
+from circuit_breaker import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, agentcore_breaker,
+                             line_breaker, loading_breaker)
+from tests.fakes import FakeResponse, text_event
+
+PLACES = ["1. スタブ食堂\n評価：4.2", "2. スタブ亭\n評価：4.0", "3. スタブ屋\n評価：3.9"]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+def _half_open(breaker: CircuitBreaker, clock: _Clock | None = None):
+    """OPENにして open_sec 経過させ、HALF_OPENにする"""
+    breaker._transition(OPEN)
+    if clock is not None:
+        clock.now += breaker.open_sec
+    else:
+        breaker._opened_at -= breaker.open_sec
+    assert breaker.state == HALF_OPEN
+
+
+def _guarded_stream(breaker: CircuitBreaker, pieces, clock: _Clock | None = None, call_sec: float = 0.0):
+    """ブレーカーで囲んだストリーム（app._stream_agentcore と同じ形）"""
+    with breaker.guard() as guard:
+        for piece in pieces:
+            if clock is not None:
+                clock.now += call_sec
+            with guard.paused():
+                yield piece
+
+
+class TestTransitions:
+    def test_opens_on_failure_rate_and_recovers(self, clock):
+        breaker = CircuitBreaker("t", min_calls=2, open_sec=10, clock=clock)
+        breaker.record(True, 0.1)
+        breaker.record(True, 0.1)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            with breaker.guard():
+                pass
+        clock.now = 10
+        with breaker.guard():
+            pass
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = CircuitBreaker("t", open_sec=10, clock=clock)
+        _half_open(breaker, clock)
+        with pytest.raises(RuntimeError):
+            with breaker.guard():
+                raise RuntimeError("boom")
+        assert breaker.state == OPEN
+
+    def test_slow_calls_open(self, clock):
+        breaker = CircuitBreaker("t", min_calls=2, slow_call_sec=5, clock=clock)
+        for _ in range(2):
+            with breaker.guard():
+                clock.now += 6
+        assert breaker.state == OPEN
+
+
+class TestHalfOpenSlot:
+    def test_only_one_probe(self, clock):
+        breaker = CircuitBreaker("t", clock=clock)
+        _half_open(breaker, clock)
+        assert breaker.allow()
+        assert not breaker.allow()
+
+    def test_abandoned_stream_releases_slot(self, clock):
+        breaker = CircuitBreaker("t", clock=clock)
+        _half_open(breaker, clock)
+        stream = _guarded_stream(breaker, ["a", "b"])
+        assert next(stream) == "a"
+        # 受け手が途中でやめた（GeneratorExit）。結果は記録しないが試行枠は返す
+        stream.close()
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+
+    def test_base_exception_releases_slot(self, clock):
+        breaker = CircuitBreaker("t", clock=clock)
+        _half_open(breaker, clock)
+        with pytest.raises(KeyboardInterrupt):
+            with breaker.guard():
+                raise KeyboardInterrupt
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+
+    def test_abandoned_agentcore_stream_releases_slot(self, fake_agent):
+        fake_agent.answer = lambda prompt: PLACES
+        _half_open(agentcore_breaker)
+        stream = app._stream_agentcore("U1", "渋谷 カフェ")
+        assert next(stream) == PLACES[0]
+        stream.close()
+        assert agentcore_breaker.allow()
+
+    def test_client_creation_is_outside_the_guard(self, monkeypatch, clock):
+        # クライアントの作成に時間がかかったり失敗したりしても、AgentCoreの遅延・失敗には数えない
+        def slow_client(read_timeout=None):
+            clock.now += 30
+            raise RuntimeError("no credentials")
+
+        monkeypatch.setattr(agentcore_breaker, "_clock", clock)
+        monkeypatch.setattr(app, "get_agentcore_client", slow_client)
+        _half_open(agentcore_breaker, clock)
+        with pytest.raises(RuntimeError):
+            next(app._stream_agentcore("U1", "渋谷 カフェ"))
+        assert agentcore_breaker.state == HALF_OPEN
+        assert agentcore_breaker.allow()
+
+
+class TestPausedTime:
+    def test_time_spent_by_consumer_is_not_counted(self, clock):
+        breaker = CircuitBreaker("t", min_calls=1, slow_call_sec=5, clock=clock)
+        for _ in _guarded_stream(breaker, ["a", "b", "c"], clock, call_sec=1):
+            # 受け手の処理（LINEへの送信など）に時間がかかっても相手の遅延にはしない
+            clock.now += 30
+        assert breaker.snapshot()["slow_rate"] == 0.0
+        assert breaker.state == CLOSED
+
+    def test_time_spent_by_callee_is_counted(self, clock):
+        breaker = CircuitBreaker("t", min_calls=1, slow_call_sec=5, clock=clock)
+        for _ in _guarded_stream(breaker, ["a", "b", "c"], clock, call_sec=2):
+            pass
+        assert breaker.state == OPEN
+
+
+class TestLineFailuresDuringProgressiveDelivery:
+    @pytest.fixture(autouse=True)
+    def progressive(self, monkeypatch, fake_agent):
+        monkeypatch.setenv("LINE_PROGRESSIVE_MODE", "place")
+        monkeypatch.setenv("LINE_PROGRESSIVE_FIRST_CHARS", "10")
+        monkeypatch.setenv("LINE_ALLOW_PUSH_FALLBACK", "true")
+        fake_agent.answer = lambda prompt: [p + "\n\n" for p in PLACES[:-1]] + [PLACES[-1]]
+
+    def test_push_failure_is_not_an_agent_failure(self, fake_line, fake_agent):
+        fake_line.errors["push"] = ConnectionError("LINE is down")
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-1"), "token")
+
+        assert fake_line.texts("reply") == [PLACES[0]]
+        assert app.AGENT_ERROR_MESSAGE not in "".join(fake_line.texts())
+        snapshot = agentcore_breaker.snapshot()
+        assert (snapshot["calls"], snapshot["failure_rate"]) == (1, 0.0)
+        # AgentCoreの応答は最後まで読んでキャッシュする
+        assert query_cache.get("渋谷 カフェ") == "\n\n".join(PLACES)
+
+    def test_half_open_probe_succeeds_despite_line_failures(self, fake_line, fake_agent):
+        fake_line.errors["reply"] = ConnectionError("LINE is down")
+        fake_line.errors["push"] = ConnectionError("LINE is down")
+        _half_open(agentcore_breaker)
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-2"), "token")
+        assert agentcore_breaker.state == CLOSED
+
+    def test_nothing_delivered_is_reported(self, fake_line, fake_agent):
+        fake_line.errors["reply"] = ConnectionError("LINE is down")
+        fake_line.errors["push"] = ConnectionError("LINE is down")
+        text, delivered = app._deliver_progressively(
+            "U1", "渋谷 カフェ", "reply-token", "U1", app.FlushPolicy.from_env(), "token")
+        assert text == "\n\n".join(PLACES)
+        assert delivered is False
+
+
+class TestLoadingIndicator:
+    @pytest.fixture
+    def session(self, monkeypatch):
+        """LINE APIのセッションの代わり（エンドポイントごとのステータスを返す）"""
+        status = {"/v2/bot/chat/loading/start": 500, "/v2/bot/message/reply": 200}
+
+        class _Session:
+            def post(self, url, **kwargs):
+                return FakeResponse(status[url.removeprefix(line_api._base_url())])
+
+        monkeypatch.setattr(line_api, "get_session", lambda access_token: _Session())
+        return status
+
+    def test_loading_failures_do_not_block_replies(self, session):
+        for _ in range(loading_breaker.min_calls):
+            line_api.start_loading("U1", 20, "token")
+        assert loading_breaker.state == OPEN
+        assert line_breaker.state == CLOSED
+        assert line_api.reply("token", [{"type": "text", "text": "1. スタブ食堂"}], "token").status_code == 200
+
+    def test_open_loading_breaker_skips_loading(self, session):
+        loading_breaker._transition(OPEN)
+        assert isinstance(line_api.start_loading("U1", 20, "token"), line_api.UnsentResponse)
@@ -0,0 +1,126 @@
+"""連続メッセージの結合（ウィンドウ内のメッセージを最後の1件でまとめて検索する）のテスト"""
+
+import pytest
+
+import app
+import coalesce
+from coalesce import Coalescer, DynamoStore, LocalStore
+from tests.fakes import text_event
+
+WINDOW_SEC = 3
+
+
+class _Clock:
+    """Coalescer の clock / sleep に渡す時計（sleep は時計を進めるだけ）"""
+
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, sec: float):
+        self.sleeps.append(sec)
+        self.now += sec
+
+    def ms(self) -> int:
+        return int(self.now * 1000)
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture(params=["local", "dynamodb"])
+def store(request, clock):
+    if request.param == "local":
+        return LocalStore(clock)
+    create_table = request.getfixturevalue("create_table")
+    return DynamoStore(create_table("COALESCE_TABLE"))
+
+
+@pytest.fixture
+def coalescer(store, clock):
+    return Coalescer(WINDOW_SEC, store, clock=clock, sleep=clock.sleep)
+
+
+class TestSettle:
+    def test_single_message_waits_for_window(self, coalescer, clock):
+        coalescer.register("U1", "evt-1", clock.ms(), "渋谷 カフェ")
+        assert coalescer.settle("U1", "evt-1", "渋谷 カフェ") == "渋谷 カフェ"
+        assert clock.sleeps == [WINDOW_SEC]
+
+    def test_messages_within_window_are_joined(self, coalescer, clock):
+        coalescer.register("U1", "evt-1", clock.ms(), "渋谷で")
+        clock.now += 1
+        coalescer.register("U1", "evt-2", clock.ms(), "静かな")
+        clock.now += 1
+        coalescer.register("U1", "evt-3", clock.ms(), "カフェ")
+
+        assert coalescer.settle("U1", "evt-1", "渋谷で") is None
+        assert coalescer.settle("U1", "evt-2", "静かな") is None
+        assert coalescer.settle("U1", "evt-3", "カフェ") == "渋谷で 静かな カフェ"
+
+    def test_later_message_settling_first_absorbs_earlier(self, coalescer, clock):
+        # 後のメッセージの処理が先に終わり、まとめたメッセージをストアから取り除いた後で
+        # 前のメッセージの処理が始まっても、単独で応答しない
+        coalescer.register("U1", "evt-1", clock.ms(), "渋谷で")
+        clock.now += 1
+        coalescer.register("U1", "evt-2", clock.ms(), "カフェ")
+
+        assert coalescer.settle("U1", "evt-2", "カフェ") == "渋谷で カフェ"
+        assert coalescer.settle("U1", "evt-1", "渋谷で") is None
+
+    def test_message_outside_window_answers_alone(self, coalescer, clock):
+        coalescer.register("U1", "evt-1", clock.ms(), "渋谷 カフェ")
+        clock.now += WINDOW_SEC + 1
+        coalescer.register("U1", "evt-2", clock.ms(), "上野 ラーメン")
+
+        assert coalescer.settle("U1", "evt-1", "渋谷 カフェ") == "渋谷 カフェ"
+        assert coalescer.settle("U1", "evt-2", "上野 ラーメン") == "上野 ラーメン"
+
+    def test_unregistered_message_is_answered(self, coalescer):
+        assert coalescer.settle("U1", "evt-9", "渋谷 カフェ") == "渋谷 カフェ"
+
+    def test_max_wait(self, coalescer, clock):
+        coalescer.register("U1", "evt-1", clock.ms(), "渋谷 カフェ")
+        assert coalescer.settle("U1", "evt-1", "渋谷 カフェ", max_wait_sec=1) == "渋谷 カフェ"
+        assert clock.sleeps == [1]
+
+
+class TestModuleSettings:
+    def test_requires_table(self, monkeypatch):
+        monkeypatch.setenv("COALESCE_WINDOW_SEC", "3")
+        assert not coalesce.enabled()
+        ev = text_event("渋谷で", event_id="evt-1")
+        coalesce.register("U1", ev, "渋谷で")
+        assert coalesce.settle("U1", ev, "渋谷で") == "渋谷で"
+
+    def test_enabled_with_table(self, monkeypatch, create_table):
+        monkeypatch.setenv("COALESCE_WINDOW_SEC", "3")
+        create_table("COALESCE_TABLE")
+        assert coalesce.enabled()
+        assert isinstance(coalesce._get_coalescer().store, DynamoStore)
+
+
+class TestSeparateWebhookDeliveries:
+    def test_later_delivery_answers_for_both(self, monkeypatch, clock, create_table, fake_line, fake_agent):
+        monkeypatch.setenv("COALESCE_WINDOW_SEC", str(WINDOW_SEC))
+        table = create_table("COALESCE_TABLE")
+        monkeypatch.setattr(coalesce, "_coalescer",
+                            Coalescer(WINDOW_SEC, DynamoStore(table), clock=clock, sleep=clock.sleep))
+
+        first = text_event("渋谷で", event_id="evt-1", timestamp=clock.ms())
+        app.register_events([first])
+        clock.now += 1
+        second = text_event("カフェ", event_id="evt-2", timestamp=clock.ms())
+        app.register_events([second])
+
+        # 別々のWebhook呼び出し（コンテナ）で、後のメッセージの処理が先に進んだ
+        app.handle_event(second, "token")
+        app.handle_event(first, "token")
+
+        assert fake_agent.prompts() == ["渋谷で カフェ"]
+        assert [r["replyToken"] for _, r in fake_line.sent("reply")] == ["reply-evt-2"]
@@ -0,0 +1,164 @@
+"""Lambdaの残り時間に合わせたAgentCore呼び出し（時間予算・クライアントの選択・時間切れの処理）のテスト"""
+
+import time
+
+import pytest
+
+import agentcore_client
+import app
+from deadline import Deadline, reply_token_expired
+from tests.fakes import text_event
+
+ACCESS_TOKEN = "token"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def read_timeouts(monkeypatch, fake_agent):
+    """get_agentcore_client に渡された読み取りタイムアウトを記録する"""
+    timeouts = []
+
+    def get_client(read_timeout=None):
+        timeouts.append(read_timeout)
+        return fake_agent
+
+    monkeypatch.setattr(app, "get_agentcore_client", get_client)
+    return timeouts
+
+
+class TestDeadline:
+    def test_budget_follows_clock(self, clock):
+        deadline = Deadline(30, clock)
+        assert deadline.agent_budget_sec() == 27
+        assert deadline.can_call_agent()
+        clock.now = 22
+        assert deadline.agent_budget_sec() == 5
+        assert deadline.can_call_agent()
+        clock.now = 22.5
+        assert not deadline.can_call_agent()
+        clock.now = 100
+        assert deadline.remaining_sec() == 0
+        assert deadline.agent_budget_sec() == 0
+
+    def test_from_context(self, clock):
+        class Context:
+            def get_remaining_time_in_millis(self):
+                return 12_500
+
+        assert Deadline.from_context(Context(), clock).remaining_sec() == 12.5
+        assert Deadline.from_context(object(), clock) is None
+
+    def test_reply_token_expired(self):
+        ev = {"timestamp": 1_000_000}
+        assert not reply_token_expired(ev, now_ms=1_000_000 + 50_000)
+        assert reply_token_expired(ev, now_ms=1_000_000 + 50_001)
+        assert not reply_token_expired({}, now_ms=0)
+
+
+class TestClientSelection:
+    @pytest.mark.parametrize("budget, bucket", [
+        (None, None),
+        (0.4, 1),
+        (3.7, 3),
+        (12.3, 10),
+        (54.9, 50),
+        # 予算がデフォルト（55秒）以上でも、予算つきのクライアントにする
+        (55, 55),
+        (840, 55),
+    ])
+    def test_timeout_bucket(self, budget, bucket):
+        assert agentcore_client._timeout_bucket(budget) == bucket
+
+    @pytest.mark.parametrize("budget", [12.3, 55, 840])
+    def test_budgeted_client_does_not_retry(self, budget):
+        config = agentcore_client.get_agentcore_client(budget).meta.config
+        assert config.retries["total_max_attempts"] == 1
+        assert config.read_timeout <= min(budget, 55)
+
+    def test_default_client_retries(self):
+        config = agentcore_client.get_agentcore_client().meta.config
+        # AGENTCORE_MAX_ATTEMPTS=2 はリトライ回数なので、初回を含めて3回
+        assert config.retries["total_max_attempts"] == 3
+        assert config.read_timeout == 55
+
+    def test_clients_are_reused_per_bucket(self):
+        assert agentcore_client.get_agentcore_client(12.3) is agentcore_client.get_agentcore_client(14.9)
+        assert agentcore_client.get_agentcore_client(840) is agentcore_client.get_agentcore_client(60)
+        assert agentcore_client.get_agentcore_client(60) is not agentcore_client.get_agentcore_client()
+
+
+class TestWebhookWithDeadline:
+    def test_budget_is_passed_to_agent(self, clock, fake_line, read_timeouts):
+        deadline = Deadline(30, clock)
+        clock.now = 4
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-1"), ACCESS_TOKEN, deadline)
+        assert read_timeouts == [23]
+        assert fake_line.texts("reply") == ["「渋谷 カフェ」の候補です。"]
+
+    def test_long_budget_still_uses_budgeted_client(self, clock, fake_line, read_timeouts):
+        # Lambdaのタイムアウトが長くても、予算つきの呼び出しとして扱う
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-2"), ACCESS_TOKEN, Deadline(900, clock))
+        assert read_timeouts == [897]
+        assert agentcore_client._timeout_bucket(read_timeouts[0]) == 55
+
+    def test_out_of_time_skips_agent(self, clock, fake_line, fake_agent):
+        deadline = Deadline(30, clock)
+        clock.now = 23
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-3"), ACCESS_TOKEN, deadline)
+        assert fake_agent.calls == []
+        assert fake_line.texts("reply") == [app.AGENT_TIMEOUT_MESSAGE]
+
+    def test_agent_timeout_within_budget(self, clock, fake_line, fake_agent):
+        fake_agent.error = TimeoutError("read timeout")
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-4"), ACCESS_TOKEN, Deadline(30, clock))
+        assert len(fake_agent.calls) == 1
+        assert fake_line.texts("reply") == [app.AGENT_TIMEOUT_MESSAGE]
+
+    def test_out_of_time_is_queued_as_followup(self, clock, monkeypatch, fake_line, fake_agent, create_queue):
+        monkeypatch.setenv("DEADLINE_FOLLOWUP", "queue")
+        monkeypatch.setenv("LINE_ALLOW_PUSH_FALLBACK", "true")
+        deadline = Deadline(30, clock)
+        clock.now = 23
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-5"), ACCESS_TOKEN, deadline)
+
+        assert fake_agent.calls == []
+        assert fake_line.texts("reply") == [app.FOLLOWUP_MESSAGE]
+        [followup] = create_queue()
+        assert followup["followup"] is True
+        assert followup["webhookEventId"] == "evt-5-followup"
+        assert "replyToken" not in followup
+
+        # キューから取り出した後続処理では、答えをpushで送る
+        app.handle_event(followup, ACCESS_TOKEN, Deadline(900, clock))
+        assert fake_line.texts("push") == ["「渋谷 カフェ」の候補です。"]
+
+    def test_followup_is_not_queued_twice(self, clock, monkeypatch, fake_line, fake_agent, create_queue):
+        monkeypatch.setenv("DEADLINE_FOLLOWUP", "queue")
+        monkeypatch.setenv("LINE_ALLOW_PUSH_FALLBACK", "true")
+        followup = text_event("渋谷 カフェ", event_id="evt-6-followup", followup=True)
+        del followup["replyToken"]
+        deadline = Deadline(30, clock)
+        clock.now = 23
+        app.handle_event(followup, ACCESS_TOKEN, deadline)
+
+        assert create_queue() == []
+        assert fake_line.texts("push") == [app.AGENT_TIMEOUT_MESSAGE]
+
+    def test_expired_reply_token_uses_push(self, clock, monkeypatch, fake_line, fake_agent):
+        monkeypatch.setenv("LINE_ALLOW_PUSH_FALLBACK", "true")
+        ev = text_event("渋谷 カフェ", event_id="evt-7", timestamp=int(time.time() * 1000) - 60_000)
+        app.handle_event(ev, ACCESS_TOKEN, Deadline(30, clock))
+        assert fake_line.sent("reply") == []
+        assert fake_line.texts("push") == ["「渋谷 カフェ」の候補です。"]
@@ -0,0 +1,203 @@
+"""配信のアウトボックス（delivery_outbox / worker.delivery_handler / scripts/replay_deliveries.py）のテスト"""
+
+import importlib.util
+import json
+import sys
+import uuid
+
+import pytest
+
+import app
+import delivery_outbox
+import worker
+from tests.conftest import LAMBDA_DIR
+from tests.fakes import text_event
+
+REPLAY_SCRIPT = LAMBDA_DIR.parent / "scripts" / "replay_deliveries.py"
+
+
+@pytest.fixture
+def queues(aws, monkeypatch):
+    """再送キューとDLQを作り、受信したメッセージ（削除済み）を返す関数を返す"""
+    import boto3
+
+    client = boto3.client("sqs")
+    urls = {
+        "retry": client.create_queue(QueueName="line-delivery")["QueueUrl"],
+        "dlq": client.create_queue(QueueName="line-delivery-dlq")["QueueUrl"],
+    }
+    monkeypatch.setenv("DELIVERY_QUEUE_URL", urls["retry"])
+    monkeypatch.setenv("DELIVERY_DLQ_URL", urls["dlq"])
+    # DelaySecondsを0にしてすぐ受信できるようにする
+    monkeypatch.setenv("DELIVERY_RETRY_BASE_SEC", "0")
+    monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+
+    def received(name: str) -> list[dict]:
+        messages = client.receive_message(QueueUrl=urls[name], MaxNumberOfMessages=10).get("Messages", [])
+        for m in messages:
+            client.delete_message(QueueUrl=urls[name], ReceiptHandle=m["ReceiptHandle"])
+        return [{"messageId": m["MessageId"], "body": m["Body"]} for m in messages]
+
+    received.urls = urls
+    return received
+
+
+def _entries(records: list[dict]) -> list[dict]:
+    return [json.loads(r["body"]) for r in records]
+
+
+def _defer(answer: str = "1. スタブ食堂") -> dict:
+    ev = text_event("渋谷 カフェ", event_id="evt-1")
+    assert delivery_outbox.defer(ev, answer, "U1", can_push=True, error="status 500")
+    return ev
+
+
+def _deliver(records: list[dict]) -> dict:
+    return worker.delivery_handler({"Records": records}, None)
+
+
+class TestDefer:
+    def test_answer_is_stored_after_failed_reply(self, monkeypatch, queues, fake_line, fake_agent):
+        monkeypatch.setenv("LINE_ALLOW_PUSH_FALLBACK", "true")
+        fake_line.status.update(reply=500, push=500)
+        app.handle_event(text_event("渋谷 カフェ", event_id="evt-1"), "token")
+
+        [entry] = _entries(queues("retry"))
+        assert entry["answer"] == fake_agent.answer("渋谷 カフェ")
+        assert entry["destination"] == "U1"
+        assert entry["event"]["webhookEventId"] == "evt-1"
+        assert entry["attempts"] == 1
+        assert queues("dlq") == []
+
+    def test_push_not_allowed_goes_to_dlq(self, queues):
+        ev = text_event("渋谷 カフェ", event_id="evt-1")
+        assert delivery_outbox.defer(ev, "1. スタブ食堂", "U1", can_push=False)
+        assert queues("retry") == []
+        assert [e["reason"] for e in _entries(queues("dlq"))] == ["push_not_allowed"]
+
+    def test_disabled_without_queues(self, monkeypatch):
+        monkeypatch.delenv("DELIVERY_QUEUE_URL", raising=False)
+        monkeypatch.delenv("DELIVERY_DLQ_URL", raising=False)
+        assert not delivery_outbox.defer(text_event("渋谷 カフェ"), "1. スタブ食堂", "U1", can_push=True)
+
+
+class TestRetry:
+    def test_retry_succeeds(self, queues, fake_line, metrics_records):
+        _defer()
+        [record] = queues("retry")
+
+        assert _deliver([record]) == {"batchItemFailures": []}
+
+        [(_, push)] = fake_line.sent("push")
+        assert push["to"] == "U1"
+        # 再送のたびに同じX-Line-Retry-Keyを使う（項目のIDから作る）
+        entry_id = uuid.UUID(json.loads(record["body"])["id"])
+        assert push["retry_key"] == str(uuid.uuid5(entry_id, "0"))
+        assert queues("retry") == [] and queues("dlq") == []
+        assert [r["DeliveryRecovered"] for r in metrics_records if "DeliveryRecovered" in r] == [1]
+
+    def test_already_accepted_counts_as_delivered(self, queues, fake_line):
+        fake_line.status["push"] = delivery_outbox.ALREADY_ACCEPTED
+        _defer()
+        _deliver(queues("retry"))
+        assert queues("retry") == [] and queues("dlq") == []
+
+    @pytest.mark.parametrize("status", [429, 500, 503])
+    def test_transient_failure_is_retried(self, queues, fake_line, status):
+        fake_line.status["push"] = status
+        _defer()
+        _deliver(queues("retry"))
+        [entry] = _entries(queues("retry"))
+        assert entry["attempts"] == 2
+        assert entry["last_error"] == f"status {status}"
+        assert queues("dlq") == []
+
+    def test_exception_is_retried(self, queues, fake_line):
+        fake_line.errors["push"] = ConnectionError("reset")
+        _defer()
+        _deliver(queues("retry"))
+        [entry] = _entries(queues("retry"))
+        assert entry["last_error"].startswith("ConnectionError")
+
+    def test_dead_lettered_after_max_attempts(self, monkeypatch, queues, fake_line):
+        monkeypatch.setenv("DELIVERY_MAX_ATTEMPTS", "3")
+        fake_line.status["push"] = 500
+        _defer()
+        for _ in range(delivery_outbox.max_attempts() - 1):
+            _deliver(queues("retry"))
+
+        assert queues("retry") == []
+        [entry] = _entries(queues("dlq"))
+        assert entry["reason"] == "max_attempts"
+        assert entry["attempts"] == delivery_outbox.max_attempts()
+        assert len(fake_line.sent("push")) == delivery_outbox.max_attempts() - 1
+
+    @pytest.mark.parametrize("status", [400, 403, 404])
+    def test_permanent_failure_is_dead_lettered_at_once(self, queues, fake_line, status):
+        fake_line.status["push"] = status
+        _defer()
+        _deliver(queues("retry"))
+        assert queues("retry") == []
+        [entry] = _entries(queues("dlq"))
+        assert entry["reason"] == f"status {status}"
+        assert len(fake_line.sent("push")) == 1
+
+    def test_malformed_body_does_not_fail_the_batch(self, queues, fake_line):
+        _defer()
+        records = [{"messageId": "broken", "body": "{not json"},
+                   {"messageId": "wrong-shape", "body": "[1, 2]"},
+                   *queues("retry")]
+
+        assert _deliver(records) == {"batchItemFailures": []}
+
+        assert len(fake_line.sent("push")) == 1
+        dead = _entries(queues("dlq"))
+        assert sorted(e["id"] for e in dead) == ["broken", "wrong-shape"]
+        assert {e["reason"] for e in dead} == {"malformed"}
+
+
+class TestReplay:
+    @pytest.fixture
+    def replay(self, monkeypatch, queues):
+        spec = importlib.util.spec_from_file_location("replay_deliveries", REPLAY_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        def run(*args) -> int:
+            monkeypatch.setattr(sys, "argv", ["replay_deliveries.py", "--queue-url", queues.urls["dlq"], *args])
+            return module.main()
+
+        return run
+
+    def _dead_letter(self, destination: str = "U1", reason: str = "max_attempts"):
+        ev = text_event("渋谷 カフェ", event_id=f"evt-{destination}")
+        entry = delivery_outbox.new_entry(ev, f"{destination}への応答", destination)
+        delivery_outbox.dead_letter(entry, reason)
+
+    def test_replay_pushes_without_calling_the_agent(self, replay, queues, fake_line, fake_agent):
+        self._dead_letter("U1")
+        self._dead_letter("U2")
+
+        assert replay() == 0
+
+        assert fake_agent.calls == []
+        assert sorted(r["to"] for _, r in fake_line.sent("push")) == ["U1", "U2"]
+        assert sorted(fake_line.texts("push")) == ["U1への応答", "U2への応答"]
+        assert queues("dlq") == []
+
+    def test_list_does_not_send(self, replay, queues, fake_line, capsys):
+        self._dead_letter("U1")
+        assert replay("--list") == 0
+        assert fake_line.sent("push") == []
+        assert "U1への応答" in capsys.readouterr().out
+        assert len(queues("dlq")) == 1
+
+    def test_filters_and_failures_stay_in_dlq(self, replay, queues, fake_line):
+        self._dead_letter("U1", reason="max_attempts")
+        self._dead_letter("U2", reason="push_not_allowed")
+        fake_line.status["push"] = 500
+
+        assert replay("--reason", "push_not_allowed", "--visibility-sec", "0", "--limit", "2") == 1
+
+        assert [r["to"] for _, r in fake_line.sent("push")] == ["U2"]
+        assert sorted(e["destination"] for e in _entries(queues("dlq"))) == ["U1", "U2"]
@@ -0,0 +1,37 @@
+"""環境変数の設定値の読み取り（env）のテスト"""
+
+import pytest
+
+import env
+
+
+@pytest.mark.parametrize("value,expected", [(None, 7), ("12", 12), ("-3", -3), ("1.5", 7), ("", 7), ("abc", 7)])
+def test_get_int(monkeypatch, value, expected):
+    if value is not None:
+        monkeypatch.setenv("TEST_VALUE", value)
+    assert env.get_int("TEST_VALUE", 7) == expected
+
+
+@pytest.mark.parametrize("value,expected", [(None, 2.5), ("0.3", 0.3), ("10", 10.0), ("abc", 2.5)])
+def test_get_float(monkeypatch, value, expected):
+    if value is not None:
+        monkeypatch.setenv("TEST_VALUE", value)
+    assert env.get_float("TEST_VALUE", 2.5) == expected
+
+
+@pytest.mark.parametrize("value", ["1", "true", "TRUE", "Yes", "on", " true "])
+def test_get_bool_truthy(monkeypatch, value):
+    monkeypatch.setenv("TEST_VALUE", value)
+    assert env.get_bool("TEST_VALUE", False)
+
+
+@pytest.mark.parametrize("value", ["0", "false", "no", "off", "", "enabled"])
+def test_get_bool_falsy(monkeypatch, value):
+    monkeypatch.setenv("TEST_VALUE", value)
+    assert not env.get_bool("TEST_VALUE", True)
+
+
+def test_get_bool_default(monkeypatch):
+    monkeypatch.delenv("TEST_VALUE", raising=False)
+    assert env.get_bool("TEST_VALUE", True)
+    assert not env.get_bool("TEST_VALUE", False)
@@ -0,0 +1,103 @@
+"""複数イベントの並列処理（送信元ごとの順序保証・同時実行数の上限）のテスト"""
+
+import threading
+import time
+
+import app
+import event_dispatch
+
+
+def _text_event(source_id: str, seq: int) -> dict:
+    return {
+        "type": "message",
+        "webhookEventId": f"{source_id}-{seq}",
+        "replyToken": f"token-{source_id}-{seq}",
+        "source": {"type": "group", "groupId": source_id, "userId": f"U{seq}"},
+        "message": {"type": "text", "text": f"@お店 渋谷 カフェ {seq}"},
+    }
+
+
+class _Recorder:
+    """handle_event の代わりに、処理順と同時実行数を記録する"""
+
+    def __init__(self, delay_sec: float = 0.02, fail_ids=()):
+        self.delay_sec = delay_sec
+        self.fail_ids = set(fail_ids)
+        self.order = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ev, access_token, deadline=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay_sec)
+            if ev["webhookEventId"] in self.fail_ids:
+                raise RuntimeError("injected")
+            with self._lock:
+                self.order.setdefault(ev["source"]["groupId"], []).append(ev["webhookEventId"])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _batch(sources: int = 5, per_source: int = 4) -> list[dict]:
+    # 送信元が交互に並ぶ、実際のwebhookに近い到着順
+    return [_text_event(f"C{s}", seq) for seq in range(per_source) for s in range(sources)]
+
+
+class TestProcessEvents:
+    def test_20_event_batch_keeps_per_source_order(self, monkeypatch):
+        monkeypatch.setenv("LINE_EVENT_CONCURRENCY", "4")
+        recorder = _Recorder()
+        monkeypatch.setattr(app, "handle_event", recorder)
+
+        events = _batch()
+        assert len(events) == 20
+        started = time.perf_counter()
+        app.process_events(events, "token")
+        elapsed = time.perf_counter() - started
+
+        assert sum(len(ids) for ids in recorder.order.values()) == 20
+        for s in range(5):
+            assert recorder.order[f"C{s}"] == [f"C{s}-{seq}" for seq in range(4)]
+        # 異なる送信元は並列に処理し、上限は超えない
+        assert 1 < recorder.max_active <= 4
+        assert elapsed < 20 * recorder.delay_sec
+
+    def test_concurrency_cap_of_one_is_sequential(self, monkeypatch):
+        monkeypatch.setenv("LINE_EVENT_CONCURRENCY", "1")
+        recorder = _Recorder(delay_sec=0.001)
+        monkeypatch.setattr(app, "handle_event", recorder)
+
+        app.process_events(_batch(), "token")
+
+        assert recorder.max_active == 1
+        assert sum(len(ids) for ids in recorder.order.values()) == 20
+
+    def test_failed_event_does_not_stop_its_source(self, monkeypatch):
+        recorder = _Recorder(delay_sec=0.001, fail_ids={"C1-1"})
+        monkeypatch.setattr(app, "handle_event", recorder)
+
+        app.process_events(_batch(), "token")
+
+        assert recorder.order["C1"] == ["C1-0", "C1-2", "C1-3"]
+        assert sum(len(ids) for ids in recorder.order.values()) == 19
+
+    def test_dispatch_key_groups_user_chats_and_groups(self):
+        user_ev = {"source": {"type": "user", "userId": "U1"}}
+        group_ev = {"source": {"type": "group", "groupId": "C1", "userId": "U1"}}
+        assert app.get_dispatch_key(user_ev) == "U1"
+        assert app.get_dispatch_key(group_ev) == "C1"
+
+
+class TestRunByGroup:
+    def test_returns_results_in_group_order(self):
+        items = ["a1", "b1", "a2", "c1", "b2"]
+        results = event_dispatch.run_by_group(items, lambda x: x[0], list, max_workers=3)
+        assert results == [["a1", "a2"], ["b1", "b2"], ["c1"]]
+
+    def test_empty(self):
+        assert event_dispatch.run_by_group([], lambda x: x, list) == []
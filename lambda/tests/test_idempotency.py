@@ -0,0 +1,132 @@
+"""webhookEventIdによる再送の重複排除のテスト（同時に届いた重複・処理済みの応答の再利用）"""
+
+import copy
+import threading
+
+import pytest
+
+import app
+import idempotency
+from tests.fakes import text_event
+from ttl_cache import TTLCache
+
+ACCESS_TOKEN = "token"
+
+
+def _redelivery(ev: dict) -> dict:
+    ev = copy.deepcopy(ev)
+    ev["deliveryContext"] = {"isRedelivery": True}
+    return ev
+
+
+def _run_concurrently(*targets):
+    barrier = threading.Barrier(len(targets))
+    errors = []
+
+    def run(target):
+        barrier.wait()
+        try:
+            target()
+        except Exception as e:  # pragma: no cover - 失敗時の表示用
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert not errors
+
+
+@pytest.fixture
+def per_thread_store(monkeypatch):
+    """スレッドごとに別のプロセス内ストアを使う（別々のコンテナに届いた重複を再現する）"""
+    local = threading.local()
+
+    def get_store():
+        if not hasattr(local, "store"):
+            local.store = TTLCache(ttl_sec=3600)
+        return local.store
+
+    monkeypatch.setattr(idempotency, "_get_local_store", get_store)
+
+
+class TestConcurrentDuplicates:
+    def test_same_container(self, fake_line, fake_agent):
+        fake_agent.delay_sec = 0.2
+        ev = text_event("渋谷 カフェ", event_id="evt-1")
+
+        _run_concurrently(
+            lambda: app.handle_event(copy.deepcopy(ev), ACCESS_TOKEN),
+            lambda: app.handle_event(_redelivery(ev), ACCESS_TOKEN),
+        )
+
+        assert len(fake_agent.calls) == 1
+        assert len(fake_line.sent("reply")) == 1
+
+    def test_across_containers_with_dynamodb(self, fake_line, fake_agent, create_table, per_thread_store):
+        create_table("IDEMPOTENCY_TABLE")
+        fake_agent.delay_sec = 0.2
+        ev = text_event("渋谷 カフェ", event_id="evt-2")
+
+        _run_concurrently(
+            lambda: app.handle_event(copy.deepcopy(ev), ACCESS_TOKEN),
+            lambda: app.handle_event(_redelivery(ev), ACCESS_TOKEN),
+        )
+
+        assert len(fake_agent.calls) == 1
+        assert len(fake_line.sent("reply")) == 1
+
+    def test_many_redeliveries(self, fake_line, fake_agent):
+        fake_agent.delay_sec = 0.1
+        ev = text_event("渋谷 カフェ", event_id="evt-3")
+
+        _run_concurrently(*[lambda: app.handle_event(_redelivery(ev), ACCESS_TOKEN) for _ in range(8)])
+
+        assert len(fake_agent.calls) == 1
+        assert len(fake_line.sent("reply")) == 1
+
+
+class TestRedeliveryAfterCompletion:
+    def test_delivered_answer_is_not_sent_again(self, fake_line, fake_agent):
+        ev = text_event("渋谷 カフェ", event_id="evt-4")
+        app.handle_event(ev, ACCESS_TOKEN)
+        app.handle_event(_redelivery(ev), ACCESS_TOKEN)
+
+        assert len(fake_agent.calls) == 1
+        assert len(fake_line.sent("reply")) == 1
+
+    def test_undelivered_answer_is_replayed_without_agent(self, fake_line, fake_agent):
+        fake_line.status["reply"] = 500
+        ev = text_event("渋谷 カフェ", event_id="evt-5")
+        app.handle_event(ev, ACCESS_TOKEN)
+        assert idempotency.begin("evt-5").delivered is False
+
+        fake_line.status["reply"] = 200
+        app.handle_event(_redelivery(ev), ACCESS_TOKEN)
+
+        assert len(fake_agent.calls) == 1
+        assert fake_line.texts("reply")[-1] == "「渋谷 カフェ」の候補です。"
+        assert idempotency.begin("evt-5").delivered is True
+
+    def test_failed_attempt_is_released_for_redelivery(self, fake_line, fake_agent):
+        fake_agent.error = RuntimeError("agent down")
+        fake_line.status["reply"] = 500
+        ev = text_event("渋谷 カフェ", event_id="evt-6")
+        app.handle_event(ev, ACCESS_TOKEN)
+        # AgentCoreにもLINEにも届かなかったので、再送で最初からやり直す
+        assert idempotency.begin("evt-6") is None
+
+    def test_shared_store_replays_across_containers(self, fake_line, fake_agent, create_table):
+        create_table("IDEMPOTENCY_TABLE")
+        fake_line.status["reply"] = 500
+        ev = text_event("渋谷 カフェ", event_id="evt-7")
+        app.handle_event(ev, ACCESS_TOKEN)
+
+        # 別のコンテナ（プロセス内ストアが空）に再送が届く
+        idempotency.clear()
+        fake_line.status["reply"] = 200
+        app.handle_event(_redelivery(ev), ACCESS_TOKEN)
+
+        assert len(fake_agent.calls) == 1
+        assert fake_line.texts("reply")[-1] == "「渋谷 カフェ」の候補です。"
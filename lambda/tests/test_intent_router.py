@@ -0,0 +1,104 @@
+"""質問の振り分け（intent_router）のテスト"""
+
+import json
+
+import pytest
+
+import intent_router
+from intent_router import AGENT, PLACES, Automaton
+from tests.conftest import LAMBDA_DIR
+
+EVAL_SET = LAMBDA_DIR.parent / "scripts" / "intent_router" / "eval_set.jsonl"
+
+
+class TestAutomaton:
+    def test_overlapping_patterns(self):
+        # 古典的な例: "ushers" には she / he / hers が重なって含まれる
+        automaton = Automaton({"he": "he", "she": "she", "his": "his", "hers": "hers"})
+        assert automaton.longest_at("ushers") == {1: (4, "she"), 2: (6, "hers")}
+
+    def test_longest_match_at_each_start(self):
+        automaton = Automaton({"新宿": 1, "新宿三丁目": 2, "三丁目": 3})
+        assert automaton.longest_at("新宿三丁目") == {0: (5, 2), 2: (5, 3)}
+        assert automaton.longest_at("新宿三") == {0: (2, 1)}
+
+    def test_match_found_through_failure_links(self):
+        # 「西新宿」の途中で失敗しても、後ろの「新宿」を取りこぼさない
+        automaton = Automaton({"西新宿駅": 1, "新宿": 2})
+        assert automaton.longest_at("西新宿で") == {1: (3, 2)}
+
+    def test_no_match(self):
+        assert Automaton({"渋谷": 1}).longest_at("しぶや") == {}
+        assert Automaton({}).longest_at("渋谷") == {}
+
+
+class TestClassify:
+    @pytest.mark.parametrize("query,area,genre", [
+        ("渋谷 ラーメン", "渋谷", "ラーメン"),
+        ("新宿駅の焼肉", "新宿", "焼肉"),
+        ("梅田でおすすめの寿司を教えて", "梅田", "寿司"),
+        ("寿司 梅田", "梅田", "寿司"),
+        # 別表記・全角半角
+        ("シモキタ ｶﾚｰ", "下北沢", "カレー"),
+        ("品川 回転ずし", "品川", "回転寿司"),
+        # 同じ語を2回書いても1つとして数える
+        ("池袋 つけ麺 つけめん", "池袋", "つけ麺"),
+    ])
+    def test_area_and_genre_go_to_places(self, query, area, genre):
+        route = intent_router.classify(query)
+        assert route.kind == PLACES
+        assert (route.area, route.genre) == (area, genre)
+        assert route.search_query == f"{area} {genre}"
+
+    @pytest.mark.parametrize("query,area,genre", [
+        # 短い名前を含む長い名前は長い方に一致する（新宿 < 新宿三丁目 / 西新宿、横浜 < 新横浜）
+        ("新宿三丁目 カフェ", "新宿三丁目", "カフェ"),
+        ("西新宿で焼肉", "西新宿", "焼肉"),
+        ("新横浜 ラーメン", "新横浜", "ラーメン"),
+        ("回転寿司 品川", "品川", "回転寿司"),
+        ("喫茶店 神田", "神田", "喫茶店"),
+        # エリア名（横浜中華街）がジャンル名（中華）を含んでいても、エリアとジャンルを取り違えない
+        ("横浜中華街 中華", "横浜中華街", "中華"),
+        ("中華街 ラーメン", "横浜中華街", "ラーメン"),
+    ])
+    def test_overlapping_keywords(self, query, area, genre):
+        route = intent_router.classify(query)
+        assert (route.kind, route.area, route.genre) == (PLACES, area, genre)
+
+    @pytest.mark.parametrize("query", ["渋谷", "渋谷駅周辺", "新宿三丁目あたり"])
+    def test_area_only_goes_to_agent(self, query):
+        route = intent_router.classify(query)
+        assert (route.kind, route.reason) == (AGENT, "no_genre")
+
+    @pytest.mark.parametrize("query", ["ラーメン", "おすすめの焼肉", "美味しい寿司を教えて"])
+    def test_genre_only_goes_to_agent(self, query):
+        route = intent_router.classify(query)
+        assert (route.kind, route.reason) == (AGENT, "no_area")
+
+    @pytest.mark.parametrize("query,reason", [
+        ("渋谷 新宿 ラーメン", "multiple_areas"),
+        ("渋谷 ラーメン 寿司", "multiple_genres"),
+        # 雰囲気・予算などの条件が残る
+        ("渋谷 静かなカフェ", "unmatched"),
+        ("新宿 3000円以内の焼肉", "unmatched"),
+        # 前の会話に依存する
+        ("さっきの店の近くでラーメン", "context"),
+    ])
+    def test_other_queries_go_to_agent(self, query, reason):
+        route = intent_router.classify(query)
+        assert (route.kind, route.reason) == (AGENT, reason)
+        assert not route.direct
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("INTENT_ROUTER_ENABLED", "false")
+        assert intent_router.classify("渋谷 ラーメン").reason == "disabled"
+
+
+def test_eval_set_has_no_false_positives():
+    # 誤って直接検索に回すと回答の質が落ちるので、評価セットでは誤判定を許さない
+    cases = [json.loads(line) for line in EVAL_SET.read_text(encoding="utf-8").splitlines() if line.strip()]
+    for case in cases:
+        route = intent_router.classify(case["query"])
+        if route.direct:
+            assert case["route"] == PLACES, case["query"]
+            assert (route.area, route.genre) == (case["area"], case["genre"]), case["query"]
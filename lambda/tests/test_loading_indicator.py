@@ -0,0 +1,177 @@
+"""ローディング表示（LoadingIndicator）のテスト"""
+
+import threading
+import time
+
+import pytest
+
+import app
+import line_api
+import loading_indicator
+from loading_indicator import LoadingIndicator
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class _Timer:
+    """threading.Timer の代わり。経過を待たずに fire() で呼び出す"""
+
+    created = []
+
+    def __init__(self, interval, function):
+        self.interval = interval
+        self.function = function
+        self.cancelled = False
+        self.daemon = False
+        _Timer.created.append(self)
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        if not self.cancelled:
+            self.function()
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    _Timer.created = []
+    monkeypatch.setattr(loading_indicator.threading, "Timer", _Timer)
+    return _Timer.created
+
+
+def _indicator(loading_seconds: int = 20) -> LoadingIndicator:
+    return LoadingIndicator(app.start_line_loading, "U1", loading_seconds, "token")
+
+
+class TestRearm:
+    def test_first_call_runs_in_background(self, fake_line, timers):
+        indicator = _indicator().start()
+        _wait_for(lambda: fake_line.sent("loading"))
+        assert fake_line.sent("loading") == [("loading", {"chatId": "U1"})]
+        indicator.stop()
+
+    def test_rearmed_before_loading_expires(self, fake_line, timers):
+        indicator = _indicator(20).start()
+        _wait_for(lambda: timers)
+        assert timers[0].interval == 20 - loading_indicator.REARM_MARGIN_SEC
+
+        # AgentCoreの呼び出しが長引くと、表示が切れる前に再表示し続ける
+        timers[0].fire()
+        timers[1].fire()
+        assert len(fake_line.sent("loading")) == 3
+        assert len(timers) == 3
+        indicator.stop()
+
+    def test_short_loading_seconds_rearm_after_at_least_one_second(self, fake_line, timers):
+        indicator = _indicator(1).start()
+        _wait_for(lambda: timers)
+        assert timers[0].interval == 1.0
+        indicator.stop()
+
+    def test_loading_failure_still_rearms(self, fake_line, timers):
+        fake_line.errors["loading"] = ConnectionError("reset")
+        indicator = _indicator().start()
+        _wait_for(lambda: timers)
+        timers[0].fire()
+        assert len(fake_line.sent("loading")) == 2
+        indicator.stop()
+
+
+class TestStop:
+    def test_stop_cancels_pending_timer(self, fake_line, timers):
+        indicator = _indicator().start()
+        _wait_for(lambda: timers)
+        indicator.stop()
+
+        assert timers[0].cancelled
+        timers[0].function()
+        assert len(fake_line.sent("loading")) == 1
+        assert len(timers) == 1
+
+    def test_stop_ends_the_timer_thread(self, fake_line):
+        indicator = _indicator().start()
+        _wait_for(lambda: indicator._timer is not None)
+        timer = indicator._timer
+        assert timer.is_alive()
+
+        indicator.stop()
+
+        timer.join(1.0)
+        assert not timer.is_alive()
+        assert len(fake_line.sent("loading")) == 1
+
+    def test_stop_during_first_call_does_not_rearm(self, monkeypatch, fake_line, timers):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def slow_loading(chat_id, loading_seconds, access_token):
+            entered.set()
+            release.wait(2)
+            return fake_line.start_loading(chat_id, loading_seconds, access_token)
+
+        monkeypatch.setattr(line_api, "start_loading", slow_loading)
+        indicator = _indicator().start()
+        assert entered.wait(2)
+        indicator.stop()
+        release.set()
+
+        _wait_for(lambda: fake_line.sent("loading"))
+        time.sleep(0.05)
+        assert timers == []
+
+    def test_context_manager_stops(self, fake_line, timers):
+        with _indicator() as indicator:
+            _wait_for(lambda: timers)
+        assert indicator._stopped.is_set()
+        assert timers[0].cancelled
+
+
+class TestOverlapMetric:
+    def _saved(self, metrics_records) -> list[float]:
+        return [r["LoadingOverlapSavedMs"] for r in metrics_records if "LoadingOverlapSavedMs" in r]
+
+    def test_first_call_time_is_reported(self, monkeypatch, fake_line, timers, metrics_records):
+        def slow_loading(chat_id, loading_seconds, access_token):
+            time.sleep(0.05)
+            return fake_line.start_loading(chat_id, loading_seconds, access_token)
+
+        monkeypatch.setattr(line_api, "start_loading", slow_loading)
+        indicator = _indicator().start()
+        _wait_for(lambda: timers)
+        # 再表示の分は含めない（最初の1回だけがAgentCoreの呼び出しと重なって短縮できた時間）
+        timers[0].fire()
+        indicator.stop()
+
+        [saved] = self._saved(metrics_records)
+        assert 50 <= saved < 1000
+
+    def test_not_reported_before_first_call_completes(self, monkeypatch, fake_line, timers, metrics_records):
+        release = threading.Event()
+
+        def blocked_loading(chat_id, loading_seconds, access_token):
+            release.wait(2)
+            return fake_line.start_loading(chat_id, loading_seconds, access_token)
+
+        monkeypatch.setattr(line_api, "start_loading", blocked_loading)
+        indicator = _indicator().start()
+        indicator.stop()
+        release.set()
+        assert self._saved(metrics_records) == []
+
+
+@pytest.mark.parametrize("value,expected", [(None, 20), ("7", 5), ("3", 5), ("45", 45), ("100", 60), ("abc", 20)])
+def test_loading_seconds_env(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("LINE_LOADING_SECONDS", raising=False)
+    else:
+        monkeypatch.setenv("LINE_LOADING_SECONDS", value)
+    assert app._get_loading_seconds() == expected
@@ -0,0 +1,82 @@
+"""直前の位置情報を続く質問に付け加える（location_context）テスト"""
+
+import json
+
+import app
+import location_context
+import worker
+from tests.fakes import location_event, text_event
+
+QUERY = "近くで静かなカフェ"
+
+
+def _attached(query: str = QUERY) -> bool:
+    return "（現在地：渋谷駅" in location_context.attach("U1", query)
+
+
+class TestLocal:
+    def test_attached_to_nearby_query(self):
+        location_context.remember("U1", 35.658034, 139.701636, "渋谷駅")
+        assert location_context.attach("U1", QUERY) == f"{QUERY}（現在地：渋谷駅 緯度35.6580 経度139.7016）"
+
+    def test_not_attached_to_other_queries_or_users(self):
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        assert not _attached("渋谷 カフェ")
+        assert location_context.attach("U2", QUERY) == QUERY
+
+    def test_attached_once(self):
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        query = location_context.attach("U1", QUERY)
+        assert location_context.attach("U1", query) == query
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("LOCATION_CONTEXT_ENABLED", "false")
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        assert not _attached()
+
+    def test_other_process_does_not_see_it_without_table(self):
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        # 別のプロセス（queueモードのworker・別コンテナ）
+        location_context.clear()
+        assert not _attached()
+
+
+class TestShared:
+    def test_other_process_sees_it(self, create_table):
+        create_table("LOCATION_CONTEXT_TABLE")
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        location_context.clear()
+        assert _attached()
+
+    def test_expired(self, create_table, monkeypatch):
+        create_table("LOCATION_CONTEXT_TABLE")
+        monkeypatch.setenv("LOCATION_CONTEXT_TTL_SEC", "0")
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        location_context.clear()
+        assert not _attached()
+
+    def test_store_errors_fall_back_to_local(self, aws, monkeypatch):
+        monkeypatch.setenv("LOCATION_CONTEXT_TABLE", "missing-table")
+        location_context.remember("U1", 35.658, 139.7016, "渋谷駅")
+        assert _attached()
+
+
+class TestQueueMode:
+    def test_follow_up_handled_by_worker(self, monkeypatch, create_table, create_queue, fake_line, fake_agent,
+                                         fake_places):
+        monkeypatch.setenv("WEBHOOK_MODE", "queue")
+        monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+        create_table("LOCATION_CONTEXT_TABLE")
+
+        def webhook(ev):
+            app.lambda_handler({"body": json.dumps({"events": [ev]}, ensure_ascii=False)}, None)
+
+        # 位置情報はWebhookのLambdaで答え、続く質問はworkerのLambda（別プロセス）で処理する
+        webhook(location_event("evt-1"))
+        webhook(text_event(QUERY, event_id="evt-2"))
+        location_context.clear()
+        records = [{"messageId": "msg-1", "body": json.dumps(e, ensure_ascii=False)} for e in create_queue()]
+        assert worker.worker_handler({"Records": records}, None) == {"batchItemFailures": []}
+
+        [prompt] = fake_agent.prompts()
+        assert "（現在地：渋谷駅 緯度35.6580 経度139.7016）" in prompt
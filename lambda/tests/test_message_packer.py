@@ -0,0 +1,138 @@
+"""長い応答の分割（UTF-16での文字数・絵文字の結合・5吹き出し/呼び出し回数での省略）のテスト"""
+
+import unicodedata
+
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+import message_packer
+import metrics
+from message_packer import MAX_MESSAGES_PER_CALL, OMITTED_SUFFIX, pack, split_text, utf16_len
+
+FAMILY = "👨‍👩‍👧‍👦"
+TECHNOLOGIST = "👩‍💻"
+THUMBS_UP = "👍🏽"
+HEART = "❤️"
+GA = "が"
+
+# 見た目の1文字（これより内側で切ってはいけない）
+clusters = st.sampled_from(
+    ["渋", "谷", "の", "カ", "フ", "ェ", "。", "a", " ", "🍣", "𠮷", FAMILY, TECHNOLOGIST, THUMBS_UP, HEART, GA, "é"])
+
+
+def _starts_inside_cluster(piece: str) -> bool:
+    first = piece[0]
+    return (first in "‍︎️" or 0x1F3FB <= ord(first) <= 0x1F3FF
+            or unicodedata.combining(first) != 0)
+
+
+class TestUtf16:
+    @pytest.mark.parametrize("text, units", [
+        ("渋谷のカフェ", 6),
+        ("🍣", 2),
+        ("𠮷野家", 4),
+        (FAMILY, 11),
+        (THUMBS_UP, 4),
+        (HEART, 2),
+    ])
+    def test_utf16_len(self, text, units):
+        assert utf16_len(text) == units
+
+
+class TestSplitText:
+    def test_short_text_is_one_piece(self):
+        assert split_text("渋谷のカフェ", 10) == ["渋谷のカフェ"]
+        assert split_text("", 10) == [""]
+
+    def test_japanese_paragraphs(self):
+        places = ["1. スタブ食堂\n住所：渋谷区1-1", "2. スタブ亭\n住所：渋谷区2-2", "3. スタブ屋\n住所：渋谷区3-3"]
+        text = "\n\n".join(places)
+        # 2件分は入るが3件は入らない
+        assert split_text(text, len(places[0]) * 2 + 2) == ["\n\n".join(places[:2]), places[2]]
+
+    def test_sentence_boundary(self):
+        text = "静かなカフェです。電源があります。"
+        assert split_text(text, 12) == ["静かなカフェです。", "電源があります。"]
+
+    def test_surrogate_pairs_are_not_split(self):
+        # 🍣 は2単位。上限5なら2個ずつ
+        assert split_text("🍣" * 5, 5) == ["🍣🍣", "🍣🍣", "🍣"]
+
+    def test_zwj_sequence_is_not_split(self):
+        assert split_text("ab" + TECHNOLOGIST, 5) == ["ab", TECHNOLOGIST]
+
+    @pytest.mark.parametrize("cluster", [THUMBS_UP, HEART, GA])
+    def test_modifier_is_not_split(self, cluster):
+        text = "あい" + cluster
+        pieces = split_text(text, utf16_len(text) - 1)
+        assert pieces == ["あい", cluster]
+
+    def test_cluster_longer_than_limit_is_cut(self):
+        pieces = split_text(FAMILY, 8)
+        assert "".join(pieces) == FAMILY
+        assert all(utf16_len(p) <= 8 for p in pieces)
+
+    @settings(max_examples=300, deadline=None)
+    @given(text=st.lists(clusters, min_size=1, max_size=200).map("".join),
+           max_units=st.integers(min_value=utf16_len(FAMILY), max_value=80))
+    def test_pieces_fit_and_keep_clusters(self, text, max_units):
+        pieces = split_text(text, max_units)
+        assert "".join(pieces) == text
+        assert all(utf16_len(p) <= max_units for p in pieces)
+        assert not any(_starts_inside_cluster(p) for p in pieces)
+        assert not any(p.endswith("‍") for p in pieces)
+
+
+class TestPack:
+    def _paragraphs(self, n: int, units: int) -> str:
+        return "\n\n".join(f"{i + 1:02d}" + "あ" * (units - 2) for i in range(n))
+
+    def test_one_call_holds_five_messages(self, metrics_records):
+        with metrics.trace("Event"):
+            batches = pack(self._paragraphs(5, 100), max_units=100)
+        assert len(batches) == 1
+        assert len(batches[0]) == 5
+        assert "TruncatedMessages" not in metrics_records[-1]
+
+    def test_truncated_to_five_messages_per_call(self, metrics_records):
+        with metrics.trace("Event"):
+            batches = pack(self._paragraphs(12, 100), max_calls=1, max_units=100)
+        assert len(batches) == 1
+        texts = [m["text"] for m in batches[0]]
+        assert len(texts) == MAX_MESSAGES_PER_CALL
+        assert texts[-1].endswith(OMITTED_SUFFIX)
+        assert utf16_len(texts[-1]) <= 100
+        assert texts[-1].startswith("05")
+        assert metrics_records[-1]["TruncatedMessages"] == 1
+        # 6件目以降の7件と、5件目の省略した末尾
+        assert metrics_records[-1]["TruncatedChars"] > 7 * 100
+
+    def test_more_calls_send_more_messages(self):
+        batches = pack(self._paragraphs(12, 100), max_calls=2, max_units=100)
+        assert [len(b) for b in batches] == [5, 5]
+        assert batches[-1][-1]["text"].endswith(OMITTED_SUFFIX)
+
+        batches = pack(self._paragraphs(12, 100), max_calls=3, max_units=100)
+        assert [len(b) for b in batches] == [5, 5, 2]
+        assert not batches[-1][-1]["text"].endswith(OMITTED_SUFFIX)
+
+    def test_truncation_keeps_surrogate_pairs(self):
+        text = "\n\n".join(["🍣" * 50] * 6)
+        batches = pack(text, max_calls=1, max_units=100)
+        last = batches[0][-1]["text"]
+        assert utf16_len(last) <= 100
+        assert last[:-len(OMITTED_SUFFIX)] == "🍣" * ((100 - utf16_len(OMITTED_SUFFIX)) // 2)
+
+    def test_quick_reply_on_last_message(self):
+        quick_reply = {"items": []}
+        batches = pack(self._paragraphs(7, 100), max_calls=2, max_units=100, quick_reply=quick_reply)
+        messages = [m for b in batches for m in b]
+        assert messages[-1]["quickReply"] is quick_reply
+        assert not any("quickReply" in m for m in messages[:-1])
+
+    def test_max_text_units_env(self, monkeypatch):
+        monkeypatch.setenv("LINE_MAX_TEXT_LEN", "9000")
+        assert message_packer.max_text_units() == 5000
+        monkeypatch.setenv("LINE_MAX_TEXT_LEN", "abc")
+        assert message_packer.max_text_units() == 4500
@@ -0,0 +1,96 @@
+"""検索結果のページ送り（「もっと見る」のpostback・「他には？」）のテスト（syncモード・queueモード）"""
+
+import json
+
+import pytest
+
+import app
+import result_pages
+import worker
+from tests.fakes import postback_event, text_event
+
+
+@pytest.fixture(autouse=True)
+def channel_token(monkeypatch):
+    monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+
+
+@pytest.fixture(params=["sync", "queue"])
+def deliver(request, monkeypatch, fake_line, fake_agent, fake_places):
+    """Webhookにイベントを1件送り、queueモードではキューに積まれた分をworkerで処理する"""
+    mode = request.param
+    monkeypatch.setenv("WEBHOOK_MODE", mode)
+    received = request.getfixturevalue("create_queue") if mode == "queue" else None
+    queued = []
+
+    def send(ev):
+        app.lambda_handler({"body": json.dumps({"events": [ev]}, ensure_ascii=False)}, None)
+        if received is None:
+            return
+        events = received()
+        queued.extend(events)
+        records = [{"messageId": f"msg-{len(queued)}-{i}", "body": json.dumps(e, ensure_ascii=False)}
+                   for i, e in enumerate(events)]
+        if records:
+            assert worker.worker_handler({"Records": records}, None) == {"batchItemFailures": []}
+
+    send.mode = mode
+    send.queued = queued
+    return send
+
+
+def _last_reply(fake_line) -> dict:
+    return fake_line.sent("reply")[-1][1]
+
+
+def _more_data(fake_line) -> str | None:
+    quick_reply = _last_reply(fake_line)["messages"][-1].get("quickReply")
+    return quick_reply["items"][0]["action"]["data"] if quick_reply else None
+
+
+class TestPagination:
+    def test_postback_pages_through_results(self, deliver, fake_line, fake_agent, fake_places):
+        page = result_pages.page_size()
+        deliver(text_event("渋谷 カフェ", event_id="evt-1"))
+        first = fake_line.texts("reply")[-1]
+        assert "スタブ食堂1" in first
+        assert f"スタブ食堂{page + 1}" not in first
+
+        deliver(postback_event(_more_data(fake_line), "evt-2"))
+        second = fake_line.texts("reply")[-1]
+        assert f"スタブ食堂{page + 1}" in second
+        assert "スタブ食堂1\n" not in second
+
+        # 最後のページにはボタンを付けない
+        while _more_data(fake_line) is not None:
+            deliver(postback_event(_more_data(fake_line), f"evt-{len(fake_line.sent('reply')) + 2}"))
+        assert f"スタブ食堂{fake_places.count}" in fake_line.texts("reply")[-1]
+
+        assert fake_agent.calls == []
+        assert len(fake_places.calls) == 1
+        if deliver.mode == "queue":
+            # postbackはキューに積まずにWebhookで答える
+            assert [ev["webhookEventId"] for ev in deliver.queued] == ["evt-1"]
+
+    def test_same_button_twice_returns_same_page(self, deliver, fake_line):
+        deliver(text_event("渋谷 カフェ", event_id="evt-1"))
+        data = _more_data(fake_line)
+        deliver(postback_event(data, "evt-2"))
+        deliver(postback_event(data, "evt-3"))
+        texts = fake_line.texts("reply")
+        assert texts[-1] == texts[-2]
+
+    def test_text_more_request(self, deliver, fake_line, fake_agent):
+        page = result_pages.page_size()
+        deliver(text_event("渋谷 カフェ", event_id="evt-1"))
+        deliver(text_event("他には？", event_id="evt-2"))
+        assert f"スタブ食堂{page + 1}" in fake_line.texts("reply")[-1]
+        assert fake_agent.calls == []
+
+    def test_expired_cursor(self, deliver, fake_line):
+        deliver(postback_event("action=more&cursor=unknown&offset=3", "evt-1"))
+        assert fake_line.texts("reply") == [result_pages.EXPIRED_MESSAGE]
+
+    def test_unrelated_postback_is_ignored(self, deliver, fake_line):
+        deliver(postback_event("action=other", "evt-1"))
+        assert fake_line.calls == []
@@ -0,0 +1,161 @@
+"""段階送信（ProgressiveBuffer / app._deliver_progressively）のテスト"""
+
+import time
+
+import pytest
+
+import app
+import usage_meter
+from progressive import FlushPolicy, ProgressiveBuffer
+
+PLACES = ["1. スタブ食堂\n評価：4.2", "2. スタブ亭\n評価：4.0", "3. スタブ屋\n評価：3.9"]
+ANSWER = "\n\n".join(PLACES)
+
+
+class _Response:
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+
+
+class _Line:
+    """send_line_reply / send_line_push の代わり"""
+
+    def __init__(self, reply_status: int = 200):
+        self.reply_status = reply_status
+        self.calls = []
+
+    def reply(self, reply_token, message, access_token, *args, **kwargs):
+        self.calls.append(("reply", message))
+        return _Response(self.reply_status)
+
+    def push(self, to_id, message, access_token, *args, **kwargs):
+        self.calls.append(("push", message))
+        return _Response()
+
+
+@pytest.fixture
+def line(monkeypatch):
+    fake = _Line()
+    monkeypatch.setattr(app, "send_line_reply", fake.reply)
+    monkeypatch.setattr(app, "send_line_push", fake.push)
+    return fake
+
+
+def _stream(pieces, error=None):
+    def stream(user_id, query, read_timeout=None):
+        yield from pieces
+        if error is not None:
+            raise error
+    return stream
+
+
+def _deliver(mode: str = "place") -> str:
+    text, _ = app._deliver_progressively("U1", "渋谷 カフェ", "token", "U1", FlushPolicy(mode, first_chars=10), "access")
+    return text
+
+
+def _tokens(text: str, size: int = 3) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestDeliverProgressively:
+    def test_single_final_chunk_is_one_reply(self, monkeypatch, line):
+        # 今のRuntimeは応答全文を1回で返す。replyとpushに分けず、pushを使わない
+        monkeypatch.setattr(app, "_stream_agentcore", _stream([ANSWER]))
+        assert _deliver("place") == ANSWER
+        assert line.calls == [("reply", ANSWER)]
+
+    def test_streamed_places_are_sent_as_they_complete(self, monkeypatch, line):
+        monkeypatch.setattr(app, "_stream_agentcore", _stream(_tokens(ANSWER)))
+        assert _deliver("place") == ANSWER
+        assert line.calls[0] == ("reply", PLACES[0])
+        assert [kind for kind, _ in line.calls[1:]] == ["push"] * (len(line.calls) - 1)
+        assert "\n\n".join(message for _, message in line.calls) == ANSWER
+
+    def test_places_completed_together_are_sent_separately(self, monkeypatch, line):
+        # 1つの断片で複数のお店が完成しても、お店ごとに別の吹き出しで送る
+        pieces = [PLACES[0] + "\n\n" + PLACES[1] + "\n\n3. ", PLACES[2][3:], ""]
+        monkeypatch.setattr(app, "_stream_agentcore", _stream(pieces))
+        assert _deliver("place") == ANSWER
+        assert line.calls == [("reply", PLACES[0]), ("push", PLACES[1]), ("push", PLACES[2])]
+
+    def test_chars_mode_flushes_once(self, monkeypatch, line):
+        monkeypatch.setattr(app, "_stream_agentcore", _stream(_tokens(ANSWER)))
+        _deliver("chars")
+        assert [kind for kind, _ in line.calls] == ["reply", "push"]
+        assert "\n\n".join(message for _, message in line.calls) == ANSWER
+
+    def test_agent_error_after_first_place(self, monkeypatch, line):
+        monkeypatch.setattr(app, "_stream_agentcore", _stream(_tokens(ANSWER[:30]), RuntimeError("boom")))
+        assert _deliver("place") == ""
+        assert line.calls[-1][1].endswith(app.AGENT_ERROR_MESSAGE)
+
+    def test_empty_stream(self, monkeypatch, line):
+        monkeypatch.setattr(app, "_stream_agentcore", _stream([]))
+        _deliver("place")
+        assert line.calls == [("reply", app.EMPTY_RESPONSE_MESSAGE)]
+
+    def test_reply_failure_falls_back_to_push(self, monkeypatch, line):
+        line.reply_status = 400
+        monkeypatch.setattr(app, "_stream_agentcore", _stream([ANSWER]))
+        _deliver("place")
+        assert line.calls == [("reply", ANSWER), ("push", ANSWER)]
+
+    def test_usage_is_metered(self, fake_agent, line):
+        # _call_agentcore を通らない段階送信でもAgentCoreの利用量を計上する
+        fake_agent.answer = lambda prompt: _tokens(ANSWER)
+        with usage_meter.attribute("U1"):
+            assert _deliver("place") == ANSWER
+        usage = usage_meter._pending_emf[(usage_meter.USER, "U1")]
+        assert usage["agent_calls"] == 1
+        assert usage["agent_bytes"] == len(ANSWER.encode("utf-8"))
+        assert "agent_errors" not in usage
+
+    def test_agent_error_is_metered(self, fake_agent, line):
+        fake_agent.error = RuntimeError("boom")
+        with usage_meter.attribute("U1"):
+            _deliver("place")
+        usage = usage_meter._pending_emf[(usage_meter.USER, "U1")]
+        assert (usage["agent_calls"], usage["agent_errors"]) == (1, 1)
+
+
+class TestProgressiveBuffer:
+    def test_separator_split_across_pieces(self):
+        buffer = ProgressiveBuffer(FlushPolicy("place"))
+        assert buffer.feed("a\n") == []
+        assert buffer.feed("\nb") == ["a"]
+        assert buffer.finish() == "b"
+
+    def test_place_mode_returns_each_paragraph(self):
+        buffer = ProgressiveBuffer(FlushPolicy("place"))
+        assert buffer.feed(ANSWER + "\n\n4. ") == PLACES
+        assert buffer.flush_count == len(PLACES)
+        assert buffer.feed("スタブ軒") == []
+        assert buffer.finish() == "4. スタブ軒"
+
+    def test_chars_mode_returns_one_chunk(self):
+        buffer = ProgressiveBuffer(FlushPolicy("chars", first_chars=10))
+        assert buffer.feed(ANSWER + "\n\n4. ") == [ANSWER]
+
+    def test_deadline_mode_uses_clock(self):
+        now = [0.0]
+        buffer = ProgressiveBuffer(FlushPolicy("deadline", deadline_sec=5), clock=lambda: now[0])
+        assert buffer.feed("a\n\nb") == []
+        now[0] = 5.0
+        assert buffer.feed("\n\nc") == ["a\n\nb"]
+        assert buffer.feed("\n\nd") == []
+        assert buffer.finish() == "c\n\nd"
+
+    def test_off_mode_never_flushes(self):
+        buffer = ProgressiveBuffer(FlushPolicy("off"))
+        assert buffer.feed(ANSWER) == []
+        assert buffer.finish() == ANSWER
+
+    def test_many_pieces_without_separator_is_linear(self):
+        # 段落区切りが来ないまま断片が続いても、断片ごとに結合し直さない
+        buffer = ProgressiveBuffer(FlushPolicy("place"))
+        started = time.perf_counter()
+        for _ in range(200_000):
+            buffer.feed("あ")
+        assert time.perf_counter() - started < 2.0
+        assert len(buffer.finish()) == 200_000
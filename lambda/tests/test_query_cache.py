@@ -0,0 +1,122 @@
+"""検索条件キャッシュ（正規化・プロセス内LRU・DynamoDBティア）のテスト"""
+
+import time
+
+import pytest
+
+import query_cache
+from dynamodb import get_dynamodb_client
+from ttl_cache import TTLCache
+
+ANSWER = "1. スタブ食堂\n評価：4.2"
+
+
+def _metric_names(records) -> list[str]:
+    return [m["Name"] for r in records for m in r["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+
+
+class TestNormalize:
+    @pytest.mark.parametrize("a, b", [
+        ("＠お店 渋谷　カフェ", "@お店 渋谷 カフェ"),
+        ("渋谷  カフェ。", "渋谷 カフェ"),
+        ("上野 ｶﾌｪ", "上野 かふぇ"),
+        ("上野 カフェ", "上野 かふぇ"),
+        ("ＳＨＩＢＵＹＡ cafe!!", "shibuya cafe"),
+    ])
+    def test_same_key(self, a, b):
+        assert query_cache.normalize_query(a) == query_cache.normalize_query(b)
+        assert query_cache.cache_key(a) == query_cache.cache_key(b)
+
+    @pytest.mark.parametrize("query", ["他には？", "もっと安いところ", "さっきの店", "2件目の詳細", ""])
+    def test_context_dependent(self, query):
+        assert query_cache.is_context_dependent(query)
+        assert not query_cache.is_cacheable(query)
+
+
+class TestLocalTier:
+    def test_hit_after_put(self, metrics_records):
+        assert query_cache.get("渋谷 カフェ") is None
+        query_cache.put("渋谷 カフェ", ANSWER, agent_ms=4000)
+        assert query_cache.get("渋谷　カフェ。") == ANSWER
+        assert _metric_names(metrics_records) == ["QueryCacheMiss", "QueryCacheHit", "QueryCacheLatencySavedMs"]
+        saved = next(r for r in metrics_records if "QueryCacheLatencySavedMs" in r)
+        assert saved["QueryCacheLatencySavedMs"] == 4000
+
+    def test_context_dependent_queries_bypass(self):
+        query_cache.put("他には？", ANSWER)
+        assert query_cache.get("他には？") is None
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("QUERY_CACHE_ENABLED", "false")
+        query_cache.put("渋谷 カフェ", ANSWER)
+        assert query_cache.get("渋谷 カフェ") is None
+
+    def test_oversized_answers_are_not_cached(self, monkeypatch):
+        monkeypatch.setenv("QUERY_CACHE_MAX_VALUE_CHARS", "5")
+        query_cache.put("渋谷 カフェ", ANSWER)
+        assert query_cache.get("渋谷 カフェ") is None
+
+    def test_max_entries(self, monkeypatch):
+        monkeypatch.setenv("QUERY_CACHE_MAX_ENTRIES", "2")
+        monkeypatch.setattr(query_cache, "_local", None)
+        for area in ("渋谷", "新宿", "上野"):
+            query_cache.put(f"{area} カフェ", ANSWER)
+        assert query_cache.get("渋谷 カフェ") is None
+        assert query_cache.get("上野 カフェ") == ANSWER
+
+
+class TestTTLCache:
+    def test_expiry_and_lru(self):
+        now = [0.0]
+        cache = TTLCache(max_entries=2, ttl_sec=10, clock=lambda: now[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+        # 直前に使った a は残り、b が追い出される
+        assert cache.get("b") is None
+        now[0] = 10.0
+        assert cache.get("a") is None
+        assert len(cache) == 1
+
+    def test_add_only_when_absent(self):
+        now = [0.0]
+        cache = TTLCache(ttl_sec=5, clock=lambda: now[0])
+        assert cache.add("k", 1)
+        assert not cache.add("k", 2)
+        now[0] = 5.0
+        assert cache.add("k", 3)
+        assert cache.pop("k") == 3
+
+
+class TestDynamoTier:
+    def test_shared_hit_fills_local(self, create_table, metrics_records):
+        table = create_table("QUERY_CACHE_TABLE")
+        query_cache.put("渋谷 カフェ", ANSWER)
+
+        item = get_dynamodb_client().get_item(
+            TableName=table, Key={"pk": {"S": query_cache.cache_key("渋谷 カフェ")}})["Item"]
+        assert item["answer"]["S"] == ANSWER
+        assert int(item["expires_at"]["N"]) > time.time()
+
+        # 別コンテナ（プロセス内キャッシュが空）からの参照
+        query_cache.clear()
+        assert query_cache.get("渋谷 カフェ") == ANSWER
+        hit = next(r for r in metrics_records if "QueryCacheHit" in r)
+        assert hit["tier"] == "dynamodb"
+        assert query_cache._get_local_cache().get(query_cache.cache_key("渋谷 カフェ")) == ANSWER
+
+    def test_expired_item_is_a_miss(self, create_table):
+        table = create_table("QUERY_CACHE_TABLE")
+        get_dynamodb_client().put_item(TableName=table, Item={
+            "pk": {"S": query_cache.cache_key("渋谷 カフェ")},
+            "answer": {"S": ANSWER},
+            "expires_at": {"N": str(int(time.time()) - 1)},
+        })
+        assert query_cache.get("渋谷 カフェ") is None
+
+    def test_table_errors_fall_back_to_miss(self, aws, monkeypatch):
+        monkeypatch.setenv("QUERY_CACHE_TABLE", "missing-table")
+        query_cache.put("渋谷 カフェ", ANSWER)
+        query_cache.clear()
+        assert query_cache.get("渋谷 カフェ") is None
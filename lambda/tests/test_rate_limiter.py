@@ -0,0 +1,116 @@
+"""ユーザー単位のレート制限（プロセス内トークンバケット・DynamoDBの共有カウンタ）のテスト"""
+
+import pytest
+
+import app
+import rate_limiter
+from dynamodb import get_dynamodb_client
+from rate_limiter import TokenBucket
+from tests.fakes import text_event
+
+
+class _Clock:
+    """rate_limiter.time の代わり（time だけ進められる）"""
+
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def _rate_limited(records) -> list[str]:
+    return [r["tier"] for r in records if "RateLimited" in r]
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self):
+        now = [0.0]
+        bucket = TokenBucket(burst=3, refill_per_sec=1.0, clock=lambda: now[0])
+        assert [bucket.allow("U1") for _ in range(4)] == [True, True, True, False]
+        # 他のユーザーには影響しない
+        assert bucket.allow("U2")
+        now[0] = 1.0
+        assert bucket.allow("U1")
+        assert not bucket.allow("U1")
+        now[0] = 100.0
+        # 回復はburstまで
+        assert [bucket.allow("U1") for _ in range(4)] == [True, True, True, False]
+
+    def test_full_buckets_are_evicted(self):
+        now = [0.0]
+        bucket = TokenBucket(burst=1, refill_per_sec=1.0, clock=lambda: now[0], max_keys=2)
+        bucket.allow("U1")
+        bucket.allow("U2")
+        now[0] = 10.0
+        bucket.allow("U3")
+        assert set(bucket._buckets) == {"U3"}
+
+
+class TestLocalTier:
+    def test_limits_and_reports_metric(self, monkeypatch, metrics_records):
+        monkeypatch.setenv("RATE_LIMIT_BURST", "2")
+        assert [rate_limiter.allow("U1") for _ in range(3)] == [True, True, False]
+        assert _rate_limited(metrics_records) == ["local"]
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+        monkeypatch.setenv("RATE_LIMIT_BURST", "1")
+        assert all(rate_limiter.allow("U1") for _ in range(5))
+
+
+class TestDynamoTier:
+    @pytest.fixture
+    def table(self, create_table, monkeypatch):
+        name = create_table("RATE_LIMIT_TABLE")
+        # プロセス内のバケットでは制限せず、共有カウンタの上限（1ウィンドウ3回）だけを確かめる
+        monkeypatch.setenv("RATE_LIMIT_BURST", "100")
+        monkeypatch.setenv("RATE_LIMIT_SHARED_MAX_PER_WINDOW", "3")
+        monkeypatch.setenv("RATE_LIMIT_WINDOW_SEC", "60")
+        return name
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        fake = _Clock()
+        monkeypatch.setattr(rate_limiter, "time", fake)
+        return fake
+
+    def test_limit_is_shared_across_containers(self, table, clock, metrics_records):
+        assert rate_limiter.allow("U1")
+        assert rate_limiter.allow("U1")
+        # 別のコンテナ（プロセス内のバケットが空）からも同じカウンタを数える
+        rate_limiter.reset()
+        assert rate_limiter.allow("U1")
+        assert not rate_limiter.allow("U1")
+        assert rate_limiter.allow("U2")
+        assert _rate_limited(metrics_records) == ["dynamodb"]
+
+    def test_window_rollover(self, table, clock):
+        clock.now -= clock.now % 60
+        assert all(rate_limiter.allow("U1") for _ in range(3))
+        assert not rate_limiter.allow("U1")
+        clock.now += 60
+        assert rate_limiter.allow("U1")
+
+        window_start = int(clock.now)
+        item = get_dynamodb_client().get_item(
+            TableName=table, Key={"pk": {"S": f"U1#{window_start}"}})["Item"]
+        assert item["count"]["N"] == "1"
+        assert int(item["expires_at"]["N"]) == window_start + 120
+
+    def test_store_errors_fall_back_to_local(self, aws, monkeypatch):
+        monkeypatch.setenv("RATE_LIMIT_TABLE", "missing-table")
+        monkeypatch.setenv("RATE_LIMIT_BURST", "2")
+        assert [rate_limiter.allow("U1") for _ in range(3)] == [True, True, False]
+
+
+class TestWebhook:
+    def test_limited_user_gets_canned_reply(self, monkeypatch, fake_line, fake_agent, metrics_records):
+        monkeypatch.setenv("RATE_LIMIT_BURST", "2")
+        monkeypatch.setenv("RATE_LIMIT_REFILL_PER_MIN", "0")
+        for i, area in enumerate(["渋谷", "新宿", "上野"]):
+            app.handle_event(text_event(f"{area} カフェ", event_id=f"evt-{i}"), "token")
+
+        assert len(fake_agent.calls) == 2
+        assert fake_line.texts("reply")[-1] == rate_limiter.LIMITED_MESSAGE
+        assert _rate_limited(metrics_records) == ["local"]
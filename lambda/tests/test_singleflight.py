@@ -0,0 +1,269 @@
+"""同じ検索条件のAgentCore呼び出しを1回にまとめる（プロセス内・DynamoDBのロック）テスト"""
+
+import threading
+import time
+
+import pytest
+
+import singleflight
+from dynamodb import get_dynamodb_client
+from singleflight import DONE, IN_FLIGHT, DynamoFlight, SingleFlight
+
+ANSWER = "1. スタブ食堂\n評価：4.2"
+KEY = "sf#test"
+
+
+class _Clock:
+    """DynamoFlight の clock / sleep に渡す時計（sleep は時計を進め、任意の処理を挟める）"""
+
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+        self.on_sleep = None
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, sec: float):
+        self.now += sec
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+
+class _Counter:
+    """呼び出し回数を数える fn（delay_sec だけかかる）"""
+
+    def __init__(self, value=ANSWER, delay_sec: float = 0.0, error: Exception | None = None):
+        self.value = value
+        self.delay_sec = delay_sec
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay_sec)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def _run_concurrently(n: int, target) -> list:
+    """target(i) を n スレッドで同時に呼び、結果（例外はそのまま）を返す"""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    return results
+
+
+def _collapsed(records) -> list[str]:
+    return [r["tier"] for r in records if "CollapsedRequests" in r]
+
+
+class TestLocal:
+    def test_concurrent_calls_share_one_result(self):
+        flight = SingleFlight()
+        fn = _Counter(delay_sec=0.2)
+        results = _run_concurrently(5, lambda i: flight.do(KEY, fn))
+        assert fn.calls == 1
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert {value for value, _ in results} == {ANSWER}
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+        fn = _Counter(delay_sec=0.2, error=RuntimeError("agent down"))
+        results = _run_concurrently(3, lambda i: flight.do(KEY, fn))
+        assert fn.calls == 1
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_follower_timeout(self):
+        flight = SingleFlight()
+        fn = _Counter(delay_sec=0.5)
+        results = _run_concurrently(2, lambda i: flight.do(KEY, fn, timeout=0.1))
+        assert fn.calls == 1
+        assert sum(isinstance(r, TimeoutError) for r in results) == 1
+
+    def test_sequential_calls_are_not_shared(self):
+        flight = SingleFlight()
+        fn = _Counter()
+        assert flight.do(KEY, fn) == (ANSWER, False)
+        assert flight.do(KEY, fn) == (ANSWER, False)
+        assert fn.calls == 2
+
+
+class TestModule:
+    def test_same_normalized_query_is_collapsed(self, metrics_records):
+        fn = _Counter(delay_sec=0.2)
+        queries = ["渋谷 カフェ", "渋谷　カフェ。", "渋谷  カフェ!"]
+        results = _run_concurrently(3, lambda i: singleflight.do(queries[i], fn))
+        assert fn.calls == 1
+        assert results == [ANSWER] * 3
+        assert _collapsed(metrics_records) == ["local", "local"]
+
+    def test_context_dependent_query_is_not_collapsed(self, metrics_records):
+        fn = _Counter(delay_sec=0.1)
+        results = _run_concurrently(3, lambda i: singleflight.do("他には？", fn))
+        assert fn.calls == 3
+        assert results == [ANSWER] * 3
+        assert _collapsed(metrics_records) == []
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("SINGLEFLIGHT_ENABLED", "false")
+        fn = _Counter(delay_sec=0.1)
+        _run_concurrently(3, lambda i: singleflight.do("渋谷 カフェ", fn))
+        assert fn.calls == 3
+
+
+class TestDynamoFlight:
+    @pytest.fixture
+    def table(self, create_table):
+        return create_table("SINGLEFLIGHT_TABLE")
+
+    @pytest.fixture
+    def clock(self):
+        return _Clock()
+
+    def _flight(self, table, clock) -> DynamoFlight:
+        return DynamoFlight(table, poll_sec=0.3, result_ttl_sec=10, clock=clock, sleep=clock.sleep)
+
+    def _item(self, table) -> dict | None:
+        return get_dynamodb_client().get_item(TableName=table, Key={"pk": {"S": KEY}}).get("Item")
+
+    def test_leader_publishes_result(self, table, clock):
+        fn = _Counter()
+        assert self._flight(table, clock).do(KEY, fn, timeout=30) == (ANSWER, False)
+        item = self._item(table)
+        assert item["status"]["S"] == DONE
+        assert item["answer"]["S"] == ANSWER
+        assert float(item["lease_until"]["N"]) == pytest.approx(clock.now + 10)
+
+    def test_follower_in_another_container_waits_for_result(self, table, clock):
+        leader = self._flight(table, clock)
+        assert leader._acquire(KEY, "leader", 30)
+        assert self._item(table)["status"]["S"] == IN_FLIGHT
+        polls = []
+
+        def leader_finishes():
+            polls.append(clock.now)
+            if len(polls) == 3:
+                leader._publish(KEY, "leader", ANSWER)
+
+        clock.on_sleep = leader_finishes
+        fn = _Counter()
+        assert self._flight(table, clock).do(KEY, fn, timeout=30) == (ANSWER, True)
+        assert fn.calls == 0
+        assert len(polls) == 3
+
+    def test_recent_result_is_returned_to_late_callers(self, table, clock):
+        self._flight(table, clock).do(KEY, _Counter(), timeout=30)
+        clock.now += 5
+        fn = _Counter(value="new")
+        assert self._flight(table, clock).do(KEY, fn, timeout=30) == (ANSWER, True)
+        clock.now += 6
+        # 結果の保持期間が過ぎたら新しく呼び出す
+        assert self._flight(table, clock).do(KEY, fn, timeout=30) == ("new", False)
+
+    def test_expired_lease_is_taken_over(self, table, clock):
+        flight = self._flight(table, clock)
+        assert flight._acquire(KEY, "crashed", 5)
+        clock.now += 6
+        fn = _Counter()
+        assert flight.do(KEY, fn, timeout=30) == (ANSWER, False)
+        assert fn.calls == 1
+        assert self._item(table)["owner"]["S"] != "crashed"
+
+    def test_follower_gives_up_at_timeout(self, table, clock):
+        flight = self._flight(table, clock)
+        assert flight._acquire(KEY, "leader", 60)
+        started = clock.now
+        with pytest.raises(TimeoutError):
+            flight.do(KEY, _Counter(), timeout=2)
+        assert clock.now - started == pytest.approx(2)
+
+    def test_failure_releases_lock(self, table, clock):
+        with pytest.raises(RuntimeError):
+            self._flight(table, clock).do(KEY, _Counter(error=RuntimeError("agent down")), timeout=30)
+        assert self._item(table) is None
+
+    def test_store_errors_call_directly(self, aws, clock):
+        fn = _Counter()
+        assert DynamoFlight("missing-table", clock=clock, sleep=clock.sleep).do(KEY, fn, timeout=30) == (ANSWER, False)
+        assert fn.calls == 1
+
+
+class TestModuleWithTable:
+    def test_collapsed_across_containers(self, monkeypatch, create_table, metrics_records):
+        table = create_table("SINGLEFLIGHT_TABLE")
+        monkeypatch.setenv("SINGLEFLIGHT_POLL_SEC", "0.05")
+        key = f"sf#{singleflight.query_cache.cache_key('渋谷 カフェ')}"
+        other = DynamoFlight(table)
+        assert other._acquire(key, "other-container", 30)
+        threading.Timer(0.2, other._publish, args=(key, "other-container", ANSWER)).start()
+
+        fn = _Counter()
+        assert singleflight.do("渋谷 カフェ", fn, timeout=5) == ANSWER
+        assert fn.calls == 0
+        assert _collapsed(metrics_records) == ["dynamodb"]
+
+
+class TestAsgi:
+    """ASGI版（asyncio）のsingle-flightもLambda版と同じキー・対象外の判定を使う"""
+
+    @pytest.fixture
+    def asgi(self, monkeypatch):
+        import asyncio
+
+        import asgi_app
+
+        calls = []
+
+        async def call_agentcore(user_id, query):
+            calls.append((user_id, query))
+            await asyncio.sleep(0.05)
+            return f"{user_id}:{query}"
+
+        monkeypatch.setattr(asgi_app, "_state", asgi_app._State())
+        monkeypatch.setattr(asgi_app, "_call_agentcore", call_agentcore)
+        return asgi_app, calls
+
+    @staticmethod
+    def _ask_all(asgi_app, requests: list[tuple[str, str]]) -> list[str]:
+        import asyncio
+
+        async def run():
+            return await asyncio.gather(*(asgi_app._ask_agent(u, q) for u, q in requests))
+
+        return asyncio.run(run())
+
+    def test_normalized_queries_share_one_call(self, asgi):
+        asgi_app, calls = asgi
+        answers = self._ask_all(asgi_app, [("U1", "渋谷 カフェ"), ("U2", "渋谷　カフェ"), ("U3", "渋谷 カフェ ")])
+        assert len(calls) == 1
+        assert len(set(answers)) == 1
+        assert asgi_app._state.counters["singleflight_shared"] == 2
+        assert asgi_app._state.flights == {}
+
+    def test_context_dependent_queries_are_not_shared(self, asgi):
+        asgi_app, calls = asgi
+        answers = self._ask_all(asgi_app, [("U1", "他には？"), ("U2", "他には？")])
+        assert sorted(calls) == [("U1", "他には？"), ("U2", "他には？")]
+        assert answers == ["U1:他には？", "U2:他には？"]
+        assert asgi_app._state.counters["singleflight_shared"] == 0
+
+    def test_disabled(self, asgi, monkeypatch):
+        monkeypatch.setenv("SINGLEFLIGHT_ENABLED", "false")
+        asgi_app, calls = asgi
+        self._ask_all(asgi_app, [("U1", "渋谷 カフェ"), ("U2", "渋谷 カフェ")])
+        assert len(calls) == 2
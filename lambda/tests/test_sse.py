@@ -0,0 +1,131 @@
+"""SSEデコーダーのテスト（任意の位置で分断されたバイト列から同じイベントを復元できるか）"""
+
+import io
+import json
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+import sse
+
+LINE_ENDINGS = ("\n", "\r", "\r\n")
+
+texts = st.lists(st.text(min_size=1, max_size=40), min_size=1, max_size=8)
+line_endings = st.sampled_from(LINE_ENDINGS)
+
+
+class _ChunkedBody:
+    """決まった区切りでバイト列を返すStreamingBodyの代わり"""
+
+    def __init__(self, chunks: list[bytes]):
+        self._chunks = chunks
+
+    def iter_chunks(self, chunk_size):
+        yield from self._chunks
+
+
+def _encode(payloads: list[str], eol: str, ensure_ascii: bool, trailing_blank: bool = True) -> bytes:
+    """AgentCoreと同じ data: "JSON文字列" 形式のストリームを作る"""
+    events = [f"data: {json.dumps(p, ensure_ascii=ensure_ascii)}{eol}" for p in payloads]
+    stream = eol.join(events)
+    if trailing_blank:
+        stream += eol
+    return stream.encode("utf-8")
+
+
+def _split(data: bytes, cuts: list[int]) -> list[bytes]:
+    points = sorted({c % (len(data) + 1) for c in cuts})
+    chunks = []
+    start = 0
+    for p in points:
+        chunks.append(data[start:p])
+        start = p
+    chunks.append(data[start:])
+    return chunks
+
+
+def _decode(chunks: list[bytes]) -> list[str]:
+    return list(sse.iter_text(_ChunkedBody(chunks)))
+
+
+class TestSSEDecoderProperties:
+    @settings(max_examples=300, deadline=None)
+    @given(payloads=texts, eol=line_endings, ensure_ascii=st.booleans(),
+           cuts=st.lists(st.integers(min_value=0, max_value=10_000), max_size=20))
+    def test_any_fragmentation_restores_payloads(self, payloads, eol, ensure_ascii, cuts):
+        data = _encode(payloads, eol, ensure_ascii)
+        assert _decode(_split(data, cuts)) == payloads
+
+    @settings(max_examples=100, deadline=None)
+    @given(payloads=texts, eol=line_endings)
+    def test_byte_by_byte(self, payloads, eol):
+        data = _encode(payloads, eol, ensure_ascii=False)
+        assert _decode([data[i:i + 1] for i in range(len(data))]) == payloads
+
+    @settings(max_examples=100, deadline=None)
+    @given(payloads=texts, eol=line_endings, cuts=st.lists(st.integers(min_value=0, max_value=10_000), max_size=5))
+    def test_missing_trailing_blank_line(self, payloads, eol, cuts):
+        data = _encode(payloads, eol, ensure_ascii=False, trailing_blank=False)
+        assert _decode(_split(data, cuts)) == payloads
+
+    @settings(max_examples=100, deadline=None)
+    @given(lines=st.lists(st.text(alphabet=st.characters(blacklist_categories=("Cs",), blacklist_characters="\r\n"),
+                                  min_size=1, max_size=20), min_size=1, max_size=5),
+           eol=line_endings, cuts=st.lists(st.integers(min_value=0, max_value=10_000), max_size=10))
+    def test_multiline_data_is_joined_with_lf(self, lines, eol, cuts):
+        # 「data:」の後の空白は1つだけ取り除かれる
+        data = "".join(f"data: {line}{eol}" for line in lines) + eol
+        decoder = sse.SSEDecoder()
+        events = []
+        for chunk in _split(data.encode("utf-8"), cuts):
+            events.extend(decoder.feed(chunk))
+        events.extend(decoder.close())
+        assert [ev.data for ev in events] == ["\n".join(lines)]
+
+
+class TestSSEDecoder:
+    def test_crlf_split_between_chunks(self):
+        decoder = sse.SSEDecoder()
+        assert decoder.feed(b'data: "a"\r') == []
+        # 行頭の \n は前のCRの続き。末尾のCRだけで空行（イベントの区切り）になる
+        assert [ev.data for ev in decoder.feed(b"\n\r")] == ['"a"']
+        # 続く \n は直前のCRの続きなので、空行を二重に数えない
+        assert [ev.data for ev in decoder.feed(b'\ndata: "b"\r\n\r\n')] == ['"b"']
+        assert decoder.close() == []
+
+    def test_multibyte_character_split_between_chunks(self):
+        data = 'data: "渋谷のカフェ🍰"\n\n'.encode("utf-8")
+        # 「渋」（3バイト）の途中で切る
+        cut = data.index("渋".encode("utf-8")) + 1
+        assert _decode([data[:cut], data[cut:]]) == ["渋谷のカフェ🍰"]
+
+    def test_escapes(self):
+        payload = 'say "hi"\\n\n\t\u00e9\U0001f35c'
+        data = f"data: {json.dumps(payload)}\n\n".encode("ascii")
+        assert b"\\ud83c\\udf5c" in data
+        assert _decode([data]) == [payload]
+
+    def test_event_fields_and_comments(self):
+        decoder = sse.SSEDecoder()
+        events = decoder.feed(b": keep-alive\nevent: done\nid: 7\ndata: {}\n\n")
+        assert len(events) == 1
+        assert (events[0].event, events[0].id, events[0].data) == ("done", "7", "{}")
+
+    def test_iter_text_skips_non_message_events(self):
+        body = io.BytesIO(b'data: "a"\n\nevent: ping\ndata: "x"\n\ndata: "b"\n\n')
+        assert list(sse.iter_text(body, chunk_size=3)) == ["a", "b"]
+
+    def test_invalid_utf8_is_replaced(self):
+        assert _decode([b'data: "a\xff"\n\n']) == ["a\ufffd"]
+
+
+class TestDecodeData:
+    def test_json_string(self):
+        assert sse.decode_data('"a\\nb"') == "a\nb"
+
+    def test_plain_text(self):
+        assert sse.decode_data("not json") == "not json"
+
+    def test_dict_with_text_field(self):
+        assert sse.decode_data('{"response": "ok"}') == "ok"
+        assert sse.decode_data('{"other": 1}') == '{"other": 1}'
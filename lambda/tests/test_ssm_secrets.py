@@ -0,0 +1,136 @@
+"""Parameter Storeからのシークレット取得（一括プリフェッチ・キャッシュ・再取得）のテスト"""
+
+import time
+
+import pytest
+
+import ssm_secrets
+
+PREFIX = "/line-bot/test"
+SECRETS = {
+    "LINE_CHANNEL_ACCESS_TOKEN": "access-token",
+    "LINE_CHANNEL_SECRET": "channel-secret",
+    "GOOGLE_MAPS_API_KEY": "maps-key",
+}
+
+
+class _Clock:
+    """ssm_secrets.time の代わり（monotonic だけ進められる）"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def ssm(aws, monkeypatch):
+    import boto3
+
+    client = boto3.client("ssm")
+    for name, value in SECRETS.items():
+        client.put_parameter(Name=f"{PREFIX}/{name}", Value=value, Type="SecureString")
+    monkeypatch.setenv("SSM_PREFIX", PREFIX)
+    return client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(ssm_secrets, "time", fake)
+    return fake
+
+
+def _wait_for_refresh(timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while ssm_secrets._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not ssm_secrets._refreshing
+
+
+class TestPrefetch:
+    def test_without_prefix_reads_environment(self, monkeypatch):
+        monkeypatch.setenv("LINE_CHANNEL_SECRET", "from-env")
+        assert ssm_secrets.prefetch_secrets() is False
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "from-env"
+        assert ssm_secrets.get_api_call_counts() == {"get_parameters_by_path": 0, "get_parameter": 0}
+
+    def test_prefetch_caches_all_secrets(self, ssm):
+        assert ssm_secrets.prefetch_secrets() is True
+        for name, value in SECRETS.items():
+            assert ssm_secrets.get_secret(name) == value
+        assert ssm_secrets.get_api_call_counts() == {"get_parameters_by_path": 1, "get_parameter": 0}
+
+    def test_pagination(self, ssm):
+        # get_parameters_by_path は1ページ10件まで
+        for i in range(15):
+            ssm.put_parameter(Name=f"{PREFIX}/EXTRA_{i}", Value=str(i), Type="String")
+        assert ssm_secrets.prefetch_secrets() is True
+        assert ssm_secrets.get_secret("EXTRA_14") == "14"
+        assert ssm_secrets.get_api_call_counts()["get_parameters_by_path"] == 2
+        assert ssm_secrets.get_api_call_counts()["get_parameter"] == 0
+
+    def test_prefetch_failure_falls_back_to_get_parameter(self, ssm, monkeypatch):
+        def fail(ssm_prefix):
+            raise RuntimeError("throttled")
+
+        monkeypatch.setattr(ssm_secrets, "_fetch_all", fail)
+        assert ssm_secrets.prefetch_secrets() is False
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "channel-secret"
+        assert ssm_secrets.get_api_call_counts()["get_parameter"] == 1
+
+    def test_missing_secret(self, ssm, monkeypatch):
+        with pytest.raises(RuntimeError):
+            ssm_secrets.get_secret("UNKNOWN_SECRET")
+        monkeypatch.setenv("UNKNOWN_SECRET", "fallback")
+        assert ssm_secrets.get_secret("UNKNOWN_SECRET") == "fallback"
+
+
+class TestApiCallsPerInvocation:
+    def test_thousand_invocations(self, ssm, clock):
+        ssm_secrets.prefetch_secrets()
+        for _ in range(1000):
+            # 1回の呼び出しで使うシークレットを毎回読む
+            for name in SECRETS:
+                ssm_secrets.get_secret(name)
+            clock.now += 0.1
+        # 100秒間・REINIT_EVERY_SEC=900 なので初期化時の1回だけ
+        assert ssm_secrets.get_api_call_counts() == {"get_parameters_by_path": 1, "get_parameter": 0}
+
+    def test_thousand_invocations_across_expiry(self, ssm, clock, monkeypatch):
+        monkeypatch.setenv("REINIT_EVERY_SEC", "60")
+        ssm_secrets.prefetch_secrets()
+        for _ in range(1000):
+            for name in SECRETS:
+                ssm_secrets.get_secret(name)
+            _wait_for_refresh()
+            clock.now += 0.1
+        # 100秒間・60秒ごとの再取得（プリフェッチ＋期限切れ後の1回）
+        assert ssm_secrets.get_api_call_counts() == {"get_parameters_by_path": 2, "get_parameter": 0}
+
+
+class TestStaleWhileRevalidate:
+    def test_expired_value_is_returned_and_refreshed(self, ssm, clock, monkeypatch):
+        monkeypatch.setenv("REINIT_EVERY_SEC", "60")
+        ssm_secrets.prefetch_secrets()
+        ssm.put_parameter(Name=f"{PREFIX}/LINE_CHANNEL_SECRET", Value="rotated", Type="SecureString", Overwrite=True)
+
+        clock.now += 30
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "channel-secret"
+        assert ssm_secrets.get_api_call_counts()["get_parameters_by_path"] == 1
+
+        clock.now += 31
+        # 期限切れでも待たせずに古い値を返し、裏で再取得する
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "channel-secret"
+        _wait_for_refresh()
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "rotated"
+        assert ssm_secrets.get_api_call_counts()["get_parameters_by_path"] == 2
+
+    def test_zero_ttl_never_expires(self, ssm, clock, monkeypatch):
+        monkeypatch.setenv("REINIT_EVERY_SEC", "0")
+        ssm_secrets.prefetch_secrets()
+        clock.now += 10 ** 9
+        assert ssm_secrets.get_secret("LINE_CHANNEL_SECRET") == "channel-secret"
+        assert not ssm_secrets._refreshing
+        assert ssm_secrets.get_api_call_counts()["get_parameters_by_path"] == 1
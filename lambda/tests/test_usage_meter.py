@@ -0,0 +1,211 @@
+"""ユーザー・グループ別の利用量（usage_meter / scripts/usage_report.py）のテスト"""
+
+import importlib.util
+import json
+import sys
+
+import pytest
+
+import app
+import usage_meter
+from tests.conftest import LAMBDA_DIR
+from tests.fakes import text_event
+
+REPORT_SCRIPT = LAMBDA_DIR.parent / "scripts" / "usage_report.py"
+
+GROUP = {"type": "group", "groupId": "G1", "userId": "U1"}
+
+
+def _usage(records: list[dict]) -> dict:
+    """EMFレコードを (種別, ID) -> レコード にする"""
+    return {(r["SubjectType"], r["SubjectId"]): r for r in records if "SubjectId" in r}
+
+
+def _counter(table_name: str, date: str, kind: str, subject_id: str) -> dict:
+    from dynamodb import get_dynamodb_client
+
+    item = get_dynamodb_client().get_item(
+        TableName=table_name, Key={"pk": {"S": f"{date}#{kind}#{subject_id}"}}).get("Item") or {}
+    return {k: int(v["N"]) for k, v in item.items() if k in usage_meter.FIELDS}
+
+
+class TestAggregation:
+    def test_counts_are_added_per_subject(self):
+        with usage_meter.attribute("U1"):
+            usage_meter.add(events=1, agent_calls=1)
+            usage_meter.add(agent_calls=1, agent_ms=120.5)
+        with usage_meter.attribute("U2"):
+            usage_meter.add(events=1)
+
+        assert usage_meter._pending_emf == {
+            (usage_meter.USER, "U1"): {"events": 1, "agent_calls": 2, "agent_ms": 120.5},
+            (usage_meter.USER, "U2"): {"events": 1},
+        }
+
+    def test_group_event_counts_for_user_and_group(self):
+        with usage_meter.attribute("U1", "G1"):
+            usage_meter.add(push_calls=1, push_messages=3)
+        assert usage_meter._pending_emf[(usage_meter.USER, "U1")] == {"push_calls": 1, "push_messages": 3}
+        assert usage_meter._pending_emf[(usage_meter.GROUP, "G1")] == {"push_calls": 1, "push_messages": 3}
+
+    def test_group_without_user_is_counted_once(self):
+        # ユーザーIDが取れない場合は app._get_user_id がグループIDを返す
+        with usage_meter.attribute("G1", "G1"):
+            usage_meter.add(events=1)
+        assert list(usage_meter._pending_emf) == [(usage_meter.GROUP, "G1")]
+
+    def test_outside_attribute_is_ignored(self):
+        usage_meter.add(events=1)
+        assert usage_meter._pending_emf == {}
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setenv("USAGE_METERING_ENABLED", "false")
+        with usage_meter.attribute("U1"):
+            usage_meter.add(events=1)
+        assert usage_meter._pending_emf == {}
+
+    def test_day_uses_utc_offset(self, monkeypatch):
+        # 2026-10-16 20:00 UTC は JST では 10-17
+        timestamp = 1792180800
+        assert usage_meter.day(timestamp) == "2026-10-17"
+        monkeypatch.setenv("USAGE_UTC_OFFSET_HOURS", "0")
+        assert usage_meter.day(timestamp) == "2026-10-16"
+
+
+class TestFlush:
+    def test_one_emf_record_per_subject(self, metrics_records):
+        with usage_meter.attribute("U1", "G1"):
+            usage_meter.add(events=1, agent_calls=1, agent_ms=1234.56, agent_bytes=2048)
+
+        usage_meter.flush()
+
+        usage = _usage(metrics_records)
+        assert set(usage) == {(usage_meter.USER, "U1"), (usage_meter.GROUP, "G1")}
+        record = usage[(usage_meter.USER, "U1")]
+        assert record["UsageEvents"] == 1
+        assert record["UsageAgentCalls"] == 1
+        assert record["UsageAgentMs"] == 1234.6
+        assert record["UsageAgentBytes"] == 2048
+        [directive] = record["_aws"]["CloudWatchMetrics"]
+        assert directive["Dimensions"] == [["SubjectType"]]
+        assert {"Name": "UsageAgentMs", "Unit": "Milliseconds"} in directive["Metrics"]
+
+    def test_flush_empties_the_buffer(self, metrics_records):
+        with usage_meter.attribute("U1"):
+            usage_meter.add(events=1)
+        usage_meter.flush()
+        usage_meter.flush()
+        assert len(_usage(metrics_records)) == 1
+
+
+class TestTable:
+    @pytest.fixture
+    def table(self, create_table):
+        return create_table("USAGE_TABLE")
+
+    def test_counters_are_incremented(self, table):
+        for _ in range(2):
+            with usage_meter.attribute("U1", "G1"):
+                usage_meter.add(events=1, agent_calls=1, agent_ms=100.4)
+            usage_meter.flush(force=True)
+
+        today = usage_meter.day()
+        expected = {"events": 2, "agent_calls": 2, "agent_ms": 200}
+        assert _counter(table, today, usage_meter.USER, "U1") == expected
+        assert _counter(table, today, usage_meter.GROUP, "G1") == expected
+
+    def test_interval_batches_writes(self, table, monkeypatch):
+        monkeypatch.setenv("USAGE_FLUSH_INTERVAL_SEC", "3600")
+        monkeypatch.setattr(usage_meter, "_last_table_flush", usage_meter.time.monotonic())
+        with usage_meter.attribute("U1"):
+            usage_meter.add(events=1)
+
+        usage_meter.flush()
+        assert _counter(table, usage_meter.day(), usage_meter.USER, "U1") == {}
+
+        usage_meter.flush(force=True)
+        assert _counter(table, usage_meter.day(), usage_meter.USER, "U1") == {"events": 1}
+
+    def test_failed_write_is_retried(self, table, monkeypatch):
+        monkeypatch.setenv("USAGE_TABLE", "missing-table")
+        with usage_meter.attribute("U1"):
+            usage_meter.add(events=1)
+        usage_meter.flush(force=True)
+
+        monkeypatch.setenv("USAGE_TABLE", table)
+        usage_meter.flush(force=True)
+        assert _counter(table, usage_meter.day(), usage_meter.USER, "U1") == {"events": 1}
+
+    def test_each_lambda_invocation_writes_counters(self, table, monkeypatch, fake_line, fake_agent):
+        # 間隔が残っていても、Lambdaは呼び出しの最後に書く（凍結・回収で失わない）
+        monkeypatch.setenv("USAGE_FLUSH_INTERVAL_SEC", "3600")
+        monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+        monkeypatch.setattr(usage_meter, "_last_table_flush", usage_meter.time.monotonic())
+        body = json.dumps({"events": [text_event("@お店 渋谷 カフェ", event_id="evt-1", source=GROUP)]},
+                          ensure_ascii=False)
+
+        app.lambda_handler({"body": body}, None)
+
+        today = usage_meter.day()
+        assert _counter(table, today, usage_meter.USER, "U1")["agent_calls"] == 1
+        assert _counter(table, today, usage_meter.GROUP, "G1")["events"] == 1
+
+
+class TestReport:
+    @pytest.fixture
+    def report(self, monkeypatch):
+        spec = importlib.util.spec_from_file_location("usage_report", REPORT_SCRIPT)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        def run(*args) -> int:
+            monkeypatch.setattr(sys, "argv", ["usage_report.py", *map(str, args)])
+            return module.main()
+
+        return run
+
+    @pytest.fixture
+    def logs(self, tmp_path, metrics_records):
+        """利用量を出力し、CloudWatch Logsのエクスポートと同じ「タイムスタンプ JSON」の行で保存する"""
+        for user_id, calls in (("U1", 3), ("U2", 1), ("U3", 2)):
+            with usage_meter.attribute(user_id, "G1" if user_id != "U3" else None):
+                for _ in range(calls):
+                    usage_meter.add(events=1, agent_calls=1, push_messages=2)
+        usage_meter.flush()
+        # 別の日のレコード
+        with usage_meter.attribute("U9"):
+            usage_meter.add(events=1, agent_calls=5)
+        usage_meter.flush()
+        metrics_records[-1]["_aws"]["Timestamp"] -= 86400 * 1000
+
+        path = tmp_path / "logs.txt"
+        lines = ["START RequestId: abc", *(f"2026-10-16T00:00:00Z {json.dumps(r)}" for r in metrics_records)]
+        path.write_text("\n".join(lines) + "\n")
+        return path
+
+    def test_top_n_per_day(self, report, logs, tmp_path):
+        out = tmp_path / "report.json"
+        assert report(logs, "--type", "user", "--top", "2", "--json", out) == 0
+
+        result = json.loads(out.read_text())
+        today, yesterday = usage_meter.day(), usage_meter.day(usage_meter.time.time() - 86400)
+        assert [r["id"] for r in result[today]] == ["U1", "U3"]
+        assert result[today][0]["agent_calls"] == 3
+        assert result[today][0]["share"] == pytest.approx(3 / 6)
+        assert [r["id"] for r in result[yesterday]] == ["U9"]
+
+    def test_groups_and_cost(self, report, logs, tmp_path, capsys):
+        out = tmp_path / "report.json"
+        assert report(logs, "--type", "group", "--date", usage_meter.day(), "--by", "cost",
+                      "--agent-cost", "0.01", "--push-cost", "0.003", "--json", out) == 0
+
+        [row] = json.loads(out.read_text())[usage_meter.day()]
+        assert row["id"] == "G1"
+        assert row["push_messages"] == 8
+        assert row["cost"] == pytest.approx(4 * 0.01 + 8 * 0.003)
+        assert "G1" in capsys.readouterr().out
+
+    def test_no_records(self, report, tmp_path):
+        path = tmp_path / "empty.txt"
+        path.write_text("START RequestId: abc\n")
+        assert report(path) == 1
@@ -0,0 +1,96 @@
+"""lambda_handler（Webhookの受信・syncモードとqueueモードの振り分け）のテスト"""
+
+import json
+
+import pytest
+
+import app
+import event_queue
+import result_pages
+from tests.fakes import location_event, postback_event, text_event
+
+U1 = {"type": "user", "userId": "U1"}
+U2 = {"type": "user", "userId": "U2"}
+U3 = {"type": "user", "userId": "U3"}
+
+
+@pytest.fixture(autouse=True)
+def channel_token(monkeypatch):
+    monkeypatch.setenv("CHANNEL_ACCESS_TOKEN", "token")
+
+
+def _webhook(*events) -> dict:
+    return {"body": json.dumps({"destination": "Ubot", "events": list(events)}, ensure_ascii=False)}
+
+
+def _reply_to(fake_line, reply_token: str) -> list[str]:
+    return ["\n\n".join(m["text"] for m in r["messages"])
+            for _, r in fake_line.sent("reply") if r["replyToken"] == reply_token]
+
+
+def _saved_page(user_id: str, fake_places) -> str:
+    """保存済みの検索結果の「もっと見る」のpostback data"""
+    _, quick_reply = result_pages.first_page(
+        user_id, result_pages.NEARBY, {"origin": "渋谷駅"}, fake_places.results())
+    return quick_reply["items"][0]["action"]["data"]
+
+
+class TestQueueMode:
+    @pytest.fixture(autouse=True)
+    def queue_mode(self, monkeypatch, create_queue):
+        monkeypatch.setenv("WEBHOOK_MODE", "queue")
+        return create_queue
+
+    def test_mixed_events(self, queue_mode, fake_line, fake_agent, fake_places):
+        text = text_event("他には？", event_id="evt-text", source=U1)
+        location = location_event("evt-location", source=U2)
+        more = postback_event(_saved_page("U3", fake_places), "evt-postback", source=U3)
+
+        res = app.lambda_handler(_webhook(text, location, more), None)
+
+        assert res["statusCode"] == 200
+        # テキストだけをworkerに回し、位置情報とpostbackはここで答える
+        assert [ev["webhookEventId"] for ev in queue_mode()] == ["evt-text"]
+        assert fake_agent.calls == []
+        assert _reply_to(fake_line, "reply-evt-location")[0].count("スタブ食堂") == result_pages.page_size()
+        assert "スタブ食堂6" in _reply_to(fake_line, "reply-evt-postback")[0]
+        assert _reply_to(fake_line, "reply-evt-text") == []
+
+    def test_events_that_failed_to_enqueue_are_processed_in_order(self, monkeypatch, fake_line, fake_agent,
+                                                                   fake_places):
+        monkeypatch.setattr(event_queue, "enqueue_events", lambda events: list(events))
+        handled = []
+        monkeypatch.setattr(app, "handle_event", lambda ev, token, deadline=None: handled.append(ev["webhookEventId"]))
+        events = [
+            location_event("evt-1", source=U1),
+            text_event("渋谷 カフェ", event_id="evt-2", source=U1),
+            location_event("evt-3", source=U1),
+        ]
+        app.lambda_handler(_webhook(*events), None)
+        assert handled == ["evt-1", "evt-2", "evt-3"]
+
+    def test_enqueue_errors_fall_back_to_sync(self, monkeypatch, fake_line, fake_agent, fake_places):
+        monkeypatch.setenv("EVENT_QUEUE_URL", "")
+        app.lambda_handler(_webhook(text_event("他には？", event_id="evt-1", source=U1),
+                                    location_event("evt-2", source=U2)), None)
+        assert fake_agent.prompts() == ["他には？"]
+        assert len(_reply_to(fake_line, "reply-evt-2")) == 1
+
+
+class TestSyncMode:
+    def test_mixed_events(self, fake_line, fake_agent, fake_places):
+        text = text_event("他には？", event_id="evt-text", source=U1)
+        location = location_event("evt-location", source=U2)
+        more = postback_event(_saved_page("U3", fake_places), "evt-postback", source=U3)
+
+        assert app.lambda_handler(_webhook(text, location, more), None)["statusCode"] == 200
+
+        assert fake_agent.prompts() == ["他には？"]
+        assert len(_reply_to(fake_line, "reply-evt-text")) == 1
+        assert len(_reply_to(fake_line, "reply-evt-location")) == 1
+        assert len(_reply_to(fake_line, "reply-evt-postback")) == 1
+
+    def test_empty_and_invalid_bodies(self, fake_line):
+        assert app.lambda_handler({"body": json.dumps({"events": []})}, None)["statusCode"] == 200
+        assert app.lambda_handler({"body": "{"}, None)["statusCode"] == 400
+        assert fake_line.calls == []
@@ -0,0 +1,66 @@
+"""
+TTL付きのLRUキャッシュ（プロセス内・スレッドセーフ）。
+
+ウォーム起動中のコンテナで使い回す各種キャッシュの共通実装。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 256, ttl_sec: float = 600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= self._clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_sec: float | None = None):
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl_sec: float | None = None) -> bool:
+        """キーが存在しない（または期限切れの）場合のみ追加する。追加できたらTrue"""
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        with self._lock:
+            now = self._clock()
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                return False
+            self._data[key] = (now + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None or item[0] <= self._clock():
+            return default
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,164 @@
+"""
+ユーザー・グループ単位の利用量（AgentCore / Places API / push）を集計するモジュール。
+
+どのユーザー・グループがBedrock・Places API・pushのコストを使っているかを把握するため、
+イベントごとの呼び出し回数・応答サイズ・応答時間・pushの送信数をプロセス内で集計し、まとめて出力する。
+- attribute(user_id, group_id) の中で add() した値を、そのユーザーとグループの両方に加算する
+- flush() でEMF（1ユーザー・グループにつき1レコード）を出力する。Lambdaでは呼び出しの最後に呼ぶ
+- USAGE_TABLE を設定すると、DynamoDBの日別カウンタにまとめて加算する（イベントごとのネットワーク呼び出しは増やさない）。
+  Lambdaは呼び出しの後に凍結・回収されるため呼び出しごとに force=True で書き、
+  常駐サーバーは USAGE_FLUSH_INTERVAL_SEC ごとと停止時に書く
+- 日付は USAGE_UTC_OFFSET_HOURS（デフォルト9 = JST）の日付で区切る
+- 集計は scripts/usage_report.py でエクスポートしたログから日別の上位Nを出す
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from dynamodb import get_dynamodb_client
+from env import get_bool, get_int
+
+USER = "user"
+GROUP = "group"
+
+# カウンター名 -> (EMFのメトリクス名, 単位)
+FIELDS = {
+    "events": ("UsageEvents", "Count"),
+    "agent_calls": ("UsageAgentCalls", "Count"),
+    "agent_errors": ("UsageAgentErrors", "Count"),
+    "agent_ms": ("UsageAgentMs", "Milliseconds"),
+    "agent_bytes": ("UsageAgentBytes", "Bytes"),
+    "places_calls": ("UsagePlacesCalls", "Count"),
+    "push_calls": ("UsagePushCalls", "Count"),
+    "push_messages": ("UsagePushMessages", "Count"),
+}
+
+# 実行中のイベントの (種別, ID) のタプル
+_current = contextvars.ContextVar("usage_subjects", default=())
+
+_lock = threading.Lock()
+# (種別, ID) -> {カウンター名: 値}
+_pending_emf = {}
+# (日付, 種別, ID) -> {カウンター名: 値}
+_pending_table = {}
+_last_table_flush = time.monotonic()
+
+
+def _enabled() -> bool:
+    return get_bool("USAGE_METERING_ENABLED", True)
+
+
+def _table_name() -> str | None:
+    return os.environ.get("USAGE_TABLE") or None
+
+
+def _flush_interval_sec() -> int:
+    return get_int("USAGE_FLUSH_INTERVAL_SEC", 60)
+
+
+def day(timestamp: float | None = None) -> str:
+    """集計する日付（USAGE_UTC_OFFSET_HOURS の時差で区切る）"""
+    offset = get_int("USAGE_UTC_OFFSET_HOURS", 9) * 3600
+    return time.strftime("%Y-%m-%d", time.gmtime((time.time() if timestamp is None else timestamp) + offset))
+
+
+@contextmanager
+def attribute(user_id: str | None, group_id: str | None = None):
+    """この中で add() した値をユーザー（とグループ・ルーム）に加算する"""
+    subjects = []
+    # ユーザーIDが取れないグループではグループIDが入るので、二重に数えない
+    if user_id and user_id != group_id:
+        subjects.append((USER, user_id))
+    if group_id:
+        subjects.append((GROUP, group_id))
+    token = _current.set(tuple(subjects))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def add(**counts):
+    """実行中のイベントの利用量を加算する（attribute の外・無効時は何もしない）"""
+    subjects = _current.get()
+    if not subjects or not _enabled():
+        return
+    today = day()
+    with _lock:
+        for subject in subjects:
+            for target in (_pending_emf.setdefault(subject, {}),
+                           _pending_table.setdefault((today, *subject), {})):
+                for name, value in counts.items():
+                    target[name] = target.get(name, 0) + value
+
+
+def flush(force: bool = False):
+    """
+    集計した利用量をEMFで出力する。
+    DynamoDBへは前回から USAGE_FLUSH_INTERVAL_SEC 経過した場合（force=True なら常に）まとめて加算する
+    """
+    global _pending_emf, _pending_table, _last_table_flush
+    with _lock:
+        emf, _pending_emf = _pending_emf, {}
+        table = None
+        if _table_name() and _pending_table and (force or time.monotonic() - _last_table_flush >= _flush_interval_sec()):
+            table, _pending_table = _pending_table, {}
+            _last_table_flush = time.monotonic()
+        elif not _table_name():
+            _pending_table.clear()
+
+    for (kind, subject_id), counts in emf.items():
+        metrics.put_metrics(
+            {FIELDS[name][0]: (round(value, 1), FIELDS[name][1]) for name, value in counts.items()},
+            dimensions={"SubjectType": kind},
+            properties={"SubjectId": subject_id},
+        )
+    if table:
+        _write_table(table)
+
+
+def _write_table(table: dict):
+    client = get_dynamodb_client()
+    expires_at = int(time.time()) + get_int("USAGE_TTL_DAYS", 90) * 86400
+    failed = {}
+    for key, counts in table.items():
+        date, kind, subject_id = key
+        names = sorted(counts)
+        try:
+            client.update_item(
+                TableName=_table_name(),
+                Key={"pk": {"S": f"{date}#{kind}#{subject_id}"}},
+                UpdateExpression=(
+                    "SET #date = :date, subject_type = :kind, subject_id = :id, expires_at = :exp ADD "
+                    + ", ".join(f"{name} :{name}" for name in names)
+                ),
+                ExpressionAttributeNames={"#date": "date"},
+                ExpressionAttributeValues={
+                    ":date": {"S": date},
+                    ":kind": {"S": kind},
+                    ":id": {"S": subject_id},
+                    ":exp": {"N": str(expires_at)},
+                    **{f":{name}": {"N": str(round(counts[name]))} for name in names},
+                },
+            )
+        except Exception as e:
+            print(f"[WARN] Usage counter update failed: {e}")
+            failed[key] = counts
+    if failed:
+        # 次回のflushで加算し直す
+        with _lock:
+            for key, counts in failed.items():
+                target = _pending_table.setdefault(key, {})
+                for name, value in counts.items():
+                    target[name] = target.get(name, 0) + value
+
+
+def clear():
+    """集計中の値を捨てる（テスト用）"""
+    with _lock:
+        _pending_emf.clear()
+        _pending_table.clear()
@@ -0,0 +1,93 @@
+"""
+SQSキューからLINEイベントを取り出して処理するworker（WEBHOOK_MODE=queue 用）。
+
+SQSイベントソースマッピングから呼ばれ、AgentCore呼び出しとreply/pushを行う。
+失敗したメッセージはReportBatchItemFailuresで返し、同じMessageGroupIdの
+後続メッセージも失敗扱いにして会話内の順序を保つ。
+
+delivery_handler はアウトボックス（DELIVERY_QUEUE_URL）から呼ばれ、
+LINEに届かなかった応答をAgentCoreを呼ばずにpushで再送する。
+"""
+
+import traceback
+
+import delivery_outbox
+import event_dispatch
+import event_queue
+import idempotency
+import metrics
+import usage_meter
+from app import handle_event, send_line_push, usage_subject
+from deadline import Deadline
+from ssm_secrets import get_secret
+
+
+def worker_handler(event, context):
+    print("=== Worker handler started ===")
+    try:
+        with metrics.trace("Worker", getattr(context, "aws_request_id", None)):
+            result = _handle_records(event, context)
+            metrics.record("WorkerRecords", len(event.get("Records") or []))
+            metrics.record("WorkerFailures", len(result["batchItemFailures"]))
+            return result
+    finally:
+        usage_meter.flush(force=True)
+
+
+def _handle_records(event, context):
+    records = event.get("Records") or []
+    CHANNEL_ACCESS_TOKEN = get_secret("CHANNEL_ACCESS_TOKEN")
+    if not CHANNEL_ACCESS_TOKEN:
+        print("[ERROR] CHANNEL_ACCESS_TOKEN is missing")
+        return {"batchItemFailures": [{"itemIdentifier": r["messageId"]} for r in records]}
+
+    deadline = Deadline.from_context(context)
+    decoded = event_queue.decode_records(records)
+
+    def process_group(group_records):
+        # 失敗したら同じグループの後続メッセージも失敗扱いにして順序を保つ
+        failures = []
+        for message_id, ev in group_records:
+            if failures:
+                failures.append({"itemIdentifier": message_id})
+                continue
+            try:
+                handle_event(ev, CHANNEL_ACCESS_TOKEN, deadline)
+            except Exception as e:
+                print(f"[ERROR] Worker event handling error: {e}")
+                traceback.print_exc()
+                failures.append({"itemIdentifier": message_id})
+        return failures
+
+    results = event_dispatch.run_by_group(
+        decoded,
+        lambda item: event_queue.message_group_id(item[1]),
+        process_group,
+    )
+    return {"batchItemFailures": [f for group_failures in results for f in group_failures]}
+
+
+def delivery_handler(event, context):
+    print("=== Delivery handler started ===")
+    with metrics.trace("Delivery", getattr(context, "aws_request_id", None)):
+        records = event.get("Records") or []
+        CHANNEL_ACCESS_TOKEN = get_secret("CHANNEL_ACCESS_TOKEN")
+        if not CHANNEL_ACCESS_TOKEN:
+            print("[ERROR] CHANNEL_ACCESS_TOKEN is missing")
+            return {"batchItemFailures": [{"itemIdentifier": r["messageId"]} for r in records]}
+
+        def push(entry) -> int:
+            with usage_subject(entry["event"]):
+                res = send_line_push(entry["destination"], entry["answer"], CHANNEL_ACCESS_TOKEN,
+                                     retry_key=entry["id"])
+            event_id = entry["event"].get("webhookEventId")
+            if event_id and (res.status_code < 400 or res.status_code == delivery_outbox.ALREADY_ACCEPTED):
+                idempotency.complete(event_id, entry["answer"], True)
+            return res.status_code
+
+        try:
+            failures = delivery_outbox.process_records(records, push)
+        finally:
+            usage_meter.flush(force=True)
+        metrics.record("DeliveryRecords", len(records))
+        return {"batchItemFailures": failures}
@@ -0,0 +1,125 @@
+"""
+Webhook Lambdaのコールドスタート（モジュール初期化）時間を計測するスクリプト。
+
+`python -X importtime -c "import app"` を新しいプロセスで複数回実行し、
+app モジュールの累積import時間の中央値が予算を超えたら終了コード1を返す。
+
+本番と同じく SSM_PREFIX を設定し、初期化時のシークレット一括取得（prefetch_secrets）も
+計測に含める。SSMはスタブ（scripts/loadtest/stub_servers.py の StubSsm）に向け、
+応答時間は --ssm-latency で指定する（デフォルトは同一リージョンのSSMの往復を想定した20ms）。
+
+使い方:
+    python scripts/check_cold_start.py                       # ローカルのPythonで計測
+    python scripts/check_cold_start.py --budget-ms 400
+    python scripts/check_cold_start.py --docker-image line-shop-bot:latest
+    python scripts/check_cold_start.py --ssm-latency fixed:0.05
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "loadtest"))
+
+from stub_servers import LatencyDist, StubSsm  # noqa: E402
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent / "lambda"
+SSM_PREFIX = "/line-shop-bot/cold-start"
+
+# import time: self [us] | cumulative | imported package
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _ssm_env(ssm_url: str) -> dict:
+    """スタブのSSMに向ける環境変数（認証情報はダミー）"""
+    return {
+        "SSM_PREFIX": SSM_PREFIX,
+        "SSM_ENDPOINT_URL": ssm_url,
+        "AWS_ACCESS_KEY_ID": "cold-start",
+        "AWS_SECRET_ACCESS_KEY": "cold-start",
+        "AWS_DEFAULT_REGION": "ap-northeast-1",
+    }
+
+
+def _command(args, ssm_env: dict) -> list[str]:
+    code = f"import {args.module}"
+    if args.docker_image:
+        # スタブのSSMはホストの127.0.0.1で待ち受けるので、ホストのネットワークを使う
+        env_args = [arg for key, value in ssm_env.items() for arg in ("-e", f"{key}={value}")]
+        return [
+            "docker", "run", "--rm", "--network", "host", "--entrypoint", "python",
+            *env_args,
+            args.docker_image, "-X", "importtime", "-c", code,
+        ]
+    return [sys.executable, "-X", "importtime", "-c", code]
+
+
+def _run_once(args, ssm_env: dict) -> list[tuple[int, int, int, str]]:
+    env = {**os.environ, **ssm_env}
+    proc = subprocess.run(
+        _command(args, ssm_env),
+        cwd=LAMBDA_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr, file=sys.stderr)
+        raise SystemExit(f"import {args.module} failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m:
+            depth = len(m.group(3)) // 2
+            rows.append((int(m.group(1)), int(m.group(2)), depth, m.group(4)))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app", help="計測するモジュール（worker等）")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("COLD_START_BUDGET_MS", "600")))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="表示する遅いimportの件数")
+    parser.add_argument("--docker-image", help="指定したイメージ内で計測する")
+    parser.add_argument("--ssm-latency", default="fixed:0.02", help="スタブのSSMの応答時間の分布")
+    args = parser.parse_args()
+
+    totals = []
+    last_rows = []
+    with StubSsm(LatencyDist(args.ssm_latency)) as ssm:
+        for _ in range(args.runs):
+            rows = _run_once(args, _ssm_env(ssm.url))
+            total = next((cum for _, cum, depth, name in rows if name == args.module and depth == 0), None)
+            if total is None:
+                raise SystemExit(f"importtime output for {args.module} not found")
+            totals.append(total / 1000)
+            last_rows = rows
+    if ssm.stats.counts.get("GetParametersByPath", 0) < args.runs:
+        raise SystemExit(f"{args.module} did not prefetch secrets from SSM "
+                         f"(GetParametersByPath calls: {ssm.stats.counts.get('GetParametersByPath', 0)})")
+
+    median_ms = statistics.median(totals)
+    print(f"import {args.module}: median {median_ms:.1f} ms "
+          f"(min {min(totals):.1f} / max {max(totals):.1f}, runs={args.runs}, budget={args.budget_ms:.0f} ms, "
+          f"ssm={args.ssm_latency})")
+
+    print("\nslowest top-level imports (cumulative):")
+    top_level = sorted((r for r in last_rows if r[2] <= 1), key=lambda r: r[1], reverse=True)
+    for self_us, cum_us, depth, name in top_level[:args.top]:
+        print(f"  {cum_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    if median_ms > args.budget_ms:
+        print(f"\n[FAIL] cold init {median_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+        return 1
+    print("\n[OK] within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
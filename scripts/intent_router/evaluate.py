@@ -0,0 +1,125 @@
+"""
+intent_router の判定精度と判定時間を評価するスクリプト。
+
+eval_set.jsonl の各行（query / 正解のroute / 直接検索の場合は正解のarea・genre）に対して
+classify を実行し、直接検索（places）と判定したものの適合率・再現率を出す。
+エリア・ジャンルまで正解と一致した場合のみ正解として数える。
+あわせて classify 1回あたりの時間（p50 / p99 / 最大）を計測し、基準を満たさなければ終了コード1を返す。
+
+使い方:
+    python scripts/intent_router/evaluate.py
+    python scripts/intent_router/evaluate.py --min-precision 0.98 --max-p99-us 1000 --verbose
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent.parent / "lambda"
+EVAL_SET = Path(__file__).resolve().parent / "eval_set.jsonl"
+
+sys.path.insert(0, str(LAMBDA_DIR))
+os.environ.setdefault("INTENT_ROUTER_ENABLED", "true")
+
+import intent_router  # noqa: E402
+
+
+def _load(path: Path) -> list[dict]:
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _is_correct(route, case: dict) -> bool:
+    return (
+        route.direct
+        and case["route"] == intent_router.PLACES
+        and route.area == case.get("area")
+        and route.genre == case.get("genre")
+    )
+
+
+def evaluate(cases: list[dict], verbose: bool = False) -> dict:
+    tp = fp = fn = 0
+    for case in cases:
+        route = intent_router.classify(case["query"])
+        expected = case["route"] == intent_router.PLACES
+        if route.direct and _is_correct(route, case):
+            tp += 1
+            continue
+        if route.direct:
+            fp += 1
+            label = "FP"
+        elif expected:
+            fn += 1
+            label = "FN"
+        else:
+            continue
+        if verbose:
+            print(f"  {label} {case['query']!r} -> {route!r} (expected {case['route']} "
+                  f"{case.get('area')}/{case.get('genre')})")
+    return {
+        "cases": len(cases),
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+    }
+
+
+def benchmark(queries: list[str], rounds: int) -> dict:
+    """classify 1回ごとの所要時間（マイクロ秒）"""
+    for q in queries:
+        intent_router.classify(q)
+    samples = []
+    for _ in range(rounds):
+        for q in queries:
+            started = time.perf_counter_ns()
+            intent_router.classify(q)
+            samples.append((time.perf_counter_ns() - started) / 1000)
+    samples.sort()
+    return {
+        "calls": len(samples),
+        "p50_us": statistics.median(samples),
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "max_us": samples[-1],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval-set", type=Path, default=EVAL_SET)
+    parser.add_argument("--min-precision", type=float, default=0.98)
+    parser.add_argument("--max-p99-us", type=float, default=1000, help="classify 1回あたりのp99の上限（マイクロ秒）")
+    parser.add_argument("--rounds", type=int, default=200, help="ベンチマークで評価セットを繰り返す回数")
+    parser.add_argument("--verbose", action="store_true", help="誤判定・取りこぼしを表示する")
+    args = parser.parse_args()
+
+    cases = _load(args.eval_set)
+    result = evaluate(cases, args.verbose)
+    print(f"routing: precision {result['precision']:.3f} / recall {result['recall']:.3f} "
+          f"(cases={result['cases']}, tp={result['tp']}, fp={result['fp']}, fn={result['fn']})")
+
+    bench = benchmark([c["query"] for c in cases], args.rounds)
+    print(f"classify: p50 {bench['p50_us']:.1f} us / p99 {bench['p99_us']:.1f} us / "
+          f"max {bench['max_us']:.1f} us (calls={bench['calls']})")
+
+    failed = False
+    if result["precision"] < args.min_precision:
+        print(f"\n[FAIL] precision {result['precision']:.3f} is below {args.min_precision:.3f}")
+        failed = True
+    if bench["p99_us"] > args.max_p99_us:
+        print(f"\n[FAIL] classify p99 {bench['p99_us']:.1f} us exceeds {args.max_p99_us:.0f} us")
+        failed = True
+    if failed:
+        return 1
+    print("\n[OK] within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+AgentCoreクライアントの呼び出しごとのオーバーヘッドを比較するベンチマーク。
+
+スタブのAgentCore（応答時間0）に対して invoke_agent_runtime を繰り返し呼び、
+- per-call : 呼び出しのたびに boto3.client("bedrock-agentcore") を作る（以前の実装）
+- pooled   : agentcore_client.get_agentcore_client() でコンテナ内のクライアントを使い回す
+の1回あたりの時間（p50/p99/平均）とスタブが受け付けたTCP接続数を出す。
+スタブはHTTPなのでTLSハンドシェイクの分は含まない（実環境では per-call の差がさらに大きくなる）。
+
+使い方:
+    python scripts/loadtest/agentcore_client_bench.py
+    python scripts/loadtest/agentcore_client_bench.py --calls 500 --json agentcore-client.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run import LAMBDA_DIR, percentile  # noqa: E402
+from stub_servers import LatencyDist, StubAgentCore  # noqa: E402
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+RUNTIME_ARN = "arn:aws:bedrock-agentcore:ap-northeast-1:000000000000:runtime/bench"
+
+
+def _invoke(client):
+    response = client.invoke_agent_runtime(
+        agentRuntimeArn=RUNTIME_ARN,
+        payload=json.dumps({"prompt": "渋谷 カフェ", "user_id": "bench"}),
+        contentType="application/json",
+    )
+    response["response"].read()
+
+
+def _per_call_client():
+    import boto3
+    from agentcore_client import _build_config
+    return boto3.client(
+        "bedrock-agentcore",
+        config=_build_config(),
+        endpoint_url=os.environ["AGENTCORE_ENDPOINT_URL"],
+    )
+
+
+def _pooled_client():
+    from agentcore_client import get_agentcore_client
+    return get_agentcore_client()
+
+
+def run(name: str, get_client, stub: StubAgentCore, calls: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        _invoke(get_client())
+    connections_before = stub.stats.counts.get("connections", 0)
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        _invoke(get_client())
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "name": name,
+        "calls": calls,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": statistics.fmean(latencies),
+        "connections": stub.stats.counts.get("connections", 0) - connections_before,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    os.environ.pop("SSM_PREFIX", None)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+
+    with StubAgentCore(LatencyDist("fixed:0")) as stub:
+        os.environ["AGENTCORE_ENDPOINT_URL"] = stub.url
+        results = [
+            run("per-call", _per_call_client, stub, args.calls, args.warmup),
+            run("pooled", _pooled_client, stub, args.calls, args.warmup),
+        ]
+
+    print(f"{'client':<10}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'conns':>8}")
+    for r in results:
+        print(f"{r['name']:<10}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['mean_ms']:>10.2f}{r['connections']:>8}")
+    saved = results[0]["mean_ms"] - results[1]["mean_ms"]
+    print(f"\noverhead saved per call: {saved:.2f} ms (mean)")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
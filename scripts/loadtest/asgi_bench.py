@@ -0,0 +1,286 @@
+"""
+ASGIサーバー（lambda/asgi_app.py）のローカル負荷試験。
+
+run.py と同じスタブのAgentCore / LINE / Places APIを起動し、uvicornで起動したサーバーの
+/callback に目標RPSでwebhookを送る。サーバーの出力するEMFトレースと /metrics から
+- 処理を完了したイベント数/秒
+- イベントの処理時間（EventTotalMs）と webhookの応答時間
+- 同時に処理中だったイベント数の最大値と、そのときのRSS（処理中のイベント1件あたりのメモリ）
+を集計する。--compare-lambda を付けると同じ条件で run.py（Lambdaハンドラー）も実行し、並べて表示する。
+
+使い方:
+    python scripts/loadtest/asgi_bench.py --rps 50 --duration 20
+    python scripts/loadtest/asgi_bench.py --rps 20 --duration 20 --compare-lambda --containers 8
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run import LAMBDA_DIR, percentile  # noqa: E402
+from stub_servers import LatencyDist, StubAgentCore, StubLineApi, StubPlacesApi  # noqa: E402
+from webhook_events import WebhookGenerator  # noqa: E402
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+import metrics  # noqa: E402
+
+
+# サーバーがX-Line-Signatureの検証に使うチャネルシークレット
+CHANNEL_SECRET = "loadtest"
+
+
+def _signature(body: bytes) -> str:
+    return base64.b64encode(hmac.new(CHANNEL_SECRET.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+def _server_env(args, agent_url: str, line_url: str, places_url: str) -> dict:
+    env = {
+        **os.environ,
+        "AGENTCORE_ENDPOINT_URL": agent_url,
+        "LINE_API_BASE_URL": line_url,
+        "PLACES_API_BASE_URL": places_url,
+        "CHANNEL_ACCESS_TOKEN": "loadtest",
+        "CHANNEL_SECRET": CHANNEL_SECRET,
+        "GOOGLE_MAPS_API_KEY": "loadtest",
+        "AWS_ACCESS_KEY_ID": "loadtest",
+        "AWS_SECRET_ACCESS_KEY": "loadtest",
+        "AWS_DEFAULT_REGION": "ap-northeast-1",
+        "QUERY_CACHE_ENABLED": "true" if args.cache else "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.pop("SSM_PREFIX", None)
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def _scrape(text: str) -> dict:
+    """/metrics のテキストからラベルなしの値を取り出す"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+async def _wait_ready(client, base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/healthz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("ASGI server did not become ready")
+
+
+async def _drive(args, base_url: str) -> dict:
+    import httpx
+
+    gen = WebhookGenerator(seed=args.seed, users=args.users, location_rate=args.location_rate,
+                           more_rate=args.more_rate)
+    samples = []
+    webhook_ms = []
+    statuses = {}
+    async with httpx.AsyncClient(timeout=30) as client:
+        await _wait_ready(client, base_url)
+        idle = _scrape((await client.get(f"{base_url}/metrics")).text)
+
+        stop = asyncio.Event()
+
+        async def sample():
+            while not stop.is_set():
+                samples.append(_scrape((await client.get(f"{base_url}/metrics")).text))
+                await asyncio.sleep(args.sample_interval)
+
+        async def post(body: bytes):
+            started = time.perf_counter()
+            try:
+                res = await client.post(f"{base_url}/callback", content=body,
+                                        headers={"Content-Type": "application/json",
+                                                 "X-Line-Signature": _signature(body)})
+                status = res.status_code
+            except Exception as e:
+                status = type(e).__name__
+            webhook_ms.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        sampler = asyncio.create_task(sample())
+        posts = []
+        started = time.monotonic()
+        interval = 1 / args.rps
+        next_at = started
+        while next_at < started + args.duration:
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            body = json.dumps(gen.body(int(time.time() * 1000)), ensure_ascii=False).encode("utf-8")
+            posts.append(asyncio.create_task(post(body)))
+            next_at += interval
+        await asyncio.gather(*posts)
+
+        # 受け付けたイベントを処理し終えるまで待つ
+        drain_deadline = time.monotonic() + args.drain_timeout
+        while time.monotonic() < drain_deadline:
+            if samples and samples[-1].get("linebot_events_pending", 0) == 0:
+                break
+            await asyncio.sleep(args.sample_interval)
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampler
+        final = _scrape((await client.get(f"{base_url}/metrics")).text)
+
+    return {"idle": idle, "final": final, "samples": samples, "elapsed": elapsed,
+            "webhook_ms": webhook_ms, "statuses": statuses}
+
+
+def _event_latencies(log_path: Path) -> list[float]:
+    with log_path.open(encoding="utf-8", errors="replace") as f:
+        return [r["EventTotalMs"] for r in metrics.parse_records(f)
+                if r.get("trace") == "Event" and "EventTotalMs" in r]
+
+
+def run_asgi(args) -> dict:
+    with StubAgentCore(LatencyDist(args.agent_latency), args.agent_error_rate, seed=args.seed) as agent, \
+            StubLineApi(LatencyDist(args.line_latency), args.line_error_rate, seed=args.seed + 1) as line, \
+            StubPlacesApi(LatencyDist(args.places_latency), seed=args.seed + 2) as places, \
+            tempfile.NamedTemporaryFile("w+", suffix=".log") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(args.port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=LAMBDA_DIR, env=_server_env(args, agent.url, line.url, places.url),
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            result = asyncio.run(_drive(args, f"http://127.0.0.1:{args.port}"))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        event_ms = _event_latencies(Path(log.name))
+        stubs = {"agentcore": agent.stats.counts, "line": line.stats.counts, "places": places.stats.counts}
+
+    samples = result["samples"]
+    idle_rss = result["idle"].get("linebot_process_resident_memory_bytes", 0)
+    peak = max(samples, key=lambda s: s.get("linebot_events_in_flight", 0), default={})
+    peak_in_flight = peak.get("linebot_events_in_flight", 0)
+    peak_rss = max((s.get("linebot_process_resident_memory_bytes", 0) for s in samples), default=idle_rss)
+    final = result["final"]
+    completed = final.get("linebot_events_completed_total", 0) + final.get("linebot_events_failed_total", 0)
+    return {
+        "events": int(completed),
+        "events_failed": int(final.get("linebot_events_failed_total", 0)),
+        "webhook_rejected": int(final.get("linebot_webhook_rejected_total", 0)),
+        "events_per_sec": completed / result["elapsed"] if result["elapsed"] else 0.0,
+        "webhook_statuses": {str(k): v for k, v in result["statuses"].items()},
+        "webhook_ms": {p: percentile(result["webhook_ms"], p) for p in (50, 95, 99)},
+        "event_ms": {p: percentile(event_ms, p) for p in (50, 95, 99)},
+        "peak_in_flight": int(peak_in_flight),
+        "idle_rss_mb": idle_rss / 2**20,
+        "peak_rss_mb": peak_rss / 2**20,
+        "rss_per_in_flight_kb": (peak.get("linebot_process_resident_memory_bytes", idle_rss) - idle_rss)
+                                / peak_in_flight / 1024 if peak_in_flight else 0.0,
+        "stubs": stubs,
+    }
+
+
+def run_lambda(args) -> dict:
+    """同じ条件で run.py（lambda_handler）を実行する"""
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        cmd = [sys.executable, str(Path(__file__).resolve().parent / "run.py"),
+               "--rps", str(args.rps), "--duration", str(args.duration), "--containers", str(args.containers),
+               "--users", str(args.users), "--seed", str(args.seed),
+               "--agent-latency", args.agent_latency, "--agent-error-rate", str(args.agent_error_rate),
+               "--line-latency", args.line_latency, "--line-error-rate", str(args.line_error_rate),
+               "--places-latency", args.places_latency, "--location-rate", str(args.location_rate),
+               "--more-rate", str(args.more_rate), "--json", out.name]
+        if args.cache:
+            cmd.append("--cache")
+        for item in args.env:
+            cmd += ["--env", item]
+        subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL)
+        report = json.loads(Path(out.name).read_text() or "{}")
+    events = report.get("events", {}).get("events", 0)
+    event_stages = report.get("stages", {}).get("Event", {}).get("EventTotalMs", {})
+    return {
+        "events": events,
+        "events_per_sec": events / args.duration if args.duration else 0.0,
+        "webhook_ms": {p: report.get("latency_ms", {}).get(f"p{p}", 0.0) for p in (50, 95, 99)},
+        "event_ms": {p: event_stages.get(f"p{p}", 0.0) for p in (50, 95, 99)},
+        "peak_in_flight": args.containers,
+        # Lambdaは1コンテナで1件ずつ処理するので、処理中のイベント1件あたり1コンテナ分のメモリを使う
+        "rss_per_in_flight_kb": report.get("max_rss_mb_median", 0.0) * 1024,
+        "peak_rss_mb": report.get("max_rss_mb_median", 0.0) * args.containers,
+    }
+
+
+def print_report(name: str, r: dict):
+    print(f"\n[{name}]")
+    print(f"  events:      {r['events']} ({r['events_per_sec']:.1f} events/s)")
+    print(f"  webhook:     p50 {r['webhook_ms'][50]:.0f} ms / p95 {r['webhook_ms'][95]:.0f} ms / "
+          f"p99 {r['webhook_ms'][99]:.0f} ms")
+    print(f"  event total: p50 {r['event_ms'][50]:.0f} ms / p95 {r['event_ms'][95]:.0f} ms / "
+          f"p99 {r['event_ms'][99]:.0f} ms")
+    print(f"  in flight:   peak {r['peak_in_flight']} / RSS {r['peak_rss_mb']:.1f} MB "
+          f"({r['rss_per_in_flight_kb']:.0f} KB per in-flight event)")
+    if "webhook_statuses" in r:
+        print(f"  statuses:    {r['webhook_statuses']} (rejected {r['webhook_rejected']}, failed {r['events_failed']})")
+        print(f"  stubs:       {json.dumps(r['stubs'], ensure_ascii=False)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20, help="目標webhook数/秒")
+    parser.add_argument("--duration", type=float, default=20, help="試験時間（秒）")
+    parser.add_argument("--users", type=int, default=200, help="送信元ユーザー数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--agent-latency", default="lognormal:2.0:0.5", help="AgentCoreの応答時間分布")
+    parser.add_argument("--agent-error-rate", type=float, default=0.0)
+    parser.add_argument("--line-latency", default="uniform:0.02:0.08", help="LINE APIの応答時間分布")
+    parser.add_argument("--line-error-rate", type=float, default=0.0)
+    parser.add_argument("--places-latency", default="uniform:0.05:0.2", help="Places APIの応答時間分布")
+    parser.add_argument("--location-rate", type=float, default=0.1, help="1対1チャットで位置情報を送る割合")
+    parser.add_argument("--more-rate", type=float, default=0.0, help="1対1チャットで「もっと見る」を送る割合")
+    parser.add_argument("--cache", action="store_true", help="応答キャッシュを有効にする")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="サーバーの環境変数を追加で設定する（複数指定可）")
+    parser.add_argument("--sample-interval", type=float, default=0.2, help="/metrics を取得する間隔（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="送信後に処理の完了を待つ最大秒数")
+    parser.add_argument("--compare-lambda", action="store_true", help="同じ条件でrun.pyも実行して比較する")
+    parser.add_argument("--containers", type=int, default=4, help="--compare-lambda で使うコンテナ数")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    if args.rps <= 0:
+        parser.error("--rps must be > 0")
+
+    report = {"asgi": run_asgi(args)}
+    print_report("asgi", report["asgi"])
+    if args.compare_lambda:
+        report["lambda"] = run_lambda(args)
+        print_report(f"lambda x{args.containers}", report["lambda"])
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
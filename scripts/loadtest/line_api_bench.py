@@ -0,0 +1,101 @@
+"""
+LINE API呼び出しの接続の使い回しとレイテンシを比較する負荷試験。
+
+スタブのLINE APIに対して reply を --concurrency 並列で --requests 回送り、
+- no-session : 呼び出しのたびに requests.post する（以前の実装）
+- session    : line_api の共有セッション（keep-alive）を使う
+のp50/p99と、スタブが受け付けたTCP接続数（接続の使い回し率 = 1 - 接続数 / リクエスト数）を出す。
+スタブはHTTPなのでTLSハンドシェイクの分は含まない（実環境では no-session の差がさらに大きくなる）。
+
+使い方:
+    python scripts/loadtest/line_api_bench.py
+    python scripts/loadtest/line_api_bench.py --requests 2000 --concurrency 8 --line-latency fixed:0.02
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run import LAMBDA_DIR, percentile  # noqa: E402
+from stub_servers import LatencyDist, StubLineApi  # noqa: E402
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+ACCESS_TOKEN = "loadtest"
+MESSAGES = [{"type": "text", "text": "「渋谷 カフェ」の候補です。"}]
+
+
+def _no_session(base_url: str):
+    import requests
+    return requests.post(
+        f"{base_url}/v2/bot/message/reply",
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {ACCESS_TOKEN}"},
+        data=json.dumps({"replyToken": "bench", "messages": MESSAGES}),
+        timeout=(3, 10),
+    )
+
+
+def _session(base_url: str):
+    import line_api
+    return line_api.reply("bench", MESSAGES, ACCESS_TOKEN)
+
+
+def run(name: str, send, stub: StubLineApi, requests: int, concurrency: int) -> dict:
+    def timed(_):
+        started = time.perf_counter()
+        res = send(stub.url)
+        return (time.perf_counter() - started) * 1000, res.status_code
+
+    connections_before = stub.stats.counts.get("connections", 0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [ms for ms, _ in results]
+    connections = stub.stats.counts.get("connections", 0) - connections_before
+    return {
+        "name": name,
+        "requests": requests,
+        "errors": sum(1 for _, status in results if status >= 400),
+        "rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "connections": connections,
+        "reuse_ratio": 1 - connections / requests,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--line-latency", default="fixed:0.01")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    with StubLineApi(LatencyDist(args.line_latency)) as stub:
+        os.environ["LINE_API_BASE_URL"] = stub.url
+        os.environ["LINE_MAX_POOL_CONNECTIONS"] = str(args.concurrency)
+        results = [
+            run("no-session", _no_session, stub, args.requests, args.concurrency),
+            run("session", _session, stub, args.requests, args.concurrency),
+        ]
+
+    print(f"{'client':<12}{'rps':>8}{'p50 ms':>10}{'p99 ms':>10}{'conns':>8}{'reuse':>8}{'errors':>8}")
+    for r in results:
+        print(f"{r['name']:<12}{r['rps']:>8.0f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['connections']:>8}{r['reuse_ratio']:>8.1%}{r['errors']:>8}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+Webhook Lambda（lambda_handler）のローカル負荷試験。
+
+スタブのAgentCore / LINE APIを起動し、N個のプロセスを「コンテナ」に見立てて
+目標RPSで lambda_handler を呼び出す。各コンテナは1件ずつ順番に処理する（Lambdaと同じ）。
+結果としてレイテンシのp50/p95/p99、エラー率、EMFトレースから集計したステージ別の内訳を出力する。
+--max-p95-ms / --max-error-rate を超えると終了コード1を返すので、CIでの性能劣化検知に使える。
+
+使い方:
+    python scripts/loadtest/run.py --rps 20 --duration 30 --containers 8
+    python scripts/loadtest/run.py --agent-latency lognormal:3:0.6 --agent-error-rate 0.02
+    python scripts/loadtest/run.py --rps 5 --duration 10 --max-p95-ms 500 --json result.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+import traceback
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_servers import LatencyDist, StubAgentCore, StubLineApi, StubPlacesApi  # noqa: E402
+from webhook_events import WebhookGenerator  # noqa: E402
+
+LAMBDA_DIR = Path(__file__).resolve().parents[2] / "lambda"
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class _Context:
+    """Lambdaのcontextの代わり（残り時間はタイムアウトから計算）"""
+
+    def __init__(self, request_id: str, timeout_sec: float):
+        self.aws_request_id = request_id
+        self._deadline = time.monotonic() + timeout_sec
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(max(0.0, self._deadline - time.monotonic()) * 1000)
+
+
+def _container_env(args, agent_url: str, line_url: str, places_url: str) -> dict:
+    env = {
+        "AGENTCORE_ENDPOINT_URL": agent_url,
+        "LINE_API_BASE_URL": line_url,
+        "PLACES_API_BASE_URL": places_url,
+        "CHANNEL_ACCESS_TOKEN": "loadtest",
+        "GOOGLE_MAPS_API_KEY": "loadtest",
+        "AWS_ACCESS_KEY_ID": "loadtest",
+        "AWS_SECRET_ACCESS_KEY": "loadtest",
+        "AWS_DEFAULT_REGION": "ap-northeast-1",
+        "QUERY_CACHE_ENABLED": "true" if args.cache else "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "WEBHOOK_MODE": "sync",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def _run_container(index: int, args, env: dict, start_at: float) -> dict:
+    """1コンテナ分の呼び出しを行う（子プロセスで実行）"""
+    os.environ.pop("SSM_PREFIX", None)
+    os.environ.update(env)
+    # 実行ログ（[DEBUG]等）は集計の邪魔なので捨て、EMFはsinkで直接受け取る
+    devnull = open(os.devnull, "w")
+    sys.stdout = devnull
+    sys.path.insert(0, str(LAMBDA_DIR))
+
+    init_started = time.perf_counter()
+    import app
+    import metrics
+    init_ms = (time.perf_counter() - init_started) * 1000
+
+    traces = []
+
+    def collect(record):
+        if "trace" in record:
+            traces.append({k: v for k, v in record.items() if k != "_aws"})
+    metrics.set_sink(collect)
+
+    gen = WebhookGenerator(seed=args.seed * 1000 + index, users=args.users, location_rate=args.location_rate,
+                           more_rate=args.more_rate)
+    interval = args.containers / args.rps
+    # 各コンテナの開始をずらして全体で均等な到着間隔にする
+    next_at = start_at + index * (interval / args.containers)
+    end_at = start_at + args.duration
+    results = []
+    while next_at < end_at:
+        now = time.time()
+        if now < next_at:
+            time.sleep(next_at - now)
+        queued_ms = max(0.0, (time.time() - next_at) * 1000)
+        event = gen.api_gateway_event(int(time.time() * 1000))
+        started = time.perf_counter()
+        status = None
+        error = None
+        try:
+            response = app.lambda_handler(event, _Context(f"c{index}-{len(results)}", args.lambda_timeout))
+            status = response.get("statusCode")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            traceback.print_exc(file=sys.stderr)
+        results.append({
+            "latency_ms": (time.perf_counter() - started) * 1000,
+            "queued_ms": queued_ms,
+            "status": status,
+            "error": error,
+        })
+        next_at += interval
+
+    sys.stdout = sys.__stdout__
+    devnull.close()
+    # ru_maxrssはLinuxではKB単位
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"index": index, "init_ms": init_ms, "max_rss_mb": max_rss_mb, "results": results, "traces": traces}
+
+
+def _summarize_stages(traces: list[dict], trace_name: str) -> dict:
+    """トレースの *Ms 値をステージごとに集計する"""
+    stages = {}
+    for t in traces:
+        if t.get("trace") != trace_name:
+            continue
+        for key, value in t.items():
+            if key.endswith("Ms") and isinstance(value, (int, float)):
+                stages.setdefault(key, []).append(value)
+    return {
+        key: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        for key, values in sorted(stages.items())
+    }
+
+
+def _summarize_sources(traces: list[dict]) -> dict:
+    """イベントの処理時間を応答元（agent / cache / places / router / result_page など）ごとに集計する"""
+    sources = {}
+    for t in traces:
+        if t.get("trace") != "Event" or "EventTotalMs" not in t:
+            continue
+        source = t.get("answer_source") or ("agent" if "AgentCoreMs" in t else "none")
+        sources.setdefault(source, []).append(t["EventTotalMs"])
+    return {
+        source: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        for source, values in sorted(sources.items())
+    }
+
+
+def _event_errors(traces: list[dict]) -> dict:
+    """イベント単位のエラー（AgentCore呼び出し失敗・LINE APIの4xx/5xx）を数える"""
+    counts = {"events": 0, "agent_errors": 0, "line_errors": 0}
+    for t in traces:
+        if t.get("trace") != "Event":
+            continue
+        counts["events"] += 1
+        if any(k.startswith("AgentCore") and k.endswith("Error") for k in t):
+            counts["agent_errors"] += 1
+        for key, value in t.items():
+            if key.startswith("line_") and key.endswith("_status"):
+                if not isinstance(value, int) or value >= 400:
+                    counts["line_errors"] += 1
+                    break
+    return counts
+
+
+def build_report(args, containers: list[dict], agent: StubAgentCore, line: StubLineApi,
+                 places: StubPlacesApi) -> dict:
+    results = [r for c in containers for r in c["results"]]
+    traces = [t for c in containers for t in c["traces"]]
+    latencies = [r["latency_ms"] for r in results]
+    failed = [r for r in results if r["error"] or r["status"] != 200]
+    event_errors = _event_errors(traces)
+    return {
+        "config": {
+            "rps": args.rps,
+            "duration_sec": args.duration,
+            "containers": args.containers,
+            "agent_latency": args.agent_latency,
+            "agent_error_rate": args.agent_error_rate,
+            "line_latency": args.line_latency,
+            "line_error_rate": args.line_error_rate,
+            "cache": args.cache,
+        },
+        "requests": len(results),
+        "achieved_rps": len(results) / args.duration if args.duration else 0.0,
+        "error_rate": len(failed) / len(results) if results else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+        },
+        "queued_ms_p95": percentile([r["queued_ms"] for r in results], 95),
+        "init_ms_median": statistics.median([c["init_ms"] for c in containers]) if containers else 0.0,
+        "max_rss_mb_median": statistics.median([c["max_rss_mb"] for c in containers]) if containers else 0.0,
+        "events": event_errors,
+        "event_error_rate": (
+            (event_errors["agent_errors"] + event_errors["line_errors"]) / event_errors["events"]
+            if event_errors["events"] else 0.0
+        ),
+        "stages": {
+            "Webhook": _summarize_stages(traces, "Webhook"),
+            "Event": _summarize_stages(traces, "Event"),
+        },
+        "answer_sources": _summarize_sources(traces),
+        "stubs": {"agentcore": agent.stats.counts, "line": line.stats.counts, "places": places.stats.counts},
+    }
+
+
+def print_report(report: dict):
+    lat = report["latency_ms"]
+    print(f"requests: {report['requests']} (achieved {report['achieved_rps']:.1f} rps, "
+          f"init median {report['init_ms_median']:.0f} ms, max RSS median {report['max_rss_mb_median']:.0f} MB)")
+    print(f"latency:  p50 {lat['p50']:.0f} ms / p95 {lat['p95']:.0f} ms / p99 {lat['p99']:.0f} ms "
+          f"(max {lat['max']:.0f} ms, queued p95 {report['queued_ms_p95']:.0f} ms)")
+    ev = report["events"]
+    print(f"errors:   webhook {report['error_rate']:.2%} / events {ev['events']} "
+          f"(agent {ev['agent_errors']}, line {ev['line_errors']})")
+    for trace_name, stages in report["stages"].items():
+        if not stages:
+            continue
+        print(f"\n{trace_name} stages (ms):")
+        print(f"  {'stage':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for key, s in stages.items():
+            print(f"  {key:<28}{s['count']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}")
+    if report["answer_sources"]:
+        print("\nEventTotalMs by answer source (ms):")
+        print(f"  {'source':<28}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for source, s in report["answer_sources"].items():
+            print(f"  {source:<28}{s['count']:>7}{s['p50']:>10.1f}{s['p95']:>10.1f}{s['p99']:>10.1f}")
+    print(f"\nstubs: {json.dumps(report['stubs'], ensure_ascii=False)}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10, help="目標リクエスト数/秒（全コンテナ合計）")
+    parser.add_argument("--duration", type=float, default=20, help="試験時間（秒）")
+    parser.add_argument("--containers", type=int, default=4, help="並列に動かすコンテナ（プロセス）数")
+    parser.add_argument("--users", type=int, default=200, help="送信元ユーザー数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--agent-latency", default="lognormal:2.0:0.5", help="AgentCoreの応答時間分布")
+    parser.add_argument("--agent-error-rate", type=float, default=0.0)
+    parser.add_argument("--line-latency", default="uniform:0.02:0.08", help="LINE APIの応答時間分布")
+    parser.add_argument("--line-error-rate", type=float, default=0.0)
+    parser.add_argument("--places-latency", default="uniform:0.05:0.2", help="Places APIの応答時間分布")
+    parser.add_argument("--location-rate", type=float, default=0.1, help="1対1チャットで位置情報を送る割合")
+    parser.add_argument("--more-rate", type=float, default=0.0,
+                        help="1対1チャットで「もっと見る」を送る割合（前回の検索結果のページ送り）")
+    parser.add_argument("--lambda-timeout", type=float, default=60, help="contextの残り時間の初期値（秒）")
+    parser.add_argument("--cache", action="store_true", help="応答キャッシュを有効にする")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Lambdaの環境変数を追加で設定する（複数指定可）")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    parser.add_argument("--max-p95-ms", type=float, help="p95がこれを超えたら失敗")
+    parser.add_argument("--max-error-rate", type=float, help="エラー率がこれを超えたら失敗")
+    args = parser.parse_args()
+
+    if args.rps <= 0 or args.containers < 1:
+        parser.error("--rps must be > 0 and --containers >= 1")
+
+    with StubAgentCore(LatencyDist(args.agent_latency), args.agent_error_rate, seed=args.seed) as agent, \
+            StubLineApi(LatencyDist(args.line_latency), args.line_error_rate, seed=args.seed + 1) as line, \
+            StubPlacesApi(LatencyDist(args.places_latency), seed=args.seed + 2) as places:
+        env = _container_env(args, agent.url, line.url, places.url)
+        # 各プロセスのimport（コールドスタート）が終わる頃に一斉に開始する
+        start_at = time.time() + 2.0
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.containers) as pool:
+            containers = pool.starmap(
+                _run_container,
+                [(i, args, env, start_at) for i in range(args.containers)],
+            )
+        report = build_report(args, containers, agent, line, places)
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    failed = False
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"\n[FAIL] p95 {report['latency_ms']['p95']:.0f} ms exceeds {args.max_p95_ms:.0f} ms")
+        failed = True
+    error_rate = max(report["error_rate"], report["event_error_rate"])
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        print(f"\n[FAIL] error rate {error_rate:.2%} exceeds {args.max_error_rate:.2%}")
+        failed = True
+    if not failed:
+        print("\n[OK]")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
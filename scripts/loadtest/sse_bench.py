@@ -0,0 +1,147 @@
+"""
+AgentCoreのSSE応答のデコード時間を比較するベンチマーク。
+
+数MBのSSEストリームをランダムな大きさのチャンクに分けて流し、
+- legacy : body.read() で全体を読んでから文字列を切り出す（以前の実装）
+- decoder: sse.iter_text でチャンクごとに逐次デコードする（現在の実装）
+の処理時間と1MBあたりの時間を出す。サイズを倍にしても1MBあたりの時間がほぼ一定なら、処理時間は線形に増えている。
+1つのdata:行に応答全体が入る形（single）は、行がほぼすべてのチャンク境界をまたぐため逐次デコードで最も不利な形になる。
+events は短いイベントが多数届く形で、legacyは1イベントしか扱えないため decoder だけを測る。
+
+使い方:
+    python scripts/loadtest/sse_bench.py
+    python scripts/loadtest/sse_bench.py --sizes-mb 1 2 4 8 16 --max-chunk 4096 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from run import LAMBDA_DIR  # noqa: E402
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+import sse  # noqa: E402
+
+LINE = "1. スタブ食堂 渋谷店（★4.2）渋谷駅から徒歩3分。静かで落ち着いた雰囲気のカフェです。\n"
+
+
+class RandomChunkBody:
+    """StreamingBodyの代わり。1〜max_chunkバイトのランダムな大きさでチャンクを返す"""
+
+    def __init__(self, raw: bytes, max_chunk: int, seed: int):
+        self._raw = raw
+        self._max_chunk = max_chunk
+        self._random = random.Random(seed)
+
+    def read(self) -> bytes:
+        return self._raw
+
+    def iter_chunks(self, chunk_size: int):
+        pos = 0
+        while pos < len(self._raw):
+            size = self._random.randint(1, self._max_chunk)
+            yield self._raw[pos:pos + size]
+            pos += size
+
+
+def _answer(size: int) -> str:
+    repeat = size // len(LINE.encode("utf-8")) + 1
+    return LINE * repeat
+
+
+def _single_stream(answer: str) -> bytes:
+    return f"data: {json.dumps(answer, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _events_stream(answer: str) -> bytes:
+    return "".join(f"data: {json.dumps(line + chr(10), ensure_ascii=False)}\n\n"
+                   for line in answer.splitlines()).encode("utf-8")
+
+
+def _legacy(body) -> str:
+    """以前の app._call_agentcore の読み取り部分"""
+    result = body.read().decode("utf-8")
+    if result.startswith('data: "'):
+        result = result[7:]
+        if result.endswith('"\n'):
+            result = result[:-2]
+        result = result.replace("\\n", "\n")
+    return result
+
+
+def _decoder(body) -> str:
+    return "".join(sse.iter_text(body))
+
+
+def _timed(decode, raw: bytes, max_chunk: int, repeat: int) -> tuple[float, str]:
+    best = None
+    text = ""
+    for i in range(repeat):
+        body = RandomChunkBody(raw, max_chunk, seed=i)
+        started = time.perf_counter()
+        text = decode(body)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, text
+
+
+def run(shape: str, size_mb: float, max_chunk: int, repeat: int) -> list[dict]:
+    answer = _answer(int(size_mb * 1024 * 1024))
+    if shape == "single":
+        raw = _single_stream(answer)
+        # legacyは末尾の "\n\n" のうち最後の1つしか落とさないので、比較用に1つ削っておく
+        cases = [("legacy", _legacy, raw[:-1]), ("decoder", _decoder, raw)]
+    else:
+        cases = [("decoder", _decoder, _events_stream(answer))]
+
+    results = []
+    for name, decode, data in cases:
+        ms, text = _timed(decode, data, max_chunk, repeat)
+        results.append({
+            "shape": shape,
+            "client": name,
+            "mb": len(data) / 1024 / 1024,
+            "ms": ms,
+            "ms_per_mb": ms / (len(data) / 1024 / 1024),
+            "ok": text == answer,
+        })
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-chunk", type=int, default=sse.DEFAULT_CHUNK_SIZE * 2,
+                        help="チャンクの最大バイト数（1〜この値でランダム）")
+    parser.add_argument("--repeat", type=int, default=3, help="各条件の試行回数（最速の値を使う）")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = [r for shape in ("single", "events") for size in args.sizes_mb
+               for r in run(shape, size, args.max_chunk, args.repeat)]
+
+    print(f"{'shape':<8}{'client':<10}{'MB':>8}{'ms':>10}{'ms/MB':>10}{'ok':>6}")
+    for r in results:
+        print(f"{r['shape']:<8}{r['client']:<10}{r['mb']:>8.1f}{r['ms']:>10.1f}{r['ms_per_mb']:>10.1f}"
+              f"{'yes' if r['ok'] else 'NO':>6}")
+
+    # 最小サイズと最大サイズの1MBあたりの時間の比（1に近いほど線形）
+    for shape in ("single", "events"):
+        decoded = [r for r in results if r["shape"] == shape and r["client"] == "decoder"]
+        if len(decoded) > 1:
+            growth = decoded[-1]["ms_per_mb"] / decoded[0]["ms_per_mb"]
+            print(f"[INFO] {shape}: decoder ms/MB {decoded[0]['mb']:.0f}MB → {decoded[-1]['mb']:.0f}MB = x{growth:.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+負荷試験用のAgentCore Runtime / LINE Messaging API / Places APIのスタブHTTPサーバー。
+
+- AgentCore: POST /runtimes/{arn}/invocations にSSE（text/event-stream）で応答する。
+  lambda側は AGENTCORE_ENDPOINT_URL をこのサーバーに向ければboto3のまま呼び出せる
+- LINE: /v2/bot/message/reply・push、/v2/bot/chat/loading/start に200で応答する。
+  lambda側は LINE_API_BASE_URL をこのサーバーに向ける
+- Places: GET /place/nearbysearch/json・/place/textsearch/json に固定の候補で応答する。
+  lambda側は PLACES_API_BASE_URL をこのサーバーに向ける
+- SSM: Parameter Storeの GetParametersByPath・GetParameter（JSONプロトコル）に固定のシークレットで応答する。
+  lambda側は SSM_ENDPOINT_URL をこのサーバーに向ける
+- 応答時間は分布（fixed / uniform / lognormal）で、エラー率は割合で指定する
+- 受け付けたTCP接続の数を stats.counts["connections"] に数える（keep-aliveでの接続の使い回しの確認用）
+"""
+
+import json
+import math
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class LatencyDist:
+    """
+    応答時間の分布（秒）。文字列で指定する:
+        fixed:0.2
+        uniform:0.5:3.0
+        lognormal:2.0:0.5   （中央値2.0秒、σ=0.5）
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, rest = spec.partition(":")
+        params = [float(p) for p in rest.split(":") if p]
+        if kind == "fixed" and len(params) == 1:
+            self._sample = lambda rng: params[0]
+        elif kind == "uniform" and len(params) == 2:
+            self._sample = lambda rng: rng.uniform(params[0], params[1])
+        elif kind == "lognormal" and len(params) == 2:
+            mu = math.log(params[0]) if params[0] > 0 else 0.0
+            self._sample = lambda rng: rng.lognormvariate(mu, params[1]) if params[0] > 0 else 0.0
+        else:
+            raise ValueError(f"invalid latency spec: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        return max(0.0, self._sample(rng))
+
+    def __repr__(self):
+        return f"LatencyDist({self.spec!r})"
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, key: str):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 同時接続の多いASGIサーバーからの接続をlisten backlogで取りこぼさない
+    request_queue_size = 1024
+
+
+class _StubServer:
+    handler_class = None
+
+    def __init__(self, latency: LatencyDist, error_rate: float = 0.0, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.stats = _Stats()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._server = _Server((host, port), self.handler_class)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw(self) -> tuple[float, bool]:
+        """(応答までの秒数, エラーにするか)"""
+        with self._rng_lock:
+            return self.latency.sample(self._rng), self._rng.random() < self.error_rate
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # ヘッダーと本文を別々に書くので、keep-aliveの接続でNagle + 遅延ACKの待ち（約40ms）が入らないようにする
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # keep-aliveでは1接続で複数のリクエストを処理するので、接続数とリクエスト数は一致しない
+        self.server.stub.stats.incr("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _AgentCoreHandler(_Handler):
+    def do_POST(self):
+        stub = self.server.stub
+        payload = self._read_json()
+        if "/invocations" not in self.path:
+            stub.stats.incr("not_found")
+            self._send(404, b'{"message": "not found"}')
+            return
+
+        delay, error = stub.draw()
+        time.sleep(delay)
+        if error:
+            stub.stats.incr("error")
+            self._send(500, b'{"message": "injected error"}')
+            return
+
+        stub.stats.incr("ok")
+        # AgentCoreのペイロードは {"prompt": ..., "user_id": ...} をJSON文字列にしたもの
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                payload = {}
+        prompt = payload.get("prompt", "") if isinstance(payload, dict) else ""
+        text = (
+            f"「{prompt}」の候補です。\n\n"
+            "1. スタブ食堂\n住所：東京都渋谷区1-1-1\n評価：4.2\n\n"
+            "2. スタブ亭\n住所：東京都渋谷区2-2-2\n評価：4.0\n\n"
+            "3. スタブ屋\n住所：東京都渋谷区3-3-3\n評価：3.9"
+        )
+        self._send(200, ("data: " + json.dumps(text, ensure_ascii=False) + "\n\n").encode("utf-8"),
+                   "text/event-stream")
+
+
+class _LineHandler(_Handler):
+    def do_POST(self):
+        stub = self.server.stub
+        self._read_json()
+        endpoint = {
+            "/v2/bot/message/reply": "reply",
+            "/v2/bot/message/push": "push",
+            "/v2/bot/chat/loading/start": "loading",
+        }.get(self.path.split("?")[0])
+        if endpoint is None:
+            stub.stats.incr("not_found")
+            self._send(404, b'{"message": "Not found"}')
+            return
+
+        delay, error = stub.draw()
+        time.sleep(delay)
+        if error:
+            stub.stats.incr(f"{endpoint}_error")
+            self._send(500, b'{"message": "injected error"}')
+            return
+        stub.stats.incr(endpoint)
+        self._send(202 if endpoint == "loading" else 200, b"{}")
+
+
+class _PlacesHandler(_Handler):
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        endpoint = {
+            "/place/nearbysearch/json": "nearby",
+            "/place/textsearch/json": "text",
+        }.get(url.path.rstrip("/").split("/maps/api")[-1])
+        if endpoint is None:
+            stub.stats.incr("not_found")
+            self._send(404, b'{"status": "NOT_FOUND"}')
+            return
+
+        delay, error = stub.draw()
+        time.sleep(delay)
+        if error:
+            stub.stats.incr(f"{endpoint}_error")
+            self._send(500, b'{"status": "UNKNOWN_ERROR"}')
+            return
+        stub.stats.incr(endpoint)
+        params = parse_qs(url.query)
+        where = (params.get("location") or params.get("query") or [""])[0]
+        # Nearby Searchは vicinity、Text Searchは formatted_address に住所が入る
+        address_key = "vicinity" if endpoint == "nearby" else "formatted_address"
+        results = [
+            {
+                "name": f"スタブ{genre}",
+                "place_id": f"stub-{i}",
+                "rating": round(4.5 - i * 0.2, 1),
+                "user_ratings_total": 120 - i * 10,
+                address_key: f"スタブ町{i + 1}-1 ({where})",
+                "business_status": "OPERATIONAL",
+                "opening_hours": {"open_now": i % 2 == 0},
+            }
+            for i, genre in enumerate(["食堂", "カフェ", "ラーメン", "居酒屋", "寿司"])
+        ]
+        body = json.dumps({"status": "OK", "results": results}, ensure_ascii=False).encode("utf-8")
+        self._send(200, body)
+
+
+class _SsmHandler(_Handler):
+    def do_POST(self):
+        stub = self.server.stub
+        payload = self._read_json()
+        # JSONプロトコル: 操作は X-Amz-Target（AmazonSSM.GetParametersByPath など）で指定される
+        action = (self.headers.get("X-Amz-Target") or "").rpartition(".")[2]
+        if action not in ("GetParametersByPath", "GetParameter"):
+            stub.stats.incr("not_found")
+            self._send(400, b'{"__type": "InvalidAction"}', "application/x-amz-json-1.1")
+            return
+
+        delay, error = stub.draw()
+        time.sleep(delay)
+        if error:
+            stub.stats.incr(f"{action}_error")
+            self._send(500, b'{"__type": "InternalServerError"}', "application/x-amz-json-1.1")
+            return
+        stub.stats.incr(action)
+        if action == "GetParametersByPath":
+            path = payload.get("Path", "").rstrip("/")
+            body = {"Parameters": [_ssm_parameter(f"{path}/{name}") for name in STUB_SECRETS]}
+        else:
+            body = {"Parameter": _ssm_parameter(payload.get("Name", ""))}
+        self._send(200, json.dumps(body).encode("utf-8"), "application/x-amz-json-1.1")
+
+
+# StubSsmが返すシークレット（値はダミー）
+STUB_SECRETS = ("CHANNEL_ACCESS_TOKEN", "CHANNEL_SECRET", "GOOGLE_MAPS_API_KEY")
+
+
+def _ssm_parameter(name: str) -> dict:
+    return {"Name": name, "Type": "SecureString", "Value": f"stub-{name.rpartition('/')[2].lower()}", "Version": 1}
+
+
+class StubAgentCore(_StubServer):
+    handler_class = _AgentCoreHandler
+
+
+class StubLineApi(_StubServer):
+    handler_class = _LineHandler
+
+
+class StubPlacesApi(_StubServer):
+    handler_class = _PlacesHandler
+
+
+class StubSsm(_StubServer):
+    handler_class = _SsmHandler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="スタブサーバーを単体で起動する")
+    parser.add_argument("--agent-latency", default="lognormal:2.0:0.5")
+    parser.add_argument("--line-latency", default="fixed:0.05")
+    parser.add_argument("--agent-port", type=int, default=8081)
+    parser.add_argument("--line-port", type=int, default=8082)
+    parser.add_argument("--places-port", type=int, default=8083)
+    args = parser.parse_args()
+
+    with StubAgentCore(LatencyDist(args.agent_latency), port=args.agent_port) as agent, \
+            StubLineApi(LatencyDist(args.line_latency), port=args.line_port) as line, \
+            StubPlacesApi(LatencyDist(args.line_latency), port=args.places_port) as places:
+        print(f"AGENTCORE_ENDPOINT_URL={agent.url}")
+        print(f"LINE_API_BASE_URL={line.url}")
+        print(f"PLACES_API_BASE_URL={places.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
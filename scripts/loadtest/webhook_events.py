@@ -0,0 +1,135 @@
+"""
+負荷試験用のLINE Webhookリクエスト（API Gatewayイベント）を生成するモジュール。
+
+- 送信元は user / group / room を比率指定で混在させる
+- group / room では一部を「@お店」トリガーなしの雑談にする（AgentCoreを呼ばないイベント）
+- 1対1チャットでは一部を位置情報メッセージや「もっと見る」（前回の検索結果の続き）にする
+- 1リクエストに複数イベントを含めたり、bodyをbase64で送ったりするケースも混ぜる
+"""
+
+import base64
+import json
+import random
+import time
+import uuid
+
+AREAS = ["渋谷", "新宿", "池袋", "上野", "銀座", "恵比寿", "吉祥寺", "横浜", "梅田", "難波", "博多", "栄"]
+GENRES = ["ラーメン", "カフェ", "焼肉", "寿司", "居酒屋", "イタリアン", "中華", "カレー", "うどん", "ベーカリー"]
+MOODS = ["", "静かな", "安い", "子連れOKの", "個室のある", "深夜までやってる", "おしゃれな"]
+CHATTER = ["おつかれさまです", "了解です！", "明日何時集合？", "写真ありがとう", "いいね"]
+TRIGGERS = ["@お店", "＠お店"]
+MORE_REQUESTS = ["もっと見る", "他には？", "次"]
+# 位置情報メッセージの送信地点 (名称, 緯度, 経度)
+SPOTS = [
+    ("渋谷駅", 35.6580, 139.7016), ("新宿駅", 35.6896, 139.7006), ("東京駅", 35.6812, 139.7671),
+    ("梅田駅", 34.7025, 135.4959), ("博多駅", 33.5902, 130.4207),
+]
+
+
+def random_query(rng: random.Random) -> str:
+    area = rng.choice(AREAS)
+    mood = rng.choice(MOODS)
+    genre = rng.choice(GENRES)
+    return f"{area}で{mood}{genre}" if rng.random() < 0.5 else f"{area} {mood}{genre}"
+
+
+class WebhookGenerator:
+    """
+    Args:
+        seed: 乱数シード（同じシードなら同じリクエスト列になる）
+        users: 送信元ユーザー数（少ないほど同じ会話に集中する）
+        source_mix: {"user": 比率, "group": 比率, "room": 比率}
+        chatter_rate: group/roomでトリガーなしのメッセージになる割合
+        multi_event_rate: 1リクエストに複数イベントを含める割合
+        base64_rate: bodyをbase64エンコードする割合
+        location_rate: 1対1チャットで位置情報メッセージになる割合
+        more_rate: 1対1チャットで「もっと見る」になる割合
+    """
+
+    def __init__(self, seed: int = 0, users: int = 200, source_mix: dict | None = None,
+                 chatter_rate: float = 0.3, multi_event_rate: float = 0.1, base64_rate: float = 0.2,
+                 location_rate: float = 0.1, more_rate: float = 0.0):
+        self._rng = random.Random(seed)
+        self.users = [f"U{uuid.UUID(int=self._rng.getrandbits(128)).hex}" for _ in range(users)]
+        self.groups = [f"C{uuid.UUID(int=self._rng.getrandbits(128)).hex}" for _ in range(max(1, users // 10))]
+        self.rooms = [f"R{uuid.UUID(int=self._rng.getrandbits(128)).hex}" for _ in range(max(1, users // 20))]
+        self.source_mix = source_mix or {"user": 0.7, "group": 0.2, "room": 0.1}
+        self.chatter_rate = chatter_rate
+        self.multi_event_rate = multi_event_rate
+        self.base64_rate = base64_rate
+        self.location_rate = location_rate
+        self.more_rate = more_rate
+
+    def _source(self) -> dict:
+        rng = self._rng
+        kinds = list(self.source_mix)
+        kind = rng.choices(kinds, weights=[self.source_mix[k] for k in kinds])[0]
+        user_id = rng.choice(self.users)
+        if kind == "group":
+            return {"type": "group", "groupId": rng.choice(self.groups), "userId": user_id}
+        if kind == "room":
+            return {"type": "room", "roomId": rng.choice(self.rooms), "userId": user_id}
+        return {"type": "user", "userId": user_id}
+
+    def _text(self, source_type: str) -> str:
+        rng = self._rng
+        if source_type == "user":
+            if self.more_rate and rng.random() < self.more_rate:
+                return rng.choice(MORE_REQUESTS)
+            return random_query(rng)
+        if rng.random() < self.chatter_rate:
+            return rng.choice(CHATTER)
+        return f"{rng.choice(TRIGGERS)} {random_query(rng)}"
+
+    def _message(self, source_type: str) -> dict:
+        rng = self._rng
+        message_id = str(rng.getrandbits(60))
+        if source_type == "user" and rng.random() < self.location_rate:
+            title, lat, lng = rng.choice(SPOTS)
+            return {
+                "id": message_id,
+                "type": "location",
+                "title": title,
+                "address": f"{title}付近",
+                "latitude": round(lat + rng.uniform(-0.005, 0.005), 6),
+                "longitude": round(lng + rng.uniform(-0.005, 0.005), 6),
+            }
+        return {
+            "id": message_id,
+            "type": "text",
+            "quoteToken": uuid.UUID(int=rng.getrandbits(128)).hex,
+            "text": self._text(source_type),
+        }
+
+    def message_event(self, now_ms: int | None = None) -> dict:
+        source = self._source()
+        return {
+            "type": "message",
+            "mode": "active",
+            "timestamp": now_ms if now_ms is not None else int(time.time() * 1000),
+            "source": source,
+            "webhookEventId": uuid.UUID(int=self._rng.getrandbits(128)).hex.upper()[:26],
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": uuid.UUID(int=self._rng.getrandbits(128)).hex,
+            "message": self._message(source["type"]),
+        }
+
+    def body(self, now_ms: int | None = None) -> dict:
+        count = self._rng.randint(2, 4) if self._rng.random() < self.multi_event_rate else 1
+        return {
+            "destination": "Uloadtest",
+            "events": [self.message_event(now_ms) for _ in range(count)],
+        }
+
+    def api_gateway_event(self, now_ms: int | None = None) -> dict:
+        """lambda_handler に渡すAPI Gateway（プロキシ統合）形式のイベント"""
+        raw = json.dumps(self.body(now_ms), ensure_ascii=False)
+        if self._rng.random() < self.base64_rate:
+            return {"body": base64.b64encode(raw.encode("utf-8")).decode("ascii"), "isBase64Encoded": True}
+        return {"body": raw, "isBase64Encoded": False}
+
+
+if __name__ == "__main__":
+    gen = WebhookGenerator(seed=1)
+    for _ in range(3):
+        print(json.dumps(gen.api_gateway_event(), ensure_ascii=False))
@@ -0,0 +1,123 @@
+"""
+配信のDLQ（DELIVERY_DLQ_URL）に退避された応答を、AgentCoreを呼ばずにpushで再送するスクリプト。
+
+DLQのメッセージには元のLINEイベントとAgentCoreの応答が入っている。
+再送に成功したメッセージはDLQから削除し、失敗したものは --visibility-sec 後にDLQに戻る。
+pushのX-Line-Retry-Keyは項目ごとに固定なので、24時間以内に送信済みの分は重複送信されない。
+LINE_ALLOW_PUSH_FALLBACK の設定によらず送信するので、内容を --list で確認してから実行すること。
+
+アクセストークンは SSM_PREFIX（Parameter Store）または環境変数 CHANNEL_ACCESS_TOKEN から取得する。
+
+使い方:
+    python scripts/replay_deliveries.py --queue-url $DELIVERY_DLQ_URL --list
+    python scripts/replay_deliveries.py --queue-url $DELIVERY_DLQ_URL --limit 20
+    python scripts/replay_deliveries.py --queue-url $DELIVERY_DLQ_URL --destination Uxxxxxxxx --reason max_attempts
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent / "lambda"
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+import delivery_outbox  # noqa: E402
+
+# DLQから1回に受け取る最大件数（SQSの上限）
+MAX_RECEIVE = 10
+
+
+def _receive(client, queue_url: str, limit: int, visibility_sec: int):
+    """DLQのメッセージを最大 limit 件、(受信ハンドル, 項目) で返す"""
+    received = 0
+    while received < limit:
+        res = client.receive_message(
+            QueueUrl=queue_url,
+            MaxNumberOfMessages=min(MAX_RECEIVE, limit - received),
+            VisibilityTimeout=visibility_sec,
+            WaitTimeSeconds=1,
+        )
+        messages = res.get("Messages") or []
+        if not messages:
+            return
+        for message in messages:
+            received += 1
+            yield message["ReceiptHandle"], json.loads(message["Body"])
+
+
+def _matches(entry: dict, args) -> bool:
+    if args.destination and entry.get("destination") != args.destination:
+        return False
+    if args.reason and entry.get("reason") != args.reason:
+        return False
+    return True
+
+
+def _summary(entry: dict) -> str:
+    answer = entry.get("answer", "").replace("\n", " ")
+    return (f"{entry['id']} to={entry.get('destination')} attempts={entry.get('attempts')} "
+            f"reason={entry.get('reason')} error={entry.get('last_error')} answer={answer[:40]!r}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queue-url", default=os.environ.get("DELIVERY_DLQ_URL"), help="DLQのURL")
+    parser.add_argument("--limit", type=int, default=100, help="処理する最大件数")
+    parser.add_argument("--list", action="store_true", help="送信せずに内容だけ表示する")
+    parser.add_argument("--destination", help="この送信先（ユーザー／グループ／ルームID）の分だけ再送する")
+    parser.add_argument("--reason", help="この理由（max_attempts / push_not_allowed など）の分だけ再送する")
+    parser.add_argument("--visibility-sec", type=int, default=60,
+                        help="処理中のメッセージを他から見えなくする秒数（再送に失敗した分はこの後DLQに戻る）")
+    args = parser.parse_args()
+
+    if not args.queue_url:
+        parser.error("--queue-url (or DELIVERY_DLQ_URL) is required")
+
+    client = delivery_outbox._get_sqs_client()
+    access_token = None
+    if not args.list:
+        from app import send_line_push
+        from ssm_secrets import get_secret
+        access_token = get_secret("CHANNEL_ACCESS_TOKEN")
+        if not access_token:
+            print("[ERROR] CHANNEL_ACCESS_TOKEN is missing", file=sys.stderr)
+            return 1
+
+    counts = {"listed": 0, "skipped": 0, "sent": 0, "failed": 0}
+    # 表示しただけ・対象外のメッセージは、終了時にすぐ見えるように戻す
+    untouched = []
+    for receipt, entry in _receive(client, args.queue_url, args.limit, args.visibility_sec):
+        if not _matches(entry, args):
+            counts["skipped"] += 1
+            untouched.append(receipt)
+            continue
+        if args.list:
+            counts["listed"] += 1
+            untouched.append(receipt)
+            print(_summary(entry))
+            continue
+        if not entry.get("destination"):
+            print(f"[WARN] No push destination; skipped {entry['id']}")
+            counts["failed"] += 1
+            continue
+        res = send_line_push(entry["destination"], entry["answer"], access_token, retry_key=entry["id"])
+        if res.status_code < 400 or res.status_code == delivery_outbox.ALREADY_ACCEPTED:
+            client.delete_message(QueueUrl=args.queue_url, ReceiptHandle=receipt)
+            counts["sent"] += 1
+            print(f"[INFO] Replayed {entry['id']} (status {res.status_code})")
+        else:
+            counts["failed"] += 1
+            print(f"[WARN] Replay failed for {entry['id']}: status {res.status_code}")
+
+    for receipt in untouched:
+        client.change_message_visibility(QueueUrl=args.queue_url, ReceiptHandle=receipt, VisibilityTimeout=0)
+
+    print(json.dumps(counts))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
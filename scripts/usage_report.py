@@ -0,0 +1,163 @@
+"""
+エクスポートしたログ（EMF）からユーザー・グループ別の利用量の日別上位Nを出すスクリプト。
+
+usage_meter が出力するレコード（SubjectType / SubjectId と Usage* メトリクス）を集計する。
+入力はCloudWatch LogsのS3エクスポート（.gz、各行「タイムスタンプ JSON」）、
+`aws logs filter-log-events` の出力を行ごとにしたもの、Lambdaのログをそのまま保存したファイルのいずれでもよい。
+ディレクトリを指定すると配下のファイルをすべて読む。
+
+1件あたりの単価を指定すると推定コストの列を追加する（例: --agent-cost 0.01 --push-cost 0.003）。
+
+使い方:
+    python scripts/usage_report.py exported-logs/ --top 20
+    python scripts/usage_report.py exported-logs/ --date 2026-10-16 --type group --by push_messages
+    python scripts/usage_report.py logs.txt --agent-cost 0.01 --places-cost 0.032 --push-cost 0.003 --json report.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent / "lambda"
+
+sys.path.insert(0, str(LAMBDA_DIR))
+
+import usage_meter  # noqa: E402
+
+# EMFのメトリクス名 -> カウンター名
+_COUNTERS = {metric: name for name, (metric, _) in usage_meter.FIELDS.items()}
+
+_COLUMNS = (
+    ("events", "events"),
+    ("agent_calls", "agent"),
+    ("agent_errors", "agent err"),
+    ("agent_ms", "agent sec"),
+    ("agent_bytes", "agent KB"),
+    ("places_calls", "places"),
+    ("push_calls", "push"),
+    ("push_messages", "push msg"),
+)
+
+
+def _iter_files(paths: list[Path]):
+    for path in paths:
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob("*") if p.is_file())
+        else:
+            yield path
+
+
+def _iter_lines(path: Path):
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+def iter_usage_records(paths: list[Path]):
+    """利用量のEMFレコードを取り出す（行頭のタイムスタンプなどは読み飛ばす）"""
+    for path in _iter_files(paths):
+        for line in _iter_lines(path):
+            start = line.find("{")
+            if start < 0 or '"SubjectId"' not in line:
+                continue
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "_aws" in record and "SubjectId" in record:
+                yield record
+
+
+def aggregate(records, utc_offset_hours: int) -> dict:
+    """{日付: {(種別, ID): {カウンター名: 値}}}"""
+    days = {}
+    for record in records:
+        timestamp = record["_aws"].get("Timestamp", 0) / 1000
+        date = time.strftime("%Y-%m-%d", time.gmtime(timestamp + utc_offset_hours * 3600))
+        key = (record.get("SubjectType", usage_meter.USER), record["SubjectId"])
+        counts = days.setdefault(date, {}).setdefault(key, {})
+        for metric, name in _COUNTERS.items():
+            if metric in record:
+                counts[name] = counts.get(name, 0) + record[metric]
+    return days
+
+
+def _cost(counts: dict, args) -> float:
+    return (counts.get("agent_calls", 0) * args.agent_cost
+            + counts.get("places_calls", 0) * args.places_cost
+            + counts.get("push_messages", 0) * args.push_cost)
+
+
+def top_n(subjects: dict, args) -> list[dict]:
+    rows = []
+    for (kind, subject_id), counts in subjects.items():
+        if args.type != "all" and kind != args.type:
+            continue
+        rows.append({"type": kind, "id": subject_id, **counts, "cost": _cost(counts, args)})
+    total = sum(r.get(args.by, 0) for r in rows)
+    rows.sort(key=lambda r: (-r.get(args.by, 0), r["id"]))
+    for r in rows:
+        r["share"] = r.get(args.by, 0) / total if total else 0.0
+    return rows[:args.top]
+
+
+def _cell(name: str, value) -> str:
+    if name == "agent_ms":
+        return f"{value / 1000:.1f}"
+    if name == "agent_bytes":
+        return f"{value / 1024:.1f}"
+    return f"{value:.0f}"
+
+
+def print_report(report: dict, args):
+    with_cost = any((args.agent_cost, args.places_cost, args.push_cost))
+    for date, rows in report.items():
+        print(f"\n{date}  top {len(rows)} by {args.by}")
+        header = f"  {'#':>3} {'type':<6}{'id':<36}" + "".join(f"{label:>11}" for _, label in _COLUMNS)
+        header += f"{'share':>8}" + (f"{'cost':>10}" if with_cost else "")
+        print(header)
+        for rank, r in enumerate(rows, 1):
+            line = f"  {rank:>3} {r['type']:<6}{r['id']:<36}"
+            line += "".join(f"{_cell(name, r.get(name, 0)):>11}" for name, _ in _COLUMNS)
+            line += f"{r['share']:>8.1%}" + (f"{r['cost']:>10.2f}" if with_cost else "")
+            print(line)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", type=Path, help="エクスポートしたログのファイル・ディレクトリ")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--by", default="agent_calls", choices=[*usage_meter.FIELDS, "cost"],
+                        help="並べ替えに使う値")
+    parser.add_argument("--type", default="all", choices=["all", usage_meter.USER, usage_meter.GROUP])
+    parser.add_argument("--date", action="append", help="この日付（YYYY-MM-DD）だけ出す（複数指定可）")
+    parser.add_argument("--utc-offset", type=int, default=int(os.environ.get("USAGE_UTC_OFFSET_HOURS", 9)),
+                        help="日付を区切る時差（時間）。usage_meter の USAGE_UTC_OFFSET_HOURS と揃える")
+    parser.add_argument("--agent-cost", type=float, default=0.0, help="AgentCore呼び出し1回あたりの単価")
+    parser.add_argument("--places-cost", type=float, default=0.0, help="Places API呼び出し1回あたりの単価")
+    parser.add_argument("--push-cost", type=float, default=0.0, help="pushの吹き出し1個あたりの単価")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    days = aggregate(iter_usage_records(args.paths), args.utc_offset)
+    if args.date:
+        days = {d: days.get(d, {}) for d in args.date}
+    report = {date: top_n(subjects, args) for date, subjects in sorted(days.items())}
+    if not args.date:
+        report = {date: rows for date, rows in report.items() if rows}
+    if not report:
+        print("no usage records found")
+        return 1
+
+    print_report(report, args)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
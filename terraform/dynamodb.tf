@@ -0,0 +1,209 @@
+# =============================================================================
+# DynamoDBテーブル（コンテナ間で共有するキャッシュ等）
+# enable_dynamodb_tiers = true の場合のみ作成
+# =============================================================================
+
+# AgentCore応答キャッシュ
+resource "aws_dynamodb_table" "query_cache" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-query-cache-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-query-cache-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# Webhook再送の冪等性ストア（webhookEventId単位）
+resource "aws_dynamodb_table" "idempotency" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-idempotency-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-idempotency-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# ユーザー単位のレート制限カウンタ
+resource "aws_dynamodb_table" "rate_limit" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-rate-limit-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-rate-limit-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# 連続メッセージの結合用（Webhookとworkerで共有）
+resource "aws_dynamodb_table" "coalesce" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-coalesce-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-coalesce-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# 同じ検索条件のAgentCore呼び出しをまとめるロック
+resource "aws_dynamodb_table" "singleflight" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-singleflight-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-singleflight-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# 「もっと見る」で次のページを返すための検索結果（カーソル）
+resource "aws_dynamodb_table" "result_pages" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-result-pages-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-result-pages-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# ユーザーが直前に送った位置情報（location_context。queueモードでWebhookとworkerの間で共有する）
+resource "aws_dynamodb_table" "location_context" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-location-context-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-location-context-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# ユーザー・グループ別の日別利用量カウンタ（usage_meter がまとめて加算する）
+resource "aws_dynamodb_table" "usage" {
+  count        = var.enable_dynamodb_tiers ? 1 : 0
+  name         = "${var.project_name}-usage-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "pk"
+
+  attribute {
+    name = "pk"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-usage-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+locals {
+  dynamodb_table_arns = concat(
+    aws_dynamodb_table.query_cache[*].arn,
+    aws_dynamodb_table.idempotency[*].arn,
+    aws_dynamodb_table.rate_limit[*].arn,
+    aws_dynamodb_table.coalesce[*].arn,
+    aws_dynamodb_table.singleflight[*].arn,
+    aws_dynamodb_table.result_pages[*].arn,
+    aws_dynamodb_table.location_context[*].arn,
+    aws_dynamodb_table.usage[*].arn,
+  )
+}
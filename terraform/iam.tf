@@ -51,9 +51,13 @@ resource "aws_iam_role_policy" "ssm_read" {
       Effect = "Allow"
       Action = [
         "ssm:GetParameter",
-        "ssm:GetParameters"
+        "ssm:GetParameters",
+        "ssm:GetParametersByPath"
+      ]
+      Resource = [
+        "arn:aws:ssm:${local.region}:${local.account_id}:parameter${local.ssm_prefix}",
+        "arn:aws:ssm:${local.region}:${local.account_id}:parameter${local.ssm_prefix}/*"
       ]
-      Resource = "arn:aws:ssm:${local.region}:${local.account_id}:parameter${local.ssm_prefix}/*"
     }]
   })
 }
@@ -77,3 +81,77 @@ resource "aws_iam_role_policy" "agentcore_invoke" {
     }]
   })
 }
+
+# -----------------------------------------------------------------------------
+# イベントキュー送受信ポリシー（Webhook: 送信 / Worker: 受信）
+# -----------------------------------------------------------------------------
+
+resource "aws_iam_role_policy" "events_queue" {
+  name = "${var.project_name}-events-queue-policy-${var.environment}"
+  role = aws_iam_role.lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect = "Allow"
+      Action = [
+        "sqs:SendMessage",
+        "sqs:ReceiveMessage",
+        "sqs:DeleteMessage",
+        "sqs:GetQueueAttributes"
+      ]
+      Resource = aws_sqs_queue.events.arn
+    }]
+  })
+}
+
+# -----------------------------------------------------------------------------
+# 配信のアウトボックス送受信ポリシー（Webhook・Worker: 送信 / Delivery: 受信・再送・退避）
+# -----------------------------------------------------------------------------
+
+resource "aws_iam_role_policy" "deliveries_queue" {
+  name = "${var.project_name}-deliveries-queue-policy-${var.environment}"
+  role = aws_iam_role.lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect = "Allow"
+      Action = [
+        "sqs:SendMessage",
+        "sqs:ReceiveMessage",
+        "sqs:DeleteMessage",
+        "sqs:ChangeMessageVisibility",
+        "sqs:GetQueueAttributes"
+      ]
+      Resource = [
+        aws_sqs_queue.deliveries.arn,
+        aws_sqs_queue.deliveries_dlq.arn
+      ]
+    }]
+  })
+}
+
+# -----------------------------------------------------------------------------
+# DynamoDB共有ティア読み書きポリシー
+# -----------------------------------------------------------------------------
+
+resource "aws_iam_role_policy" "dynamodb_tiers" {
+  count = var.enable_dynamodb_tiers ? 1 : 0
+  name  = "${var.project_name}-dynamodb-policy-${var.environment}"
+  role  = aws_iam_role.lambda_execution.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Effect = "Allow"
+      Action = [
+        "dynamodb:GetItem",
+        "dynamodb:PutItem",
+        "dynamodb:UpdateItem",
+        "dynamodb:DeleteItem"
+      ]
+      Resource = local.dynamodb_table_arns
+    }]
+  })
+}
@@ -13,10 +13,22 @@ resource "aws_lambda_function" "line_bot" {
 
   environment {
     variables = {
-      ENVIRONMENT       = var.environment
-      SSM_PREFIX        = "/${var.project_name}/${var.environment}"
-      REINIT_EVERY_SEC  = "900"
-      LINE_MAX_TEXT_LEN = "4500"
+      ENVIRONMENT            = var.environment
+      SSM_PREFIX             = "/${var.project_name}/${var.environment}"
+      REINIT_EVERY_SEC       = "900"
+      LINE_MAX_TEXT_LEN      = "4500"
+      WEBHOOK_MODE           = var.webhook_mode
+      EVENT_QUEUE_URL        = aws_sqs_queue.events.url
+      QUERY_CACHE_TABLE      = join("", aws_dynamodb_table.query_cache[*].name)
+      IDEMPOTENCY_TABLE      = join("", aws_dynamodb_table.idempotency[*].name)
+      RATE_LIMIT_TABLE       = join("", aws_dynamodb_table.rate_limit[*].name)
+      COALESCE_TABLE         = join("", aws_dynamodb_table.coalesce[*].name)
+      SINGLEFLIGHT_TABLE     = join("", aws_dynamodb_table.singleflight[*].name)
+      RESULT_PAGES_TABLE     = join("", aws_dynamodb_table.result_pages[*].name)
+      LOCATION_CONTEXT_TABLE = join("", aws_dynamodb_table.location_context[*].name)
+      USAGE_TABLE            = join("", aws_dynamodb_table.usage[*].name)
+      DELIVERY_QUEUE_URL     = aws_sqs_queue.deliveries.url
+      DELIVERY_DLQ_URL       = aws_sqs_queue.deliveries_dlq.url
     }
   }
 
@@ -26,3 +38,99 @@ resource "aws_lambda_function" "line_bot" {
     Project     = var.project_name
   }
 }
+
+# =============================================================================
+# Worker Lambda（WEBHOOK_MODE=queue 時にSQSからイベントを処理）
+# =============================================================================
+
+resource "aws_lambda_function" "worker" {
+  function_name = "${var.project_name}-worker-${var.environment}"
+  role          = aws_iam_role.lambda_execution.arn
+  package_type  = "Image"
+  image_uri     = "${aws_ecr_repository.line_bot.repository_url}:latest"
+
+  image_config {
+    command = ["worker.worker_handler"]
+  }
+
+  timeout     = var.worker_timeout
+  memory_size = var.lambda_memory_size
+
+  environment {
+    variables = {
+      ENVIRONMENT            = var.environment
+      SSM_PREFIX             = "/${var.project_name}/${var.environment}"
+      REINIT_EVERY_SEC       = "900"
+      LINE_MAX_TEXT_LEN      = "4500"
+      QUERY_CACHE_TABLE      = join("", aws_dynamodb_table.query_cache[*].name)
+      IDEMPOTENCY_TABLE      = join("", aws_dynamodb_table.idempotency[*].name)
+      RATE_LIMIT_TABLE       = join("", aws_dynamodb_table.rate_limit[*].name)
+      COALESCE_TABLE         = join("", aws_dynamodb_table.coalesce[*].name)
+      SINGLEFLIGHT_TABLE     = join("", aws_dynamodb_table.singleflight[*].name)
+      RESULT_PAGES_TABLE     = join("", aws_dynamodb_table.result_pages[*].name)
+      LOCATION_CONTEXT_TABLE = join("", aws_dynamodb_table.location_context[*].name)
+      USAGE_TABLE            = join("", aws_dynamodb_table.usage[*].name)
+      DELIVERY_QUEUE_URL     = aws_sqs_queue.deliveries.url
+      DELIVERY_DLQ_URL       = aws_sqs_queue.deliveries_dlq.url
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-worker-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "worker" {
+  event_source_arn        = aws_sqs_queue.events.arn
+  function_name           = aws_lambda_function.worker.arn
+  batch_size              = 10
+  function_response_types = ["ReportBatchItemFailures"]
+}
+
+# =============================================================================
+# Delivery Lambda（LINEに届かなかった応答をアウトボックスからpushで再送）
+# =============================================================================
+
+resource "aws_lambda_function" "delivery" {
+  function_name = "${var.project_name}-delivery-${var.environment}"
+  role          = aws_iam_role.lambda_execution.arn
+  package_type  = "Image"
+  image_uri     = "${aws_ecr_repository.line_bot.repository_url}:latest"
+
+  image_config {
+    command = ["worker.delivery_handler"]
+  }
+
+  timeout     = var.worker_timeout
+  memory_size = var.lambda_memory_size
+
+  environment {
+    variables = {
+      ENVIRONMENT             = var.environment
+      SSM_PREFIX              = "/${var.project_name}/${var.environment}"
+      REINIT_EVERY_SEC        = "900"
+      LINE_MAX_TEXT_LEN       = "4500"
+      IDEMPOTENCY_TABLE       = join("", aws_dynamodb_table.idempotency[*].name)
+      USAGE_TABLE             = join("", aws_dynamodb_table.usage[*].name)
+      DELIVERY_QUEUE_URL      = aws_sqs_queue.deliveries.url
+      DELIVERY_DLQ_URL        = aws_sqs_queue.deliveries_dlq.url
+      DELIVERY_MAX_ATTEMPTS   = "5"
+      DELIVERY_RETRY_BASE_SEC = "30"
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-delivery-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "delivery" {
+  event_source_arn        = aws_sqs_queue.deliveries.arn
+  function_name           = aws_lambda_function.delivery.arn
+  batch_size              = 10
+  function_response_types = ["ReportBatchItemFailures"]
+}
@@ -37,3 +37,15 @@ output "lambda_function_name" {
   description = "Lambda関数名"
   value       = aws_lambda_function.line_bot.function_name
 }
+
+# イベントキューURL
+output "event_queue_url" {
+  description = "イベントキュー（SQS FIFO）URL"
+  value       = aws_sqs_queue.events.url
+}
+
+# 配信のDLQ URL（scripts/replay_deliveries.py の --queue-url）
+output "delivery_dlq_url" {
+  description = "LINEに届かなかった応答の退避先（SQS）URL"
+  value       = aws_sqs_queue.deliveries_dlq.url
+}
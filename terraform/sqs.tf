@@ -0,0 +1,74 @@
+# =============================================================================
+# SQSキュー（WEBHOOK_MODE=queue 用のイベントキュー）
+# =============================================================================
+
+# 処理に失敗し続けたイベントの退避先
+resource "aws_sqs_queue" "events_dlq" {
+  name                      = "${var.project_name}-events-dlq-${var.environment}.fifo"
+  fifo_queue                = true
+  message_retention_seconds = 1209600
+
+  tags = {
+    Name        = "${var.project_name}-events-dlq-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# 会話単位（MessageGroupId）で順序を保証するFIFOキュー
+resource "aws_sqs_queue" "events" {
+  name                        = "${var.project_name}-events-${var.environment}.fifo"
+  fifo_queue                  = true
+  content_based_deduplication = true
+  deduplication_scope         = "messageGroup"
+  fifo_throughput_limit       = "perMessageGroupId"
+  # workerのタイムアウトより長くする
+  visibility_timeout_seconds = var.worker_timeout * 6
+  message_retention_seconds  = 3600
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.events_dlq.arn
+    maxReceiveCount     = 3
+  })
+
+  tags = {
+    Name        = "${var.project_name}-events-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# =============================================================================
+# 配信のアウトボックス（LINEに届かなかった応答の再送）
+# =============================================================================
+
+# 再送をあきらめた応答の退避先（scripts/replay_deliveries.py で再送する）
+resource "aws_sqs_queue" "deliveries_dlq" {
+  name                      = "${var.project_name}-deliveries-dlq-${var.environment}"
+  message_retention_seconds = 1209600
+
+  tags = {
+    Name        = "${var.project_name}-deliveries-dlq-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
+
+# 再送待ちの応答（DelaySecondsでバックオフするため標準キュー）
+resource "aws_sqs_queue" "deliveries" {
+  name                       = "${var.project_name}-deliveries-${var.environment}"
+  visibility_timeout_seconds = var.worker_timeout * 6
+  message_retention_seconds  = 86400
+
+  # 再送回数はアプリ側（DELIVERY_MAX_ATTEMPTS）で数える。これはworkerが異常終了し続けた場合の保険
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.deliveries_dlq.arn
+    maxReceiveCount     = 5
+  })
+
+  tags = {
+    Name        = "${var.project_name}-deliveries-${var.environment}"
+    Environment = var.environment
+    Project     = var.project_name
+  }
+}
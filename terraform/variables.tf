@@ -56,6 +56,29 @@ variable "lambda_timeout" {
   default     = 60
 }
 
+variable "webhook_mode" {
+  description = "Webhook処理モード (sync: Webhook内で処理, queue: SQS経由でworkerが処理)"
+  type        = string
+  default     = "sync"
+
+  validation {
+    condition     = contains(["sync", "queue"], var.webhook_mode)
+    error_message = "webhook_mode は sync, queue のいずれかである必要があります"
+  }
+}
+
+variable "worker_timeout" {
+  description = "Worker Lambdaタイムアウト (秒)"
+  type        = number
+  default     = 120
+}
+
+variable "enable_dynamodb_tiers" {
+  description = "コンテナ間で共有するDynamoDBティア（応答キャッシュ等）を作成するか"
+  type        = bool
+  default     = false
+}
+
 # =============================================================================
 # API Gateway設定
 # =============================================================================